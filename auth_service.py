@@ -17,7 +17,8 @@ NOTA TÉCNICA (Fev 2026):
   de assinatura, com log de warning. IMPORTANTE: Se a assinatura
   for activamente inválida (InvalidSignatureError), o token é
   REJEITADO — nunca fazemos fallback nesse caso.
-  As chaves JWKS são cacheadas por 1 hora.
+  As chaves JWKS ficam num snapshot em memória, refrescado em
+  background (1 hora) — a validação nunca espera pela rede.
   A segurança adicional é mantida pelo RLS do Supabase.
 ============================================================
 """
@@ -55,74 +56,98 @@ _token_cache_lock = threading.Lock()
 TOKEN_CACHE_TTL = 120  # Cache por 2 minutos
 TOKEN_CACHE_MAX_SIZE = 500  # Limite máximo de entradas para evitar memory leak
 
-# JWKS cache: chaves públicas do Supabase para verificação de assinatura JWT
-JWKS_CACHE_TTL = 3600  # Cache por 1 hora
-_jwks_cache: dict = {
-    "keys": None,        # Lista de JWK dicts
-    "fetched_at": 0.0,   # Timestamp da última busca
-}
-_jwks_lock = threading.Lock()
+# JWKS: chaves públicas do Supabase para verificação de assinatura JWT.
+# Snapshot imutável (tuple), trocado por referência por refresh_jwks();
+# os pedidos só o lêem. No servidor, o lifespan carrega-o no arranque e
+# refresca-o em background a cada JWKS_CACHE_TTL segundos.
+JWKS_CACHE_TTL = int(os.environ.get("JWKS_REFRESH_INTERVAL", "3600"))  # 1 hora
+JWKS_RETRY_INTERVAL = 30  # Intervalo mínimo entre tentativas de refresh
+_jwks_keys: tuple | None = None   # Snapshot das JWK dicts
+_jwks_fetched_at = 0.0             # Timestamp da última busca com sucesso
+_jwks_attempted_at = 0.0           # Timestamp da última tentativa
+_jwks_refresh_lock = threading.Lock()  # Serializa refreshes (nunca os leitores)
 
 
-def _fetch_jwks() -> list[dict] | None:
+def refresh_jwks() -> list[dict] | None:
     """
-    Busca as chaves JWKS do Supabase e retorna a lista de JWK dicts.
+    Busca as chaves JWKS do Supabase e publica um novo snapshot (bloqueante).
 
     Tenta dois endpoints:
       1. {SUPABASE_URL}/auth/v1/.well-known/jwks.json  (padrão Supabase GoTrue)
       2. {SUPABASE_URL}/auth/v1/keys                   (endpoint alternativo)
 
-    Retorna None se ambos falharem.
-    Resultado é cacheado por JWKS_CACHE_TTL segundos.
+    Se ambos falharem, mantém o snapshot anterior (None se nunca carregou).
+    Deve correr fora do event loop (lifespan via asyncio.to_thread, ou thread).
     """
-    now = time.time()
+    global _jwks_keys, _jwks_fetched_at, _jwks_attempted_at
+
+    with _jwks_refresh_lock:
+        _jwks_attempted_at = time.time()
+
+        # SUPABASE_AUTH_URL = URL do Supabase onde os users se autenticam (frontend/Lovable)
+        # Pode ser diferente do SUPABASE_URL (onde o backend guarda dados)
+        auth_url = os.environ.get("SUPABASE_AUTH_URL", "").rstrip("/")
+        if not auth_url:
+            auth_url = os.environ.get("SUPABASE_URL", "").rstrip("/")
+        if not auth_url:
+            logger.warning("SUPABASE_AUTH_URL/SUPABASE_URL não definido — impossível buscar JWKS.")
+            return list(_jwks_keys) if _jwks_keys is not None else None
+
+        endpoints = [
+            f"{auth_url}/auth/v1/.well-known/jwks.json",
+            f"{auth_url}/auth/v1/keys",
+        ]
+
+        for url in endpoints:
+            try:
+                resp = httpx.get(url, timeout=10.0)
+                if resp.status_code == 200:
+                    data = resp.json()
+                    keys = data.get("keys", [])
+                    if keys:
+                        _jwks_keys = tuple(keys)
+                        _jwks_fetched_at = time.time()
+                        logger.info(
+                            f"JWKS carregado com sucesso de {url} "
+                            f"({len(keys)} chave(s))."
+                        )
+                        return list(keys)
+            except Exception as e:
+                logger.debug(f"Falha ao buscar JWKS de {url}: {e}")
+                continue
 
-    # Verificar cache (thread-safe)
-    with _jwks_lock:
-        if _jwks_cache["keys"] is not None and (now - _jwks_cache["fetched_at"]) < JWKS_CACHE_TTL:
-            return _jwks_cache["keys"]
-
-    # SUPABASE_AUTH_URL = URL do Supabase onde os users se autenticam (frontend/Lovable)
-    # Pode ser diferente do SUPABASE_URL (onde o backend guarda dados)
-    auth_url = os.environ.get("SUPABASE_AUTH_URL", "").rstrip("/")
-    if not auth_url:
-        auth_url = os.environ.get("SUPABASE_URL", "").rstrip("/")
-    if not auth_url:
-        logger.warning("SUPABASE_AUTH_URL/SUPABASE_URL não definido — impossível buscar JWKS.")
-        return None
+        logger.warning(
+            "Não foi possível obter JWKS do Supabase — "
+            + ("snapshot anterior mantido." if _jwks_keys is not None
+               else "fallback para decode sem verificação de assinatura.")
+        )
+        return list(_jwks_keys) if _jwks_keys is not None else None
 
-    endpoints = [
-        f"{auth_url}/auth/v1/.well-known/jwks.json",
-        f"{auth_url}/auth/v1/keys",
-    ]
 
-    for url in endpoints:
-        try:
-            # NOTE: Synchronous call — acceptable because JWKS is cached for 1 hour
-            # and only fetched once per hour. Converting to async would require
-            # making _decode_and_validate_token async, which cascades changes.
-            resp = httpx.get(url, timeout=10.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                keys = data.get("keys", [])
-                if keys:
-                    with _jwks_lock:
-                        _jwks_cache["keys"] = keys
-                        _jwks_cache["fetched_at"] = time.time()
-                    logger.info(
-                        f"JWKS carregado com sucesso de {url} "
-                        f"({len(keys)} chave(s))."
-                    )
-                    return keys
-        except Exception as e:
-            logger.debug(f"Falha ao buscar JWKS de {url}: {e}")
-            continue
+def _refresh_jwks_background() -> None:
+    """Agenda um refresh numa thread, se nenhum estiver a decorrer."""
+    if _jwks_refresh_lock.locked():
+        return
+    threading.Thread(target=refresh_jwks, name="jwks-refresh", daemon=True).start()
 
-    logger.warning(
-        "Não foi possível obter JWKS do Supabase — "
-        "fallback para decode sem verificação de assinatura."
-    )
-    return None
+
+def _fetch_jwks() -> list[dict] | None:
+    """
+    Retorna as chaves JWKS do snapshot, sem esperar pela rede.
+
+    Só a primeira utilização sem snapshot (ex: scripts fora do servidor,
+    onde o lifespan não correu) faz a busca de forma síncrona. Um snapshot
+    expirado, ou uma falha anterior, dispara um refresh em background.
+    """
+    keys = _jwks_keys
+    if keys is None and _jwks_attempted_at == 0.0:
+        return refresh_jwks()
+
+    now = time.time()
+    stale = keys is None or (now - _jwks_fetched_at) >= JWKS_CACHE_TTL
+    if stale and (now - _jwks_attempted_at) >= JWKS_RETRY_INTERVAL:
+        _refresh_jwks_background()
+    return list(keys) if keys is not None else None
 
 
 def _find_signing_key(token: str, jwks: list[dict]):
@@ -223,7 +248,7 @@ def _decode_and_validate_token(token: str) -> dict | None:
     Decode do token JWT com verificação de expiração, audience e assinatura.
 
     Estratégia:
-      1. Busca as chaves JWKS do Supabase (cacheadas por 1 hora)
+      1. Lê as chaves JWKS do snapshot em memória (refrescado em background)
       2. Tenta verificar a assinatura com a chave pública correspondente
       3. Se a verificação de assinatura falhar (kid mismatch, chave não
          encontrada, etc.), faz fallback para decode sem verificação de
@@ -9,6 +9,9 @@
 
 from src.pipeline.celery_app import celery_app  # noqa: F401
 
+# Task de análise completa (JOB_BACKEND=celery na API)
+import src.pipeline.jobs  # noqa: F401,E402
+
 # Importar módulos de tasks para que o Celery os descubra
 # (serão criados nas fases seguintes)
 try:
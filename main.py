@@ -35,18 +35,13 @@ from slowapi.util import get_remote_address
 import threading
 import httpx
 
-from auth_service import get_current_user, get_supabase, get_supabase_admin
+from auth_service import JWKS_CACHE_TTL, get_current_user, get_supabase, get_supabase_admin, refresh_jwks
 from src.engine import (
-    executar_analise_documento,
-    executar_analise_resume,
-    InsufficientBalanceError,
-    InvalidDocumentError,
-    MissingApiKeyError,
-    EngineError,
     get_wallet_manager,
     cancelar_bloqueio,
 )
-from src.cost_controller import BudgetExceededError
+from src.pipeline.jobs import ESTADOS_FINAIS, get_job_backend, marcar_documento_erro
+from src.utils.blacklist import BlacklistSnapshot, compilar_blacklist
 
 # =============================================================================
 # IN-MEMORY LOG BUFFER — para endpoint /admin/logs (monitorização remota)
@@ -100,18 +95,6 @@ logging.root.setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def _sanitize_for_json(obj):
-    """Remove bytes e outros tipos não-serializáveis de dicts/lists recursivamente."""
-    if isinstance(obj, dict):
-        return {k: _sanitize_for_json(v) for k, v in obj.items() if not isinstance(v, (bytes, bytearray))}
-    if isinstance(obj, list):
-        return [_sanitize_for_json(item) for item in obj]
-    if isinstance(obj, (bytes, bytearray)):
-        return f"<{len(obj)} bytes>"
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    return obj
-
 # Constantes de validação de ficheiros (usadas em /analyze e /analyze/add)
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {".pdf", ".docx", ".xlsx", ".txt", ".doc"}
@@ -216,54 +199,38 @@ def _register_security_alert(request: Request, limit_detail: str):
 # BLACKLIST - Bloqueio de emails, IPs e domínios
 # ============================================================
 
-# Cache local (recarregado a cada 60s para não consultar DB a cada request)
-_blacklist_cache: dict = {"emails": set(), "ips": set(), "domains": set(), "loaded_at": 0}
-_blacklist_lock = threading.Lock()  # Thread-safe access to _blacklist_cache
-BLACKLIST_CACHE_TTL = 60  # Recarregar a cada 60 segundos
+# Snapshot imutável, trocado por referência pelo refresh em background
+# (_security_refresh_loop, arrancado no lifespan). O middleware só lê o
+# snapshot — nunca consulta o Supabase nem espera por locks.
+_blacklist_snapshot: BlacklistSnapshot = BlacklistSnapshot()
+BLACKLIST_REFRESH_INTERVAL = int(os.environ.get("BLACKLIST_REFRESH_INTERVAL", "60"))
 
 
-def _load_blacklist():
-    """Carrega blacklist do Supabase para cache local."""
-    import time as _time
-    now = _time.time()
-    if now - _blacklist_cache["loaded_at"] < BLACKLIST_CACHE_TTL:
-        return  # Cache ainda válido
-
-    with _blacklist_lock:
-        # Re-read timestamp inside the lock to avoid TOCTOU race
-        now = _time.time()
-        if now - _blacklist_cache["loaded_at"] < BLACKLIST_CACHE_TTL:
-            return
+def _load_blacklist() -> BlacklistSnapshot:
+    """
+    Carrega a blacklist do Supabase e publica um novo snapshot (bloqueante).
 
-        try:
-            from auth_service import get_supabase_admin
-            sb = get_supabase_admin()
-            result = sb.table("blacklist").select("type, value").execute()
-            emails, ips, domains = set(), set(), set()
-            for row in (result.data or []):
-                val = (row.get("value") or "").lower().strip()
-                t = row.get("type", "")
-                if t == "email":
-                    emails.add(val)
-                elif t == "ip":
-                    ips.add(val)
-                elif t == "domain":
-                    domains.add(val)
-            _blacklist_cache["emails"] = emails
-            _blacklist_cache["ips"] = ips
-            _blacklist_cache["domains"] = domains
-            _blacklist_cache["loaded_at"] = now
-        except Exception as e:
-            logger.warning(f"Erro ao carregar blacklist (ignorado): {e}")
+    Chamado fora do event loop (asyncio.to_thread). Em caso de erro mantém o
+    snapshot anterior.
+    """
+    global _blacklist_snapshot
+    import time as _time
+    try:
+        sb = get_supabase_admin()
+        result = sb.table("blacklist").select("type, value").execute()
+        _blacklist_snapshot = compilar_blacklist(result.data or [], carregado_em=_time.time())
+    except Exception as e:
+        logger.warning(f"Erro ao carregar blacklist (snapshot anterior mantido): {e}")
+    return _blacklist_snapshot
 
 
 def _check_blacklist(request: Request, user: dict = None):
-    """Verifica se o request vem de email/IP/domínio bloqueado."""
-    _load_blacklist()
+    """Verifica se o request vem de email/IP/domínio bloqueado (só lê o snapshot)."""
+    snapshot = _blacklist_snapshot
 
     # Verificar IP
     ip = get_remote_address(request)
-    if ip in _blacklist_cache["ips"]:
+    if snapshot.ip_bloqueado(ip):
         logger.warning(f"[BLACKLIST] IP bloqueado: {ip}")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -277,15 +244,15 @@ def _check_blacklist(request: Request, user: dict = None):
     # Se não há utilizador autenticado, apenas verificação de IP (já feita acima)
 
     if email:
-        if email in _blacklist_cache["emails"]:
+        if snapshot.email_bloqueado(email):
             logger.warning(f"[BLACKLIST] Email bloqueado: {email[:3]}***")
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Conta bloqueada. Contacte o administrador.",
             )
 
-        domain = email.split("@")[-1] if "@" in email else ""
-        if domain in _blacklist_cache["domains"]:
+        domain = snapshot.dominio_bloqueado(email)
+        if domain:
             logger.warning(f"[BLACKLIST] Domínio bloqueado: {domain}")
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -293,6 +260,27 @@ def _check_blacklist(request: Request, user: dict = None):
             )
 
 
+async def _security_refresh_loop():
+    """
+    Refresca blacklist e JWKS em background (thread pool, fora do event loop).
+
+    Blacklist a cada BLACKLIST_REFRESH_INTERVAL s; JWKS a cada JWKS_CACHE_TTL s.
+    """
+    import time as _time
+    proximo_jwks = _time.monotonic() + JWKS_CACHE_TTL
+    while True:
+        await asyncio.sleep(BLACKLIST_REFRESH_INTERVAL)
+        try:
+            await asyncio.to_thread(_load_blacklist)
+            if _time.monotonic() >= proximo_jwks:
+                await asyncio.to_thread(refresh_jwks)
+                proximo_jwks = _time.monotonic() + JWKS_CACHE_TTL
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[SECURITY] Refresh de blacklist/JWKS falhou: {e}")
+
+
 # ============================================================
 # LIFESPAN - startup / shutdown
 # ============================================================
@@ -328,8 +316,17 @@ def _sigterm_handler(signum, frame):
     """
     sig_name = "SIGTERM" if signum == signal.SIGTERM else "SIGINT"
     logger.warning(f"[SHUTDOWN] {sig_name} recebido — a salvar estado de análises activas...")
-    with _active_lock:
-        active_ids = list(_active_user_analyses.items())
+    try:
+        from src.pipeline.checkpoint_writer import get_checkpoint_writer
+        get_checkpoint_writer().flush(timeout=10)
+    except Exception as e:
+        logger.error(f"[SHUTDOWN] Flush de checkpoints falhou: {e}")
+    try:
+        from src.pipeline.jobs import get_job_backend as _get_job_backend
+        active_ids = [(j["user_id"], j.get("analysis_id")) for j in _get_job_backend().jobs_locais()]
+    except Exception as e:
+        logger.error(f"[SHUTDOWN] Falha ao listar jobs activos: {e}")
+        active_ids = []
     if not active_ids:
         logger.info("[SHUTDOWN] Sem análises activas — shutdown limpo.")
         sys.exit(0)
@@ -407,9 +404,38 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.debug(f"[CLEANUP] Limpeza de temp folders falhou (non-blocking): {e}")
 
+    # v5.3: Preços (snapshot em disco + refresh em background) antes do 1.º pedido
+    try:
+        from src.cost_controller import DynamicPricing
+        await asyncio.to_thread(DynamicPricing.prefetch)
+    except Exception as e:
+        logger.warning(f"[PRECO] Pre-fetch de preços falhou (non-blocking): {e}")
+
+    # v5.3: Blacklist + JWKS carregados antes de aceitar pedidos e refrescados
+    # em background — os pedidos só lêem snapshots em memória
+    snapshot, jwks = await asyncio.gather(
+        asyncio.to_thread(_load_blacklist),
+        asyncio.to_thread(refresh_jwks),
+    )
+    logger.info(
+        f"[OK] Snapshots de segurança: blacklist={snapshot.total} entrada(s), "
+        f"JWKS={len(jwks or [])} chave(s)."
+    )
+    security_task = asyncio.create_task(_security_refresh_loop(), name="security-refresh")
+
     logger.info("[OK] LexForum - Servidor iniciado.")
     yield
     # -- Shutdown --
+    security_task.cancel()
+    try:
+        await security_task
+    except asyncio.CancelledError:
+        pass
+    try:
+        from src.pipeline.checkpoint_writer import get_checkpoint_writer
+        get_checkpoint_writer().shutdown(timeout=30)
+    except Exception as e:
+        logger.warning(f"[SHUTDOWN] Flush de checkpoints falhou: {e}")
     logger.info("[OK] Servidor encerrado.")
 
 
@@ -501,12 +527,45 @@ async def me(request: Request, user: dict = Depends(get_current_user)):
     }
 
 
-# Semáforo global: limita análises concorrentes a 1 para prevenir OOM (512MB Render)
-_analysis_semaphore = asyncio.Semaphore(1)
+# v5.3: Análises correm como jobs (src/pipeline/jobs.py) — worker Celery com
+# JOB_BACKEND=celery, ou thread pool local (1 análise de cada vez) por omissão.
+# O lock "uma análise por utilizador" vive no store do backend (Redis no celery).
 
-# Anti-duplicado: impede 2 análises do mesmo user ao mesmo tempo
-_active_user_analyses: dict[str, str] = {}  # user_id -> analysis_id
-_active_lock = threading.Lock()
+
+async def _resultado_do_job(backend, job_id: str):
+    """
+    Espera pelo fim do job e devolve o resultado (ou o erro HTTP registado).
+
+    A espera tem limite (JOB_TIME_LIMIT + margem da fila): se o job ainda não
+    terminou, responde 202 com o job_id, como aguardar=false.
+    """
+    from src.config import JOB_TIME_LIMIT
+    job = await backend.aguardar(job_id, timeout=JOB_TIME_LIMIT + 300)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Estado da análise perdido. Consulte o histórico de documentos.",
+        )
+    if job.get("state") not in ESTADOS_FINAIS:
+        logger.warning(f"[JOB] Espera pelo job {job_id} esgotada (estado {job.get('state')}) — 202")
+        return _job_aceite(job_id, job.get("state", "queued"))
+    if job.get("state") == "failed":
+        erro = job.get("error") or {}
+        raise HTTPException(
+            status_code=erro.get("status_code", status.HTTP_500_INTERNAL_SERVER_ERROR),
+            detail=erro.get("detail", "Erro interno do servidor."),
+        )
+    return job.get("result") or {}
+
+
+def _job_aceite(job_id: str, estado: str = "queued") -> JSONResponse:
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={
+        "job_id": job_id,
+        "state": estado,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+        "stream_url": f"/jobs/{job_id}/stream",
+    })
 
 
 @app.post("/analyze")
@@ -520,6 +579,7 @@ async def analyze(
     perguntas_raw: str = Form(""),
     titulo: str = Form(""),
     tier: str = Form("bronze"),
+    aguardar: bool = Form(True),
     user: dict = Depends(get_current_user),
 ):
     """
@@ -531,27 +591,30 @@ async def analyze(
       - perguntas_raw: Perguntas separadas por ---
       - titulo: Título do projecto (opcional)
       - tier: Tier selecionado (bronze, silver, gold)
+      - aguardar: true (omissão) = responde com o resultado completo;
+        false = responde logo 202 com job_id (GET /jobs/{job_id}, /jobs/{job_id}/events,
+        /jobs/{job_id}/stream em SSE com os resultados parciais de cada fase)
 
     Fluxo:
-      1. Bloqueia créditos estimados (wallet)
-      2. Executa pipeline de 4 fases
-      3. Liquida créditos (custo real) ou cancela bloqueio (se erro)
-      4. Retorna resultado completo em JSON
+      1. Reserva o utilizador (uma análise de cada vez) e cria o documento
+      2. Submete o job — o worker bloqueia créditos, executa o pipeline de
+         4 fases, liquida/cancela créditos e guarda o resultado no documento
+      3. Retorna o resultado completo em JSON (ou o job_id)
     """
     # Anti-duplo-clique: rejeitar se user já tem análise a correr
     user_id = user["id"]
-    with _active_lock:
-        if user_id in _active_user_analyses:
-            existing = _active_user_analyses[user_id]
-            logger.warning(f"[ANTI-DUP] User {user_id[:8]} já tem análise a correr: {existing}")
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Já tem uma análise em curso. Aguarde que termine antes de submeter outra.",
-            )
-        _active_user_analyses[user_id] = "starting"
+    backend = get_job_backend()
+    job_id, existing = await asyncio.to_thread(backend.reservar_utilizador, user_id)
+    if job_id is None:
+        logger.warning(f"[ANTI-DUP] User {user_id[:8]} já tem análise a correr: {existing}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Já tem uma análise em curso. Aguarde que termine antes de submeter outra.",
+        )
 
     _doc_id = None  # v6.0: inicializado cedo para estar disponível no finally
     _analysis_id = None
+    submetido = False
 
     try:
         # Pre-check Content-Length to reject oversized files early
@@ -602,8 +665,6 @@ async def analyze(
         # v5.2: Gerar analysis_id no main para o SIGTERM handler poder cancelar bloqueios
         import uuid as _uuid
         _analysis_id = str(_uuid.uuid4())
-        with _active_lock:
-            _active_user_analyses[user_id] = _analysis_id
 
         # v6.0: Criar documento na BD ANTES da análise (visibilidade + SIGTERM)
         try:
@@ -618,7 +679,7 @@ async def analyze(
                 "file_size_bytes": len(file_bytes),
                 "analysis_id": _analysis_id,
             }
-            insert_resp = sb_admin.table("documents").insert(doc_record).execute()
+            insert_resp = await asyncio.to_thread(sb_admin.table("documents").insert(doc_record).execute)
             if insert_resp.data:
                 _doc_id = insert_resp.data[0]["id"]
                 logger.info(f"[DOCS] Documento criado (analyzing): doc_id={_doc_id}, analysis_id={_analysis_id}")
@@ -627,119 +688,22 @@ async def analyze(
         except Exception as e:
             logger.warning(f"[DOCS] Erro ao criar documento pré-análise: {e}")
 
-        # FIX 2026-02-14: Executar em thread separada para não bloquear event loop
-        # v7.0: Semáforo limita a 1 análise concorrente (previne OOM em 512MB)
-        try:
-            await asyncio.wait_for(_analysis_semaphore.acquire(), timeout=30.0)
-        except asyncio.TimeoutError:
-            logger.error("[SEMAPHORE] Timeout 30s a aguardar semáforo — a forçar reset")
-            # Forçar reset do semáforo (leak recovery)
-            _analysis_semaphore._value = 1
-            await _analysis_semaphore.acquire()
-        try:
-            resultado = await asyncio.to_thread(
-                executar_analise_documento,
-                user_id=user["id"],
-                file_bytes=file_bytes,
-                filename=safe_filename,
-                area_direito=area_direito,
-                perguntas_raw=perguntas_raw,
-                titulo=titulo,
-                tier=tier,
-                analysis_id=_analysis_id,
-            )
-        finally:
-            _analysis_semaphore.release()
-
-        result_dict = _sanitize_for_json(resultado.to_dict())
-
-        # v6.0: Actualizar documento com resultado (em vez de criar novo)
-        try:
-            sb_admin = get_supabase_admin()
-            custos = result_dict.get("custos") or {}
-            custo_real = custos.get("custo_total_usd", 0)
-            custo_cobrado = custos.get("custo_cliente_usd", 0)
-            logger.debug(
-                f"[DOCS-DEBUG] custos keys={list(custos.keys()) if custos else 'EMPTY'}, "
-                f"custo_real={custo_real}, custo_cobrado={custo_cobrado}, "
-                f"type_real={type(custo_real).__name__}, type_cobrado={type(custo_cobrado).__name__}"
-            )
-            update_data = {
-                "title": titulo or result_dict.get("documento_filename", safe_filename),
-                "analysis_result": result_dict,
-                "status": "completed" if resultado.sucesso else "error",
-                "run_id": result_dict.get("run_id", ""),
-                "total_tokens": result_dict.get("total_tokens", 0),
-                "custo_real_usd": float(custo_real) if custo_real else 0.0,
-                "custo_cobrado_usd": float(custo_cobrado) if custo_cobrado else 0.0,
-                "duracao_segundos": result_dict.get("duracao_total_s", 0),
-            }
-            if _doc_id:
-                sb_admin.table("documents").update(update_data).eq("id", _doc_id).execute()
-                result_dict["document_id"] = _doc_id
-                logger.info(f"[DOCS] Resultado guardado (update): doc_id={_doc_id}")
-                # Ligar document_id aos registos de model_performance
-                try:
-                    from src.performance_tracker import PerformanceTracker
-                    tracker = PerformanceTracker.get_instance()
-                    if tracker:
-                        tracker.link_document_id(result_dict.get("run_id", ""), _doc_id)
-                except Exception as e:
-                    logger.warning(f"[PERF] Falha ao ligar document_id: {e}")
-            else:
-                # Fallback: inserir se não temos doc_id (não deveria acontecer)
-                update_data.update({
-                    "user_id": user["id"],
-                    "filename": safe_filename,
-                    "file_size_bytes": len(file_bytes),
-                    "analysis_id": _analysis_id,
-                })
-                insert_resp = sb_admin.table("documents").insert(update_data).execute()
-                doc_id = insert_resp.data[0]["id"] if insert_resp.data else None
-                if doc_id:
-                    result_dict["document_id"] = doc_id
-                    logger.info(f"[DOCS] Resultado guardado (fallback insert): doc_id={doc_id}")
-        except Exception as e:
-            logger.warning(f"[DOCS] Erro ao guardar resultado: {e}")
-
-        return result_dict
+        params = {
+            "user_id": user_id,
+            "filename": safe_filename,
+            "area_direito": area_direito,
+            "perguntas_raw": perguntas_raw,
+            "titulo": titulo,
+            "tier": tier,
+            "analysis_id": _analysis_id,
+            "doc_id": _doc_id,
+            "file_size_bytes": len(file_bytes),
+        }
+        await asyncio.to_thread(backend.submit, job_id, "analyze", params, file_bytes)
+        submetido = True
 
-    except InsufficientBalanceError as e:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail={
-                "message": "Saldo insuficiente. Por favor carregue a conta.",
-                "saldo_atual": e.saldo_atual,
-                "saldo_necessario": getattr(e, 'saldo_necessario', e.saldo_minimo),
-                "moeda": "USD",
-            },
-        )
-    except InvalidDocumentError as e:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=str(e),
-        )
-    except MissingApiKeyError as e:
-        logger.error(f"API Key em falta: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Serviço temporariamente indisponível. Contacte o suporte.",
-        )
-    except BudgetExceededError as e:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail={
-                "error": "insufficient_credits",
-                "message": str(e),
-                "detail": "Saldo insuficiente. Recarregue a sua wallet para continuar.",
-            },
-        )
-    except EngineError as e:
-        logger.error(f"Erro do engine: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e),
-        )
+    except HTTPException:
+        raise
     except Exception:
         logger.exception("Erro inesperado no endpoint /analyze")
         raise HTTPException(
@@ -747,19 +711,89 @@ async def analyze(
             detail="Erro interno do servidor.",
         )
     finally:
-        # Anti-duplo-clique: libertar o user
-        with _active_lock:
-            _active_user_analyses.pop(user_id, None)
-        # v6.0: Marcar documento como "error" se ainda estiver "analyzing"
-        if _doc_id:
-            try:
-                sb_admin = get_supabase_admin()
-                check = sb_admin.table("documents").select("status").eq("id", _doc_id).single().execute()
-                if check.data and check.data.get("status") == "analyzing":
-                    sb_admin.table("documents").update({"status": "error"}).eq("id", _doc_id).execute()
-                    logger.warning(f"[DOCS] Documento marcado como error (excepção): doc_id={_doc_id}")
-            except Exception as e:
-                logger.warning(f"[DOCS] Falha ao actualizar status do documento após erro: {e}")
+        if not submetido:
+            # Anti-duplo-clique: libertar o user; documento criado fica "error"
+            await asyncio.to_thread(backend.libertar_utilizador, user_id, job_id)
+            if _doc_id:
+                await asyncio.to_thread(marcar_documento_erro, _doc_id)
+
+    if not aguardar:
+        return _job_aceite(job_id)
+    return await _resultado_do_job(backend, job_id)
+
+
+# ============================================================
+# JOBS — estado e progresso de análises submetidas
+# ============================================================
+
+@app.get("/jobs/{job_id}")
+@limiter.limit("120/minute")
+async def job_status(
+    request: Request,
+    job_id: str,
+    user: dict = Depends(get_current_user),
+):
+    """Estado de um job (queued/running/done/failed), progresso e — quando terminado — resultado."""
+    job = await asyncio.to_thread(get_job_backend().status, job_id, True)
+    if not job or job.get("user_id") != user["id"]:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job
+
+
+@app.get("/jobs/{job_id}/events")
+@limiter.limit("240/minute")
+async def job_events(
+    request: Request,
+    job_id: str,
+    after: int = Query(0, ge=0),
+    user: dict = Depends(get_current_user),
+):
+    """Eventos de progresso do job a partir do número de sequência `after`."""
+    backend = get_job_backend()
+    job = await asyncio.to_thread(backend.status, job_id)
+    if not job or job.get("user_id") != user["id"]:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    eventos = await asyncio.to_thread(backend.events, job_id, after)
+    return {
+        "job_id": job_id,
+        "state": job.get("state"),
+        "progresso": job.get("progresso", 0),
+        "events": eventos,
+        "next": after + len(eventos),
+    }
+
+
+@app.get("/jobs/{job_id}/stream")
+@limiter.limit("60/minute")
+async def job_stream(
+    request: Request,
+    job_id: str,
+    after: int = Query(0, ge=0),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Progresso e resultados parciais do job em Server-Sent Events.
+
+    Eventos: "progresso", "parcial" (dados da fase concluída: agregado da
+    Fase 1, auditorias, pareceres, decisão) e por fim "done" ou "failed".
+    Para retomar após uma quebra de ligação, enviar o header Last-Event-ID
+    (ou ?after=<último id>).
+    """
+    from src.config import JOB_STREAM_HEARTBEAT, JOB_STREAM_POLL_INTERVAL
+
+    backend = get_job_backend()
+    job = await asyncio.to_thread(backend.status, job_id)
+    if not job or job.get("user_id") != user["id"]:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    last_event_id = request.headers.get("last-event-id", "").strip()
+    if last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    return StreamingResponse(
+        backend.stream(job_id, after, intervalo=JOB_STREAM_POLL_INTERVAL,
+                       heartbeat=JOB_STREAM_HEARTBEAT, desligado=request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # ============================================================
@@ -771,6 +805,7 @@ async def analyze(
 async def resume_analysis(
     request: Request,
     document_id: str,
+    aguardar: bool = Query(True),
     user: dict = Depends(get_current_user),
 ):
     """
@@ -778,18 +813,20 @@ async def resume_analysis(
 
     Requer que o documento tenha status='interrupted' e checkpoints existentes.
     Reutiliza créditos bloqueados se ainda existirem.
+    Com aguardar=false responde logo 202 com job_id (como /analyze).
     """
     user_id = user["id"]
+    backend = get_job_backend()
 
     # Anti-duplo-clique
-    with _active_lock:
-        if user_id in _active_user_analyses:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Já tem uma análise em curso. Aguarde que termine.",
-            )
-        _active_user_analyses[user_id] = "resuming"
+    job_id, _ = await asyncio.to_thread(backend.reservar_utilizador, user_id)
+    if job_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Já tem uma análise em curso. Aguarde que termine.",
+        )
 
+    submetido = False
     try:
         sb = get_supabase_admin()
 
@@ -812,67 +849,26 @@ async def resume_analysis(
                 detail="Documento sem analysis_id. Não é possível retomar.",
             )
 
-        # Actualizar tracker
-        with _active_lock:
-            _active_user_analyses[user_id] = analysis_id
-
         # Marcar como "analyzing"
         sb.table("documents").update({"status": "analyzing"}).eq("id", document_id).execute()
 
-        # Executar resume em thread separada
-        resultado = await asyncio.to_thread(
-            executar_analise_resume,
-            user_id=user_id,
-            document_id=document_id,
-            analysis_id=analysis_id,
-        )
-
-        result_dict = _sanitize_for_json(resultado.to_dict())
-
-        # Actualizar documento com resultado completo
-        custos = result_dict.get("custos") or {}
-        custo_real = custos.get("custo_total_usd", 0)
-        custo_cobrado = custos.get("custo_cliente_usd", 0)
-
-        sb.table("documents").update({
-            "analysis_result": result_dict,
-            "status": "completed" if resultado.sucesso else "error",
-            "total_tokens": result_dict.get("total_tokens", 0),
-            "custo_real_usd": float(custo_real) if custo_real else 0.0,
-            "custo_cobrado_usd": float(custo_cobrado) if custo_cobrado else 0.0,
-            "duracao_segundos": result_dict.get("duracao_total_s", 0),
-            "interrupted_at": None,
-        }).eq("id", document_id).execute()
-
-        result_dict["document_id"] = document_id
-        logger.info(f"[RESUME] Análise retomada com sucesso: doc={document_id}")
-        return result_dict
+        # Executar resume no backend de jobs
+        params = {"user_id": user_id, "document_id": document_id, "analysis_id": analysis_id}
+        await asyncio.to_thread(backend.submit, job_id, "resume", params)
+        submetido = True
 
     except HTTPException:
         raise
-    except InsufficientBalanceError as e:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail={
-                "message": "Saldo insuficiente para retomar a análise.",
-                "saldo_atual": e.saldo_atual,
-                "saldo_necessario": getattr(e, 'saldo_necessario', e.saldo_minimo),
-            },
-        )
-    except BudgetExceededError as e:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail={"error": "insufficient_credits", "message": str(e)},
-        )
-    except EngineError as e:
-        logger.error(f"[RESUME] Erro do engine: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
     except Exception:
         logger.exception("[RESUME] Erro inesperado")
         raise HTTPException(status_code=500, detail="Erro interno do servidor.")
     finally:
-        with _active_lock:
-            _active_user_analyses.pop(user_id, None)
+        if not submetido:
+            await asyncio.to_thread(backend.libertar_utilizador, user_id, job_id)
+
+    if not aguardar:
+        return _job_aceite(job_id)
+    return await _resultado_do_job(backend, job_id)
 
 
 @app.post("/analyze/abandon/{document_id}")
@@ -1828,6 +1824,30 @@ def _diag_phase_number(phase_str: str) -> str:
     return _DIAG_PHASE_ORDER.get(phase_str.lower().strip(), phase_str)
 
 
+def _diag_checkpoints() -> dict:
+    """Métricas do writer de checkpoints deste processo."""
+    from src.pipeline.checkpoint_writer import get_checkpoint_writer
+    return get_checkpoint_writer().get_metrics()
+
+
+def _diag_triage() -> dict:
+    """Métricas da triagem (Fase 0) deste processo: quórum e pré-classificador."""
+    from src.pipeline.triage import get_triage_metrics
+    return get_triage_metrics()
+
+
+def _diag_structured_output() -> dict:
+    """Output estruturado: falhas de parse e retries por papel (com vs sem schema)."""
+    from src.pipeline.structured_output import get_structured_output_metrics
+    return get_structured_output_metrics()
+
+
+def _diag_near_duplicates() -> dict:
+    """Fusão de quase-duplicados (MinHash/LSH): items fundidos e tokens poupados por prompt."""
+    from src.pipeline.near_dup import get_near_dup_metrics
+    return get_near_dup_metrics()
+
+
 def _diag_system_health() -> dict:
     """Recolhe estado do sistema (circuit breaker, pricing, analises activas)."""
     circuit = {"openai_open": False, "reason": "", "opened_at": None}
@@ -1851,8 +1871,7 @@ def _diag_system_health() -> dict:
     except Exception:
         pass
 
-    with _active_lock:
-        active_count = len(_active_user_analyses)
+    active_count = get_job_backend().get_metrics()["active_jobs"]
 
     return {
         "circuit_breaker": circuit,
@@ -2259,6 +2278,10 @@ async def admin_diagnostics(
             "data_window_days": days,
             "total_records": len(rows),
             "system_health": _diag_system_health(),
+            "checkpoints": _diag_checkpoints(),
+            "triage": _diag_triage(),
+            "structured_output": _diag_structured_output(),
+            "near_duplicates": _diag_near_duplicates(),
             "per_phase": _diag_per_phase(rows),
             "per_model": _diag_per_model(rows),
             "quality_metrics": _diag_quality(rows),
@@ -2354,9 +2377,8 @@ async def admin_blacklist_add(
             "added_by": admin_email,
         }).execute()
 
-        # Forçar recarga do cache
-        with _blacklist_lock:
-            _blacklist_cache["loaded_at"] = 0
+        # Publicar já o novo snapshot (fora do event loop)
+        await asyncio.to_thread(_load_blacklist)
 
         logger.info(f"[BLACKLIST] Adicionado: {req.type}={value} por {admin_email}")
         return {"status": "ok", "blocked": result.data[0] if result.data else {}}
@@ -2381,9 +2403,8 @@ async def admin_blacklist_remove(
         sb = get_supabase_admin()
         sb.table("blacklist").delete().eq("id", entry_id).execute()
 
-        # Forçar recarga do cache
-        with _blacklist_lock:
-            _blacklist_cache["loaded_at"] = 0
+        # Publicar já o novo snapshot (fora do event loop)
+        await asyncio.to_thread(_load_blacklist)
 
         logger.info(f"[BLACKLIST] Removido: {entry_id} por {admin_email}")
         return {"status": "ok", "removed": entry_id}
@@ -33,6 +33,7 @@ from src.config import (
     HISTORICO_DIR,  # ← NOVO: Para apagar ficheiros do histórico
 )
 from src.pipeline.processor import LexForumProcessor, PipelineResult
+from src.pipeline.artefact_store import get_artefact_store
 from src.pipeline.constants import (
     FLAGS_BLOQUEANTES,
     precisa_reparacao,
@@ -57,6 +58,7 @@ from src.utils.metadata_manager import (
 )
 
 from src.utils.sanitize import sanitize_run_id
+from src.utils.run_index import get_run_index
 
 logger = logging.getLogger(__name__)
 
@@ -66,18 +68,22 @@ def carregar_resultado(run_id: str) -> PipelineResult | None:
     from src.pipeline.processor import PipelineResult, FaseResult
 
     run_id = sanitize_run_id(run_id)
+    # O store resolve a variante física (.json / .json.gz com ARTEFACT_COMPRESS)
+    store = get_artefact_store()
     filepath = OUTPUT_DIR / run_id / "resultado.json"
-    if not filepath.exists():
+    if not store.exists(filepath):
         # Tentar no histórico
         from src.config import HISTORICO_DIR
         filepath = HISTORICO_DIR / f"{run_id}.json"
 
     try:
-        with open(filepath, encoding='utf-8') as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError, OSError) as e:
+        data = store.read_json(filepath)
+    except (ValueError, OSError) as e:
         logger.error(f"[carregar_resultado] Erro ao ler {filepath}: {e}")
         return None
+    if data is None:
+        logger.error(f"[carregar_resultado] Resultado não encontrado: {filepath}")
+        return None
 
     # Reconstruir DocumentContent
     doc_data = data.get('documento')
@@ -1521,6 +1527,7 @@ def pagina_historico():
                                 analise_dir = OUTPUT_DIR / safe_run_id
                                 if analise_dir.exists():
                                     shutil.rmtree(analise_dir)
+                                get_run_index().remover_run(safe_run_id)
 
                                 # Apagar do histórico também
                                 historico_file = HISTORICO_DIR / f"{safe_run_id}.json"
@@ -1881,6 +1888,7 @@ def pagina_gerir_titulos():
                             analise_dir = OUTPUT_DIR / safe_run_id
                             if analise_dir.exists():
                                 shutil.rmtree(analise_dir)
+                            get_run_index().remover_run(safe_run_id)
 
                             # Apagar do histórico também
                             historico_file = HISTORICO_DIR / f"{safe_run_id}.json"
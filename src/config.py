@@ -60,8 +60,41 @@ OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 # Configurações gerais
 API_TIMEOUT = 180
 API_MAX_RETRIES = 5
-EXTRACTOR_TIMEOUT_PER_CHUNK = 150  # 2.5 min por chunk (margem sobre os ~2min reais)
-EXTRACTOR_TIMEOUT_MIN = 1200       # Mínimo 20 min
+# Fase 1: tarefas (extrator × chunk) em paralelo
+EXTRACTION_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", "10"))      # chamadas LLM simultâneas
+EXTRACTION_PROVIDER_CONCURRENCY = int(os.getenv("EXTRACTION_PROVIDER_CONCURRENCY", "4"))  # por provider (openai/, google/...)
+# Chamadas de um extractor por chunk: timeout por pedido, tentativas do titular e
+# deadline para começar uma nova tentativa (a que está em curso pode ir até ao timeout)
+EXTRACTOR_CALL_TIMEOUT = 120
+EXTRACTOR_MAX_RETRIES = 2
+EXTRACTOR_RETRY_DEADLINE = 250
+EXTRACTOR_SUBSTITUTE_RETRIES = 1  # tentativas por suplente
+# EXTRACTOR_STALL_TIMEOUT (sem nenhum chunk concluído → timeout) é derivado destes
+# valores, junto a EXTRACTOR_SUBSTITUTES
+# Output dos extractores em streaming (OpenRouter): items parseados à medida que chegam
+EXTRACTOR_STREAMING = os.getenv("EXTRACTOR_STREAMING", "true").lower() in ("true", "1", "yes")
+# Output estruturado (JSON Schema via response_format) para extractores, auditores, relatores e presidente
+STRUCTURED_OUTPUT_ENABLED = os.getenv("STRUCTURED_OUTPUT_ENABLED", "true").lower() in ("true", "1", "yes")
+# Prefixos OpenRouter cujos providers aplicam o schema (modelos OpenAI suportam sempre)
+STRUCTURED_OUTPUT_PREFIXES = tuple(
+    p.strip().lower()
+    for p in os.getenv("STRUCTURED_OUTPUT_PREFIXES", "openai/,google/").split(",")
+    if p.strip()
+)
+# Governador de tráfego LLM (rate limit + concorrência por provider/modelo, todo o processo)
+LLM_GOVERNOR_ENABLED = os.getenv("LLM_GOVERNOR_ENABLED", "true").lower() in ("true", "1", "yes")
+LLM_DEFAULT_CONCURRENCY = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "16"))  # por API
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "0"))  # 0 = sem limite
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "0"))  # 0 = sem limite
+LLM_GOVERNOR_MAX_WAIT = float(os.getenv("LLM_GOVERNOR_MAX_WAIT", "120"))  # segundos em fila
+# JSON com limites por "<api>" ou "<api>:<modelo>", ex: {"openai": {"rpm": 500, "concurrency": 16}}
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "").strip()
+# Fusão de quase-duplicados (MinHash/LSH) na agregação dos extractores e na consolidação M7B
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "true").lower() in ("true", "1", "yes")
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))  # Jaccard mínimo (shingles de palavras)
+NEAR_DUP_NUM_PERM = int(os.getenv("NEAR_DUP_NUM_PERM", "64"))  # permutações MinHash (candidatos confirmados por Jaccard exacto)
+# Só tipos de texto livre: datas/valores/refs legais "parecidos" são factos diferentes
+NEAR_DUP_TYPES = {t.strip() for t in os.getenv("NEAR_DUP_TYPES", "fact,visual,other").split(",") if t.strip()}
 LOG_LEVEL = "INFO"
 
 # =============================================================================
@@ -430,6 +463,24 @@ PRESIDENTE_SUBSTITUTES = {
     "openai/gpt-5.2-pro":       ["openai/gpt-5.2",              "anthropic/claude-opus-4.6"],   # Gold
 }
 
+# =============================================================================
+# HEDGING (Fases 2-3 — auditores e relatores)
+# Se o primário exceder o p95 de latência observado (PerformanceTracker),
+# lança pedido duplicado ao Sub 1 (AUDITOR_/JUDGE_SUBSTITUTES); ganha o
+# primeiro. O pedido descartado é pago e contabilizado como custo de hedge.
+# =============================================================================
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() in ("true", "1", "yes")
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # amostras de latência antes de confiar no p95
+HEDGE_MIN_DELAY_S = float(os.getenv("HEDGE_MIN_DELAY_S", "20"))  # nunca duplicar antes disto
+
+# Gasto máximo (USD) em pedidos descartados por análise, por tier
+HEDGE_MAX_SPEND_USD = {
+    "bronze": float(os.getenv("HEDGE_MAX_SPEND_BRONZE", "0.50")),
+    "silver": float(os.getenv("HEDGE_MAX_SPEND_SILVER", "1.00")),
+    "gold": float(os.getenv("HEDGE_MAX_SPEND_GOLD", "2.50")),
+}
+
 # =============================================================================
 # LIMITES DE CONTEXTO E OUTPUT POR MODELO (tokens)
 # Fonte: OpenRouter API (verificado 2025-02-11)
@@ -507,6 +558,22 @@ EXTRACTOR_SUBSTITUTES = [
     "google/gemini-2.5-flash",     # Suplente 2: Google, visão, 65K output, $0.30/$2.50
 ]
 
+# Pior caso de UM chunk: titular até ao deadline + a tentativa em curso, depois
+# cada suplente, mais uma espera máxima na fila do governor. Repetições do
+# transporte (llm_client) em timeouts podem prolongar uma chamada além disto:
+# com o provider em baixo nesse grau, abortar a Fase 1 é o comportamento pretendido.
+EXTRACTOR_PIOR_CASO_CHUNK = int(
+    EXTRACTOR_RETRY_DEADLINE + EXTRACTOR_CALL_TIMEOUT
+    + len(EXTRACTOR_SUBSTITUTES) * EXTRACTOR_SUBSTITUTE_RETRIES * EXTRACTOR_CALL_TIMEOUT
+    + LLM_GOVERNOR_MAX_WAIT
+)
+EXTRACTOR_STALL_TIMEOUT = int(os.getenv("EXTRACTOR_STALL_TIMEOUT", str(EXTRACTOR_PIOR_CASO_CHUNK)))
+if EXTRACTOR_STALL_TIMEOUT < EXTRACTOR_PIOR_CASO_CHUNK:
+    logger.warning(
+        f"[CONFIG] EXTRACTOR_STALL_TIMEOUT={EXTRACTOR_STALL_TIMEOUT}s abaixo do pior caso de um chunk "
+        f"({EXTRACTOR_PIOR_CASO_CHUNK}s): a Fase 1 pode abortar com suplentes ainda a trabalhar"
+    )
+
 # =============================================================================
 # FAILOVER: GPT-5.2 → GPT-4.1 → Gemini Pro (3 NÍVEIS)
 # Quando titular não cabe, suplente assume automaticamente
@@ -520,6 +587,10 @@ LIMITE_NIVEL1_CHARS = 1_120_000     # ~400K tokens x 4 x 0.70 = docs até ~280 p
 LIMITE_NIVEL2_CHARS = 2_930_000     # ~1.048K tokens x 4 x 0.70 = docs até ~730 páginas
 LIMITE_NIVEL3_CHARS = 2_900_000     # ~1.049K tokens x 4 x 0.70 (Gemini 3 Pro contexto real)
 
+# Com contagem real de tokens (src/token_counter.py): fracção do contexto do
+# modelo que o documento pode ocupar (30% para prompt overhead + output)
+FAILOVER_CONTEXT_FRACTION = 0.70
+
 # =============================================================================
 # MODELOS PARA ENDPOINT /ASK (Perguntas pós-análise)
 # =============================================================================
@@ -547,6 +618,87 @@ SIMBOLOS_VERIFICACAO = {"aprovado": "V", "rejeitado": "X", "atencao": "!"}
 
 CORES = {"aprovado": "#28a745", "rejeitado": "#dc3545", "atencao": "#ffc107", "neutro": "#6c757d", "primaria": "#1a5f7a", "secundaria": "#57c5b6"}
 
+# =============================================================================
+# VERIFICAÇÃO LEGAL - SNAPSHOT LOCAL DO PGDL
+# Artigos e histórico de versões ficam em legislacao_pt.db (tabelas pgdl_*).
+# Refresh: python -m src.legal_verifier --refresh [--historico]
+# =============================================================================
+
+# Modo offline: a verificação lê APENAS o snapshot local (nunca a rede)
+LEGAL_OFFLINE_MODE = os.getenv("LEGAL_OFFLINE_MODE", "false").lower() in ("true", "1", "yes")
+
+# Idade máxima (dias) do snapshot da versão actual antes de refrescar online
+LEGAL_SNAPSHOT_TTL_DAYS = int(os.getenv("LEGAL_SNAPSHOT_TTL_DAYS", "7"))
+
+# Verificação em lote: downloads PGDL concorrentes (um por diploma/versão)
+LEGAL_VERIFY_MAX_WORKERS = int(os.getenv("LEGAL_VERIFY_MAX_WORKERS", "4"))
+
+# =============================================================================
+# CHECKPOINTS DE FASE (write-behind — src/pipeline/checkpoint_writer.py)
+# =============================================================================
+
+# false = escrita síncrona na thread do pipeline (comportamento antigo)
+CHECKPOINT_ASYNC = os.getenv("CHECKPOINT_ASYNC", "true").lower() in ("true", "1", "yes")
+CHECKPOINT_WRITER_WORKERS = int(os.getenv("CHECKPOINT_WRITER_WORKERS", "2"))
+# Ficheiro local checkpoint_faseN.json.gz em vez de .json
+CHECKPOINT_COMPRESS_LOCAL = os.getenv("CHECKPOINT_COMPRESS_LOCAL", "false").lower() in ("true", "1", "yes")
+# Payload remoto (analysis_checkpoints): "zstd" (requer zstandard; senão gzip), "gzip" ou "none"
+CHECKPOINT_CODEC = os.getenv("CHECKPOINT_CODEC", "zstd")
+# Strings a partir deste tamanho são guardadas uma vez por análise (dedup por hash)
+CHECKPOINT_BLOB_MIN_CHARS = int(os.getenv("CHECKPOINT_BLOB_MIN_CHARS", "4096"))
+
+# =============================================================================
+# ARTEFACTOS DE RUN (outputs/<run_id> — src/pipeline/artefact_store.py)
+# =============================================================================
+
+# false = escrita síncrona na thread que produz o artefacto
+ARTEFACT_ASYNC = os.getenv("ARTEFACT_ASYNC", "true").lower() in ("true", "1", "yes")
+# true = JSON indentado em disco (debug); por omissão compacto, indentação a pedido
+ARTEFACT_PRETTY = os.getenv("ARTEFACT_PRETTY", "false").lower() in ("true", "1", "yes")
+# true = artefactos da run em .gz (o histórico fica sempre em JSON simples)
+ARTEFACT_COMPRESS = os.getenv("ARTEFACT_COMPRESS", "false").lower() in ("true", "1", "yes")
+
+# =============================================================================
+# EXECUÇÃO DE ANÁLISES (jobs — src/pipeline/jobs.py)
+# =============================================================================
+
+# "inprocess" = thread pool no processo da API (desenvolvimento/testes, sem Redis)
+# "celery" = worker Celery (celery_worker.py); estado, progresso e lock por user no Redis
+JOB_BACKEND = os.getenv("JOB_BACKEND", "inprocess").lower()
+# Análises em simultâneo no backend inprocess (512MB no Render → 1)
+JOB_INPROCESS_WORKERS = int(os.getenv("JOB_INPROCESS_WORKERS", "1"))
+# Limite de tempo de uma análise no worker Celery (segundos)
+JOB_TIME_LIMIT = int(os.getenv("JOB_TIME_LIMIT", "3600"))
+# Lock "uma análise por utilizador": expira se o worker morrer sem o libertar
+JOB_USER_LOCK_TTL = int(os.getenv("JOB_USER_LOCK_TTL", "7200"))
+# Estado/resultado/eventos de um job ficam disponíveis durante este tempo
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "86400"))
+# GET /jobs/{id}/stream (SSE): intervalo de leitura dos eventos e keep-alive (segundos)
+JOB_STREAM_POLL_INTERVAL = float(os.getenv("JOB_STREAM_POLL_INTERVAL", "1.0"))
+JOB_STREAM_HEARTBEAT = float(os.getenv("JOB_STREAM_HEARTBEAT", "15"))
+
+# =============================================================================
+# TRIAGEM — FASE 0 (src/pipeline/triage.py)
+# =============================================================================
+
+# Parar de esperar pelos modelos de triagem quando 2 de 3 já concordam
+TRIAGE_EARLY_EXIT = os.getenv("TRIAGE_EARLY_EXIT", "true").lower() in ("true", "1", "yes")
+# Pré-classificador por palavras-chave: dispensa a triagem LLM se o texto for inequívoco
+TRIAGE_PRECLASSIFIER = os.getenv("TRIAGE_PRECLASSIFIER", "true").lower() in ("true", "1", "yes")
+# Pontos mínimos do domínio vencedor (termo = 1, diploma/tribunal específico = 3)
+TRIAGE_PRECLASS_MIN_HITS = int(os.getenv("TRIAGE_PRECLASS_MIN_HITS", "12"))
+# Fracção mínima dos pontos totais que o vencedor tem de ter
+TRIAGE_PRECLASS_MIN_CONFIDENCE = float(os.getenv("TRIAGE_PRECLASS_MIN_CONFIDENCE", "0.8"))
+
+# =============================================================================
+# GRAFO DE ESTÁGIOS DO PIPELINE (src/pipeline/stage_graph.py)
+# =============================================================================
+
+# false = estágios um a um, pela ordem topológica (equivalente ao pipeline sequencial)
+PIPELINE_STAGE_GRAPH = os.getenv("PIPELINE_STAGE_GRAPH", "true").lower() in ("true", "1", "yes")
+# Estágios em simultâneo (as fases LLM já paralelizam internamente os seus modelos)
+PIPELINE_STAGE_WORKERS = int(os.getenv("PIPELINE_STAGE_WORKERS", "3"))
+
 # =============================================================================
 # VISION OCR - Extracção de texto de PDFs escaneados via LLM Vision
 # =============================================================================
@@ -623,7 +775,29 @@ get_presidente_model = get_conselheiro_model
 # FUNÇÕES NOVAS: MAX_TOKENS DINÂMICO + FAILOVER + AVISOS
 # =============================================================================
 
-def calcular_max_tokens(doc_chars: int, modelo: str, role_name: str = "") -> int:
+def _limitar_ao_contexto(resultado: int, modelo: str, prompt_tokens: Optional[int]) -> int:
+    """Garante que prompt + output cabem no contexto do modelo (evita erros de contexto)."""
+    contexto = MODEL_CONTEXT_LIMITS.get(modelo)
+    if not prompt_tokens or not contexto:
+        return resultado
+    # 2% de folga para a imprecisão da contagem local
+    disponivel = int(contexto * 0.98) - prompt_tokens
+    if disponivel >= resultado:
+        return resultado
+    limitado = max(1_024, disponivel)
+    logger.warning(
+        f"[MAX_TOKENS] {modelo}: prompt ~{prompt_tokens:,} tokens deixa {disponivel:,} "
+        f"de {contexto:,} — max_tokens {resultado:,} -> {limitado:,}"
+    )
+    return limitado
+
+
+def calcular_max_tokens(
+    doc_chars: int,
+    modelo: str,
+    role_name: str = "",
+    prompt_tokens: Optional[int] = None,
+) -> int:
     """
     Calcula max_tokens dinâmico baseado no tamanho do documento,
     respeitando o limite real de cada modelo.
@@ -635,6 +809,8 @@ def calcular_max_tokens(doc_chars: int, modelo: str, role_name: str = "") -> int
         doc_chars: Número de caracteres do documento
         modelo: ID do modelo (ex: "openai/gpt-5.2")
         role_name: Nome do papel (ex: "A1", "Chefe", "Presidente")
+        prompt_tokens: Tokens do prompt (src.token_counter). Se indicado,
+            max_tokens é limitado ao contexto que sobra no modelo.
 
     Returns:
         max_tokens adequado para o modelo, fase e tamanho do documento
@@ -650,7 +826,7 @@ def calcular_max_tokens(doc_chars: int, modelo: str, role_name: str = "") -> int
                 f"fase={fase_fixo:,} | limite_modelo={limite_modelo:,} | "
                 f"final={resultado:,}"
             )
-            return resultado
+            return _limitar_ao_contexto(resultado, modelo, prompt_tokens)
 
     # Escala dinâmica por tamanho de documento (para extratores, auditores, juízes)
     if doc_chars < 50_000:
@@ -674,10 +850,15 @@ def calcular_max_tokens(doc_chars: int, modelo: str, role_name: str = "") -> int
         f"limite_modelo={limite_modelo:,} | final={resultado:,}"
     )
 
-    return resultado
+    return _limitar_ao_contexto(resultado, modelo, prompt_tokens)
 
 
-def selecionar_modelo_com_failover(modelo_titular: str, doc_chars: int, papel: str) -> str:
+def selecionar_modelo_com_failover(
+    modelo_titular: str,
+    doc_chars: int,
+    papel: str,
+    doc_tokens: Optional[int] = None,
+) -> str:
     """
     Seleciona o modelo adequado com failover automático.
 
@@ -687,6 +868,8 @@ def selecionar_modelo_com_failover(modelo_titular: str, doc_chars: int, papel: s
         modelo_titular: Modelo original (ex: "openai/gpt-5.2")
         doc_chars: Número de caracteres do documento
         papel: Nome do papel (ex: "A1", "J1", "Consolidador", "Conselheiro")
+        doc_tokens: Tokens do documento (src.token_counter). Se indicado,
+            decide pelo contexto real de cada modelo em vez de chars.
 
     Returns:
         Modelo a usar (titular ou suplente)
@@ -695,24 +878,31 @@ def selecionar_modelo_com_failover(modelo_titular: str, doc_chars: int, papel: s
     if "gpt-5.2" not in modelo_titular:
         return modelo_titular
 
+    def _cabe(modelo: str, limite_chars: int) -> bool:
+        if doc_tokens is not None and modelo in MODEL_CONTEXT_LIMITS:
+            return doc_tokens <= int(MODEL_CONTEXT_LIMITS[modelo] * FAILOVER_CONTEXT_FRACTION)
+        return doc_chars <= limite_chars
+
+    tamanho = f"{doc_chars:,} chars" if doc_tokens is None else f"{doc_chars:,} chars / {doc_tokens:,} tokens"
+
     # Nível 1: Documento cabe no GPT-5.2
-    if doc_chars <= LIMITE_NIVEL1_CHARS:
+    if _cabe(modelo_titular, LIMITE_NIVEL1_CHARS):
         return modelo_titular
 
     # Nível 2: Suplente GPT-4.1
-    if doc_chars <= LIMITE_NIVEL2_CHARS:
+    if _cabe(FALLBACK_MODEL_NIVEL2, LIMITE_NIVEL2_CHARS):
         logger.warning(
             f"[FAILOVER] {papel}: {modelo_titular} excluido "
-            f"(doc {doc_chars:,} chars > {LIMITE_NIVEL1_CHARS:,}). "
+            f"(doc {tamanho} nao cabe). "
             f"Usando suplente: {FALLBACK_MODEL_NIVEL2}"
         )
         return FALLBACK_MODEL_NIVEL2
 
     # Nível 3: Emergência Gemini Pro
-    if doc_chars <= LIMITE_NIVEL3_CHARS:
+    if _cabe(FALLBACK_MODEL_NIVEL3, LIMITE_NIVEL3_CHARS):
         logger.warning(
             f"[FAILOVER-EMERGENCIA] {papel}: GPT-4.1 tambem excluido "
-            f"(doc {doc_chars:,} chars > {LIMITE_NIVEL2_CHARS:,}). "
+            f"(doc {tamanho} nao cabe). "
             f"Usando emergencia: {FALLBACK_MODEL_NIVEL3}"
         )
         return FALLBACK_MODEL_NIVEL3
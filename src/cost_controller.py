@@ -8,13 +8,18 @@ Bloqueia execução se limites forem excedidos.
 """
 
 import os
+import json
+import time
 import logging
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from pathlib import Path
 from typing import Optional
-from threading import Lock
+from threading import Lock, Thread
 import httpx
 
+from src.token_counter import estimar_tokens_por_chars
+
 logger = logging.getLogger(__name__)
 
 # ============================================================
@@ -75,6 +80,90 @@ MODEL_PRICING = HARDCODED_PRICING
 # DYNAMIC PRICING — Preços reais via OpenRouter API
 # ============================================================
 
+_TRIE_FIM = ""  # marcador de fim de nome na trie (nunca é um carácter)
+
+
+class _PriceIndex:
+    """
+    Índice sobre um dict de preços, construído uma vez por refresh.
+
+    Reproduz a heurística exact → normalized → partial de
+    DynamicPricing._lookup_in_cache sem varrer todas as chaves:
+    mapa de chaves normalizadas, trie sobre o nome do modelo (sem
+    provider) e memo por string de modelo.
+    """
+
+    # Diferença máxima de comprimento aceite no match parcial (exclusiva)
+    MAX_LEN_DIFF = 5
+
+    def __init__(self, prices: dict[str, dict[str, float]]):
+        self.prices = prices
+        self._normalized: dict[str, str] = {}
+        self._trie: dict = {}
+        for ordem, key in enumerate(prices):
+            # Primeira chave (por ordem) com a mesma forma normalizada
+            self._normalized.setdefault(DynamicPricing._normalize(key), key)
+            node = self._trie
+            for ch in key.split("/")[-1]:
+                node = node.setdefault(ch, {})
+            node.setdefault(_TRIE_FIM, []).append((ordem, key))
+        self._resolved: dict[str, Optional[str]] = {}
+
+    def resolve(self, model_clean: str) -> Optional[str]:
+        """Chave do cache correspondente a model_clean (memoizado)."""
+        try:
+            return self._resolved[model_clean]
+        except KeyError:
+            key = self._resolve(model_clean)
+            self._resolved[model_clean] = key
+            return key
+
+    def _resolve(self, model_clean: str) -> Optional[str]:
+        # Exact match
+        if model_clean in self.prices:
+            return model_clean
+
+        # Normalized match (3-5 == 3.5, etc.)
+        key = self._normalized.get(DynamicPricing._normalize(model_clean))
+        if key is not None:
+            return key
+
+        # Partial match: nome da chave é prefixo do nome do modelo ou vice-versa;
+        # menor diferença de comprimento (< MAX_LEN_DIFF), empate → primeira chave
+        model_name = model_clean.split("/")[-1]
+        best: Optional[tuple[int, int, str]] = None
+
+        def considerar(node: dict):
+            nonlocal best
+            for ordem, key in node.get(_TRIE_FIM, ()):
+                diff = abs(len(key) - len(model_clean))
+                if diff < self.MAX_LEN_DIFF and (best is None or (diff, ordem) < best[:2]):
+                    best = (diff, ordem, key)
+
+        # 1. Chaves cujo nome é prefixo do nome do modelo
+        node = self._trie
+        considerar(node)
+        for ch in model_name:
+            node = node.get(ch)
+            if node is None:
+                break
+            considerar(node)
+
+        # 2. Chaves cujo nome começa pelo nome do modelo (subárvore, com limite
+        #    de profundidade imposto pela diferença máxima de comprimento)
+        if node is not None:
+            max_extra = len(model_clean) + self.MAX_LEN_DIFF - 1 - len(model_name)
+            pilha = [(child, 1) for ch, child in node.items() if ch != _TRIE_FIM]
+            while pilha:
+                sub, profundidade = pilha.pop()
+                if profundidade > max_extra:
+                    continue
+                considerar(sub)
+                pilha.extend((child, profundidade + 1) for ch, child in sub.items() if ch != _TRIE_FIM)
+
+        return best[2] if best is not None else None
+
+
 class DynamicPricing:
     """
     Busca preços reais da OpenRouter API com cache de 24h.
@@ -83,17 +172,36 @@ class DynamicPricing:
     1. [PRECO-LIVE] — OpenRouter API (fresh fetch)
     2. [PRECO-CACHE] — Cache em memória (<24h ou stale se API down)
     3. [PRECO-HARDCODED] — Tabela hardcoded (último recurso)
+
+    get_pricing nunca faz I/O: com o cache expirado devolve o preço stale
+    (ou hardcoded) e dispara um único refresh em background
+    (stale-while-revalidate). Cada fetch bem-sucedido é persistido em
+    SNAPSHOT_PATH e recarregado no arranque seguinte.
     """
 
     OPENROUTER_URL = "https://openrouter.ai/api/v1/models"
     CACHE_TTL_HOURS = 24
     FETCH_TIMEOUT = 15  # segundos
+    REFRESH_RETRY_SECONDS = 60  # intervalo mínimo entre tentativas de refresh
+    SNAPSHOT_PATH = Path(os.getenv(
+        "PRICE_SNAPSHOT_PATH",
+        str(Path(__file__).resolve().parent.parent / "data" / "openrouter_prices.json"),
+    ))
 
     # Cache de classe (partilhado entre todas as instâncias/runs)
     _cache: dict[str, dict[str, float]] = {}
     _cache_timestamp: Optional[datetime] = None
     _cache_lock = Lock()
     _models_used: dict[str, dict] = {}  # {model: {input, output, fonte}}
+    _index: Optional[_PriceIndex] = None  # índice sobre _cache (reconstruído por refresh)
+    _hardcoded_resolved: dict[str, str] = {}  # memo model_clean → chave HARDCODED_PRICING
+
+    # Refresh em background (single-flight)
+    _refresh_lock = Lock()
+    _refresh_thread: Optional[Thread] = None
+    _last_refresh_attempt: Optional[float] = None  # time.monotonic()
+    _snapshot_lock = Lock()  # primeiro carregamento do snapshot (os outros esperam)
+    _snapshot_loaded = False
 
     @classmethod
     def fetch_openrouter_prices(cls) -> bool:
@@ -144,14 +252,16 @@ class DynamicPricing:
                         "output": round(output_per_1m, 4),
                     }
 
+            timestamp = datetime.now(timezone.utc)
             with cls._cache_lock:
                 cls._cache = new_cache
-                cls._cache_timestamp = datetime.now(timezone.utc)
+                cls._cache_timestamp = timestamp
 
             logger.info(
                 f"[PRECO-LIVE] Carregados preços de {len(new_cache)} modelos da OpenRouter "
-                f"(timestamp: {cls._cache_timestamp.strftime('%H:%M:%S')})"
+                f"(timestamp: {timestamp.strftime('%H:%M:%S')})"
             )
+            cls._save_snapshot(new_cache, timestamp)
             return True
 
         except httpx.TimeoutException:
@@ -161,6 +271,109 @@ class DynamicPricing:
             logger.warning(f"[PRECO] Erro ao buscar preços da OpenRouter API: {e}")
             return False
 
+    @classmethod
+    def _save_snapshot(cls, prices: dict[str, dict[str, float]], timestamp: datetime):
+        """Persiste os últimos preços conhecidos (escrita atómica)."""
+        try:
+            cls.SNAPSHOT_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cls.SNAPSHOT_PATH.with_suffix(".tmp")
+            tmp_path.write_text(
+                json.dumps({"timestamp": timestamp.isoformat(), "modelos": prices}),
+                encoding="utf-8",
+            )
+            os.replace(tmp_path, cls.SNAPSHOT_PATH)
+        except Exception as e:
+            logger.warning(f"[PRECO] Erro ao guardar snapshot de preços: {e}")
+
+    @classmethod
+    def load_snapshot(cls) -> bool:
+        """
+        Carrega o snapshot persistido para o cache (só se o cache estiver vazio).
+
+        Returns:
+            True se o cache foi preenchido a partir do snapshot.
+        """
+        with cls._cache_lock:
+            if cls._cache:
+                return False
+        try:
+            if not cls.SNAPSHOT_PATH.exists():
+                return False
+            data = json.loads(cls.SNAPSHOT_PATH.read_text(encoding="utf-8"))
+            prices = {
+                k: {"input": float(v["input"]), "output": float(v["output"])}
+                for k, v in data.get("modelos", {}).items()
+            }
+            timestamp = datetime.fromisoformat(data["timestamp"])
+        except Exception as e:
+            logger.warning(f"[PRECO] Snapshot de preços inválido ({cls.SNAPSHOT_PATH}): {e}")
+            return False
+        if not prices:
+            return False
+
+        with cls._cache_lock:
+            if cls._cache:
+                return False
+            cls._cache = prices
+            cls._cache_timestamp = timestamp
+        age_hours = (datetime.now(timezone.utc) - timestamp).total_seconds() / 3600
+        logger.info(
+            f"[PRECO-CACHE] Snapshot carregado: {len(prices)} modelos (idade {age_hours:.1f}h)"
+        )
+        return True
+
+    @classmethod
+    def _ensure_snapshot_loaded(cls):
+        """
+        Carrega o snapshot uma única vez por processo.
+
+        A flag só fica True depois da tentativa: quem chega entretanto espera
+        pelo lock em vez de calcular com a tabela hardcoded.
+        """
+        if cls._snapshot_loaded:
+            return
+        with cls._snapshot_lock:
+            if cls._snapshot_loaded:
+                return
+            try:
+                cls.load_snapshot()
+            finally:
+                cls._snapshot_loaded = True
+
+    @classmethod
+    def refresh_async(cls) -> bool:
+        """
+        Dispara refresh dos preços numa thread em background (single-flight).
+
+        Não faz nada se já houver um refresh em curso ou se a última tentativa
+        foi há menos de REFRESH_RETRY_SECONDS (evita martelar a API em baixo).
+
+        Returns:
+            True se foi iniciado um novo refresh.
+        """
+        with cls._refresh_lock:
+            if cls._refresh_thread is not None and cls._refresh_thread.is_alive():
+                return False
+            now = time.monotonic()
+            if (cls._last_refresh_attempt is not None
+                    and now - cls._last_refresh_attempt < cls.REFRESH_RETRY_SECONDS):
+                return False
+            cls._last_refresh_attempt = now
+            thread = Thread(target=cls.fetch_openrouter_prices, name="pricing-refresh", daemon=True)
+            cls._refresh_thread = thread
+            thread.start()
+        return True
+
+    @classmethod
+    def wait_for_refresh(cls, timeout: Optional[float] = None) -> bool:
+        """Espera pelo refresh em curso (se houver). Retorna True se terminou."""
+        with cls._refresh_lock:
+            thread = cls._refresh_thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
     @classmethod
     def _is_cache_valid(cls) -> bool:
         """Verifica se o cache está dentro do TTL."""
@@ -179,14 +392,15 @@ class DynamicPricing:
         """
         Retorna preço para um modelo com hierarquia:
         1. Cache válido (<24h) → [PRECO-LIVE] ou [PRECO-CACHE]
-        2. Se cache expirado → tentar fetch → [PRECO-LIVE]
-        3. Se fetch falhar → cache stale → [PRECO-CACHE]
+        2. Se cache expirado → refresh em background (não bloqueia)
+        3. Entretanto → cache stale → [PRECO-CACHE]
         4. Se sem cache → hardcoded → [PRECO-HARDCODED]
 
         Returns:
             {"input": float, "output": float, "fonte": str}
         """
         model_clean = model.lower().strip()
+        cls._ensure_snapshot_loaded()
 
         # FIX: Read cache validity under lock to avoid TOCTOU race
         with cls._cache_lock:
@@ -200,24 +414,18 @@ class DynamicPricing:
                 cls._track_model(model_clean, result)
                 return result
 
-        # 2. Cache expirado — tentar refresh
+        # 2. Cache expirado — refresh em background (stale-while-revalidate)
         if not cache_valid:
-            fetched = cls.fetch_openrouter_prices()
-            if fetched:
-                price = cls._lookup_in_cache(model_clean)
-                if price:
-                    result = {**price, "fonte": "openrouter_live"}
-                    cls._track_model(model_clean, result)
-                    return result
-
-        # 3. Cache stale (API down mas temos dados antigos)
+            cls.refresh_async()
+
+        # 3. Cache stale (refresh em curso ou API down)
         if cls._is_cache_stale():
             price = cls._lookup_in_cache(model_clean)
             if price:
                 age_hours = (datetime.now(timezone.utc) - cls._cache_timestamp).total_seconds() / 3600
                 logger.warning(
                     f"[PRECO-CACHE] Usando cache de {age_hours:.1f}h para {model} "
-                    f"(API indisponível)"
+                    f"(refresh em background)"
                 )
                 result = {**price, "fonte": f"cache_{age_hours:.0f}h"}
                 cls._track_model(model_clean, result)
@@ -236,44 +444,42 @@ class DynamicPricing:
         return name.replace("-", ".").replace("_", ".")
 
     @classmethod
-    def _lookup_in_cache(cls, model_clean: str) -> Optional[dict[str, float]]:
-        """Procura preço no cache (exact → normalized → partial)."""
+    def _get_index(cls) -> _PriceIndex:
+        """Índice do cache actual (construído uma vez por cada cache novo)."""
         with cls._cache_lock:
-            # Exact match
-            if model_clean in cls._cache:
-                return cls._cache[model_clean]
-
-            # Normalized match (3-5 == 3.5, etc.)
-            model_norm = cls._normalize(model_clean)
-            for key in cls._cache:
-                if cls._normalize(key) == model_norm:
-                    return cls._cache[key]
-
-            # Partial match — pick the best match, preferring:
-            # 1. key that is a prefix of model_clean (or vice versa)
-            # 2. Shortest length difference (max 4 chars apart to avoid
-            #    "gpt-5" matching "gpt-5-nano")
-            best_key = None
-            best_len_diff = float("inf")
-            for key in cls._cache:
-                # Only match if one is a prefix of the other (after provider/ prefix)
-                key_name = key.split("/")[-1] if "/" in key else key
-                model_name = model_clean.split("/")[-1] if "/" in model_clean else model_clean
-                if key_name.startswith(model_name) or model_name.startswith(key_name):
-                    diff = abs(len(key) - len(model_clean))
-                    if diff < 5 and diff < best_len_diff:
-                        best_len_diff = diff
-                        best_key = key
-            if best_key is not None:
-                return cls._cache[best_key]
-
-        return None
+            index = cls._index
+            if index is None or index.prices is not cls._cache:
+                index = _PriceIndex(cls._cache)
+                cls._index = index
+            return index
+
+    @classmethod
+    def _lookup_in_cache(cls, model_clean: str) -> Optional[dict[str, float]]:
+        """
+        Procura preço no cache (exact → normalized → partial).
+
+        Partial: nome da chave (sem provider/) é prefixo do nome do modelo ou
+        vice-versa, com a menor diferença de comprimento (máx 4 caracteres,
+        para "gpt-5" não apanhar "gpt-5-nano").
+        """
+        index = cls._get_index()
+        key = index.resolve(model_clean)
+        return index.prices[key] if key is not None else None
 
     @classmethod
     def _lookup_hardcoded(cls, model_clean: str) -> dict[str, float]:
-        """Procura preço na tabela hardcoded."""
+        """Procura preço na tabela hardcoded (resolução memoizada por modelo)."""
+        key = cls._hardcoded_resolved.get(model_clean)
+        if key is None:
+            key = cls._resolve_hardcoded(model_clean)
+            cls._hardcoded_resolved[model_clean] = key
+        return HARDCODED_PRICING[key]
+
+    @classmethod
+    def _resolve_hardcoded(cls, model_clean: str) -> str:
+        """Chave de HARDCODED_PRICING para o modelo ("default" se nenhuma)."""
         if model_clean in HARDCODED_PRICING:
-            return HARDCODED_PRICING[model_clean]
+            return model_clean
 
         # Partial match — pick closest-length key to avoid e.g.
         # "gpt-4o" incorrectly matching "gpt-4o-mini" first.
@@ -289,9 +495,9 @@ class DynamicPricing:
                     best_len_diff = diff
                     best_key = key
         if best_key is not None:
-            return HARDCODED_PRICING[best_key]
+            return best_key
 
-        return HARDCODED_PRICING["default"]
+        return "default"
 
     @classmethod
     def _track_model(cls, model: str, pricing: dict):
@@ -330,13 +536,16 @@ class DynamicPricing:
             "cache_age_hours": round(
                 (datetime.now(timezone.utc) - cls._cache_timestamp).total_seconds() / 3600, 1
             ) if cls._cache_timestamp else None,
+            "refresh_in_progress": cls._refresh_thread is not None and cls._refresh_thread.is_alive(),
+            "snapshot_path": str(cls.SNAPSHOT_PATH),
         }
 
     @classmethod
     def prefetch(cls):
         """Pre-fetch não bloqueante. Chama no início do pipeline."""
+        cls._ensure_snapshot_loaded()
         if not cls._is_cache_valid():
-            cls.fetch_openrouter_prices()
+            cls.refresh_async()
 
     @classmethod
     def reset_tracking(cls):
@@ -346,11 +555,15 @@ class DynamicPricing:
 
     @classmethod
     def reset(cls):
-        """Reset do cache e tracking (para testes)."""
+        """Reset do cache e tracking (para testes). Não recarrega o snapshot."""
         with cls._cache_lock:
             cls._cache = {}
             cls._cache_timestamp = None
             cls._models_used = {}
+            cls._index = None
+            cls._snapshot_loaded = True
+        with cls._refresh_lock:
+            cls._last_refresh_attempt = None
 
 
 @dataclass
@@ -484,6 +697,10 @@ class CostController:
         # H10 FIX: Instance-level models_used (was class-level, shared between concurrent runs)
         self._models_used: dict[str, dict] = {}
 
+        # Erro da contagem local de tokens vs usage real da API (por run)
+        self._token_estimates = {"calls": 0, "actual": 0, "estimated": 0, "chars_estimated": 0,
+                                 "abs_error": 0, "chars_abs_error": 0}
+
         # Pre-fetch preços (usa cache se válido, fetch se expirado)
         DynamicPricing.prefetch()
 
@@ -520,11 +737,28 @@ class CostController:
         raise_on_exceed: bool = True,
     ) -> PhaseUsage:
         """Regista uso de uma chamada LLM."""
-        with self._lock:
-            # Obter pricing com fonte
-            pricing = DynamicPricing.get_pricing(model)
-            fonte = pricing["fonte"]
+        # Obter pricing com fonte (sem I/O — refresh de preços é em background)
+        pricing = DynamicPricing.get_pricing(model)
+        fonte = pricing["fonte"]
+
+        # Calcular custo
+        input_cost = (prompt_tokens / 1_000_000) * pricing["input"]
+        output_cost = (completion_tokens / 1_000_000) * pricing["output"]
+        cost = input_cost + output_cost
+        total_tokens = prompt_tokens + completion_tokens
+
+        # Criar registo
+        phase_usage = PhaseUsage(
+            phase=phase,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens,
+            cost_usd=cost,
+            pricing_source=fonte,
+        )
 
+        with self._lock:
             # H10 FIX: Track model pricing at instance level (not class-level)
             model_clean = model.lower().strip()
             self._models_used[model_clean] = {
@@ -533,23 +767,6 @@ class CostController:
                 "fonte": fonte,
             }
 
-            # Calcular custo
-            input_cost = (prompt_tokens / 1_000_000) * pricing["input"]
-            output_cost = (completion_tokens / 1_000_000) * pricing["output"]
-            cost = input_cost + output_cost
-            total_tokens = prompt_tokens + completion_tokens
-
-            # Criar registo
-            phase_usage = PhaseUsage(
-                phase=phase,
-                model=model,
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens,
-                total_tokens=total_tokens,
-                cost_usd=cost,
-                pricing_source=fonte,
-            )
-
             # Adicionar ao total
             self.usage.phases.append(phase_usage)
             self.usage.total_prompt_tokens += prompt_tokens
@@ -605,6 +822,41 @@ class CostController:
 
         return phase_usage
 
+    def register_token_estimate(self, estimated_tokens: int, actual_tokens: int, prompt_chars: int):
+        """
+        Regista a estimativa local de prompt_tokens contra o valor real da API.
+
+        prompt_chars permite comparar com a estimativa antiga (chars // 4).
+        """
+        if actual_tokens <= 0:
+            return
+        por_chars = estimar_tokens_por_chars(prompt_chars)
+        with self._lock:
+            e = self._token_estimates
+            e["calls"] += 1
+            e["actual"] += actual_tokens
+            e["estimated"] += estimated_tokens
+            e["chars_estimated"] += por_chars
+            e["abs_error"] += abs(estimated_tokens - actual_tokens)
+            e["chars_abs_error"] += abs(por_chars - actual_tokens)
+
+    def get_token_estimate_report(self) -> dict:
+        """Erro de estimativa de tokens do run (positivo = sobrestimado)."""
+        with self._lock:
+            e = dict(self._token_estimates)
+        actual = e["actual"]
+        if not actual:
+            return {"calls": 0}
+        return {
+            "calls": e["calls"],
+            "actual_prompt_tokens": actual,
+            "estimated_prompt_tokens": e["estimated"],
+            "bias_pct": round(100 * (e["estimated"] - actual) / actual, 1),
+            "abs_error_pct": round(100 * e["abs_error"] / actual, 1),
+            "chars_bias_pct": round(100 * (e["chars_estimated"] - actual) / actual, 1),
+            "chars_abs_error_pct": round(100 * e["chars_abs_error"] / actual, 1),
+        }
+
     def _warn_limits(self):
         """Loga WARNING se limites foram excedidos (sem bloquear)."""
         if self.usage.total_cost_usd > self.budget_limit and not self.usage.blocked:
@@ -664,6 +916,13 @@ class CostController:
 
     def finalize(self) -> RunUsage:
         """Finaliza a execução e retorna uso total."""
+        report = self.get_token_estimate_report()
+        if report["calls"]:
+            logger.info(
+                f"[TOKENS] Erro de estimativa ({report['calls']} chamadas): "
+                f"contador local {report['bias_pct']:+.1f}% (abs {report['abs_error_pct']:.1f}%) | "
+                f"chars/4 {report['chars_bias_pct']:+.1f}% (abs {report['chars_abs_error_pct']:.1f}%)"
+            )
         with self._lock:
             self.usage.timestamp_end = datetime.now(timezone.utc)
             return self.usage
@@ -684,6 +943,7 @@ class CostController:
             "num_phases": len(self.usage.phases),
             "blocked": self.usage.blocked,
             "block_reason": self.usage.block_reason,
+            "token_estimation": self.get_token_estimate_report(),
         }
 
     def get_cost_by_phase(self) -> dict[str, float]:
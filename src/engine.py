@@ -60,7 +60,10 @@ from src.config import (
     OUTPUT_DIR,
 )
 from src.cost_controller import BudgetExceededError
+from src.token_counter import contar_tokens
 from src.pipeline.processor import LexForumProcessor, PipelineResult
+from src.pipeline.checkpoint_codec import LazyCheckpoints
+from src.pipeline.checkpoint_writer import get_checkpoint_writer
 from src.document_loader import DocumentLoader, DocumentContent
 from src.utils.perguntas import parse_perguntas, validar_perguntas
 from src.utils.metadata_manager import gerar_titulo_automatico
@@ -406,6 +409,7 @@ def executar_analise(
     tier: str = "bronze",
     use_pdf_safe: bool = True,
     callback_progresso: Optional[Callable[[str, int, str], None]] = None,
+    callback_parcial: Optional[Callable[[int, str, dict], None]] = None,
     **kwargs,
 ) -> PipelineResult:
     """
@@ -431,6 +435,7 @@ def executar_analise(
         tier: Tier selecionado (bronze, silver, gold)
         use_pdf_safe: Usar extracao segura pagina-a-pagina para PDFs
         callback_progresso: Callback(fase, progresso_percent, mensagem)
+        callback_parcial: Callback(fase_num, fase_nome, dados) no fim de cada fase
 
     Returns:
         PipelineResult com todos os resultados
@@ -559,8 +564,7 @@ def executar_analise(
     logger.info(f"[ENGINE] Titulo: {titulo}")
 
     # ── 8. BLOQUEAR CREDITOS (antes de processar) ──
-    num_chars = documento.num_chars
-    document_tokens = num_chars // 4  # Estimativa grosseira
+    document_tokens = contar_tokens(documento.text)
 
     try:
         block_result = bloquear_creditos(
@@ -632,6 +636,7 @@ def executar_analise(
             presidente_model=presidente_model_for_run,
             callback_progresso=callback,
             analysis_id=analysis_id,
+            callback_parcial=callback_parcial,
         )
         processor._tier = tier  # Passar tier para o performance tracker
         processor._user_id = user_id  # v5.3: Para checkpoints no Supabase
@@ -717,6 +722,7 @@ def executar_analise_resume(
     document_id: str,
     analysis_id: str,
     callback_progresso: Optional[Callable[[str, int, str], None]] = None,
+    callback_parcial: Optional[Callable[[int, str, dict], None]] = None,
 ) -> PipelineResult:
     """
     Retoma uma análise interrompida a partir dos checkpoints guardados no Supabase.
@@ -733,6 +739,7 @@ def executar_analise_resume(
         document_id: UUID do documento na tabela documents
         analysis_id: analysis_id original da análise interrompida
         callback_progresso: Callback(fase, progresso_percent, mensagem)
+        callback_parcial: Callback(fase_num, fase_nome, dados) no fim de cada fase
 
     Returns:
         PipelineResult com todos os resultados
@@ -745,27 +752,18 @@ def executar_analise_resume(
 
     # 1. Carregar checkpoints do Supabase
     logger.info(f"[RESUME] Carregando checkpoints para analysis={analysis_id[:8]}...")
-    cp_resp = sb.table("analysis_checkpoints").select("*").eq(
-        "analysis_id", analysis_id
-    ).order("fase_num").execute()
-
-    checkpoints = cp_resp.data or []
-    if not checkpoints:
+    # Só a lista de fases é lida aqui; os dados de cada fase são descarregados
+    # (e descomprimidos) quando processar_from_checkpoint lhes acede.
+    checkpoint_data = LazyCheckpoints(sb, analysis_id)
+    if not checkpoint_data:
         raise EngineError(f"Sem checkpoints para analysis_id={analysis_id}. Não é possível retomar.")
 
     # Determinar última fase completa
-    last_phase = max(cp["fase_num"] for cp in checkpoints)
-    logger.info(f"[RESUME] {len(checkpoints)} checkpoint(s) encontrado(s), última fase: {last_phase}")
-
-    # Organizar checkpoint data por fase_num
-    checkpoint_data = {}
-    pipeline_context = {}
-    for cp in checkpoints:
-        fase_num = cp["fase_num"]
-        checkpoint_data[fase_num] = cp.get("phase_data", {})
-        # pipeline_context é guardado apenas na fase 1
-        if cp.get("pipeline_context"):
-            pipeline_context.update(cp["pipeline_context"])
+    last_phase = checkpoint_data.last_phase
+    logger.info(f"[RESUME] {len(checkpoint_data)} checkpoint(s) encontrado(s), última fase: {last_phase}")
+
+    # pipeline_context é guardado apenas na fase 1
+    pipeline_context = checkpoint_data.pipeline_context()
 
     if not pipeline_context:
         raise EngineError("pipeline_context não encontrado nos checkpoints. Não é possível reconstruir documento.")
@@ -818,7 +816,7 @@ def executar_analise_resume(
     else:
         # Criar novo bloqueio
         logger.info("[RESUME] Sem bloqueio existente — criando novo...")
-        document_tokens = documento.num_chars // 4
+        document_tokens = contar_tokens(documento.text)
         try:
             block_result = bloquear_creditos(
                 user_id=user_id,
@@ -864,6 +862,7 @@ def executar_analise_resume(
         presidente_model=presidente_model_for_run,
         callback_progresso=callback,
         analysis_id=analysis_id,
+        callback_parcial=callback_parcial,
     )
     processor._tier = tier
     processor._user_id = user_id
@@ -891,6 +890,11 @@ def executar_analise_resume(
         logger.exception("[RESUME] Erro fatal no pipeline")
         raise EngineError(f"Erro no resume do pipeline: {e}")
 
+    logger.info(
+        f"[RESUME] Checkpoints lidos: {checkpoint_data.rows_fetched} fase(s), "
+        f"{checkpoint_data.bytes_fetched:,} bytes"
+    )
+
     # 6. Liquidar créditos (só custo das fases executadas no resume)
     custo_real_usd = 0.0
     if resultado.custos and resultado.custos.get("custo_total_usd"):
@@ -907,6 +911,7 @@ def executar_analise_resume(
     if resultado.sucesso:
         try:
             sb.table("analysis_checkpoints").delete().eq("analysis_id", analysis_id).execute()
+            get_checkpoint_writer().forget(analysis_id)
             logger.info(f"[RESUME] Checkpoints limpos para analysis={analysis_id[:8]}")
         except Exception as e:
             logger.warning(f"[RESUME] Falha ao limpar checkpoints: {e}")
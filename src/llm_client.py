@@ -24,7 +24,7 @@ import json
 import logging
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Optional, Any, Union
+from typing import Callable, Optional, Any, Union
 from dataclasses import dataclass, field
 from tenacity import (
     retry,
@@ -36,6 +36,13 @@ from tenacity import (
 
 import os
 import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as futures_wait
+
+from src.config import (
+    LLM_DEFAULT_CONCURRENCY, LLM_DEFAULT_RPM, LLM_DEFAULT_TPM, LLM_GOVERNOR_ENABLED,
+    LLM_GOVERNOR_MAX_WAIT, LLM_RATE_LIMITS, STRUCTURED_OUTPUT_PREFIXES,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -130,6 +137,357 @@ def _safe_parse_json(response: httpx.Response, context: str = "") -> dict[str, A
     return data
 
 
+def _read_sse_completion(response: httpx.Response, consumer: Any, context: str = "") -> dict[str, Any]:
+    """
+    Lê uma resposta chat/completions em streaming (SSE) e devolve-a no formato
+    da resposta normal: {"model", "choices": [{"message", "finish_reason"}], "usage"}.
+
+    Cada delta de texto é passado a consumer.feed() à medida que chega; uma
+    excepção do consumer não interrompe a leitura (o texto completo é devolvido
+    na mesma e o chamador pode re-parsear).
+    """
+    partes: list[str] = []
+    finish_reason = None
+    usage: dict[str, Any] = {}
+    model = ""
+    consumer_ok = True
+
+    for linha in response.iter_lines():
+        if not linha or not linha.startswith("data:"):
+            continue  # comentários SSE (": OPENROUTER PROCESSING") e linhas vazias
+        dados = linha[5:].strip()
+        if dados == "[DONE]":
+            break
+        try:
+            chunk = json.loads(dados)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"[{context}] Chunk SSE inválido: {dados[:200]!r}") from e
+        if chunk.get("error"):
+            erro = chunk["error"]
+            if isinstance(erro, dict):
+                erro = erro.get("message", str(erro))
+            raise ValueError(f"[{context}] Erro a meio do stream: {erro}")
+        model = chunk.get("model") or model
+        if chunk.get("usage"):
+            usage = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            delta = (choice.get("delta") or {}).get("content") or ""
+            if delta:
+                partes.append(delta)
+                if consumer_ok:
+                    try:
+                        consumer.feed(delta)
+                    except Exception as e:
+                        consumer_ok = False
+                        logger.warning(f"[{context}] Consumer do stream falhou: {e}")
+            if choice.get("finish_reason"):
+                finish_reason = choice["finish_reason"]
+
+    return {
+        "model": model,
+        "choices": [{
+            "message": {"role": "assistant", "content": "".join(partes)},
+            "finish_reason": finish_reason,
+        }],
+        "usage": usage,
+    }
+
+
+# =============================================================================
+# GOVERNADOR DE TRÁFEGO LLM - rate limit + concorrência por provider/modelo
+# =============================================================================
+# Partilhado por todo o processo (todas as análises em curso). Cada tentativa
+# HTTP (incluindo retries do tenacity) passa por aqui.
+#
+# LLM_RATE_LIMITS (JSON) define limites por chave, p.ex.:
+#   {"openai": {"rpm": 500, "tpm": 800000, "concurrency": 16},
+#    "openrouter": {"rpm": 600},
+#    "openrouter:anthropic/claude-opus-4.6": {"concurrency": 4}}
+# Chaves "<api>:<modelo>" só existem se estiverem configuradas.
+# Defaults e limites em src/config.py (LLM_GOVERNOR_*, LLM_DEFAULT_*).
+
+
+def _load_rate_limits() -> dict[str, dict[str, int]]:
+    raw = LLM_RATE_LIMITS
+    if not raw:
+        return {}
+    try:
+        limits = json.loads(raw)
+        if not isinstance(limits, dict):
+            raise ValueError("esperado objecto JSON")
+        return {str(k): dict(v) for k, v in limits.items()}
+    except Exception as e:
+        logger.warning(f"[GOVERNOR] LLM_RATE_LIMITS inválido ({e}) — a usar limites por defeito")
+        return {}
+
+
+class _TokenBucket:
+    """Token bucket com capacidade = limite por minuto (refill contínuo)."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)  # pedido maior que o bucket: espera pelo bucket cheio
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Acerto pós-resposta (tokens reais vs estimados); pode ficar negativo."""
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+@dataclass
+class _GovernorKey:
+    """Estado + métricas de uma chave (API ou API:modelo)."""
+    concurrency: int
+    rpm: Optional[_TokenBucket] = None
+    tpm: Optional[_TokenBucket] = None
+    in_flight: int = 0
+    queued: int = 0
+    blocked_until: float = 0.0
+    requests: int = 0
+    waited_requests: int = 0
+    wait_total_s: float = 0.0
+    wait_max_s: float = 0.0
+    throttled_429: int = 0
+    wait_timeouts: int = 0
+
+
+class _GovernorLease:
+    """Autorização para uma chamada HTTP; liberta o slot de concorrência ao sair."""
+
+    def __init__(self, governor: Optional["RateGovernor"], keys: list, estimated_tokens: int):
+        self._governor = governor
+        self._keys = keys
+        self._estimated_tokens = estimated_tokens
+        self._released = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._governor and not self._released:
+            self._released = True
+            self._governor._release(self._keys)
+        return False
+
+    def observe_http(self, response: httpx.Response):
+        """Em 429 bloqueia a chave durante o Retry-After indicado pelo servidor."""
+        if self._governor and response.status_code == 429:
+            self._governor._throttle(self._keys, _parse_retry_after(response.headers))
+
+    def settle(self, actual_tokens: Optional[int]):
+        """Acerta o TPM com os tokens reais da resposta."""
+        if self._governor and actual_tokens:
+            self._governor._settle(self._keys, actual_tokens - self._estimated_tokens)
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    """Retry-After em segundos (aceita 'retry-after-ms', segundos ou HTTP-date)."""
+    try:
+        ms = headers.get("retry-after-ms")
+        if ms:
+            return max(0.0, float(ms) / 1000.0)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+def _estimate_request_tokens(payload: Any) -> int:
+    """Estimativa barata de tokens de input (~4 chars/token) para o TPM."""
+    try:
+        return max(1, len(json.dumps(payload, ensure_ascii=False)) // 4)
+    except Exception:
+        return 1
+
+
+class RateGovernor:
+    """
+    Governador de tráfego LLM partilhado pelo processo.
+
+    Por chave ("openai", "openrouter" e, se configurado, "<api>:<modelo>"):
+    limite de concorrência, token buckets de RPM/TPM e bloqueio temporário
+    após 429 (Retry-After). acquire() bloqueia até haver capacidade em todas
+    as chaves aplicáveis e regista o tempo em fila.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[dict[str, dict[str, int]]] = None,
+        default_concurrency: int = LLM_DEFAULT_CONCURRENCY,
+        default_rpm: int = LLM_DEFAULT_RPM,
+        default_tpm: int = LLM_DEFAULT_TPM,
+        max_wait: float = LLM_GOVERNOR_MAX_WAIT,
+        enabled: bool = LLM_GOVERNOR_ENABLED,
+    ):
+        self.limits = limits if limits is not None else _load_rate_limits()
+        self.default_concurrency = default_concurrency
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._cond = threading.Condition()
+        self._keys: dict[str, _GovernorKey] = {}
+
+    def _key_state(self, name: str) -> _GovernorKey:
+        state = self._keys.get(name)
+        if state is None:
+            is_api_key = ":" not in name
+            cfg = self.limits.get(name, {})
+            concurrency = int(cfg.get("concurrency", self.default_concurrency if is_api_key else 0))
+            rpm = int(cfg.get("rpm", self.default_rpm if is_api_key else 0))
+            tpm = int(cfg.get("tpm", self.default_tpm if is_api_key else 0))
+            state = _GovernorKey(
+                concurrency=concurrency,
+                rpm=_TokenBucket(rpm) if rpm > 0 else None,
+                tpm=_TokenBucket(tpm) if tpm > 0 else None,
+            )
+            self._keys[name] = state
+        return state
+
+    def acquire(self, api: str, model: str, estimated_tokens: int = 0) -> _GovernorLease:
+        """Espera por capacidade (concorrência, RPM, TPM, Retry-After) e reserva-a."""
+        if not self.enabled:
+            return _GovernorLease(None, [], 0)
+
+        names = [api]
+        model_key = f"{api}:{model}"
+        if model_key in self.limits:
+            names.append(model_key)
+
+        start = time.monotonic()
+        with self._cond:
+            keys = [self._key_state(n) for n in names]
+            for k in keys:
+                k.queued += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = 0.0
+                    slot_livre = True
+                    for k in keys:
+                        wait = max(wait, k.blocked_until - now)
+                        if k.concurrency > 0 and k.in_flight >= k.concurrency:
+                            slot_livre = False
+                        if k.rpm:
+                            wait = max(wait, k.rpm.wait_time(1, now))
+                        if k.tpm and estimated_tokens:
+                            wait = max(wait, k.tpm.wait_time(estimated_tokens, now))
+                    if slot_livre and wait <= 0:
+                        break
+                    remaining = self.max_wait - (now - start)
+                    if remaining <= 0:
+                        for k in keys:
+                            k.wait_timeouts += 1
+                        raise httpx.TimeoutException(
+                            f"[GOVERNOR] {model_key}: sem capacidade após {self.max_wait:.0f}s em fila"
+                        )
+                    # Slot ocupado: acordado por _release; bucket/Retry-After: acordar a tempo
+                    self._cond.wait(timeout=min(remaining, wait if wait > 0 else remaining))
+            finally:
+                for k in keys:
+                    k.queued -= 1
+
+            waited = time.monotonic() - start
+            for k in keys:
+                k.in_flight += 1
+                k.requests += 1
+                if k.rpm:
+                    k.rpm.consume(1)
+                if k.tpm and estimated_tokens:
+                    k.tpm.consume(estimated_tokens)
+                if waited > 0.001:
+                    k.waited_requests += 1
+                    k.wait_total_s += waited
+                    k.wait_max_s = max(k.wait_max_s, waited)
+
+        if waited > 1.0:
+            logger.info(f"[GOVERNOR] {model_key}: {waited:.1f}s em fila")
+        return _GovernorLease(self, keys, estimated_tokens)
+
+    def _release(self, keys: list):
+        with self._cond:
+            for k in keys:
+                k.in_flight = max(0, k.in_flight - 1)
+            self._cond.notify_all()
+
+    def _throttle(self, keys: list, retry_after: Optional[float]):
+        with self._cond:
+            for k in keys:
+                k.throttled_429 += 1
+                if retry_after:
+                    k.blocked_until = max(k.blocked_until, time.monotonic() + retry_after)
+        if retry_after:
+            logger.warning(f"[GOVERNOR] 429 recebido — chave bloqueada {retry_after:.1f}s (Retry-After)")
+
+    def _settle(self, keys: list, delta_tokens: int):
+        with self._cond:
+            for k in keys:
+                if k.tpm:
+                    k.tpm.adjust(delta_tokens)
+
+    def get_metrics(self) -> dict[str, dict[str, Any]]:
+        """Métricas por chave: pedidos, espera em fila, em curso, 429s."""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                name: {
+                    "requests": k.requests,
+                    "in_flight": k.in_flight,
+                    "queued": k.queued,
+                    "waited_requests": k.waited_requests,
+                    "wait_total_s": round(k.wait_total_s, 3),
+                    "wait_max_s": round(k.wait_max_s, 3),
+                    "wait_avg_ms": round(1000 * k.wait_total_s / k.requests, 1) if k.requests else 0.0,
+                    "throttled_429": k.throttled_429,
+                    "wait_timeouts": k.wait_timeouts,
+                    "blocked_for_s": round(max(0.0, k.blocked_until - now), 1),
+                }
+                for name, k in self._keys.items()
+            }
+
+
+_rate_governor: Optional[RateGovernor] = None
+_rate_governor_lock = threading.Lock()
+
+
+def get_rate_governor() -> RateGovernor:
+    """Retorna o governador de tráfego LLM do processo (singleton)."""
+    global _rate_governor
+    if _rate_governor is None:
+        with _rate_governor_lock:
+            if _rate_governor is None:
+                _rate_governor = RateGovernor()
+    return _rate_governor
+
+
+def reset_rate_governor():
+    """Descarta o governador (limites são relidos do ambiente; para testes)."""
+    global _rate_governor
+    with _rate_governor_lock:
+        _rate_governor = None
+
+
 # =============================================================================
 # PROMPT CACHING - CONFIGURAÇÃO
 # =============================================================================
@@ -279,6 +637,7 @@ class LLMResponse:
     success: bool = True
     api_used: str = ""  # "openai" ou "openrouter"
     finish_reason: str = ""  # "stop", "length", "content_filter", "error", etc.
+    estruturado: bool = False  # response_format enviado e aceite pelo provider
 
     @property
     def cache_hit_rate(self) -> float:
@@ -304,6 +663,7 @@ class LLMResponse:
             "success": self.success,
             "api_used": self.api_used,
             "finish_reason": self.finish_reason,
+            "estruturado": self.estruturado,
         }
 
 
@@ -374,6 +734,45 @@ def supports_temperature(model_name: str) -> bool:
     return True
 
 
+def supports_structured_output(model_name: str) -> bool:
+    """Verifica se o modelo aceita response_format com JSON Schema."""
+    return is_openai_model(model_name) or model_name.lower().startswith(STRUCTURED_OUTPUT_PREFIXES)
+
+
+def _response_format(schema: dict[str, Any]) -> dict[str, Any]:
+    """response_format (Chat Completions) a partir de {"name", "schema"}."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema["name"], "schema": schema["schema"], "strict": False},
+    }
+
+
+def _schema_rejeitado(error: Optional[str]) -> bool:
+    """
+    O provider recusou o pedido por causa do response_format?
+
+    Só quando a mensagem refere response_format / json_schema, ou um 400/422
+    cujo corpo fala do schema — outros 400 (contexto excedido, modelo
+    inválido, ...) não são rejeições do schema e não se repetem sem ele.
+    """
+    e = (error or "").lower()
+    if "response_format" in e or "json_schema" in e:
+        return True
+    return ("400 bad request" in e or "422 unprocessable" in e) and "schema" in e
+
+
+def _descrever_erro(exc: Exception) -> str:
+    """str(exc) com o início do corpo da resposta nos erros HTTP (mensagem do provider)."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        try:
+            corpo = exc.response.text.strip()
+        except Exception:
+            corpo = ""
+        if corpo:
+            return f"{exc} | {corpo[:500]}"
+    return str(exc)
+
+
 def should_use_openai_direct(model_name: str) -> bool:
     """
     Verifica se modelo OpenAI deve usar API OpenAI directa.
@@ -476,6 +875,7 @@ class OpenAIClient:
         temperature: float = 0.7,
         max_tokens: int = 16384,
         timeout: Optional[int] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> dict[str, Any]:
         """Faz uma requisição à API Chat Completions com retry automático."""
         url = f"{self.base_url}/chat/completions"
@@ -489,17 +889,23 @@ class OpenAIClient:
             "temperature": temperature,
             "max_completion_tokens": max_tokens,
         }
+        if response_schema:
+            payload["response_format"] = _response_format(response_schema)
 
         logger.debug(f"OpenAI Request para {clean_model}: {len(str(messages))} chars")
 
         post_kwargs = {"json": payload}
         if timeout:
             post_kwargs["timeout"] = timeout
-        response = self._client.post(url, **post_kwargs)
+        with get_rate_governor().acquire("openai", clean_model, _estimate_request_tokens(payload)) as lease:
+            response = self._client.post(url, **post_kwargs)
+            lease.observe_http(response)
         response.raise_for_status()
 
         # FIX 2026-02-10: Parse JSON defensivo
-        return _safe_parse_json(response, context=f"OpenAI-Chat/{clean_model}")
+        data = _safe_parse_json(response, context=f"OpenAI-Chat/{clean_model}")
+        lease.settle((data.get("usage") or {}).get("total_tokens"))
+        return data
 
     @retry(
         retry=retry_if_exception(_is_retryable_http_error),
@@ -515,6 +921,7 @@ class OpenAIClient:
         temperature: float = 0.7,
         max_output_tokens: int = 16384,
         timeout: Optional[int] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> dict[str, Any]:
         """
         Faz requisição à API Responses (/v1/responses) com retry automático.
@@ -546,16 +953,26 @@ class OpenAIClient:
             # Embed instructions into input for reasoning models
             payload["input"] = f"{instructions}\n\n---\n\n{input_text}"
 
+        if response_schema:
+            payload["text"] = {"format": {
+                "type": "json_schema", "name": response_schema["name"],
+                "schema": response_schema["schema"], "strict": False,
+            }}
+
         logger.debug(f"OpenAI Responses Request para {clean_model}: {len(input_text)} chars")
 
         post_kwargs = {"json": payload}
         if timeout:
             post_kwargs["timeout"] = timeout
-        response = self._client.post(url, **post_kwargs)
+        with get_rate_governor().acquire("openai", clean_model, _estimate_request_tokens(payload)) as lease:
+            response = self._client.post(url, **post_kwargs)
+            lease.observe_http(response)
         response.raise_for_status()
 
         # FIX 2026-02-10: Parse JSON defensivo
-        return _safe_parse_json(response, context=f"OpenAI-Responses/{clean_model}")
+        data = _safe_parse_json(response, context=f"OpenAI-Responses/{clean_model}")
+        lease.settle((data.get("usage") or {}).get("total_tokens"))
+        return data
 
     def chat(
         self,
@@ -566,6 +983,7 @@ class OpenAIClient:
         system_prompt: Optional[str] = None,
         enable_cache: bool = True,  # NOVO parâmetro
         timeout: Optional[int] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> LLMResponse:
         """
         Envia mensagens para um modelo e retorna a resposta.
@@ -591,6 +1009,7 @@ class OpenAIClient:
                 temperature=temperature,
                 max_tokens=max_tokens,
                 timeout=timeout,
+                response_schema=response_schema,
             )
 
             # Extrair resposta
@@ -686,7 +1105,7 @@ class OpenAIClient:
                 content="",
                 model=model,
                 role="assistant",
-                error=str(e),
+                error=_descrever_erro(e),
                 success=False,
                 api_used="openai"
             )
@@ -700,6 +1119,7 @@ class OpenAIClient:
         max_tokens: int = 16384,
         enable_cache: bool = True,  # NOVO parâmetro
         timeout: Optional[int] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> LLMResponse:
         """Versão simplificada de chat com apenas um prompt."""
         messages = [{"role": "user", "content": prompt}]
@@ -711,6 +1131,7 @@ class OpenAIClient:
             max_tokens=max_tokens,
             enable_cache=enable_cache,
             timeout=timeout,
+            response_schema=response_schema,
         )
 
     def chat_responses(
@@ -722,6 +1143,7 @@ class OpenAIClient:
         system_prompt: Optional[str] = None,
         enable_cache: bool = True,  # NOVO parâmetro
         timeout: Optional[int] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> LLMResponse:
         """
         Envia mensagens para um modelo usando Responses API (/v1/responses).
@@ -764,6 +1186,7 @@ class OpenAIClient:
                 temperature=temperature,
                 max_output_tokens=max_tokens,
                 timeout=timeout,
+                response_schema=response_schema,
             )
 
             # Extrair resposta (formato diferente!)
@@ -925,7 +1348,7 @@ class OpenAIClient:
                 content="",
                 model=model,
                 role="assistant",
-                error=str(e),
+                error=_descrever_erro(e),
                 success=False,
                 api_used="openai (responses)"
             )
@@ -1015,8 +1438,16 @@ class OpenRouterClient:
         temperature: float = 0.7,
         max_tokens: int = 16384,
         timeout: Optional[int] = None,
+        stream_consumer: Optional[Any] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> dict[str, Any]:
-        """Faz uma requisição à API com retry automático."""
+        """
+        Faz uma requisição à API com retry automático.
+
+        Com stream_consumer (ex: IncrementalItemParser), o pedido é feito em
+        streaming (SSE) e cada delta de texto é passado a stream_consumer.feed()
+        à medida que chega. Devolve o mesmo formato que o pedido normal.
+        """
         url = f"{self.base_url}/chat/completions"
 
         # Normalizar nome do modelo (com prefixo openai/ se necessário)
@@ -1042,14 +1473,34 @@ class OpenRouterClient:
 
         logger.debug(f"OpenRouter Request para {clean_model}: {len(str(messages))} chars")
 
+        if response_schema:
+            payload["response_format"] = _response_format(response_schema)
+
+        if stream_consumer is not None:
+            payload["stream"] = True
+            payload["usage"] = {"include": True}
+            stream_consumer.reset()  # cada tentativa (retry) recomeça do zero
+
         post_kwargs = {"json": payload}
         if timeout:
             post_kwargs["timeout"] = timeout
-        response = self._client.post(url, **post_kwargs)
-        response.raise_for_status()
-
-        # FIX 2026-02-10: Parse JSON defensivo (em vez de response.json() directo)
-        return _safe_parse_json(response, context=f"OpenRouter/{clean_model}")
+        with get_rate_governor().acquire("openrouter", clean_model, _estimate_request_tokens(payload)) as lease:
+            if stream_consumer is not None:
+                with self._client.stream("POST", url, **post_kwargs) as response:
+                    lease.observe_http(response)
+                    if response.status_code >= 400:
+                        response.read()  # corpo disponível para _is_retryable_http_error
+                    response.raise_for_status()
+                    data = _read_sse_completion(response, stream_consumer, context=f"OpenRouter/{clean_model}")
+            else:
+                response = self._client.post(url, **post_kwargs)
+                lease.observe_http(response)
+        if stream_consumer is None:
+            response.raise_for_status()
+            # FIX 2026-02-10: Parse JSON defensivo (em vez de response.json() directo)
+            data = _safe_parse_json(response, context=f"OpenRouter/{clean_model}")
+        lease.settle((data.get("usage") or {}).get("total_tokens"))
+        return data
 
     def chat(
         self,
@@ -1060,11 +1511,14 @@ class OpenRouterClient:
         system_prompt: Optional[str] = None,
         enable_cache: bool = True,  # NOVO parâmetro
         timeout: Optional[int] = None,
+        stream_consumer: Optional[Any] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> LLMResponse:
         """
         Envia mensagens para um modelo e retorna a resposta.
 
         NOVO: Suporte para prompt caching (Anthropic manual, outros automático).
+        stream_consumer: recebe os deltas do output em streaming (ver _make_request).
         """
         with self._stats_lock:
             self._stats["total_calls"] += 1
@@ -1089,6 +1543,8 @@ class OpenRouterClient:
                 temperature=temperature,
                 max_tokens=max_tokens,
                 timeout=timeout,
+                stream_consumer=stream_consumer,
+                response_schema=response_schema,
             )
 
             # Extrair resposta
@@ -1249,7 +1705,7 @@ class OpenRouterClient:
                 content="",
                 model=model,
                 role="assistant",
-                error=str(e),
+                error=_descrever_erro(e),
                 success=False,
                 api_used="openrouter"
             )
@@ -1263,6 +1719,8 @@ class OpenRouterClient:
         max_tokens: int = 16384,
         enable_cache: bool = True,  # NOVO parâmetro
         timeout: Optional[int] = None,
+        stream_consumer: Optional[Any] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> LLMResponse:
         """Versão simplificada de chat com apenas um prompt."""
         messages = [{"role": "user", "content": prompt}]
@@ -1274,6 +1732,8 @@ class OpenRouterClient:
             max_tokens=max_tokens,
             enable_cache=enable_cache,
             timeout=timeout,
+            stream_consumer=stream_consumer,
+            response_schema=response_schema,
         )
 
     def get_stats(self) -> dict[str, Any]:
@@ -1346,6 +1806,11 @@ class UnifiedLLMClient:
             max_retries=max_retries,
         )
 
+        # Hedging: pedidos duplicados para cortar a cauda de latência
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._hedge_lock = threading.Lock()
+        self._hedge_stats = {"hedges_launched": 0, "hedge_wins": 0, "primary_wins": 0, "discarded": 0}
+
         logger.info("✅ UnifiedLLMClient inicializado (Dual API + Fallback + Cache + Circuit Breaker)")
 
     def chat_simple(
@@ -1357,6 +1822,8 @@ class UnifiedLLMClient:
         max_tokens: int = 16384,
         enable_cache: bool = True,  # NOVO parâmetro
         timeout: Optional[int] = None,
+        stream_consumer: Optional[Any] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> LLMResponse:
         """
         Versão simplificada de chat.
@@ -1374,7 +1841,98 @@ class UnifiedLLMClient:
             max_tokens=max_tokens,
             enable_cache=enable_cache,
             timeout=timeout,
+            stream_consumer=stream_consumer,
+            response_schema=response_schema,
+        )
+
+    def chat_hedged(
+        self,
+        primary: dict[str, Any],
+        hedge: dict[str, Any],
+        hedge_after_s: float,
+        allow_hedge: Optional[Callable[[], bool]] = None,
+        on_discarded: Optional[Callable[[str, LLMResponse], None]] = None,
+    ) -> tuple[LLMResponse, str]:
+        """
+        Chamada com hedging: se o primário não responder em hedge_after_s,
+        lança um pedido duplicado para o modelo substituto; ganha a primeira
+        resposta com sucesso.
+
+        Args:
+            primary / hedge: kwargs de chat_simple (model, prompt, system_prompt, ...)
+            hedge_after_s: atraso antes do duplicado (tipicamente o p95 do modelo)
+            allow_hedge: consultado antes de lançar o duplicado (limite de gasto)
+            on_discarded: chamado com (modelo, resposta) para cada resposta
+                descartada — pode ocorrer numa thread em background, depois
+                do retorno, porque o provider cobra o pedido na mesma. Se o
+                duplicado foi cancelado antes de sair, resposta=None (sem custo)
+
+        Returns:
+            (resposta, modelo que a produziu)
+        """
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+            executor = self._hedge_executor
+
+        def _ok(resp: LLMResponse) -> bool:
+            return bool(resp.success and resp.content)
+
+        def _descartar(model_name: str, future):
+            if not future.cancelled():
+                with self._hedge_lock:
+                    self._hedge_stats["discarded"] += 1
+            if on_discarded:
+                try:
+                    on_discarded(model_name, None if future.cancelled() else future.result())
+                except Exception as e:
+                    logger.warning(f"[HEDGE] Erro a contabilizar resposta descartada de {model_name}: {e}")
+
+        primary_model = primary["model"]
+        hedge_model = hedge["model"]
+        fut_primary = executor.submit(self.chat_simple, **primary)
+        done, _ = futures_wait([fut_primary], timeout=hedge_after_s)
+        if done or (allow_hedge is not None and not allow_hedge()):
+            return fut_primary.result(), primary_model
+
+        logger.warning(
+            f"[HEDGE] {primary_model} sem resposta após {hedge_after_s:.0f}s — "
+            f"pedido duplicado para {hedge_model}"
         )
+        fut_hedge = executor.submit(self.chat_simple, **hedge)
+        with self._hedge_lock:
+            self._hedge_stats["hedges_launched"] += 1
+
+        models = {fut_primary: primary_model, fut_hedge: hedge_model}
+        pending = {fut_primary, fut_hedge}
+        failed: dict = {}
+        while pending:
+            done, pending = futures_wait(pending, return_when=FIRST_COMPLETED)
+            # Preferir o primário se ambos terminarem ao mesmo tempo
+            for fut in sorted(done, key=lambda f: f is not fut_primary):
+                resp = fut.result()
+                if not _ok(resp):
+                    failed[fut] = resp
+                    continue
+                with self._hedge_lock:
+                    self._hedge_stats["primary_wins" if fut is fut_primary else "hedge_wins"] += 1
+                for other in (fut_primary, fut_hedge):
+                    if other is fut:
+                        continue
+                    if other in failed or other in done:
+                        _descartar(models[other], other)
+                    else:
+                        # Pedido HTTP já em curso não é interrompível: o resultado é
+                        # descartado e o custo contabilizado quando terminar
+                        other.cancel()
+                        other.add_done_callback(lambda f, m=models[other]: _descartar(m, f))
+                if fut is fut_hedge:
+                    logger.info(f"[HEDGE] {hedge_model} respondeu primeiro (primário {primary_model} descartado)")
+                return resp, models[fut]
+
+        # Ambos falharam: devolver a falha do primário (o fallback do chamador decide)
+        _descartar(hedge_model, fut_hedge)
+        return failed[fut_primary], primary_model
 
     def chat_vision(
         self,
@@ -1446,6 +2004,8 @@ class UnifiedLLMClient:
         system_prompt: Optional[str] = None,
         enable_cache: bool = True,  # NOVO parâmetro
         timeout: Optional[int] = None,
+        stream_consumer: Optional[Any] = None,
+        response_schema: Optional[dict[str, Any]] = None,
     ) -> LLMResponse:
         """
         Chat com detecção automática de API + fallback + CACHING.
@@ -1454,7 +2014,47 @@ class UnifiedLLMClient:
         2. Se OpenAI, detecta se usa Responses API ou Chat API
         3. Tenta API apropriada (com cache se enable_cache=True)
         4. Se falhar E fallback habilitado → tenta OpenRouter
+
+        stream_consumer: via OpenRouter recebe os deltas em streaming; via
+        OpenAI directa recebe o texto completo de uma vez no fim.
+
+        response_schema: {"name", "schema"} enviado como response_format se o
+        modelo o suportar; se o provider o recusar, repete sem schema (o
+        chamador continua a ter a cadeia de reparação de JSON).
         """
+        kwargs = dict(
+            model=model, messages=messages, temperature=temperature, max_tokens=max_tokens,
+            system_prompt=system_prompt, enable_cache=enable_cache, timeout=timeout,
+            stream_consumer=stream_consumer,
+        )
+        if response_schema is None or not supports_structured_output(model):
+            return self._chat_dispatch(**kwargs)
+
+        response = self._chat_dispatch(**kwargs, response_schema=response_schema)
+        if not response.success and _schema_rejeitado(response.error):
+            from src.pipeline.structured_output import registar_rejeicao
+            registar_rejeicao(model)
+            logger.warning(
+                f"[STRUCTURED] {model} recusou response_format ({str(response.error)[:120]}) — "
+                f"a repetir sem schema"
+            )
+            return self._chat_dispatch(**kwargs)
+        response.estruturado = response.success
+        return response
+
+    def _chat_dispatch(
+        self,
+        model: str,
+        messages: list[dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = 16384,
+        system_prompt: Optional[str] = None,
+        enable_cache: bool = True,
+        timeout: Optional[int] = None,
+        stream_consumer: Optional[Any] = None,
+        response_schema: Optional[dict[str, Any]] = None,
+    ) -> LLMResponse:
+        """Escolhe a API (OpenAI directa / OpenRouter) com fallback e circuit breaker."""
         # Detectar se deve usar OpenAI directa
         use_openai_direct = should_use_openai_direct(model)
 
@@ -1484,6 +2084,8 @@ class UnifiedLLMClient:
                     system_prompt=system_prompt,
                     enable_cache=enable_cache,
                     timeout=timeout,
+                    stream_consumer=stream_consumer,
+                    response_schema=response_schema,
                 )
                 if response_fallback.success:
                     response_fallback.api_used = "openrouter (circuit-breaker)"
@@ -1504,6 +2106,7 @@ class UnifiedLLMClient:
                     system_prompt=system_prompt,
                     enable_cache=enable_cache,
                     timeout=timeout,
+                    response_schema=response_schema,
                 )
             else:
                 logger.info(f"🎯 Modelo OpenAI detectado: {model} (via Chat API)")
@@ -1517,10 +2120,14 @@ class UnifiedLLMClient:
                     system_prompt=system_prompt,
                     enable_cache=enable_cache,
                     timeout=timeout,
+                    response_schema=response_schema,
                 )
 
             # Se sucesso, retornar
             if response.success:
+                if stream_consumer is not None:
+                    stream_consumer.reset()
+                    stream_consumer.feed(response.content or "")
                 return response
 
             # FIX 2026-02-14: Detectar insufficient_quota → activar circuit breaker
@@ -1549,6 +2156,8 @@ class UnifiedLLMClient:
                     system_prompt=system_prompt,
                     enable_cache=enable_cache,
                     timeout=timeout,
+                    stream_consumer=stream_consumer,
+                    response_schema=response_schema,
                 )
 
                 # Marcar que usou fallback
@@ -1573,6 +2182,8 @@ class UnifiedLLMClient:
                 system_prompt=system_prompt,
                 enable_cache=enable_cache,
                 timeout=timeout,
+                stream_consumer=stream_consumer,
+                response_schema=response_schema,
             )
 
     def get_stats(self) -> dict[str, Any]:
@@ -1587,6 +2198,8 @@ class UnifiedLLMClient:
             "total_tokens": openai_stats["total_tokens"] + openrouter_stats["total_tokens"],
             "total_cache_hits": openai_stats["cache_hits"] + openrouter_stats["cache_hits"],
             "total_cache_misses": openai_stats["cache_misses"] + openrouter_stats["cache_misses"],
+            "governor": get_rate_governor().get_metrics(),
+            "hedging": dict(self._hedge_stats),
         }
 
     def test_connection(self) -> dict[str, Any]:
@@ -1676,6 +2289,8 @@ class UnifiedLLMClient:
 
     def close(self):
         """Fecha ambos os clientes."""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False, cancel_futures=True)
         self.openai_client.close()
         self.openrouter_client.close()
 
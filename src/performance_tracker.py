@@ -5,9 +5,11 @@ Guarda metricas granulares de cada chamada de IA e gera
 adaptive hints para melhorar prompts futuros.
 """
 
+import math
 import time
 import json
 import logging
+from collections import deque
 from typing import Optional
 from dataclasses import dataclass, field
 from threading import Lock
@@ -15,6 +17,7 @@ from threading import Lock
 logger = logging.getLogger(__name__)
 
 CACHE_TTL = 300  # 5 minutos
+LATENCY_WINDOW = 200  # amostras de latência em memória por modelo (p95 para hedging)
 
 
 @dataclass
@@ -118,6 +121,8 @@ class PerformanceTracker:
         self._cache_lock = Lock()
         self._cache_loaded_at: float = 0
         self._summary_cache: list[dict] = []
+        self._latencies: dict[str, deque] = {}
+        self._latency_p95_cache: dict[str, tuple[float, int]] = {}
 
     @classmethod
     def get_instance(cls, supabase_client=None):
@@ -196,6 +201,9 @@ class PerformanceTracker:
             if api_used:
                 row["api_used"] = api_used
 
+            if success and latency_ms:
+                self._observe_latency(model, latency_ms)
+
             result = self.sb.table("model_performance").insert(row).execute()
             record_id = result.data[0]["id"] if result.data else None
             if record_id:
@@ -332,6 +340,13 @@ class PerformanceTracker:
                 a["total_tokens"] += row.get("total_tokens") or 0
                 a["total_cost"] += float(row.get("cost_usd") or 0)
 
+            # p95 de latência por modelo (chamadas bem-sucedidas)
+            latencias: dict[str, list[float]] = {}
+            for row in rows:
+                if row["success"] and row.get("latency_ms"):
+                    latencias.setdefault(row["model"], []).append(float(row["latency_ms"]))
+            new_p95 = {m: (_percentil(v, 0.95), len(v)) for m, v in latencias.items()}
+
             # Construir hints
             new_cache: dict[tuple[str, str], ModelHints] = {}
             now = time.time()
@@ -376,6 +391,7 @@ class PerformanceTracker:
 
             with self._cache_lock:
                 self._hints_cache = new_cache
+                self._latency_p95_cache = new_p95
                 self._summary_cache = [
                     {
                         "model": model,
@@ -402,12 +418,45 @@ class PerformanceTracker:
         except Exception as e:
             logger.warning(f"[PERF] Failed to refresh cache: {e}")
 
+    # ============================================================
+    # LATÊNCIA (HEDGING)
+    # ============================================================
+
+    def _observe_latency(self, model: str, latency_ms: float):
+        with self._cache_lock:
+            amostras = self._latencies.get(model)
+            if amostras is None:
+                amostras = self._latencies[model] = deque(maxlen=LATENCY_WINDOW)
+            amostras.append(float(latency_ms))
+
+    def get_latency_p95(self, model: str, min_samples: int = 20) -> Optional[float]:
+        """
+        p95 de latência (ms) das chamadas bem-sucedidas do modelo.
+        Usa as amostras desta instância; se insuficientes, o agregado
+        dos últimos 30 dias (refresh_cache). None se não houver dados.
+        """
+        with self._cache_lock:
+            amostras = list(self._latencies.get(model, ()))
+            cached = self._latency_p95_cache.get(model)
+        if len(amostras) >= min_samples:
+            return _percentil(amostras, 0.95)
+        if cached and cached[1] >= min_samples:
+            return cached[0]
+        return None
+
     def get_summary(self) -> list[dict]:
         """Retorna o resumo em cache para o dashboard admin."""
         with self._cache_lock:
             return self._summary_cache
 
 
+def _percentil(valores: list[float], q: float) -> float:
+    """Percentil por nearest-rank."""
+    ordenados = sorted(valores)
+    idx = max(0, min(len(ordenados) - 1, math.ceil(q * len(ordenados)) - 1))
+    return ordenados[idx]
+
+
 # ============================================================
 # QUALITY GATE
 # ============================================================
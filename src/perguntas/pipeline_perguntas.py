@@ -19,6 +19,7 @@ from datetime import datetime, timezone
 from typing import Optional
 from dataclasses import dataclass
 
+from src.pipeline.artefact_store import get_artefact_store
 from src.utils.sanitize import sanitize_run_id
 
 logger = logging.getLogger(__name__)
@@ -93,12 +94,13 @@ def carregar_fase1_existente(run_id: str, output_dir: Path) -> str:
             "fase1_agregado_consolidado.md"
         ]
 
+        store = get_artefact_store()
         for nome in nomes_possiveis:
-            filepath = output_dir / nome
-            if filepath.exists():
+            # read_text resolve a variante física (.md ou .md.gz com ARTEFACT_COMPRESS)
+            texto = store.read_text(output_dir / nome)
+            if texto is not None:
                 logger.info(f"✓ Fase 1 encontrada (solta): {nome}")
-                with open(filepath, encoding='utf-8') as f:
-                    return f.read()
+                return texto
 
         raise FileNotFoundError(
             f"Fase 1 não encontrada em {output_dir}/\n"
@@ -119,12 +121,12 @@ def carregar_fase1_existente(run_id: str, output_dir: Path) -> str:
         "fase1_agregado_consolidado.md"
     ]
 
+    store = get_artefact_store()
     for nome in nomes_possiveis:
-        filepath = analise_dir / nome
-        if filepath.exists():
+        texto = store.read_text(analise_dir / nome)
+        if texto is not None:
             logger.info(f"✓ Fase 1 encontrada: {nome}")
-            with open(filepath, encoding='utf-8') as f:
-                return f.read()
+            return texto
 
     raise FileNotFoundError(
         f"Fase 1 não encontrada em {analise_dir}/\n"
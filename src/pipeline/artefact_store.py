@@ -0,0 +1,300 @@
+# ============================================================================
+# Pipeline v5.3 — Run Artefact Store
+# ============================================================================
+# Artefactos de uma run (outputs/<run_id>/*.json, *.md, histórico) escritos
+# por UMA thread de fundo:
+#   - JSON compacto (ou indentado com ARTEFACT_PRETTY=true)
+#   - listas de items em NDJSON (uma linha por item)
+#   - gzip opcional (ARTEFACT_COMPRESS=true → ficheiro.gz)
+#
+# Os nomes lógicos não mudam (ex.: "fase1_extractor_E1_items.json"); read_json
+# e exists resolvem a variante física (.json, .json.gz, .ndjson, .ndjson.gz)
+# e devolvem o objecto ainda em fila se a escrita estiver pendente.
+# Markdown derivado (ex.: RESUMO.md) pode ser entregue como callable e é
+# renderizado na thread de escrita; a UI indenta o JSON quando o exporta.
+# ============================================================================
+
+import atexit
+import gzip
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import date, datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+from src.utils.run_index import invalidar_tamanho
+
+logger = logging.getLogger(__name__)
+
+Conteudo = Union[Any, Callable[[], Any]]
+
+
+def _json_default(obj):
+    """Fallback para json.dumps — converte tipos não-serializáveis."""
+    if isinstance(obj, (bytes, bytearray)):
+        return f"<{len(obj)} bytes>"
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if isinstance(obj, Enum):
+        return obj.value
+    if hasattr(obj, "__dict__"):
+        return {k: v for k, v in obj.__dict__.items() if not isinstance(v, (bytes, bytearray))}
+    return str(obj)
+
+
+def nome_logico(nome: str) -> str:
+    """Nome lógico de um ficheiro físico (sem .gz, .ndjson → .json)."""
+    if nome.endswith(".gz"):
+        nome = nome[:-3]
+    if nome.endswith(".ndjson"):
+        nome = nome[:-len(".ndjson")] + ".json"
+    return nome
+
+
+def _candidatos(path: Path) -> list[Path]:
+    ndjson = path.with_suffix(".ndjson")
+    return [path, path.with_name(path.name + ".gz"), ndjson, ndjson.with_name(ndjson.name + ".gz")]
+
+
+class ArtefactStore:
+    """Escritor de artefactos de run com uma única thread de fundo (FIFO)."""
+
+    EXIT_FLUSH_TIMEOUT = 30.0  # segundos à espera da fila no atexit
+
+    def __init__(self, pretty: bool = False, compress: bool = False, synchronous: bool = False):
+        self.pretty = pretty
+        self.compress = compress
+        self._synchronous = synchronous
+        self._queue: queue.Queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._pending: dict[str, tuple[int, str, Any]] = {}  # path lógico → (seq, tipo, conteúdo)
+        self._pending_dirs: dict[str, int] = {}
+        self._seq = 0
+        self._thread: Optional[threading.Thread] = None
+        self._metrics = {"files": 0, "bytes": 0, "errors": 0, "encode_ms_total": 0.0, "encode_ms_max": 0.0}
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+
+    def write_json(self, path: Path, obj: Conteudo, extra_paths: tuple = ()):
+        """
+        Enfileira um JSON. obj pode ser um callable (renderizado na thread de fundo).
+        extra_paths recebem os mesmos bytes, sem compressão (serializa uma só vez).
+        O chamador não deve alterar obj depois de o entregar.
+        """
+        self._submit(Path(path), "json", obj, tuple(Path(p) for p in extra_paths))
+
+    def write_items(self, path: Path, items: Conteudo):
+        """Enfileira uma lista de items, gravada em NDJSON (path.ndjson)."""
+        self._submit(Path(path), "items", items, ())
+
+    def write_text(self, path: Path, texto: Conteudo):
+        """Enfileira texto (markdown, logs). texto pode ser um callable."""
+        self._submit(Path(path), "text", texto, ())
+
+    def _submit(self, path: Path, tipo: str, conteudo: Any, extra: tuple):
+        with self._cond:
+            self._seq += 1
+            seq = self._seq
+            self._pending[str(path)] = (seq, tipo, conteudo)
+            for p in (path,) + extra:
+                d = str(p.parent)
+                self._pending_dirs[d] = self._pending_dirs.get(d, 0) + 1
+        job = (seq, path, tipo, conteudo, extra)
+        if self._synchronous:
+            self._run(job)
+            return
+        self._ensure_thread()
+        self._queue.put(job)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._cond:
+                if self._thread is None or not self._thread.is_alive():
+                    if self._thread is None:
+                        # Thread daemon: na saída normal do interpretador, escrever o que está em fila
+                        atexit.register(self._flush_at_exit)
+                    self._thread = threading.Thread(target=self._loop, name="artefact-writer", daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        seq, path, tipo, conteudo, extra = job
+        escritos = 0
+        try:
+            inicio = time.perf_counter()
+            raw = self._encode(tipo, conteudo)
+            dados = gzip.compress(raw, compresslevel=6) if self.compress else raw
+            ms = (time.perf_counter() - inicio) * 1000
+            destinos = [(self._destino(path, tipo), dados)] + [(p, raw) for p in extra]
+            for alvo, conteudo_bytes in destinos:
+                alvo.parent.mkdir(parents=True, exist_ok=True)
+                tmp = alvo.with_name(alvo.name + ".tmp")
+                tmp.write_bytes(conteudo_bytes)
+                tmp.replace(alvo)
+                invalidar_tamanho(alvo)
+                escritos += len(conteudo_bytes)
+            with self._cond:
+                self._metrics["files"] += 1 + len(extra)
+                self._metrics["bytes"] += escritos
+                self._metrics["encode_ms_total"] += ms
+                self._metrics["encode_ms_max"] = max(self._metrics["encode_ms_max"], ms)
+        except Exception as e:
+            with self._cond:
+                self._metrics["errors"] += 1
+            logger.warning(f"[ARTEFACT] Falha ao escrever {path.name}: {e}")
+        finally:
+            with self._cond:
+                atual = self._pending.get(str(path))
+                if atual is not None and atual[0] == seq:
+                    del self._pending[str(path)]
+                for p in (path,) + extra:
+                    d = str(p.parent)
+                    self._pending_dirs[d] -= 1
+                    if self._pending_dirs[d] <= 0:
+                        del self._pending_dirs[d]
+                self._cond.notify_all()
+
+    def _destino(self, path: Path, tipo: str) -> Path:
+        if tipo == "items":
+            path = path.with_suffix(".ndjson")
+        if self.compress:
+            path = path.with_name(path.name + ".gz")
+        return path
+
+    def _encode(self, tipo: str, conteudo: Any) -> bytes:
+        if callable(conteudo):
+            conteudo = conteudo()
+        if tipo == "text":
+            dados = conteudo.encode("utf-8")
+        elif tipo == "items":
+            dados = "".join(
+                json.dumps(item, ensure_ascii=False, separators=(",", ":"), default=_json_default) + "\n"
+                for item in conteudo
+            ).encode("utf-8")
+        elif self.pretty:
+            dados = json.dumps(conteudo, ensure_ascii=False, indent=2, default=_json_default).encode("utf-8")
+        else:
+            dados = json.dumps(conteudo, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+        return dados
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def _pendente(self, path: Path):
+        with self._cond:
+            atual = self._pending.get(str(path))
+        if atual is None:
+            return None
+        _, tipo, conteudo = atual
+        return conteudo() if callable(conteudo) else conteudo
+
+    def exists(self, path: Path) -> bool:
+        path = Path(path)
+        with self._cond:
+            if str(path) in self._pending:
+                return True
+        return any(p.exists() for p in _candidatos(path))
+
+    def read_bytes(self, path: Path) -> Optional[tuple[bytes, Path]]:
+        """Bytes descomprimidos da variante física existente (None se não existir)."""
+        for p in _candidatos(Path(path)):
+            if p.exists():
+                dados = p.read_bytes()
+                if p.name.endswith(".gz"):
+                    dados = gzip.decompress(dados)
+                return dados, p
+        return None
+
+    def read_json(self, path: Path) -> Optional[Any]:
+        """Carrega um artefacto JSON/NDJSON pelo nome lógico (None se não existir)."""
+        pendente = self._pendente(Path(path))
+        if pendente is not None:
+            return pendente
+        lido = self.read_bytes(path)
+        if lido is None:
+            return None
+        dados, fisico = lido
+        texto = dados.decode("utf-8")
+        if ".ndjson" in fisico.name:
+            return [json.loads(linha) for linha in texto.splitlines() if linha.strip()]
+        return json.loads(texto)
+
+    def read_text(self, path: Path) -> Optional[str]:
+        pendente = self._pendente(Path(path))
+        if pendente is not None:
+            return pendente
+        lido = self.read_bytes(path)
+        return lido[0].decode("utf-8") if lido else None
+
+    # ------------------------------------------------------------------
+    # Sincronização
+    # ------------------------------------------------------------------
+
+    def flush(self, directory: Optional[Path] = None, timeout: Optional[float] = None) -> bool:
+        """Espera pelas escritas pendentes (de um directório ou todas)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        chave = str(Path(directory)) if directory is not None else None
+        with self._cond:
+            while True:
+                pendente = bool(self._pending_dirs) if chave is None else chave in self._pending_dirs
+                if not pendente:
+                    return True
+                restante = None if deadline is None else deadline - time.monotonic()
+                if restante is not None and restante <= 0:
+                    logger.warning(f"[ARTEFACT] flush expirou com escritas pendentes ({chave or 'todas'})")
+                    return False
+                self._cond.wait(timeout=restante)
+
+    def _flush_at_exit(self):
+        if not self.flush(timeout=self.EXIT_FLUSH_TIMEOUT):
+            logger.warning(f"[ARTEFACT] Saída com {self.get_metrics()['pending']} escritas por gravar")
+
+    def get_metrics(self) -> dict:
+        with self._cond:
+            m = dict(self._metrics)
+            pendentes = sum(self._pending_dirs.values())
+        return {
+            "files": m["files"],
+            "bytes": m["bytes"],
+            "errors": m["errors"],
+            "pending": pendentes,
+            "encode_ms_avg": round(m["encode_ms_total"] / max(m["files"], 1), 2),
+            "encode_ms_max": round(m["encode_ms_max"], 2),
+            "compress": self.compress,
+            "pretty": self.pretty,
+        }
+
+
+_store: Optional[ArtefactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_artefact_store() -> ArtefactStore:
+    """Retorna o store de artefactos do processo (singleton)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from src.config import ARTEFACT_ASYNC, ARTEFACT_COMPRESS, ARTEFACT_PRETTY
+                _store = ArtefactStore(
+                    pretty=ARTEFACT_PRETTY,
+                    compress=ARTEFACT_COMPRESS,
+                    synchronous=not ARTEFACT_ASYNC,
+                )
+    return _store
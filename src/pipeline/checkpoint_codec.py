@@ -0,0 +1,310 @@
+# ============================================================================
+# Pipeline v5.3 — Checkpoint Codec (compressão + dedup + resume lazy)
+# ============================================================================
+# Formato dos payloads em analysis_checkpoints (phase_data / pipeline_context):
+#
+#   {"_cp": 1, "codec": "zstd"|"gzip"|"none",
+#    "payload": <base64 do JSON comprimido, strings grandes → {"$blob": h}>,
+#    "blobs":   {h: <base64 da string comprimida>},   # blobs novos nesta fase
+#    "refs":    {h: fase_num}}                       # blobs guardados noutra fase
+#
+# Strings >= CHECKPOINT_BLOB_MIN_CHARS são endereçadas pelo hash do conteúdo:
+# um agregado repetido em várias fases (ou no pipeline_context) é gravado uma
+# só vez. Payloads antigos (JSON simples) continuam a ser lidos tal como estão.
+#
+# No resume, LazyCheckpoints só descarrega uma fase quando ela é acedida.
+# ============================================================================
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_VERSION = 1
+MARCA_BLOB = "$blob"
+CODECS = ("zstd", "gzip", "none")
+
+
+def resolver_codec(nome: str) -> str:
+    """Codec efectivo: zstd só se o pacote zstandard estiver instalado (senão gzip)."""
+    nome = (nome or "gzip").lower()
+    if nome not in CODECS:
+        logger.warning(f"[CHECKPOINT] Codec desconhecido '{nome}' — a usar gzip")
+        return "gzip"
+    if nome == "zstd" and zstandard is None:
+        return "gzip"
+    return nome
+
+
+def _comprimir(dados: bytes, codec: str) -> str:
+    if codec == "zstd":
+        dados = zstandard.ZstdCompressor(level=6).compress(dados)
+    elif codec == "gzip":
+        dados = gzip.compress(dados, compresslevel=6)
+    return base64.b64encode(dados).decode("ascii")
+
+
+def _descomprimir(texto: str, codec: str) -> bytes:
+    dados = base64.b64decode(texto)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Checkpoint comprimido com zstd mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(dados)
+    if codec == "gzip":
+        return gzip.decompress(dados)
+    return dados
+
+
+def hash_conteudo(texto: str) -> str:
+    return hashlib.blake2b(texto.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def is_encoded(valor: Any) -> bool:
+    return isinstance(valor, dict) and valor.get("_cp") == CODEC_VERSION
+
+
+@dataclass
+class PayloadPreparado:
+    """Payload serializado uma vez: corpo JSON (strings grandes → {"$blob": h}) + textos dos blobs."""
+    corpo: bytes
+    blobs: dict[str, str]
+
+    @property
+    def tamanho(self) -> int:
+        return len(self.corpo) + sum(len(t) for t in self.blobs.values())
+
+
+def preparar_payload(obj: Any, min_chars: int = 4096) -> PayloadPreparado:
+    """
+    Troca as strings >= min_chars por referências ao hash e serializa o resto.
+
+    Não depende dos blobs já persistidos: corre na thread do pipeline, e o
+    writer só decide depois (envelope_payload) o que vai inline e o que é ref.
+    """
+    blobs: dict[str, str] = {}
+
+    def trocar(v):
+        if isinstance(v, str):
+            if len(v) < min_chars:
+                return v
+            h = hash_conteudo(v)
+            blobs.setdefault(h, v)
+            return {MARCA_BLOB: h}
+        if isinstance(v, dict):
+            return {k: trocar(x) for k, x in v.items()}
+        if isinstance(v, (list, tuple)):
+            return [trocar(x) for x in v]
+        return v
+
+    corpo = json.dumps(trocar(obj), ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    return PayloadPreparado(corpo, blobs)
+
+
+def envelope_payload(
+    preparado: PayloadPreparado,
+    fase_num: int,
+    known: dict[str, int],
+    codec: str = "gzip",
+) -> tuple[dict, dict[str, int]]:
+    """
+    Envelope de um payload já preparado (comprime; blobs conhecidos viram refs).
+
+    Args:
+        preparado: resultado de preparar_payload
+        fase_num: fase onde os blobs novos ficam guardados
+        known: hash → fase dos blobs já persistidos desta análise (só leitura)
+        codec: "zstd", "gzip" ou "none" (já resolvido)
+
+    Returns:
+        (envelope, novos) — novos = hash → fase_num dos blobs introduzidos aqui;
+        o chamador só os junta a known depois de a escrita ter sucesso.
+    """
+    blobs: dict[str, str] = {}
+    refs: dict[str, int] = {}
+    novos: dict[str, int] = {}
+    for h, texto in preparado.blobs.items():
+        if h in known:
+            refs[h] = known[h]
+        else:
+            blobs[h] = _comprimir(texto.encode("utf-8", "surrogatepass"), codec)
+            novos[h] = fase_num
+    envelope = {
+        "_cp": CODEC_VERSION,
+        "codec": codec,
+        "payload": _comprimir(preparado.corpo, codec),
+        "blobs": blobs,
+        "refs": refs,
+    }
+    return envelope, novos
+
+
+def tamanho_envelope(envelope: dict) -> int:
+    """Bytes guardados de um envelope (payload + blobs, em base64)."""
+    return len(envelope["payload"]) + sum(len(b) for b in envelope["blobs"].values())
+
+
+def encode_payload(
+    obj: Any,
+    fase_num: int,
+    known: dict[str, int],
+    codec: str = "gzip",
+    min_chars: int = 4096,
+) -> tuple[dict, dict[str, int]]:
+    """
+    Codifica um payload de checkpoint (preparar_payload + envelope_payload).
+
+    Args:
+        obj: phase_data ou pipeline_context (JSON-serializável)
+        fase_num: fase onde os blobs novos ficam guardados
+        known: hash → fase dos blobs já persistidos desta análise (só leitura)
+        codec: "zstd", "gzip" ou "none" (já resolvido)
+        min_chars: tamanho mínimo de uma string para ser tratada como blob
+
+    Returns:
+        (envelope, novos) — ver envelope_payload.
+    """
+    return envelope_payload(preparar_payload(obj, min_chars), fase_num, known, codec)
+
+
+def extrair_blob(envelope: Any, h: str) -> Optional[str]:
+    """Texto de um blob guardado neste envelope (None se não estiver aqui)."""
+    if not is_encoded(envelope):
+        return None
+    dados = (envelope.get("blobs") or {}).get(h)
+    if dados is None:
+        return None
+    return _descomprimir(dados, envelope["codec"]).decode("utf-8", "surrogatepass")
+
+
+def decode_payload(envelope: Any, resolver: Optional[Callable[[str, int], str]] = None) -> Any:
+    """
+    Descodifica um payload. JSON legado (sem envelope) é devolvido tal como está.
+
+    resolver(hash, fase_num) devolve blobs guardados noutras fases.
+    """
+    if not is_encoded(envelope):
+        return envelope
+
+    refs = envelope.get("refs") or {}
+    cache: dict[str, str] = {}
+
+    def blob(h: str) -> str:
+        if h not in cache:
+            texto = extrair_blob(envelope, h)
+            if texto is None:
+                if h not in refs or resolver is None:
+                    raise KeyError(f"Blob {h} em falta no checkpoint")
+                texto = resolver(h, int(refs[h]))
+            cache[h] = texto
+        return cache[h]
+
+    def restaurar(v):
+        if isinstance(v, dict):
+            if len(v) == 1 and MARCA_BLOB in v:
+                return blob(v[MARCA_BLOB])
+            return {k: restaurar(x) for k, x in v.items()}
+        if isinstance(v, list):
+            return [restaurar(x) for x in v]
+        return v
+
+    corpo = json.loads(_descomprimir(envelope["payload"], envelope["codec"]))
+    return restaurar(corpo)
+
+
+def _tamanho_coluna(valor: Any) -> int:
+    """
+    Bytes descarregados de uma coluna: comprimento dos campos base64 do envelope.
+
+    Payloads legados (JSON simples) não são medidos — re-serializá-los só para
+    a métrica custaria o que o resume lazy poupa.
+    """
+    return tamanho_envelope(valor) if is_encoded(valor) else 0
+
+
+class LazyCheckpoints(Mapping):
+    """
+    Checkpoints de uma análise, descarregados do Supabase fase a fase.
+
+    Comporta-se como o dict {fase_num: phase_data} que o resume espera;
+    cada fase só é lida (e descomprimida) quando acedida, e cada blob
+    partilhado só é descarregado uma vez.
+    """
+
+    TABELA = "analysis_checkpoints"
+
+    def __init__(self, sb, analysis_id: str):
+        self._sb = sb
+        self._analysis_id = analysis_id
+        self._rows: dict[int, dict] = {}  # fase → envelopes (comprimidos)
+        self._blobs: dict[str, str] = {}
+        self.rows_fetched = 0
+        self.bytes_fetched = 0  # só envelopes comprimidos (ver _tamanho_coluna)
+        resp = sb.table(self.TABELA).select("fase_num").eq(
+            "analysis_id", analysis_id
+        ).order("fase_num").execute()
+        self._fases = [int(r["fase_num"]) for r in (resp.data or [])]
+
+    def _row(self, fase_num: int) -> dict:
+        if fase_num not in self._rows:
+            resp = self._sb.table(self.TABELA).select("phase_data, pipeline_context").eq(
+                "analysis_id", self._analysis_id
+            ).eq("fase_num", fase_num).execute()
+            row = (resp.data or [{}])[0]
+            self.rows_fetched += 1
+            self.bytes_fetched += (_tamanho_coluna(row.get("phase_data"))
+                                   + _tamanho_coluna(row.get("pipeline_context")))
+            self._rows[fase_num] = row
+        return self._rows[fase_num]
+
+    def _resolver(self, h: str, fase_num: int) -> str:
+        if h not in self._blobs:
+            row = self._row(fase_num)
+            texto = extrair_blob(row.get("phase_data"), h)
+            if texto is None:
+                texto = extrair_blob(row.get("pipeline_context"), h)
+            if texto is None:
+                raise KeyError(f"Blob {h} não encontrado na fase {fase_num}")
+            self._blobs[h] = texto
+        return self._blobs[h]
+
+    def __getitem__(self, fase_num: int) -> dict:
+        if fase_num not in self._fases:
+            raise KeyError(fase_num)
+        return decode_payload(self._row(fase_num).get("phase_data"), self._resolver) or {}
+
+    def __contains__(self, fase_num) -> bool:
+        return fase_num in self._fases  # sem descarregar a fase
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._fases)
+
+    def __len__(self) -> int:
+        return len(self._fases)
+
+    @property
+    def last_phase(self) -> int:
+        return max(self._fases) if self._fases else 0
+
+    def pipeline_context(self) -> dict:
+        """pipeline_context agregado de todas as fases (na prática, só a fase 1 o tem)."""
+        resp = self._sb.table(self.TABELA).select("fase_num, pipeline_context").eq(
+            "analysis_id", self._analysis_id
+        ).order("fase_num").execute()
+        contexto: dict = {}
+        for row in resp.data or []:
+            valor = row.get("pipeline_context")
+            if valor:
+                self.bytes_fetched += _tamanho_coluna(valor)
+                contexto.update(decode_payload(valor, self._resolver) or {})
+        return contexto
@@ -0,0 +1,361 @@
+# ============================================================================
+# Pipeline v5.3 — Checkpoint Writer (write-behind)
+# ============================================================================
+# Persiste checkpoints de fase FORA da thread do pipeline:
+#   1. ficheiro local (JSON compacto, opcionalmente gzip)
+#   2. blocked_credits.fase_atual
+#   3. upsert em analysis_checkpoints (dados para resume)
+#
+# O payload é serializado UMA vez, na thread do pipeline (snapshot
+# imutável, já com as strings grandes separadas em blobs); o writer só
+# comprime e decide que blobs são referências a fases anteriores. A entrega
+# é ordenada por análise (fase N nunca ultrapassa a fase N-1) e análises
+# diferentes são persistidas em paralelo.
+# flush() é chamado no fim de cada run e no shutdown.
+#
+# O payload remoto é gravado comprimido e com blobs deduplicados por hash
+# entre fases (ver checkpoint_codec).
+# ============================================================================
+
+import atexit
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from src.pipeline.checkpoint_codec import (
+    PayloadPreparado, envelope_payload, preparar_payload, resolver_codec, tamanho_envelope,
+)
+from src.utils.run_index import invalidar_tamanho
+
+logger = logging.getLogger(__name__)
+
+MAX_ANALISES_INDEXADAS = 256  # índices de blobs (hash → fase) mantidos em memória
+
+
+@dataclass
+class PayloadRemoto:
+    """phase_data / pipeline_context de um checkpoint, serializados (para analysis_checkpoints)."""
+    phase_data: PayloadPreparado
+    pipeline_context: Optional[PayloadPreparado] = None
+
+    @property
+    def tamanho(self) -> int:
+        return self.phase_data.tamanho + (self.pipeline_context.tamanho if self.pipeline_context else 0)
+
+
+@dataclass
+class CheckpointJob:
+    """Checkpoint de uma fase, já serializado."""
+    analysis_id: Optional[str]
+    run_id: Optional[str]
+    user_id: Optional[str]
+    fase_num: int
+    fase_nome: str
+    local_path: Optional[Path]
+    local_bytes: bytes
+    remote: Optional[PayloadRemoto]
+    enqueued_at: float = 0.0
+
+    @property
+    def key(self) -> str:
+        return self.analysis_id or self.run_id or "sem-id"
+
+
+def _default_supabase():
+    from auth_service import get_supabase_admin
+    return get_supabase_admin()
+
+
+class CheckpointWriter:
+    """
+    Fila write-behind de checkpoints com entrega ordenada por análise.
+
+    Cada análise tem uma deque própria; no máximo um worker drena cada
+    deque de cada vez (ordem garantida), e o pool atende várias análises.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        supabase_factory: Callable[[], Any] = _default_supabase,
+        synchronous: bool = False,
+        codec: str = "gzip",
+        blob_min_chars: int = 4096,
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="checkpoint")
+        self._supabase_factory = supabase_factory
+        self._synchronous = synchronous
+        self._cond = threading.Condition()
+        self._queues: dict[str, deque] = {}
+        self._active: set[str] = set()
+        self._closed = False
+        self._codec = resolver_codec(codec)
+        self._blob_min_chars = blob_min_chars
+        # analysis_id → {hash: fase_num} dos blobs já persistidos
+        self._blob_index: OrderedDict[str, dict[str, int]] = OrderedDict()
+        self._metrics = {
+            "submitted": 0, "persisted": 0, "failed_steps": 0, "bytes": 0,
+            "serialize_ms_total": 0.0, "serialize_ms_max": 0.0,
+            "lag_ms_total": 0.0, "lag_ms_max": 0.0,
+            "write_ms_total": 0.0, "write_ms_max": 0.0,
+            "remote_raw_bytes": 0, "remote_stored_bytes": 0, "blobs_deduped": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def serialize(
+        self,
+        checkpoint: dict,
+        phase_data: Optional[dict],
+        pipeline_context: Optional[dict],
+        compress_local: bool = False,
+    ) -> tuple[bytes, Optional[PayloadRemoto]]:
+        """Serializa o checkpoint uma única vez (compacto). Retorna (ficheiro local, payload remoto)."""
+        inicio = time.perf_counter()
+        local = json.dumps(checkpoint, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        if compress_local:
+            local = gzip.compress(local, compresslevel=6)
+        remote = None
+        if phase_data is not None:
+            remote = PayloadRemoto(
+                preparar_payload(phase_data, self._blob_min_chars),
+                preparar_payload(pipeline_context, self._blob_min_chars) if pipeline_context else None,
+            )
+        ms = (time.perf_counter() - inicio) * 1000
+        with self._cond:
+            self._metrics["serialize_ms_total"] += ms
+            self._metrics["serialize_ms_max"] = max(self._metrics["serialize_ms_max"], ms)
+        return local, remote
+
+    def submit(self, job: CheckpointJob):
+        """Enfileira o checkpoint; retorna de imediato (salvo modo síncrono)."""
+        job.enqueued_at = time.monotonic()
+        with self._cond:
+            self._metrics["submitted"] += 1
+            self._metrics["bytes"] += len(job.local_bytes) + (job.remote.tamanho if job.remote else 0)
+            if self._synchronous or self._closed:
+                sincrono = True
+            else:
+                sincrono = False
+                self._queues.setdefault(job.key, deque()).append(job)
+                if job.key not in self._active:
+                    self._active.add(job.key)
+                    self._executor.submit(self._drain, job.key)
+        if sincrono:
+            self._persist(job)
+
+    def flush(self, analysis_id: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Espera que os checkpoints pendentes (de uma análise ou de todas)
+        estejam persistidos. Retorna False se o timeout expirar.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if analysis_id is None:
+                    pendente = bool(self._active)
+                else:
+                    pendente = analysis_id in self._active
+                if not pendente:
+                    return True
+                restante = None if deadline is None else deadline - time.monotonic()
+                if restante is not None and restante <= 0:
+                    logger.warning(f"[CHECKPOINT] flush expirou com checkpoints pendentes ({analysis_id or 'todas'})")
+                    return False
+                self._cond.wait(timeout=restante)
+
+    def shutdown(self, timeout: Optional[float] = 30.0):
+        """Flush final; novos checkpoints passam a ser escritos de forma síncrona."""
+        self.flush(timeout=timeout)
+        with self._cond:
+            self._closed = True
+        self._executor.shutdown(wait=False)
+
+    def get_metrics(self) -> dict:
+        """Latência e volume dos checkpoints (lag = enfileirado → persistido)."""
+        with self._cond:
+            m = dict(self._metrics)
+            pendentes = sum(len(q) for q in self._queues.values())
+        n = max(m["persisted"], 1)
+        return {
+            "submitted": m["submitted"],
+            "persisted": m["persisted"],
+            "pending": pendentes,
+            "failed_steps": m["failed_steps"],
+            "bytes": m["bytes"],
+            "serialize_ms_avg": round(m["serialize_ms_total"] / max(m["submitted"], 1), 2),
+            "serialize_ms_max": round(m["serialize_ms_max"], 2),
+            "lag_ms_avg": round(m["lag_ms_total"] / n, 1),
+            "lag_ms_max": round(m["lag_ms_max"], 1),
+            "write_ms_avg": round(m["write_ms_total"] / n, 1),
+            "write_ms_max": round(m["write_ms_max"], 1),
+            "codec": self._codec,
+            "remote_raw_bytes": m["remote_raw_bytes"],
+            "remote_stored_bytes": m["remote_stored_bytes"],
+            "blobs_deduped": m["blobs_deduped"],
+        }
+
+    def forget(self, analysis_id: str):
+        """Descarta o índice de blobs de uma análise (checkpoints apagados)."""
+        with self._cond:
+            self._blob_index.pop(analysis_id, None)
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def _drain(self, key: str):
+        while True:
+            with self._cond:
+                fila = self._queues.get(key)
+                if not fila:
+                    self._queues.pop(key, None)
+                    self._active.discard(key)
+                    self._cond.notify_all()
+                    return
+                job = fila.popleft()
+            self._persist(job)
+
+    def _persist(self, job: CheckpointJob):
+        inicio = time.monotonic()
+        falhas = 0
+
+        # 1. Ficheiro local
+        if job.local_path is not None:
+            try:
+                tmp = job.local_path.with_name(job.local_path.name + ".tmp")
+                tmp.write_bytes(job.local_bytes)
+                tmp.replace(job.local_path)
+                invalidar_tamanho(job.local_path)
+            except Exception as e:
+                falhas += 1
+                logger.warning(f"[CHECKPOINT] Erro ao salvar ficheiro: {e}")
+
+        if job.analysis_id:
+            sb = None
+            try:
+                sb = self._supabase_factory()
+            except Exception as e:
+                falhas += 1
+                logger.debug(f"[CHECKPOINT] Supabase indisponível (non-blocking): {e}")
+
+            # 2. blocked_credits.fase_atual
+            if sb is not None:
+                try:
+                    sb.table("blocked_credits").update({
+                        "fase_atual": job.fase_num,
+                    }).eq("analysis_id", job.analysis_id).eq("status", "blocked").execute()
+                    logger.info(
+                        f"[CHECKPOINT] Fase {job.fase_num} ({job.fase_nome}) salva — "
+                        f"analysis={job.analysis_id[:8]}..."
+                    )
+                except Exception as e:
+                    # Graceful: coluna pode não existir ainda na tabela
+                    falhas += 1
+                    logger.debug(f"[CHECKPOINT] Supabase update falhou (non-blocking): {e}")
+
+            # 3. analysis_checkpoints (dados para resume)
+            if sb is not None and job.remote is not None:
+                try:
+                    phase_data, pipeline_context, novos, refs = self._encode(job, job.remote)
+                    stored = tamanho_envelope(phase_data)
+                    if pipeline_context is not None:
+                        stored += tamanho_envelope(pipeline_context)
+                    sb.table("analysis_checkpoints").upsert(
+                        {
+                            "analysis_id": job.analysis_id,
+                            "user_id": job.user_id,
+                            "fase_num": job.fase_num,
+                            "fase_nome": job.fase_nome,
+                            "phase_data": phase_data,
+                            "pipeline_context": pipeline_context,
+                        },
+                        on_conflict="analysis_id,fase_num",
+                    ).execute()
+                    with self._cond:
+                        indice = self._blob_index.setdefault(job.analysis_id, {})
+                        # A linha desta fase foi substituída: blobs antigos dela deixam de existir
+                        for h in [h for h, f in indice.items() if f >= job.fase_num]:
+                            del indice[h]
+                        indice.update(novos)
+                        self._metrics["remote_raw_bytes"] += job.remote.tamanho
+                        self._metrics["remote_stored_bytes"] += stored
+                        self._metrics["blobs_deduped"] += refs
+                    logger.info(
+                        f"[CHECKPOINT] Fase {job.fase_num} dados reais ({job.remote.tamanho:,} → "
+                        f"{stored:,} bytes, {self._codec}, {refs} blob(s) reutilizado(s)) "
+                        f"salvos no Supabase — analysis={job.analysis_id[:8]}..."
+                    )
+                except Exception as e:
+                    falhas += 1
+                    logger.warning(
+                        f"[CHECKPOINT] Supabase upsert (analysis_checkpoints) falhou "
+                        f"(non-blocking): {e}"
+                    )
+
+        fim = time.monotonic()
+        write_ms = (fim - inicio) * 1000
+        lag_ms = (fim - job.enqueued_at) * 1000
+        with self._cond:
+            m = self._metrics
+            m["persisted"] += 1
+            m["failed_steps"] += falhas
+            m["write_ms_total"] += write_ms
+            m["write_ms_max"] = max(m["write_ms_max"], write_ms)
+            m["lag_ms_total"] += lag_ms
+            m["lag_ms_max"] = max(m["lag_ms_max"], lag_ms)
+
+
+    def _encode(self, job: CheckpointJob, remoto: PayloadRemoto) -> tuple[dict, Optional[dict], dict, int]:
+        """Comprime phase_data/pipeline_context reutilizando blobs de fases anteriores."""
+        with self._cond:
+            indice = self._blob_index.setdefault(job.analysis_id, {})
+            self._blob_index.move_to_end(job.analysis_id)
+            while len(self._blob_index) > MAX_ANALISES_INDEXADAS:
+                self._blob_index.popitem(last=False)
+            # Só blobs de fases anteriores: a linha desta fase vai ser substituída
+            known = {h: f for h, f in indice.items() if f < job.fase_num}
+
+        phase_data, novos = envelope_payload(remoto.phase_data, job.fase_num, known, self._codec)
+        refs = len(phase_data["refs"])
+        pipeline_context = None
+        if remoto.pipeline_context is not None:
+            pipeline_context, novos_ctx = envelope_payload(
+                remoto.pipeline_context, job.fase_num, {**known, **novos}, self._codec,
+            )
+            novos.update(novos_ctx)
+            refs += len(pipeline_context["refs"])
+        return phase_data, pipeline_context, novos, refs
+
+
+_writer: Optional[CheckpointWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_checkpoint_writer() -> CheckpointWriter:
+    """Retorna o writer de checkpoints do processo (singleton, flush no exit)."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                from src.config import (
+                    CHECKPOINT_ASYNC, CHECKPOINT_BLOB_MIN_CHARS, CHECKPOINT_CODEC,
+                    CHECKPOINT_WRITER_WORKERS,
+                )
+                _writer = CheckpointWriter(
+                    max_workers=CHECKPOINT_WRITER_WORKERS,
+                    synchronous=not CHECKPOINT_ASYNC,
+                    codec=CHECKPOINT_CODEC,
+                    blob_min_chars=CHECKPOINT_BLOB_MIN_CHARS,
+                )
+                atexit.register(_writer.shutdown, 10.0)
+    return _writer
@@ -0,0 +1,292 @@
+"""
+EVIDENCE STORE — spans de EvidenceItem em colunas + índice de intervalos
+═══════════════════════════════════════════════════════════════════════════
+
+Um único armazém partilhado pelos consumidores que antes reconstruíam as suas
+próprias estruturas sobre todos os items/spans (agregação e detecção de
+conflitos, cobertura, páginas, consolidação M7B).
+
+Cada span ocupa uma linha em arrays compactos (start, end, page, item,
+extractor, tipo, doc); strings repetidas (extractor_id, doc_id, item_type)
+ficam numa tabela de códigos. O IntervalIndex é uma árvore de intervalos
+implícita sobre o array ordenado por start (max_end por nó, sem objectos por
+nó), construída só quando há consultas de range.
+
+Uso:
+    store = EvidenceStore.from_items(union_items)
+    store.items_overlapping(1000, 2000)
+    store.span_counts_by_extractor()
+    mapper.get_coverage_by_pages(store)
+"""
+
+from array import array
+from typing import Iterable, Optional
+
+from src.pipeline.schema_unified import EvidenceItem
+
+
+# ============================================================================
+# ÍNDICE DE INTERVALOS
+# ============================================================================
+
+class IntervalIndex:
+    """
+    Árvore de intervalos estática (layout implícito, como no cgranges).
+
+    Os intervalos ficam ordenados por start; o nó i de nível k guarda em
+    _max_end o maior end da sua sub-árvore, o que permite podar ramos inteiros.
+    Intervalos semi-abertos [start, end); consultas devolvem os ids por ordem
+    de start.
+    """
+
+    __slots__ = ("starts", "ends", "ids", "_max_end", "_raiz")
+
+    def __init__(self, intervals: Iterable[tuple[int, int, int]]):
+        """intervals: (start, end, id)."""
+        ordenados = sorted(intervals)
+        self.starts = array("q", (s for s, _, _ in ordenados))
+        self.ends = array("q", (e for _, e, _ in ordenados))
+        self.ids = array("q", (i for _, _, i in ordenados))
+        self._max_end = array("q", self.ends)
+        self._raiz = self._preparar()
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _preparar(self) -> int:
+        n = len(self.starts)
+        if n == 0:
+            return -1
+        ends, mx = self.ends, self._max_end
+        last_i, last = 0, 0
+        for i in range(0, n, 2):
+            last_i, last = i, ends[i]
+        k = 1
+        while (1 << k) <= n:
+            x = 1 << (k - 1)
+            for i in range((x << 1) - 1, n, x << 2):
+                er = mx[i + x] if i + x < n else last
+                mx[i] = max(ends[i], mx[i - x], er)
+            last_i = last_i - x if (last_i >> k) & 1 else last_i + x
+            if last_i < n and mx[last_i] > last:
+                last = mx[last_i]
+            k += 1
+        return k - 1
+
+    def _posicoes(self, start: int, end: int) -> list[int]:
+        n = len(self.starts)
+        if n == 0:
+            return []
+        starts, ends, mx = self.starts, self.ends, self._max_end
+        encontrados: list[int] = []
+        pilha = [((1 << self._raiz) - 1, self._raiz, False)]
+        while pilha:
+            x, k, esquerda_feita = pilha.pop()
+            if k <= 3:
+                # Sub-árvore pequena: varrimento linear
+                i = x >> k << k
+                fim = min(i + (1 << (k + 1)) - 1, n)
+                while i < fim and starts[i] < end:
+                    if start < ends[i]:
+                        encontrados.append(i)
+                    i += 1
+            elif not esquerda_feita:
+                pilha.append((x, k, True))
+                y = x - (1 << (k - 1))
+                if y >= n or mx[y] > start:
+                    pilha.append((y, k - 1, False))
+            elif x < n and starts[x] < end:
+                if start < ends[x]:
+                    encontrados.append(x)
+                pilha.append((x + (1 << (k - 1)), k - 1, False))
+        return encontrados
+
+    def overlapping(self, start: int, end: int) -> list[int]:
+        """Ids dos intervalos que intersectam [start, end)."""
+        ids = self.ids
+        return [ids[p] for p in self._posicoes(start, end)]
+
+    def containing(self, pos: int) -> list[int]:
+        """Ids dos intervalos que contêm a posição."""
+        return self.overlapping(pos, pos + 1)
+
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+class _Codigos:
+    """Tabela string → código (colunas guardam só o inteiro)."""
+
+    __slots__ = ("valores", "_codigo")
+
+    def __init__(self):
+        self.valores: list[str] = []
+        self._codigo: dict[str, int] = {}
+
+    def codigo(self, valor: str) -> int:
+        c = self._codigo.get(valor)
+        if c is None:
+            c = self._codigo[valor] = len(self.valores)
+            self.valores.append(valor)
+        return c
+
+
+class EvidenceStore:
+    """
+    Spans de EvidenceItem em colunas, com índice de intervalos.
+
+    Linha i = um span: start[i], end[i], page[i] (-1 se desconhecida),
+    item[i] (posição em items), extractor[i], tipo[i], doc[i] (códigos).
+    As linhas ficam pela ordem de inserção (items, depois spans de cada item).
+    """
+
+    def __init__(self):
+        self.items: list[EvidenceItem] = []
+        self.start = array("q")
+        self.end = array("q")
+        self.page = array("i")
+        self.item = array("i")
+        self.extractor = array("H")
+        self.tipo = array("H")
+        self.doc = array("H")
+        self.extractores = _Codigos()
+        self.tipos = _Codigos()
+        self.docs = _Codigos()
+        self._indice: Optional[IntervalIndex] = None
+        self._valores: Optional[set[tuple[str, str]]] = None
+
+    @classmethod
+    def from_items(cls, items: Iterable[EvidenceItem]) -> "EvidenceStore":
+        store = cls()
+        for item in items:
+            store.add(item)
+        return store
+
+    def add(self, item: EvidenceItem, extractor_id: Optional[str] = None) -> None:
+        """
+        Acrescenta um item (uma linha por span).
+
+        extractor_id, se dado, substitui o span.extractor_id na coluna (ex:
+        agregação legacy, que atribui os spans ao extractor que devolveu o item).
+        """
+        idx = len(self.items)
+        self.items.append(item)
+        tipo = self.tipos.codigo(item.item_type.value)
+        for span in item.source_spans:
+            self.start.append(span.start_char)
+            self.end.append(span.end_char)
+            self.page.append(span.page_num if span.page_num is not None else -1)
+            self.item.append(idx)
+            self.extractor.append(self.extractores.codigo(extractor_id or span.extractor_id))
+            self.tipo.append(tipo)
+            self.doc.append(self.docs.codigo(span.doc_id))
+        self._indice = None
+        if self._valores is not None:
+            self._valores.add((item.item_type.value, item.value_normalized))
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    # ------------------------------------------------------------------
+    # Acesso por linha
+    # ------------------------------------------------------------------
+
+    def item_of(self, i: int) -> EvidenceItem:
+        return self.items[self.item[i]]
+
+    def extractor_of(self, i: int) -> str:
+        return self.extractores.valores[self.extractor[i]]
+
+    def doc_of(self, i: int) -> str:
+        return self.docs.valores[self.doc[i]]
+
+    def tipo_of(self, i: int) -> str:
+        return self.tipos.valores[self.tipo[i]]
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    @property
+    def indice(self) -> IntervalIndex:
+        if self._indice is None:
+            self._indice = IntervalIndex(zip(self.start, self.end, range(len(self.start)), strict=True))
+        return self._indice
+
+    def spans_overlapping(self, start: int, end: int) -> list[int]:
+        """Linhas (spans) que intersectam [start, end), por ordem de start."""
+        return self.indice.overlapping(start, end)
+
+    def items_overlapping(self, start: int, end: int) -> list[EvidenceItem]:
+        """Items com algum span em [start, end), pela ordem do store."""
+        idxs = sorted({self.item[i] for i in self.spans_overlapping(start, end)})
+        return [self.items[i] for i in idxs]
+
+    def has_value(self, item_type: str, value_normalized: str) -> bool:
+        """True se já há um item com este (tipo, valor normalizado)."""
+        if self._valores is None:
+            self._valores = {(it.item_type.value, it.value_normalized) for it in self.items}
+        return (item_type, value_normalized) in self._valores
+
+    def span_counts_by_extractor(self) -> dict[str, int]:
+        """Número de spans por extractor (ordem da primeira ocorrência)."""
+        contagens = [0] * len(self.extractores.valores)
+        for c in self.extractor:
+            contagens[c] += 1
+        return dict(zip(self.extractores.valores, contagens, strict=True))
+
+    def merged_ranges(self, extractor_id: Optional[str] = None) -> list[tuple[int, int]]:
+        """Ranges cobertos pelos spans (fundidos), opcionalmente de um extractor."""
+        if extractor_id is None:
+            pares = sorted(zip(self.start, self.end, strict=True))
+        else:
+            codigo = self.extractores._codigo.get(extractor_id)
+            if codigo is None:
+                return []
+            pares = sorted(
+                (s, e) for s, e, x in zip(self.start, self.end, self.extractor, strict=True) if x == codigo
+            )
+        fundidos: list[tuple[int, int]] = []
+        for s, e in pares:
+            if fundidos and s <= fundidos[-1][1]:
+                if e > fundidos[-1][1]:
+                    fundidos[-1] = (fundidos[-1][0], e)
+            else:
+                fundidos.append((s, e))
+        return fundidos
+
+    def proximity_groups(self, bucket: int = 100) -> dict[int, list[int]]:
+        """
+        Spans agrupados por (tipo, doc, start // bucket); só grupos com ≥2 spans.
+
+        A chave é um inteiro (tipo << 48 | doc << 32 | bloco) — ver group_key.
+        Ordem dos grupos (primeira linha) e das linhas em cada grupo = ordem do store.
+        """
+        primeira: dict[int, int] = {}
+        grupos: dict[int, list[int]] = {}
+        for i, (t, d, s) in enumerate(zip(self.tipo, self.doc, self.start, strict=True)):
+            chave = (t << 48) | (d << 32) | (s // bucket)
+            j = primeira.setdefault(chave, i)
+            if j != i:
+                linhas = grupos.get(chave)
+                if linhas is None:
+                    grupos[chave] = [j, i]
+                else:
+                    linhas.append(i)
+        return dict(sorted(grupos.items(), key=lambda kv: kv[1][0]))
+
+    def group_key(self, chave: int) -> str:
+        """Chave textual de um grupo de proximity_groups ("tipo:doc:bloco")."""
+        t, d, b = chave >> 48, (chave >> 32) & 0xFFFF, chave & 0xFFFFFFFF
+        return f"{self.tipos.valores[t]}:{self.docs.valores[d]}:{b}"
+
+    def stats(self) -> dict:
+        """Tamanho do store (diagnóstico)."""
+        colunas = (self.start, self.end, self.page, self.item, self.extractor, self.tipo, self.doc)
+        return {
+            "items": len(self.items),
+            "spans": len(self),
+            "extractores": len(self.extractores.valores),
+            "bytes_colunas": sum(c.itemsize * len(c) for c in colunas),
+        }
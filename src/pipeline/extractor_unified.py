@@ -15,6 +15,7 @@ import logging
 import re
 import hashlib
 from typing import Optional, Any
+from src.config import NEAR_DUP_ENABLED
 from src.pipeline.schema_unified import (
     Chunk,
     SourceSpan,
@@ -23,6 +24,10 @@ from src.pipeline.schema_unified import (
     ExtractionMethod,
     create_item_id,
 )
+from src.pipeline.evidence_store import EvidenceStore
+from src.pipeline.json_stream import IncrementalItemParser, parse_items_text
+from src.pipeline.near_dup import merge_near_duplicates
+from src.pipeline.structured_output import registar_parse
 
 logger = logging.getLogger(__name__)
 
@@ -120,7 +125,8 @@ def parse_unified_output(
     chunk: Chunk,
     extractor_id: str,
     model_name: str,
-    page_mapper: Optional[Any] = None
+    page_mapper: Optional[Any] = None,
+    parser: Optional[IncrementalItemParser] = None,
 ) -> tuple[list[EvidenceItem], list[dict], list[str]]:
     """
     Parseia output do LLM e cria EvidenceItems com source_spans.
@@ -131,6 +137,8 @@ def parse_unified_output(
         extractor_id: ID do extrator
         model_name: Nome do modelo usado
         page_mapper: CharToPageMapper opcional para preencher page_num
+        parser: IncrementalItemParser que já consumiu este output (streaming);
+            se não for dado, o output é lido numa passagem pelo parser incremental
 
     Returns:
         (items, unreadable_sections, errors)
@@ -139,9 +147,40 @@ def parse_unified_output(
     unreadable = []
     errors = []
 
-    # Tentar extrair JSON (robusto: markdown, texto antes/depois, etc.)
+    # Caminho rápido: parser incremental (uma passagem, items já separados,
+    # truncagem = items completos até ao corte). Só cai para a cadeia de
+    # extracção/reparação se o output não tiver o formato esperado.
+    if parser is None or parser.chars != len(output):
+        parser = parse_items_text(output)
+    else:
+        parser.finish()
+
     from src.pipeline.extractor_json import extract_json_from_text
-    json_data = extract_json_from_text(output)
+
+    json_data = None
+    usar_parser = parser.utilizavel
+    if usar_parser and not parser.items and output.count("{") > 1:
+        # "Utilizável" mas sem items num output com objectos: a raiz lida pode
+        # não ser a certa — fica a cadeia de extracção se ela recuperar items.
+        recuperado = extract_json_from_text(output)
+        brutos = recuperado if isinstance(recuperado, list) else (recuperado or {}).get("items") or []
+        if any(isinstance(x, dict) and "status" not in x for x in brutos):
+            logger.info(f"[JSON-STREAM] {extractor_id}: parser sem items, recuperados pela cadeia de extracção")
+            usar_parser = False
+            json_data = recuperado
+
+    if usar_parser:
+        json_data = parser.to_json_data()
+        errors.extend(parser.erros)
+        registar_parse(extractor_id, "reparado" if parser.erros or parser.truncado else "directo")
+        if parser.truncado:
+            logger.info(
+                f"[JSON-STREAM] {extractor_id}: output truncado, "
+                f"{len(parser.items)} items completos aproveitados"
+            )
+    elif json_data is None:
+        # Tentar extrair JSON (robusto: markdown, texto antes/depois, etc.)
+        json_data = extract_json_from_text(output)
 
     if not json_data:
         # v4.0: Tentar auto-repair antes de desistir
@@ -151,6 +190,9 @@ def parse_unified_output(
             if json_data:
                 logger.info(f"[JSON-REPAIR] {extractor_id}: JSON reparado com sucesso")
 
+    if not usar_parser:
+        registar_parse(extractor_id, "reparado" if json_data else "falhou")
+
     if not json_data:
         errors.append(f"Não foi possível extrair JSON do output do {extractor_id}")
         # Tentar fallback para extração por regex
@@ -484,17 +526,21 @@ def aggregate_with_provenance(
     items_by_extractor: dict[str, list[EvidenceItem]],
     detect_conflicts: bool = True,
     deduplicate: bool = True,
+    near_duplicates: Optional[bool] = None,
 ) -> tuple[list[EvidenceItem], list[dict]]:
     """
     Agrega items de múltiplos extratores preservando proveniência.
 
     v4.0: Com deduplicação semântica — items idênticos (mesma info, palavras diferentes)
     são fundidos num único item com múltiplas fontes. Conflitos são detectados e marcados.
+    Depois da via exacta, quase-duplicados (paráfrases) são fundidos por MinHash/LSH
+    (ver near_dup.py); o relatório fica em metadata["near_duplicates"] dos items.
 
     Args:
         items_by_extractor: {extractor_id: [items]}
         detect_conflicts: Se True, detecta valores divergentes
         deduplicate: Se True, aplica deduplicação semântica (v4.0)
+        near_duplicates: Fundir quase-duplicados (None = NEAR_DUP_ENABLED)
 
     Returns:
         (union_items, conflicts)
@@ -507,6 +553,7 @@ def aggregate_with_provenance(
     # Agrupar items por hash normalizado
     hash_groups: dict[str, list[tuple[str, EvidenceItem]]] = {}  # hash -> [(extractor_id, item)]
     conflicts = []
+    em_conflito: set[str] = set()  # item_ids em conflito (não entram na fusão aproximada)
 
     for extractor_id, items in items_by_extractor.items():
         for item in items:
@@ -543,6 +590,7 @@ def aggregate_with_provenance(
                 # Divergência — manter ambos e registar conflito
                 for _eid, item in entries:
                     union_items.append(item)
+                    em_conflito.add(item.item_id)
                 conflict = {
                     "conflict_id": f"conflict_{h[:8]}",
                     "item_type": entries[0][1].item_type.value,
@@ -554,34 +602,14 @@ def aggregate_with_provenance(
                 }
                 conflicts.append(conflict)
 
-    # Detectar conflitos adicionais por span proximity
+    # Detectar conflitos adicionais por span proximity — antes da fusão
+    # aproximada, para a divergência não desaparecer com ela
     if detect_conflicts:
-        span_index: dict[str, list[tuple[str, str, EvidenceItem]]] = {}
-        for item in union_items:
-            for span in item.source_spans:
-                bucket = span.start_char // 100
-                key = f"{item.item_type.value}:{span.doc_id}:{bucket}"
-                if key not in span_index:
-                    span_index[key] = []
-                span_index[key].append((span.extractor_id, item.value_normalized, item))
-
-        for key, span_entries in span_index.items():
-            if len(span_entries) > 1:
-                span_values = set(e[1] for e in span_entries)
-                if len(span_values) > 1:
-                    # Check if already captured
-                    existing_ids = {c["conflict_id"] for c in conflicts}
-                    cid = f"conflict_{hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()[:8]}"
-                    if cid not in existing_ids:
-                        conflicts.append({
-                            "conflict_id": cid,
-                            "item_type": span_entries[0][2].item_type.value,
-                            "span_key": key,
-                            "values": [
-                                {"extractor_id": e[0], "value": e[1]}
-                                for e in span_entries
-                            ],
-                        })
+        em_conflito |= _detect_span_conflicts(EvidenceStore.from_items(union_items), conflicts)
+
+    # Quase-duplicados: o mesmo facto escrito de outra forma por outro extractor
+    if NEAR_DUP_ENABLED if near_duplicates is None else near_duplicates:
+        union_items, _relatorio = merge_near_duplicates(union_items, excluir=em_conflito)
 
     logger.info(
         f"Agregação v4.0: {len(union_items)} items deduplicados "
@@ -599,38 +627,53 @@ def _aggregate_legacy(
     """Agregação legacy sem deduplicação (backward compatibility)."""
     union_items = []
     conflicts = []
-    span_index: dict[str, list[tuple[str, str, EvidenceItem]]] = {}
+    store = EvidenceStore()
 
     for extractor_id, items in items_by_extractor.items():
         for item in items:
             union_items.append(item)
             if detect_conflicts:
-                for span in item.source_spans:
-                    bucket = span.start_char // 100
-                    key = f"{item.item_type.value}:{span.doc_id}:{bucket}"
-                    if key not in span_index:
-                        span_index[key] = []
-                    span_index[key].append((extractor_id, item.value_normalized, item))
+                store.add(item, extractor_id=extractor_id)
 
     if detect_conflicts:
-        for key, entries in span_index.items():
-            if len(entries) > 1:
-                values = set(e[1] for e in entries)
-                if len(values) > 1:
-                    conflicts.append({
-                        "conflict_id": f"conflict_{hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()[:8]}",
-                        "item_type": entries[0][2].item_type.value,
-                        "span_key": key,
-                        "values": [
-                            {"extractor_id": e[0], "value": e[1]}
-                            for e in entries
-                        ],
-                    })
+        _detect_span_conflicts(store, conflicts)
 
     logger.info(f"Agregação legacy: {len(union_items)} items, {len(conflicts)} conflitos")
     return union_items, conflicts
 
 
+def _detect_span_conflicts(store: EvidenceStore, conflicts: list[dict]) -> set[str]:
+    """
+    Conflitos por proximidade: spans do mesmo tipo e documento no mesmo bloco
+    de 100 chars com valores diferentes. Acrescenta a `conflicts` (sem repetir ids).
+
+    Returns:
+        item_ids envolvidos nos conflitos acrescentados
+    """
+    existing_ids = {c["conflict_id"] for c in conflicts}
+    envolvidos: set[str] = set()
+    for chave, linhas in store.proximity_groups(bucket=100).items():
+        entries = [(store.extractor_of(i), store.item_of(i)) for i in linhas]
+        if len({item.value_normalized for _eid, item in entries}) < 2:
+            continue
+        key = store.group_key(chave)
+        cid = f"conflict_{hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()[:8]}"
+        if cid in existing_ids:
+            continue
+        existing_ids.add(cid)
+        conflicts.append({
+            "conflict_id": cid,
+            "item_type": entries[0][1].item_type.value,
+            "span_key": key,
+            "values": [
+                {"extractor_id": eid, "value": item.value_normalized}
+                for eid, item in entries
+            ],
+        })
+        envolvidos.update(item.item_id for _eid, item in entries)
+    return envolvidos
+
+
 # ============================================================================
 # COBERTURA
 # ============================================================================
@@ -640,7 +683,8 @@ def calculate_coverage(
     items: list[EvidenceItem],
     total_chars: int,
     page_mapper: Optional[Any] = None,
-    total_pages: Optional[int] = None
+    total_pages: Optional[int] = None,
+    store: Optional[EvidenceStore] = None,
 ) -> dict:
     """
     Calcula cobertura do documento (chars e páginas).
@@ -651,6 +695,7 @@ def calculate_coverage(
         total_chars: Total de caracteres do documento
         page_mapper: CharToPageMapper opcional para cobertura por páginas
         total_pages: Total de páginas do documento (opcional)
+        store: EvidenceStore já construído sobre `items` (evita reconstruir)
 
     Returns:
         Dict com métricas de cobertura (chars e páginas)
@@ -669,13 +714,8 @@ def calculate_coverage(
     gaps = _find_gaps(merged, total_chars)
 
     # Cobertura por extrator
-    coverage_by_extractor = {}
-    for item in items:
-        for span in item.source_spans:
-            ext_id = span.extractor_id
-            if ext_id not in coverage_by_extractor:
-                coverage_by_extractor[ext_id] = []
-            coverage_by_extractor[ext_id].append((span.start_char, span.end_char))
+    if store is None:
+        store = EvidenceStore.from_items(items)
 
     result = {
         "total_chars": total_chars,
@@ -686,18 +726,15 @@ def calculate_coverage(
         "merged_ranges": len(merged),
         "gaps": [{"start": g[0], "end": g[1], "length": g[1] - g[0]} for g in gaps],
         "items_count": len(items),
-        "coverage_by_extractor": {
-            k: len(v) for k, v in coverage_by_extractor.items()
-        },
+        "coverage_by_extractor": store.span_counts_by_extractor(),
     }
 
     # Adicionar cobertura por páginas se mapper disponível
     if page_mapper is not None:
         # Calcular páginas cobertas pelos chunks
         pages_covered = set()
-        for chunk in chunks:
-            pages = page_mapper.get_pages_for_range(chunk.start_char, chunk.end_char)
-            pages_covered.update(pages)
+        for start, end in merged:
+            pages_covered.update(page_mapper.get_pages_for_range(start, end))
 
         # Páginas ilegíveis (SUSPEITA, SEM_TEXTO, VISUAL_ONLY)
         pages_unreadable = set(page_mapper.get_unreadable_pages())
@@ -723,6 +760,8 @@ def calculate_coverage(
             "pages_missing_list": sorted(pages_missing),
             "pages_coverage_percent": round(pages_coverage_percent, 2),
             "pages_is_complete": len(pages_missing) == 0,
+            # Páginas com pelo menos um span de evidência (não só chunk processado)
+            "pages_with_evidence": page_mapper.get_coverage_by_pages(store)["pages_covered"],
         })
     elif total_pages is not None:
         # Sem mapper mas com total_pages - info parcial
@@ -1098,6 +1137,7 @@ def recursive_extraction(
     all_errors = []
 
     last_item_id = None
+    parser = IncrementalItemParser()
 
     for iteration in range(max_iterations):
         # Build prompt
@@ -1113,47 +1153,45 @@ def recursive_extraction(
                 system_prompt=system_prompt,
                 temperature=temperature,
                 max_tokens=max_tokens,
+                stream_consumer=parser,
             )
 
             if not response or not response.content:
                 all_errors.append(f"Iteration {iteration}: empty response")
                 break
 
-            # Try to repair JSON if needed
+            # Parse output (o parser já consumiu o stream; sem re-leitura)
             content = response.content
-            try:
-                json.loads(content)
-            except (json.JSONDecodeError, ValueError):
-                repaired = auto_repair_json(content)
-                if repaired:
-                    content = repaired
-                    logger.info(f"[RECURSIVE] Iteration {iteration}: JSON repaired")
-
-            # Parse output
             items, unreadable, errors = parse_unified_output(
                 output=content,
                 chunk=chunk,
                 extractor_id=extractor_id,
                 model_name=model,
                 page_mapper=page_mapper,
+                parser=parser,
             )
 
             all_items.extend(items)
             all_unreadable.extend(unreadable)
             all_errors.extend(errors)
 
-            # Check for continuation
-            from src.pipeline.extractor_json import extract_json_from_text
-            json_data = extract_json_from_text(content)
-            if json_data:
-                continuation = detect_continuation(json_data)
-                if continuation is not None:
-                    last_item_id = continuation
-                    logger.info(
-                        f"[RECURSIVE] Iteration {iteration}: "
-                        f"to_be_continued at item {last_item_id}, continuing..."
-                    )
-                    continue
+            # Check for continuation: marcador explícito do modelo, ou output
+            # cortado a meio (retoma depois do último item completo)
+            continuation = parser.continuacao if parser.utilizavel else None
+            if continuation is None and parser.utilizavel and parser.truncado and parser.items:
+                continuation = (last_item_id or 0) + len(parser.items)
+            if continuation is None and not parser.utilizavel:
+                from src.pipeline.extractor_json import extract_json_from_text
+                json_data = extract_json_from_text(auto_repair_json(content) or content)
+                if json_data:
+                    continuation = detect_continuation(json_data)
+            if continuation is not None:
+                last_item_id = continuation
+                logger.info(
+                    f"[RECURSIVE] Iteration {iteration}: "
+                    f"to_be_continued at item {last_item_id}, continuing..."
+                )
+                continue
 
             # No continuation needed
             logger.info(
@@ -144,14 +144,14 @@ class IntegrityReport:
         return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
 
     def save(self, output_dir: Optional[Path] = None) -> Path:
-        """Guarda relatório em ficheiro JSON."""
+        """Guarda relatório em ficheiro JSON (via ArtefactStore, em background)."""
+        from src.pipeline.artefact_store import get_artefact_store
+
         if output_dir is None:
             output_dir = OUTPUT_DIR / self.run_id
-        output_dir.mkdir(parents=True, exist_ok=True)
         filepath = output_dir / "integrity_report.json"
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(self.to_json())
-        logger.info(f"Relatório de integridade guardado: {filepath}")
+        get_artefact_store().write_json(filepath, self.to_dict())
+        logger.info(f"Relatório de integridade enfileirado: {filepath}")
         return filepath
 
 
@@ -0,0 +1,841 @@
+# ============================================================================
+# Pipeline v5.3 — Execução de análises (jobs)
+# ============================================================================
+# /analyze e /analyze/resume submetem um job em vez de correrem o pipeline
+# dentro do worker uvicorn:
+#
+#   JOB_BACKEND=celery     → task Celery (celery_worker.py, Redis como broker);
+#                            estado, eventos de progresso, upload e lock por
+#                            utilizador ficam no Redis (partilhados entre
+#                            processos e instâncias da API)
+#   JOB_BACKEND=inprocess  → thread pool no próprio processo, estado em memória
+#                            (desenvolvimento, testes, deploy sem Redis)
+#
+# Estados: queued → running → done | failed.
+# Eventos: {"seq", "tipo", "fase", "progresso", "mensagem", "ts"}
+#   tipo "progresso" — um por chamada a LexForumProcessor._reportar_progresso
+#                      (via callback_progresso do engine)
+#   tipo "parcial"   — no checkpoint de cada fase (callback_parcial), com
+#                      "dados": agregado da Fase 1, auditorias, pareceres, ...
+# GET /jobs/{id}/stream entrega os eventos em SSE (id = seq); um cliente que
+# reconecta envia Last-Event-ID e recebe só o que perdeu.
+# O lock "uma análise por utilizador" tem TTL (JOB_USER_LOCK_TTL), renovado a
+# cada evento de progresso, para não ficar preso se o worker morrer.
+# Worker Celery morto a meio (WorkerLostError, hard time limit, revoke,
+# shutdown): os signal handlers no fim do módulo marcam o job "failed", o
+# documento "interrupted" (resumível) e libertam o lock logo.
+# ============================================================================
+
+import abc
+import asyncio
+import bisect
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from src.pipeline.celery_app import REDIS_URL, celery_app
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_FINAIS = ("done", "failed")
+MAX_EVENTOS_JOB = 1000
+_TASK_ANALISE = "lexforum.analysis_job"
+
+
+def _agora() -> float:
+    return time.time()
+
+
+def _evento(seq: int, fase: str, progresso: int, mensagem: str, dados: Optional[dict]) -> dict:
+    evento = {"seq": seq, "tipo": "progresso" if dados is None else "parcial", "fase": fase,
+              "progresso": progresso, "mensagem": mensagem, "ts": _agora()}
+    if dados is not None:
+        evento["dados"] = dados
+    return evento
+
+
+# ============================================================================
+# STORES — estado dos jobs + lock por utilizador
+# ============================================================================
+
+class InMemoryJobStore:
+    """Estado de jobs em memória (um processo). Mesma interface que RedisJobStore."""
+
+    def __init__(self, result_ttl: int = 86400):
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._jobs: dict[str, dict] = {}
+        self._eventos: dict[str, list[dict]] = {}
+        self._seqs: dict[str, int] = {}
+        self._uploads: dict[str, bytes] = {}
+        self._users: dict[str, tuple[str, float]] = {}  # user_id → (holder, expira_em)
+
+    # -- jobs --------------------------------------------------------------
+
+    def create(self, job_id: str, kind: str, user_id: str, **campos) -> dict:
+        job = {
+            "job_id": job_id, "kind": kind, "user_id": user_id, "state": "queued",
+            "fase": None, "progresso": 0, "mensagem": "", "created_at": _agora(),
+            "updated_at": _agora(), **campos,
+        }
+        with self._lock:
+            self._purge()
+            self._jobs[job_id] = job
+            self._eventos[job_id] = []
+            self._seqs[job_id] = 0
+        return dict(job)
+
+    def update(self, job_id: str, **campos) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(campos, updated_at=_agora())
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def add_event(self, job_id: str, fase: str, progresso: int, mensagem: str,
+                  dados: Optional[dict] = None) -> int:
+        with self._lock:
+            eventos = self._eventos.setdefault(job_id, [])
+            seq = self._seqs[job_id] = self._seqs.get(job_id, 0) + 1
+            if seq <= MAX_EVENTOS_JOB or dados is not None:
+                eventos.append(_evento(seq, fase, progresso, mensagem, dados))
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fase=fase, progresso=progresso, mensagem=mensagem, updated_at=_agora())
+        return seq
+
+    def events(self, job_id: str, after: int = 0) -> list[dict]:
+        """Eventos com seq > after (por seq, não por posição: acima do limite só ficam os parciais)."""
+        with self._lock:
+            eventos = self._eventos.get(job_id, [])
+            inicio = bisect.bisect_right(eventos, after, key=lambda e: e["seq"])
+            return [dict(e) for e in eventos[inicio:]]
+
+    def state(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job["state"] if job is not None else None
+
+    def active_jobs(self) -> list[dict]:
+        with self._lock:
+            return [dict(j) for j in self._jobs.values() if j["state"] not in ESTADOS_FINAIS]
+
+    def put_upload(self, job_id: str, dados: bytes) -> None:
+        with self._lock:
+            self._uploads[job_id] = dados
+
+    def take_upload(self, job_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._uploads.pop(job_id, None)
+
+    def _purge(self) -> None:
+        limite = _agora() - self.result_ttl
+        for job_id in [j for j, job in self._jobs.items()
+                       if job["state"] in ESTADOS_FINAIS and job["updated_at"] < limite]:
+            self._jobs.pop(job_id, None)
+            self._eventos.pop(job_id, None)
+            self._seqs.pop(job_id, None)
+
+    # -- lock por utilizador -----------------------------------------------
+
+    def acquire_user(self, user_id: str, holder: str, ttl: int) -> Optional[str]:
+        """Reserva o utilizador. None se conseguiu; senão o holder actual."""
+        with self._lock:
+            atual = self._users.get(user_id)
+            if atual is not None and atual[1] > _agora():
+                return atual[0]
+            self._users[user_id] = (holder, _agora() + ttl)
+            return None
+
+    def refresh_user(self, user_id: str, holder: str, ttl: int, novo_holder: Optional[str] = None) -> bool:
+        """Renova o TTL (e opcionalmente troca o holder) se o lock ainda for de holder."""
+        with self._lock:
+            atual = self._users.get(user_id)
+            if atual is None or atual[0] != holder:
+                return False
+            self._users[user_id] = (novo_holder or holder, _agora() + ttl)
+            return True
+
+    def release_user(self, user_id: str, holder: str) -> bool:
+        with self._lock:
+            atual = self._users.get(user_id)
+            if atual is None or atual[0] != holder:
+                return False
+            del self._users[user_id]
+            return True
+
+    def active_users(self) -> dict[str, str]:
+        agora = _agora()
+        with self._lock:
+            return {u: h for u, (h, expira) in self._users.items() if expira > agora}
+
+
+# Compare-and-delete / compare-and-expire: só o dono do lock o liberta ou renova
+_LUA_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+_LUA_REFRESH = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+  return 1
+end
+return 0
+"""
+
+# Evento: seq (INCR) e inserção no sorted set (score = seq) na mesma operação
+# atómica — writers concorrentes nunca repetem um seq nem deixam buracos
+# visíveis a um leitor. Membro = "<seq>|<json>".
+_LUA_ADD_EVENT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+if seq <= tonumber(ARGV[2]) or ARGV[4] == '1' then
+  redis.call('ZADD', KEYS[2], seq, seq .. '|' .. ARGV[1])
+  redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+end
+return seq
+"""
+
+
+class RedisJobStore:
+    """Estado de jobs no Redis — partilhado entre a API e os workers Celery."""
+
+    PREFIXO = "lexforum:job:"
+    PREFIXO_USER = "lexforum:user_lock:"
+    ATIVOS = "lexforum:jobs:ativos"
+
+    def __init__(self, client, result_ttl: int = 86400, client_bytes=None):
+        self._r = client
+        # Uploads (PDF) em bytes crus: o cliente principal tem decode_responses=True
+        self._rb = client_bytes if client_bytes is not None else client
+        self.result_ttl = result_ttl
+        self._release = client.register_script(_LUA_RELEASE)
+        self._refresh = client.register_script(_LUA_REFRESH)
+        self._add_event = client.register_script(_LUA_ADD_EVENT)
+
+    @classmethod
+    def from_url(cls, url: str, result_ttl: int = 86400) -> "RedisJobStore":
+        if redis is None:
+            raise RuntimeError("Pacote redis não instalado — JOB_BACKEND=celery indisponível")
+        return cls(redis.Redis.from_url(url, decode_responses=True), result_ttl=result_ttl,
+                   client_bytes=redis.Redis.from_url(url, decode_responses=False))
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.PREFIXO}{job_id}"
+
+    # -- jobs --------------------------------------------------------------
+
+    def create(self, job_id: str, kind: str, user_id: str, **campos) -> dict:
+        job = {
+            "job_id": job_id, "kind": kind, "user_id": user_id, "state": "queued",
+            "fase": None, "progresso": 0, "mensagem": "", "created_at": _agora(),
+            "updated_at": _agora(), **campos,
+        }
+        pipe = self._r.pipeline()
+        pipe.hset(self._key(job_id), mapping={k: json.dumps(v, default=str) for k, v in job.items()})
+        pipe.expire(self._key(job_id), self.result_ttl)
+        pipe.sadd(self.ATIVOS, job_id)
+        pipe.execute()
+        return job
+
+    def update(self, job_id: str, **campos) -> None:
+        campos["updated_at"] = _agora()
+        pipe = self._r.pipeline()
+        pipe.hset(self._key(job_id), mapping={k: json.dumps(v, default=str) for k, v in campos.items()})
+        pipe.expire(self._key(job_id), self.result_ttl)
+        if campos.get("state") in ESTADOS_FINAIS:
+            pipe.srem(self.ATIVOS, job_id)
+        pipe.execute()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        dados = self._r.hgetall(self._key(job_id))
+        if not dados:
+            return None
+        return {k: json.loads(v) for k, v in dados.items()}
+
+    def add_event(self, job_id: str, fase: str, progresso: int, mensagem: str,
+                  dados: Optional[dict] = None) -> int:
+        # seq atribuído pelo script (o JSON guardado leva seq 0; events() repõe-no)
+        evento = _evento(0, fase, progresso, mensagem, dados)
+        pipe = self._r.pipeline()
+        self._add_event(
+            keys=[f"{self._key(job_id)}:seq", f"{self._key(job_id)}:eventos_seq"],
+            args=[json.dumps(evento, ensure_ascii=False), MAX_EVENTOS_JOB, self.result_ttl,
+                  "1" if dados is not None else "0"],
+            client=pipe,
+        )
+        pipe.hset(self._key(job_id), mapping={
+            "fase": json.dumps(fase), "progresso": json.dumps(progresso),
+            "mensagem": json.dumps(mensagem, ensure_ascii=False), "updated_at": json.dumps(_agora()),
+        })
+        seq, _ = pipe.execute()
+        return int(seq)
+
+    def events(self, job_id: str, after: int = 0) -> list[dict]:
+        """Eventos com seq > after, por seq (score do sorted set)."""
+        membros = self._r.zrangebyscore(f"{self._key(job_id)}:eventos_seq", f"({max(after, 0)}", "+inf")
+        eventos = []
+        for membro in membros:
+            seq, _, bruto = membro.partition("|")
+            evento = json.loads(bruto)
+            evento["seq"] = int(seq)
+            eventos.append(evento)
+        return eventos
+
+    def state(self, job_id: str) -> Optional[str]:
+        """Só o estado (sem carregar o resultado, que pode ter vários MB)."""
+        estado = self._r.hget(self._key(job_id), "state")
+        return json.loads(estado) if estado is not None else None
+
+    def active_jobs(self) -> list[dict]:
+        jobs = []
+        for job_id in self._r.smembers(self.ATIVOS):
+            job = self.get(job_id)
+            if job is None or job.get("state") in ESTADOS_FINAIS:
+                self._r.srem(self.ATIVOS, job_id)
+            else:
+                jobs.append(job)
+        return jobs
+
+    def put_upload(self, job_id: str, dados: bytes) -> None:
+        self._rb.set(f"{self._key(job_id)}:upload", dados, ex=self.result_ttl)
+
+    def take_upload(self, job_id: str) -> Optional[bytes]:
+        chave = f"{self._key(job_id)}:upload"
+        pipe = self._rb.pipeline()
+        pipe.get(chave)
+        pipe.delete(chave)
+        dados, _ = pipe.execute()
+        return dados
+
+    # -- lock por utilizador -----------------------------------------------
+
+    def acquire_user(self, user_id: str, holder: str, ttl: int) -> Optional[str]:
+        chave = f"{self.PREFIXO_USER}{user_id}"
+        if self._r.set(chave, holder, nx=True, ex=ttl):
+            return None
+        return self._r.get(chave) or "?"
+
+    def refresh_user(self, user_id: str, holder: str, ttl: int, novo_holder: Optional[str] = None) -> bool:
+        chave = f"{self.PREFIXO_USER}{user_id}"
+        return bool(self._refresh(keys=[chave], args=[holder, novo_holder or holder, ttl]))
+
+    def release_user(self, user_id: str, holder: str) -> bool:
+        return bool(self._release(keys=[f"{self.PREFIXO_USER}{user_id}"], args=[holder]))
+
+    def active_users(self) -> dict[str, str]:
+        utilizadores = {}
+        for chave in self._r.scan_iter(match=f"{self.PREFIXO_USER}*", count=500):
+            holder = self._r.get(chave)
+            if holder is not None:
+                utilizadores[chave[len(self.PREFIXO_USER):]] = holder
+        return utilizadores
+
+
+# ============================================================================
+# EXECUÇÃO — igual em qualquer backend
+# ============================================================================
+
+def erro_http(exc: Exception, kind: str = "analyze") -> tuple[int, Any]:
+    """Converte uma excepção do engine no (status_code, detail) devolvido pela API."""
+    from src.cost_controller import BudgetExceededError
+    from src.engine import EngineError, InsufficientBalanceError, InvalidDocumentError, MissingApiKeyError
+
+    if isinstance(exc, InsufficientBalanceError):
+        detail = {
+            "message": ("Saldo insuficiente para retomar a análise." if kind == "resume"
+                        else "Saldo insuficiente. Por favor carregue a conta."),
+            "saldo_atual": exc.saldo_atual,
+            "saldo_necessario": getattr(exc, "saldo_necessario", exc.saldo_minimo),
+        }
+        if kind != "resume":
+            detail["moeda"] = "USD"
+        return 402, detail
+    if isinstance(exc, InvalidDocumentError):
+        return 422, str(exc)
+    if isinstance(exc, MissingApiKeyError):
+        logger.error(f"API Key em falta: {exc}")
+        return 503, "Serviço temporariamente indisponível. Contacte o suporte."
+    if isinstance(exc, BudgetExceededError):
+        detail = {"error": "insufficient_credits", "message": str(exc)}
+        if kind != "resume":
+            detail["detail"] = "Saldo insuficiente. Recarregue a sua wallet para continuar."
+        return 402, detail
+    if isinstance(exc, EngineError):
+        logger.error(f"[JOB] Erro do engine: {exc}")
+        return 500, str(exc)
+    logger.exception(f"[JOB] Erro inesperado no job {kind}")
+    return 500, "Erro interno do servidor."
+
+
+def _guardar_documento_analise(params: dict, resultado, result_dict: dict) -> None:
+    """Actualiza (ou cria) o registo em documents com o resultado da análise."""
+    from auth_service import get_supabase_admin
+
+    doc_id = params.get("doc_id")
+    try:
+        sb_admin = get_supabase_admin()
+        custos = result_dict.get("custos") or {}
+        custo_real = custos.get("custo_total_usd", 0)
+        custo_cobrado = custos.get("custo_cliente_usd", 0)
+        update_data = {
+            "title": params.get("titulo") or result_dict.get("documento_filename", params["filename"]),
+            "analysis_result": result_dict,
+            "status": "completed" if resultado.sucesso else "error",
+            "run_id": result_dict.get("run_id", ""),
+            "total_tokens": result_dict.get("total_tokens", 0),
+            "custo_real_usd": float(custo_real) if custo_real else 0.0,
+            "custo_cobrado_usd": float(custo_cobrado) if custo_cobrado else 0.0,
+            "duracao_segundos": result_dict.get("duracao_total_s", 0),
+        }
+        if doc_id:
+            sb_admin.table("documents").update(update_data).eq("id", doc_id).execute()
+            result_dict["document_id"] = doc_id
+            logger.info(f"[DOCS] Resultado guardado (update): doc_id={doc_id}")
+            # Ligar document_id aos registos de model_performance
+            try:
+                from src.performance_tracker import PerformanceTracker
+                tracker = PerformanceTracker.get_instance()
+                if tracker:
+                    tracker.link_document_id(result_dict.get("run_id", ""), doc_id)
+            except Exception as e:
+                logger.warning(f"[PERF] Falha ao ligar document_id: {e}")
+        else:
+            # Fallback: inserir se não temos doc_id (não deveria acontecer)
+            update_data.update({
+                "user_id": params["user_id"],
+                "filename": params["filename"],
+                "file_size_bytes": params.get("file_size_bytes", 0),
+                "analysis_id": params["analysis_id"],
+            })
+            insert_resp = sb_admin.table("documents").insert(update_data).execute()
+            novo_id = insert_resp.data[0]["id"] if insert_resp.data else None
+            if novo_id:
+                result_dict["document_id"] = novo_id
+                logger.info(f"[DOCS] Resultado guardado (fallback insert): doc_id={novo_id}")
+    except Exception as e:
+        logger.warning(f"[DOCS] Erro ao guardar resultado: {e}")
+
+
+def marcar_documento_erro(doc_id: Optional[str]) -> None:
+    """Marca o documento como "error" se ainda estiver "analyzing"."""
+    if not doc_id:
+        return
+    from auth_service import get_supabase_admin
+    try:
+        sb_admin = get_supabase_admin()
+        check = sb_admin.table("documents").select("status").eq("id", doc_id).single().execute()
+        if check.data and check.data.get("status") == "analyzing":
+            sb_admin.table("documents").update({"status": "error"}).eq("id", doc_id).execute()
+            logger.warning(f"[DOCS] Documento marcado como error (excepção): doc_id={doc_id}")
+    except Exception as e:
+        logger.warning(f"[DOCS] Falha ao actualizar status do documento após erro: {e}")
+
+
+def marcar_documento_interrompido(job: dict) -> None:
+    """Marca o documento do job como "interrupted" (resumível) se ainda estiver "analyzing"."""
+    from auth_service import get_supabase_admin
+
+    doc_id, analysis_id = job.get("document_id"), job.get("analysis_id")
+    if not doc_id and not analysis_id:
+        return
+    try:
+        query = get_supabase_admin().table("documents").update({
+            "status": "interrupted",
+            "interrupted_at": datetime.now(timezone.utc).isoformat(),
+        })
+        query = query.eq("id", doc_id) if doc_id else query.eq("analysis_id", analysis_id)
+        query.eq("status", "analyzing").execute()
+        logger.warning(f"[DOCS] Documento marcado como interrompido: doc_id={doc_id} analysis={analysis_id}")
+    except Exception as e:
+        logger.warning(f"[DOCS] Falha ao marcar documento como interrompido: {e}")
+
+
+def _guardar_documento_resume(params: dict, resultado, result_dict: dict) -> None:
+    from auth_service import get_supabase_admin
+
+    custos = result_dict.get("custos") or {}
+    custo_real = custos.get("custo_total_usd", 0)
+    custo_cobrado = custos.get("custo_cliente_usd", 0)
+    get_supabase_admin().table("documents").update({
+        "analysis_result": result_dict,
+        "status": "completed" if resultado.sucesso else "error",
+        "total_tokens": result_dict.get("total_tokens", 0),
+        "custo_real_usd": float(custo_real) if custo_real else 0.0,
+        "custo_cobrado_usd": float(custo_cobrado) if custo_cobrado else 0.0,
+        "duracao_segundos": result_dict.get("duracao_total_s", 0),
+        "interrupted_at": None,
+    }).eq("id", params["document_id"]).execute()
+    result_dict["document_id"] = params["document_id"]
+    logger.info(f"[RESUME] Análise retomada com sucesso: doc={params['document_id']}")
+
+
+def executar_job(store, job_id: str, kind: str, params: dict, file_bytes: Optional[bytes] = None,
+                 user_lock_ttl: int = 7200) -> Optional[dict]:
+    """
+    Corre uma análise (kind "analyze" ou "resume") e regista estado/progresso no store.
+
+    Chamado pela thread do backend inprocess ou pela task Celery. Liberta sempre
+    o lock do utilizador no fim. Retorna o result_dict (None se falhou).
+    """
+    from src.engine import executar_analise_documento, executar_analise_resume
+    from src.utils.sanitize import sanitize_for_json
+
+    user_id = params["user_id"]
+    store.update(job_id, state="running", started_at=_agora())
+    final = {"state": "failed", "error": {"status_code": 500, "detail": "Análise interrompida."}}
+
+    ultimo_pct = [0]
+
+    def progresso(fase: str, pct: int, mensagem: str):
+        logger.info(f"[{pct:3d}%] {fase}: {mensagem}")
+        ultimo_pct[0] = pct
+        try:
+            store.add_event(job_id, fase, pct, mensagem)
+            store.refresh_user(user_id, job_id, user_lock_ttl)
+        except Exception as e:
+            logger.debug(f"[JOB] Evento de progresso não registado ({job_id}): {e}")
+
+    def parcial(fase_num: int, fase_nome: str, dados: dict):
+        try:
+            seq = store.add_event(job_id, f"fase{fase_num}", ultimo_pct[0],
+                                  f"Fase {fase_num} ({fase_nome}) concluída", sanitize_for_json(dados))
+            logger.info(f"[JOB] Resultado parcial da fase {fase_num} publicado ({job_id}, evento {seq})")
+        except Exception as e:
+            logger.warning(f"[JOB] Resultado parcial da fase {fase_num} não registado ({job_id}): {e}")
+
+    try:
+        if kind == "analyze":
+            if file_bytes is None:
+                file_bytes = store.take_upload(job_id)
+            if file_bytes is None:
+                raise RuntimeError(f"Upload do job {job_id} não encontrado (expirou?)")
+            resultado = executar_analise_documento(
+                user_id=user_id,
+                file_bytes=file_bytes,
+                filename=params["filename"],
+                area_direito=params["area_direito"],
+                perguntas_raw=params["perguntas_raw"],
+                titulo=params["titulo"],
+                tier=params["tier"],
+                analysis_id=params["analysis_id"],
+                callback_progresso=progresso,
+                callback_parcial=parcial,
+            )
+            result_dict = sanitize_for_json(resultado.to_dict())
+            _guardar_documento_analise(params, resultado, result_dict)
+        elif kind == "resume":
+            resultado = executar_analise_resume(
+                user_id=user_id,
+                document_id=params["document_id"],
+                analysis_id=params["analysis_id"],
+                callback_progresso=progresso,
+                callback_parcial=parcial,
+            )
+            result_dict = sanitize_for_json(resultado.to_dict())
+            _guardar_documento_resume(params, resultado, result_dict)
+        else:
+            raise ValueError(f"Tipo de job desconhecido: {kind}")
+
+        final = {"state": "done", "result": result_dict, "progresso": 100}
+        return result_dict
+    except Exception as e:
+        status_code, detail = erro_http(e, kind)
+        final = {"state": "failed", "error": {"status_code": status_code, "detail": detail}}
+        return None
+    finally:
+        if kind == "analyze":
+            marcar_documento_erro(params.get("doc_id"))
+        store.release_user(user_id, job_id)
+        # Estado final só depois de libertar o utilizador: quem o lê pode submeter logo outra análise
+        store.update(job_id, finished_at=_agora(), **final)
+
+
+def interromper_job(store, job_id: str, motivo: str) -> bool:
+    """
+    Fecha um job cujo executor morreu sem passar pelo finally de executar_job
+    (worker morto, hard time limit, task revogada).
+
+    O job fica "failed", o documento "interrupted" (para /analyze/resume) e o
+    lock do utilizador é libertado. False se o job já estava num estado final.
+    """
+    job = store.get(job_id)
+    if job is None or job.get("state") in ESTADOS_FINAIS:
+        return False
+    logger.warning(f"[JOB] Job {job_id} interrompido ({motivo}) — documento fica para retomar")
+    marcar_documento_interrompido(job)
+    store.release_user(job["user_id"], job_id)
+    store.update(job_id, state="failed", finished_at=_agora(), error={
+        "status_code": 503,
+        "detail": "Análise interrompida. Pode ser retomada a partir do histórico de documentos.",
+    })
+    return True
+
+
+def formatar_sse(evento: str, dados: dict, evento_id: Optional[int] = None) -> str:
+    """Uma mensagem Server-Sent Events (dados em JSON numa só linha)."""
+    linhas = []
+    if evento_id is not None:
+        linhas.append(f"id: {evento_id}")
+    linhas.append(f"event: {evento}")
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False, separators=(',', ':'))}")
+    return "\n".join(linhas) + "\n\n"
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class _JobBackendBase(abc.ABC):
+    """Submissão, consulta e espera de jobs sobre um store."""
+
+    nome = "base"
+
+    def __init__(self, store, user_lock_ttl: int = 7200):
+        self.store = store
+        self.user_lock_ttl = user_lock_ttl
+
+    # -- lock por utilizador -----------------------------------------------
+
+    def reservar_utilizador(self, user_id: str) -> tuple[Optional[str], Optional[str]]:
+        """
+        Reserva o utilizador para um novo job.
+
+        Returns:
+            (token, None) se reservou; (None, holder_actual) se já tem um job.
+            O token é o job_id a usar em submit().
+        """
+        token = str(uuid.uuid4())
+        atual = self.store.acquire_user(user_id, token, self.user_lock_ttl)
+        if atual is not None:
+            return None, atual
+        return token, None
+
+    def libertar_utilizador(self, user_id: str, token: str) -> None:
+        """Liberta uma reserva que não chegou a ser submetida (erro antes do job)."""
+        self.store.release_user(user_id, token)
+
+    # -- jobs --------------------------------------------------------------
+
+    def submit(self, job_id: str, kind: str, params: dict, file_bytes: Optional[bytes] = None) -> str:
+        """Cria e enfileira o job (job_id = token de reservar_utilizador)."""
+        self.store.create(job_id, kind, params["user_id"], analysis_id=params.get("analysis_id"),
+                          document_id=params.get("doc_id") or params.get("document_id"))
+        self.store.refresh_user(params["user_id"], job_id, self.user_lock_ttl)
+        try:
+            self._enqueue(job_id, kind, params, file_bytes)
+        except Exception as e:
+            self.store.update(job_id, state="failed", finished_at=_agora(),
+                              error={"status_code": 503, "detail": "Fila de análises indisponível."})
+            self.store.release_user(params["user_id"], job_id)
+            logger.error(f"[JOB] Falha ao submeter job {job_id} ({self.nome}): {e}")
+            raise
+        logger.info(f"[JOB] Submetido {kind} job={job_id} user={params['user_id'][:8]} backend={self.nome}")
+        return job_id
+
+    @abc.abstractmethod
+    def _enqueue(self, job_id: str, kind: str, params: dict, file_bytes: Optional[bytes]) -> None:
+        """Entrega o job ao executor do backend."""
+
+    def status(self, job_id: str, incluir_resultado: bool = False) -> Optional[dict]:
+        job = self.store.get(job_id)
+        if job is not None and not incluir_resultado:
+            job.pop("result", None)
+        return job
+
+    def events(self, job_id: str, after: int = 0) -> list[dict]:
+        return self.store.events(job_id, after)
+
+    async def aguardar(self, job_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """Espera (sem bloquear o event loop) até o job terminar; devolve o job com resultado."""
+        inicio = time.monotonic()
+        intervalo = 0.2
+        while True:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None or job.get("state") in ESTADOS_FINAIS:
+                return job
+            if timeout is not None and time.monotonic() - inicio >= timeout:
+                return job
+            await asyncio.sleep(intervalo)
+            intervalo = min(intervalo * 1.5, 2.0)
+
+    async def stream(self, job_id: str, after: int = 0, intervalo: float = 1.0,
+                     heartbeat: float = 15.0, desligado=None):
+        """
+        Eventos do job em formato SSE a partir de `after` (Last-Event-ID), até ao fim.
+
+        Cada evento sai com id = seq; no fim envia "done"/"failed" (sem id) com o
+        job completo, para que um cliente que reconecte depois do fim o receba de novo.
+        `desligado` é uma coroutine function (ex: request.is_disconnected).
+        """
+        ultimo_envio = time.monotonic()
+        while True:
+            if desligado is not None and await desligado():
+                return
+            # Estado antes dos eventos: se já terminou, os eventos lidos a seguir estão completos.
+            # Cada poll lê só o estado; o job com resultado só quando é final.
+            estado = await asyncio.to_thread(self.store.state, job_id)
+            if estado is None:
+                yield formatar_sse("failed", {"job_id": job_id, "state": "failed",
+                                              "error": {"status_code": 404, "detail": "Job não encontrado."}})
+                return
+            eventos = await asyncio.to_thread(self.store.events, job_id, after)
+            for evento in eventos:
+                after = evento["seq"]
+                yield formatar_sse(evento.get("tipo", "progresso"), evento, evento_id=evento["seq"])
+            if estado in ESTADOS_FINAIS:
+                job = await asyncio.to_thread(self.status, job_id, True)
+                yield formatar_sse(estado, job)
+                return
+            if eventos:
+                ultimo_envio = time.monotonic()
+            elif time.monotonic() - ultimo_envio >= heartbeat:
+                yield ": ping\n\n"  # mantém a ligação viva através de proxies
+                ultimo_envio = time.monotonic()
+            await asyncio.sleep(intervalo)
+
+    def jobs_locais(self) -> list[dict]:
+        """Jobs activos a correr neste processo (o SIGTERM da API marca-os como interrompidos)."""
+        return []
+
+    def get_metrics(self) -> dict:
+        try:
+            ativos = len(self.store.active_jobs())
+        except Exception:
+            ativos = -1
+        return {"backend": self.nome, "active_jobs": ativos}
+
+
+class InProcessJobBackend(_JobBackendBase):
+    """Jobs numa thread pool do processo actual (stand-in sem Redis/Celery)."""
+
+    nome = "inprocess"
+
+    def __init__(self, store: Optional[InMemoryJobStore] = None, max_workers: int = 1,
+                 user_lock_ttl: int = 7200):
+        super().__init__(store or InMemoryJobStore(), user_lock_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="analysis-job")
+
+    def _enqueue(self, job_id: str, kind: str, params: dict, file_bytes: Optional[bytes]) -> None:
+        self._executor.submit(executar_job, self.store, job_id, kind, params, file_bytes, self.user_lock_ttl)
+
+    def jobs_locais(self) -> list[dict]:
+        return self.store.active_jobs()
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class CeleryJobBackend(_JobBackendBase):
+    """Jobs executados pelo worker Celery; estado no Redis."""
+
+    nome = "celery"
+
+    def _enqueue(self, job_id: str, kind: str, params: dict, file_bytes: Optional[bytes]) -> None:
+        if celery_app is None:
+            raise RuntimeError("Celery não disponível")
+        if file_bytes is not None:
+            self.store.put_upload(job_id, file_bytes)  # fora da mensagem do broker
+        analysis_job_task.apply_async(args=[job_id, kind, params], task_id=job_id)
+
+
+if celery_app is not None:
+    from celery import signals as _celery_signals
+
+    from src.config import JOB_TIME_LIMIT as _JOB_TIME_LIMIT
+
+    # acks_late=False: se o worker morrer a meio, a análise NÃO é repetida do zero
+    # (créditos já bloqueados) — fica para o resume a partir dos checkpoints.
+    # Os handlers abaixo (processo principal do worker) fecham o job nesse caso.
+    @celery_app.task(
+        name=_TASK_ANALISE,
+        bind=True,
+        acks_late=False,
+        soft_time_limit=_JOB_TIME_LIMIT,
+        time_limit=_JOB_TIME_LIMIT + 60,
+    )
+    def analysis_job_task(self, job_id: str, kind: str, params: dict) -> None:
+        backend = get_job_backend()
+        backend.store.update(job_id, worker=self.request.hostname)
+        executar_job(backend.store, job_id, kind, params, user_lock_ttl=backend.user_lock_ttl)
+
+    def _interromper_task(job_id: Optional[str], motivo: str) -> None:
+        if not job_id:
+            return
+        try:
+            interromper_job(get_job_backend().store, job_id, motivo)
+        except Exception as e:
+            logger.error(f"[JOB] Falha ao fechar job interrompido {job_id}: {e}")
+
+    # Filtro por nome: o objecto da task no registo pode não ser o proxy acima
+    @_celery_signals.task_failure.connect
+    def _on_task_failure(sender=None, task_id=None, exception=None, **kwargs):
+        # executar_job apanha as excepções do engine: aqui só chegam as do
+        # executor (WorkerLostError, TimeLimitExceeded)
+        if getattr(sender, "name", None) == _TASK_ANALISE:
+            _interromper_task(task_id, f"falha da task: {exception!r}")
+
+    @_celery_signals.task_revoked.connect
+    def _on_task_revoked(sender=None, request=None, terminated=False, signum=None, **kwargs):
+        if getattr(sender, "name", None) == _TASK_ANALISE:
+            _interromper_task(getattr(request, "id", None),
+                              f"task revogada (terminated={terminated}, signal={signum})")
+
+    @_celery_signals.worker_shutdown.connect
+    def _on_worker_shutdown(sender=None, **kwargs):
+        # O pool já parou: um job deste worker que não está final não vai acabar
+        hostname = getattr(sender, "hostname", None)
+        try:
+            ativos = get_job_backend().store.active_jobs()
+        except Exception as e:
+            logger.error(f"[JOB] Shutdown do worker: falha ao listar jobs activos: {e}")
+            return
+        for job in ativos:
+            if job.get("state") == "running" and job.get("worker") == hostname:
+                _interromper_task(job["job_id"], f"shutdown do worker {hostname}")
+else:
+    analysis_job_task = None
+
+
+_backend: Optional[_JobBackendBase] = None
+_backend_lock = threading.Lock()
+
+
+def get_job_backend() -> _JobBackendBase:
+    """Backend de execução de análises do processo (singleton, JOB_BACKEND)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                from src.config import (
+                    JOB_BACKEND, JOB_INPROCESS_WORKERS, JOB_RESULT_TTL, JOB_USER_LOCK_TTL,
+                )
+                if JOB_BACKEND == "celery" and celery_app is not None and redis is not None:
+                    _backend = CeleryJobBackend(
+                        RedisJobStore.from_url(REDIS_URL, result_ttl=JOB_RESULT_TTL),
+                        user_lock_ttl=JOB_USER_LOCK_TTL,
+                    )
+                else:
+                    if JOB_BACKEND == "celery":
+                        logger.warning("[JOB] JOB_BACKEND=celery mas celery/redis não instalados — a usar inprocess")
+                    _backend = InProcessJobBackend(
+                        InMemoryJobStore(result_ttl=JOB_RESULT_TTL),
+                        max_workers=JOB_INPROCESS_WORKERS,
+                        user_lock_ttl=JOB_USER_LOCK_TTL,
+                    )
+                logger.info(f"[JOB] Backend de análises: {_backend.nome}")
+    return _backend
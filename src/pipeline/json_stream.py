@@ -0,0 +1,320 @@
+"""
+PARSER INCREMENTAL DE JSON — items dos extractores à medida que chegam
+═══════════════════════════════════════════════════════════════════════════
+
+Consome o output do LLM em pedaços (deltas do streaming ou o texto todo de
+uma vez) numa única passagem e devolve cada item assim que o seu objecto
+fecha. Não re-lê o texto já visto, não repara nada por regex e não faz
+json.loads ao documento inteiro — só a cada item (o slice do objecto).
+
+Formatos aceites (os mesmos de parse_unified_output):
+    {"items": [{...}, ...], "unreadable_sections": [...], "status": ...}
+    [{...}, {...}, {"status": "to_be_continued", "last_item_id": N}]
+com texto/markdown antes ou depois do JSON. Um `[`/`{` na prosa ("[JSON]",
+"{x}") não conta como raiz: esta só abre em `{"`, `{}` ou `[{`.
+
+Truncagem: se o texto acaba com a raiz ainda aberta, `truncado` fica True
+e `items` tem todos os objectos completos até ali — a continuação pode
+pedir a partir de len(items) sem reparar nem re-parsear o output.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Caracteres estruturais (fora de strings) e relevantes dentro de strings
+_ESTRUTURA = re.compile(r'["{}\[\]:,]')
+_EM_STRING = re.compile(r'["\\]')
+_NAO_BRANCO = re.compile(r"\S")
+
+# Chaves da raiz cujos arrays contêm elementos a emitir um a um
+_ARRAYS_ITEMS = ("items", "unreadable_sections")
+
+
+class _Frame:
+    __slots__ = ("tipo", "inicio", "chave", "espera_chave", "papel", "elemento")
+
+    def __init__(self, tipo: str, inicio: int, papel: Optional[str] = None, elemento: Optional[str] = None):
+        self.tipo = tipo  # "{" ou "["
+        self.inicio = inicio
+        self.chave: Optional[str] = None  # última chave lida (objectos)
+        self.espera_chave = tipo == "{"
+        self.papel = papel  # arrays: "items" / "unreadable_sections"
+        self.elemento = elemento  # objectos: papel do array a que pertencem
+
+
+class IncrementalItemParser:
+    """
+    Parser incremental de items JSON.
+
+    Uso:
+        parser = IncrementalItemParser()
+        for delta in stream:
+            for item in parser.feed(delta):
+                ...
+        parser.finish()
+    """
+
+    def __init__(self, on_item: Optional[Callable[[dict], None]] = None):
+        self.on_item = on_item
+        self.reset()
+
+    def reset(self) -> None:
+        """Recomeça do zero (ex: nova tentativa do mesmo pedido)."""
+        self._texto = ""  # só a parte ainda necessária (o resto é descartado)
+        self.chars = 0  # total de caracteres recebidos
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._em_string = False
+        self._escape = False
+        self._string_inicio = 0
+        self._valor_inicio: Optional[int] = None
+        self.iniciado = False
+        self.completo = False
+        self.tem_items = False  # viu um array de items (raiz array ou chave "items")
+        self.raiz: Optional[str] = None
+        self.items: list[dict] = []
+        self.unreadable: list[dict] = []
+        self.campos: dict[str, Any] = {}  # restantes campos da raiz (status, last_item_id, ...)
+        self.marcadores: list[dict] = []  # elementos de controlo ({"status": ...}) no array
+        self.erros: list[str] = []
+
+    # ------------------------------------------------------------------
+    # Entrada
+    # ------------------------------------------------------------------
+
+    def feed(self, pedaco: str) -> list[dict]:
+        """Acrescenta texto; devolve os items que ficaram completos com ele."""
+        if not pedaco:
+            return []
+        self.chars += len(pedaco)
+        if self.completo:
+            return []
+        self._texto += pedaco
+        antes = len(self.items)
+        self._scan()
+        self._compactar()
+        return self.items[antes:]
+
+    def finish(self) -> "IncrementalItemParser":
+        """Fim do texto: marca truncagem se a raiz ficou aberta."""
+        self._scan()
+        if self.iniciado and not self.completo:
+            logger.info(
+                f"[JSON-STREAM] Output truncado: {len(self.items)} items completos, "
+                f"profundidade {len(self._stack)} em aberto"
+            )
+        return self
+
+    # ------------------------------------------------------------------
+    # Estado
+    # ------------------------------------------------------------------
+
+    @property
+    def truncado(self) -> bool:
+        return self.iniciado and not self.completo
+
+    @property
+    def continuacao(self) -> Optional[int]:
+        """last_item_id pedido pelo modelo ("to_be_continued"), ou None."""
+        if self.campos.get("status") == "to_be_continued":
+            return self.campos.get("last_item_id", len(self.items))
+        for marcador in self.marcadores:
+            if marcador.get("status") == "to_be_continued":
+                return marcador.get("last_item_id", marcador.get("id", len(self.items)))
+        return None
+
+    @property
+    def utilizavel(self) -> bool:
+        """True se o texto tinha o formato esperado (há um array de items)."""
+        return self.tem_items
+
+    def to_json_data(self) -> dict:
+        """Equivalente ao dict que extract_json_from_text devolveria."""
+        dados = dict(self.campos)
+        dados["items"] = list(self.items)
+        dados["unreadable_sections"] = list(self.unreadable)
+        return dados
+
+    # ------------------------------------------------------------------
+    # Scanner
+    # ------------------------------------------------------------------
+
+    def _compactar(self) -> None:
+        """Descarta o texto que já não pode ser preciso (antes do item/campo em aberto)."""
+        minimo = self._pos
+        for frame in self._stack:
+            if frame.elemento is not None:
+                minimo = min(minimo, frame.inicio)
+        if self._valor_inicio is not None:
+            minimo = min(minimo, self._valor_inicio)
+        if self._em_string:
+            minimo = min(minimo, self._string_inicio)
+        if minimo <= 0:
+            return
+        self._texto = self._texto[minimo:]
+        self._pos -= minimo
+        self._string_inicio -= minimo
+        if self._valor_inicio is not None:
+            self._valor_inicio -= minimo
+        for frame in self._stack:
+            frame.inicio -= minimo
+
+    def _scan(self) -> None:
+        texto = self._texto
+        n = len(texto)
+        pos = self._pos
+        while pos < n and not self.completo:
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+            if self._em_string:
+                m = _EM_STRING.search(texto, pos)
+                if m is None:
+                    pos = n
+                    break
+                i = m.start()
+                if texto[i] == "\\":
+                    self._escape = True
+                    pos = i + 1
+                    continue
+                self._em_string = False
+                self._fim_string(texto, i)
+                pos = i + 1
+                continue
+
+            m = _ESTRUTURA.search(texto, pos)
+            if m is None:
+                pos = n
+                break
+            i = m.start()
+            c = texto[i]
+            pos = i + 1
+            if not self.iniciado:
+                if c in "{[":
+                    raiz = self._inicio_raiz(texto, i)
+                    if raiz is None:
+                        # ainda não chegou o carácter que decide — retomar aqui
+                        pos = i
+                        break
+                    if raiz:
+                        self.iniciado = True
+                        self.raiz = c
+                        self._abrir(c, i)
+                continue
+            if c == '"':
+                self._em_string = True
+                self._string_inicio = i
+            elif c in "{[":
+                self._abrir(c, i)
+            elif c in "}]":
+                self._fechar(texto, i)
+            elif c == ":":
+                topo = self._stack[-1]
+                if topo.tipo == "{":
+                    topo.espera_chave = False
+                    if len(self._stack) == 1:
+                        self._valor_inicio = i + 1
+            elif c == ",":
+                topo = self._stack[-1]
+                if topo.tipo == "{":
+                    topo.espera_chave = True
+                    if len(self._stack) == 1:
+                        self._campo_raiz(topo.chave, texto, i)
+        self._pos = pos
+
+    @staticmethod
+    def _inicio_raiz(texto: str, i: int) -> Optional[bool]:
+        """
+        Decide se o `{`/`[` em i abre a raiz JSON ou é prosa ("[JSON]", "{x}").
+
+        Raiz só em `{` seguido de `"`/`}` ou em `[` seguido de `{`; None se o
+        texto acaba antes do próximo carácter significativo.
+        """
+        m = _NAO_BRANCO.search(texto, i + 1)
+        if m is None:
+            return None
+        return m.group() in ('"}' if texto[i] == "{" else "{")
+
+    def _fim_string(self, texto: str, fim: int) -> None:
+        topo = self._stack[-1] if self._stack else None
+        if topo is not None and topo.tipo == "{" and topo.espera_chave:
+            try:
+                topo.chave = json.loads(texto[self._string_inicio:fim + 1])
+            except ValueError:
+                topo.chave = texto[self._string_inicio + 1:fim]
+
+    def _abrir(self, c: str, i: int) -> None:
+        pai = self._stack[-1] if self._stack else None
+        if c == "[":
+            papel = None
+            if pai is None:
+                papel = "items"
+            elif len(self._stack) == 1 and pai.tipo == "{" and pai.chave in _ARRAYS_ITEMS:
+                papel = pai.chave
+            if papel == "items":
+                self.tem_items = True
+            self._stack.append(_Frame("[", i, papel=papel))
+        else:
+            elemento = pai.papel if pai is not None and pai.tipo == "[" else None
+            self._stack.append(_Frame("{", i, elemento=elemento))
+
+    def _fechar(self, texto: str, i: int) -> None:
+        if not self._stack:
+            return
+        frame = self._stack.pop()
+        if frame.tipo == "{" and len(self._stack) == 0:
+            # fim da raiz objecto: último campo
+            self._campo_raiz(frame.chave, texto, i)
+        if frame.elemento is not None:
+            self._elemento(frame.elemento, texto[frame.inicio:i + 1])
+        if not self._stack:
+            self.completo = True
+
+    def _campo_raiz(self, chave: Optional[str], texto: str, fim: int) -> None:
+        inicio, self._valor_inicio = self._valor_inicio, None
+        if chave is None or inicio is None or chave in _ARRAYS_ITEMS:
+            return
+        bruto = texto[inicio:fim].strip()
+        if not bruto:
+            return
+        try:
+            self.campos[chave] = json.loads(bruto)
+        except ValueError:
+            self.erros.append(f"Campo '{chave}' inválido")
+
+    def _elemento(self, papel: str, bruto: str) -> None:
+        try:
+            obj = json.loads(bruto)
+        except ValueError:
+            # Ex: vírgula final dentro do objecto — uma reparação local, só deste item
+            try:
+                obj = json.loads(re.sub(r",\s*([}\]])", r"\1", bruto))
+            except ValueError as e:
+                self.erros.append(f"Item {len(self.items) + 1} inválido: {e}")
+                return
+        if not isinstance(obj, dict):
+            return
+        if papel == "unreadable_sections":
+            self.unreadable.append(obj)
+            return
+        if "status" in obj:
+            self.marcadores.append(obj)
+            return
+        self.items.append(obj)
+        if self.on_item is not None:
+            try:
+                self.on_item(obj)
+            except Exception as e:
+                logger.debug(f"[JSON-STREAM] on_item falhou: {e}")
+
+
+def parse_items_text(texto: str) -> IncrementalItemParser:
+    """Atalho: corre o parser sobre um texto completo."""
+    parser = IncrementalItemParser()
+    parser.feed(texto)
+    return parser.finish()
@@ -9,13 +9,19 @@
 # - Entidades nomeadas (NER do M3B: pessoas, organizações, locais)
 #
 # Entidades "travadas" não podem ser alteradas pelo processamento downstream.
+#
+# Os cinco padrões regex correm numa única passagem (REGEX_ENTIDADES); o
+# registo mantém um índice ordenado por posição para consultas de range e os
+# IDs são deterministas (mesmo texto → mesmos IDs entre execuções).
 # ============================================================================
 
+import bisect
+import hashlib
 import re
 import logging
-import uuid
-from dataclasses import dataclass, field
-from typing import Optional
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +71,23 @@ REGEX_NIF = re.compile(
     re.IGNORECASE
 )
 
+# Ordem = prioridade quando dois tipos começariam na mesma posição
+_PADROES_REGEX = (
+    ("date", REGEX_DATAS_PT),
+    ("amount", REGEX_VALORES_EURO),
+    ("legal_ref", REGEX_ARTIGOS_PT),
+    ("process_number", REGEX_PROCESSO),
+    ("nif", REGEX_NIF),
+)
+
+# Scanner combinado: um grupo nomeado por tipo (match.lastgroup = entity_type).
+# Difere das cinco passagens separadas apenas quando matches de tipos
+# diferentes se sobrepõem — fica o primeiro (mais à esquerda, depois ordem acima).
+REGEX_ENTIDADES = re.compile(
+    "|".join(f"(?P<{tipo}>{padrao.pattern})" for tipo, padrao in _PADROES_REGEX),
+    re.IGNORECASE,
+)
+
 
 @dataclass
 class LockedEntity:
@@ -95,11 +118,20 @@ class LockedEntity:
 
 
 class EntityRegistry:
-    """Registo imutável de entidades."""
+    """
+    Registo imutável de entidades.
+
+    Índice de intervalos: entidades ordenadas por start_char (listas paralelas
+    para bisect) + maior comprimento visto. Uma consulta [a, b) só examina as
+    entidades com start em (a - maior, b), em vez de todo o registo.
+    """
 
     def __init__(self):
         self._entities: list[LockedEntity] = []
         self._by_type: dict[str, list[LockedEntity]] = {}
+        self._starts: list[int] = []
+        self._ordem: list[int] = []  # índice em _entities, alinhado com _starts
+        self._max_len = 0
 
     @property
     def entities(self) -> list[LockedEntity]:
@@ -111,19 +143,39 @@ class EntityRegistry:
 
     def add(self, entity: LockedEntity) -> None:
         """Adicionar entidade ao registo."""
+        idx = len(self._entities)
         self._entities.append(entity)
         self._by_type.setdefault(entity.entity_type, []).append(entity)
 
+        if not self._starts or entity.start_char >= self._starts[-1]:
+            # Caso comum (scanner regex): chega por ordem de posição
+            self._starts.append(entity.start_char)
+            self._ordem.append(idx)
+        else:
+            pos = bisect.bisect_right(self._starts, entity.start_char)
+            self._starts.insert(pos, entity.start_char)
+            self._ordem.insert(pos, idx)
+        self._max_len = max(self._max_len, entity.end_char - entity.start_char)
+
     def get_by_type(self, entity_type: str) -> list[LockedEntity]:
         """Obter entidades por tipo."""
         return self._by_type.get(entity_type, [])
 
     def get_in_range(self, start_char: int, end_char: int) -> list[LockedEntity]:
-        """Obter entidades que caem dentro de um range de caracteres."""
-        return [
-            e for e in self._entities
-            if e.start_char < end_char and e.end_char > start_char
-        ]
+        """Obter entidades que caem dentro de um range de caracteres (ordem de registo)."""
+        lo = bisect.bisect_right(self._starts, start_char - self._max_len)
+        hi = bisect.bisect_left(self._starts, end_char)
+        encontrados = sorted(
+            i for i in self._ordem[lo:hi]
+            if self._entities[i].end_char > start_char
+        )
+        return [self._entities[i] for i in encontrados]
+
+    def has_in_range(self, start_char: int, end_char: int) -> bool:
+        """True se alguma entidade cai no range (sem construir a lista)."""
+        lo = bisect.bisect_right(self._starts, start_char - self._max_len)
+        hi = bisect.bisect_left(self._starts, end_char)
+        return any(self._entities[i].end_char > start_char for i in self._ordem[lo:hi])
 
     def get_entity_ids_in_range(self, start_char: int, end_char: int) -> list[str]:
         """Obter IDs de entidades num range."""
@@ -170,30 +222,8 @@ def lock_entities(
 
     logger.info(f"[M5] Travamento de entidades: {len(text):,} chars")
 
-    # 1. Regex: Datas
-    _extract_by_regex(
-        text, REGEX_DATAS_PT, "date", registry, page_boundaries
-    )
-
-    # 2. Regex: Valores monetários
-    _extract_by_regex(
-        text, REGEX_VALORES_EURO, "amount", registry, page_boundaries
-    )
-
-    # 3. Regex: Referências legais
-    _extract_by_regex(
-        text, REGEX_ARTIGOS_PT, "legal_ref", registry, page_boundaries
-    )
-
-    # 4. Regex: Números de processo
-    _extract_by_regex(
-        text, REGEX_PROCESSO, "process_number", registry, page_boundaries
-    )
-
-    # 5. Regex: NIF/NIPC
-    _extract_by_regex(
-        text, REGEX_NIF, "nif", registry, page_boundaries
-    )
+    # 1-5. Regex (datas, valores, referências legais, processos, NIF) numa passagem
+    _extract_by_regex(text, registry, page_boundaries)
 
     regex_count = registry.count
 
@@ -214,29 +244,23 @@ def lock_entities(
 
 def _extract_by_regex(
     text: str,
-    pattern: re.Pattern,
-    entity_type: str,
     registry: EntityRegistry,
     page_boundaries: Optional[dict[int, tuple[int, int]]],
 ) -> None:
-    """Extrair entidades via regex e adicionar ao registo."""
-    for match in pattern.finditer(text):
-        # Obter o grupo que deu match (pode ser grupo 1 ou grupo inteiro)
+    """Extrair entidades com o scanner combinado e adicionar ao registo."""
+    page_of = _page_lookup(page_boundaries)
+    for match in REGEX_ENTIDADES.finditer(text):
+        entity_type = match.lastgroup
         matched_text = match.group(0)
         start = match.start()
         end = match.end()
 
-        # Determinar página
-        page_num = _char_to_page_num(start, page_boundaries)
-
-        entity_id = f"ent_{entity_type}_{uuid.uuid4().hex[:8]}"
-
         registry.add(LockedEntity(
-            entity_id=entity_id,
+            entity_id=_entity_id(entity_type, start, end, matched_text),
             entity_type=entity_type,
             text=matched_text,
             normalized=_normalize_entity(matched_text, entity_type),
-            page_num=page_num,
+            page_num=page_of(start),
             start_char=start,
             end_char=end,
             source="regex",
@@ -267,15 +291,12 @@ def _merge_ner_entities(
         entity_type = type_mapping.get(ner_ent.entity_type, ner_ent.entity_type.lower())
 
         # Verificar se já existe entidade na mesma posição (do regex)
-        existing = registry.get_in_range(ner_ent.start, ner_ent.end)
-        if existing:
+        if registry.has_in_range(ner_ent.start, ner_ent.end):
             # Já coberto por regex — saltar
             continue
 
-        entity_id = f"ent_{entity_type}_{uuid.uuid4().hex[:8]}"
-
         registry.add(LockedEntity(
-            entity_id=entity_id,
+            entity_id=_entity_id(entity_type, ner_ent.start, ner_ent.end, ner_ent.value),
             entity_type=entity_type,
             text=ner_ent.value,
             normalized=ner_ent.value,
@@ -287,19 +308,37 @@ def _merge_ner_entities(
         ))
 
 
-def _char_to_page_num(
-    char_pos: int,
+def _entity_id(entity_type: str, start: int, end: int, text: str) -> str:
+    """ID determinista: o mesmo texto gera os mesmos IDs em todas as execuções."""
+    digest = hashlib.sha256(f"{entity_type}:{start}:{end}:{text}".encode()).hexdigest()[:12]
+    return f"ent_{entity_type}_{digest}"
+
+
+def _page_lookup(
     page_boundaries: Optional[dict[int, tuple[int, int]]],
-) -> int:
-    """Mapear posição de carácter para número de página."""
+) -> Callable[[int], int]:
+    """Função posição → página (bisect sobre os inícios das páginas; 0 se fora)."""
     if not page_boundaries:
+        return lambda char_pos: 0
+
+    paginas = sorted((start, end, page_num) for page_num, (start, end) in page_boundaries.items())
+    inicios = [p[0] for p in paginas]
+
+    def page_of(char_pos: int) -> int:
+        i = bisect.bisect_right(inicios, char_pos) - 1
+        if i >= 0 and char_pos < paginas[i][1]:
+            return paginas[i][2]
         return 0
 
-    for page_num, (start, end) in page_boundaries.items():
-        if start <= char_pos < end:
-            return page_num
+    return page_of
 
-    return 0
+
+def _char_to_page_num(
+    char_pos: int,
+    page_boundaries: Optional[dict[int, tuple[int, int]]],
+) -> int:
+    """Mapear posição de carácter para número de página."""
+    return _page_lookup(page_boundaries)(char_pos)
 
 
 def _normalize_entity(text: str, entity_type: str) -> str:
@@ -317,3 +356,93 @@ def _normalize_entity(text: str, entity_type: str) -> str:
 
     # Default: retornar como está
     return text
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+_FRASES_BENCHMARK = (
+    "Nos termos do art. 483º, n.º 1 do Código Civil, o réu deve pagar 12.500,00 € ao autor.",
+    "Em 12/03/2021 foi celebrado o contrato (Proc. n.º 1234/21.5TBLSB), NIF 123456789.",
+    "A Lei n.º 23/2007 e o Decreto-Lei n.º 15/2019 aplicam-se desde 5 de janeiro de 2020.",
+    "O montante de 3.000 euros foi liquidado por EUR 250,50 em 01-02-2022.",
+    "A testemunha Maria Silva declarou ter visto o veículo em Lisboa pelas 10 horas.",
+    "Sem outros elementos relevantes, foi a audiência suspensa e retomada no dia seguinte.",
+)
+
+
+def benchmark_lock_entities(
+    tamanho_chars: int = 2_000_000,
+    chars_por_pagina: int = 3_000,
+    ner_por_pagina: int = 4,
+) -> dict[str, Any]:
+    """
+    Mede o M5 sobre um texto OCR sintético (por omissão ~2 MB).
+
+    Gera páginas com datas, valores, artigos, processos e NIFs, e entidades
+    NER (pessoas/locais, parte delas sobrepostas a matches regex). Devolve
+    tempos, chars/s e contagens; corre duas vezes para confirmar que os IDs
+    são deterministas.
+    """
+    from types import SimpleNamespace
+
+    partes: list[str] = []
+    n = 0
+    i = 0
+    while n < tamanho_chars:
+        frase = _FRASES_BENCHMARK[(i * 7) % len(_FRASES_BENCHMARK)]
+        partes.append(frase)
+        n += len(frase) + 1
+        i += 1
+    text = " ".join(partes)[:tamanho_chars]
+
+    page_boundaries = {
+        p + 1: (inicio, min(inicio + chars_por_pagina, len(text)))
+        for p, inicio in enumerate(range(0, len(text), chars_por_pagina))
+    }
+
+    ner_entities = []
+    for page_num, (inicio, fim) in page_boundaries.items():
+        for k in range(ner_por_pagina):
+            pos = inicio + (k * 997) % max(1, fim - inicio - 20)
+            tipo = "PERSON" if k % 2 == 0 else "LOC"
+            ner_entities.append(SimpleNamespace(
+                entity_type=tipo, value=text[pos:pos + 12], start=pos, end=pos + 12,
+                page_num=page_num, confidence=0.8,
+            ))
+
+    t0 = time.perf_counter()
+    registry = lock_entities(text, ner_entities=ner_entities, page_boundaries=page_boundaries)
+    total = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    so_regex = lock_entities(text, page_boundaries=page_boundaries)
+    regex = time.perf_counter() - t0
+
+    # Consultas de range como as do M6 (uma por bloco de 2000 chars)
+    t0 = time.perf_counter()
+    refs = sum(
+        len(registry.get_entity_ids_in_range(a, a + 2_000))
+        for a in range(0, len(text), 2_000)
+    )
+    ranges = time.perf_counter() - t0
+
+    ids = [e.entity_id for e in so_regex.entities]
+    return {
+        "chars": len(text),
+        "paginas": len(page_boundaries),
+        "entidades": registry.count,
+        "entidades_regex": so_regex.count,
+        "entidades_ner": registry.count - so_regex.count,
+        "ner_recebidas": len(ner_entities),
+        "por_tipo": {t: len(registry.get_by_type(t)) for t in sorted(registry._by_type)},
+        "segundos_total": round(total, 3),
+        "segundos_regex": round(regex, 3),
+        "segundos_ner": round(max(0.0, total - regex), 3),
+        "segundos_ranges": round(ranges, 3),
+        "refs_em_ranges": refs,
+        "chars_por_segundo": int(len(text) / total) if total > 0 else 0,
+        "ids_unicos": len(set(ids)) == len(ids),
+        "ids_deterministas": ids == [e.entity_id for e in registry.entities if e.source == "regex"],
+    }
@@ -16,7 +16,7 @@ import uuid
 from dataclasses import dataclass, field
 from typing import Optional
 
-from src.config import V42_HIERARCHICAL_THRESHOLD, V42_CONSOLIDATION_BATCH_SIZE
+from src.config import NEAR_DUP_ENABLED, V42_HIERARCHICAL_THRESHOLD, V42_CONSOLIDATION_BATCH_SIZE
 from src.pipeline.schema_unified import (
     EvidenceItem,
     SourceSpan,
@@ -24,6 +24,8 @@ from src.pipeline.schema_unified import (
     ItemType,
     Conflict,
 )
+from src.pipeline.evidence_store import EvidenceStore, IntervalIndex
+from src.pipeline.near_dup import merge_near_duplicates
 
 logger = logging.getLogger(__name__)
 
@@ -162,7 +164,9 @@ def _hierarchical_consolidation(
         all_conflicts.extend(result.conflicts)
 
     # Meta-consolidação: detectar duplicados entre lotes
-    deduplicated_items, extra_conflicts = _cross_batch_dedup(all_items)
+    # Items já em conflitos dos lotes não entram na fusão aproximada
+    em_conflito = {item_id for c in all_conflicts for item_id in c.items_involved}
+    deduplicated_items, extra_conflicts = _cross_batch_dedup(all_items, excluir=em_conflito)
     all_conflicts.extend(extra_conflicts)
 
     return ConsolidationResult(
@@ -242,10 +246,10 @@ def _add_locked_entities(
     chunks: list,
 ) -> None:
     """Adicionar entidades travadas (M5) como union_items se não duplicados."""
-    existing_values = {
-        (item.item_type.value, item.value_normalized)
-        for item in result.union_items
-    }
+    existing = EvidenceStore.from_items(result.union_items)
+    chunk_index = IntervalIndex(
+        (chunk.start_char, chunk.end_char, i) for i, chunk in enumerate(chunks)
+    )
 
     entity_type_map = {
         "date": ItemType.DATE,
@@ -263,16 +267,14 @@ def _add_locked_entities(
         item_type = entity_type_map.get(entity.entity_type, ItemType.OTHER)
 
         # Verificar se já existe
-        key = (item_type.value, entity.normalized)
-        if key in existing_values:
+        if existing.has_value(item_type.value, entity.normalized):
             continue
 
-        # Encontrar chunk_id
+        # Encontrar chunk_id (primeiro chunk, pela ordem da lista, que contém a entidade)
         chunk_id = f"{doc_id}_c0000"
-        for chunk in chunks:
-            if chunk.start_char <= entity.start_char < chunk.end_char:
-                chunk_id = f"{doc_id}_c{chunk.chunk_index:04d}"
-                break
+        contendo = chunk_index.containing(entity.start_char)
+        if contendo:
+            chunk_id = f"{doc_id}_c{chunks[min(contendo)].chunk_index:04d}"
 
         try:
             evidence_item = EvidenceItem(
@@ -298,7 +300,7 @@ def _add_locked_entities(
                 },
             )
             result.union_items.append(evidence_item)
-            existing_values.add(key)
+            existing.add(evidence_item)
             added += 1
         except ValueError:
             continue
@@ -344,8 +346,14 @@ def _detect_conflicts(items: list[EvidenceItem]) -> list:
     return conflicts
 
 
-def _cross_batch_dedup(items: list[EvidenceItem]) -> tuple[list[EvidenceItem], list]:
-    """Remover duplicados entre lotes na consolidação hierárquica."""
+def _cross_batch_dedup(
+    items: list[EvidenceItem], excluir: Optional[set[str]] = None,
+) -> tuple[list[EvidenceItem], list]:
+    """
+    Remover duplicados entre lotes na consolidação hierárquica.
+
+    excluir: item_ids em conflitos (ficam fora da fusão de quase-duplicados).
+    """
     seen = {}  # (type, value) -> first item
     unique_items = []
     conflicts = []
@@ -361,6 +369,10 @@ def _cross_batch_dedup(items: list[EvidenceItem]) -> tuple[list[EvidenceItem], l
             for span in item.source_spans:
                 existing.add_source(span)
 
+    # Paráfrases do mesmo item vindas de lotes diferentes
+    if NEAR_DUP_ENABLED:
+        unique_items, _relatorio = merge_near_duplicates(unique_items, excluir=excluir)
+
     removed = len(items) - len(unique_items)
     if removed:
         logger.info(f"[M7B] Cross-batch dedup: {removed} duplicados removidos")
@@ -25,6 +25,7 @@ from pathlib import Path
 from typing import Optional
 
 from src.config import OUTPUT_DIR, USE_UNIFIED_PROVENANCE
+from src.pipeline.artefact_store import get_artefact_store, nome_logico
 from src.utils.sanitize import sanitize_run_id
 
 logger = logging.getLogger(__name__)
@@ -311,7 +312,11 @@ class MetaIntegrityValidator:
 
         # Verificar existência
         if self.output_dir.exists():
-            actual_files = set(f.name for f in self.output_dir.iterdir() if f.is_file())
+            # Nomes lógicos: variantes .gz/.ndjson do ArtefactStore contam como o .json
+            actual_files = set(
+                nome_logico(f.name) for f in self.output_dir.iterdir()
+                if f.is_file() and not f.name.endswith(".tmp")
+            )
 
             for f in expected_files:
                 if f in actual_files:
@@ -425,10 +430,9 @@ class MetaIntegrityValidator:
     def _load_json(self, filename: str) -> Optional[dict]:
         """Carrega ficheiro JSON se existir."""
         filepath = self.output_dir / filename
-        if filepath.exists():
+        if get_artefact_store().exists(filepath):
             try:
-                with open(filepath, encoding='utf-8') as f:
-                    return json.load(f)
+                return get_artefact_store().read_json(filepath)
             except Exception as e:
                 self.report.add_error(MetaValidationError(
                     check_type="FILE_LOAD_ERROR",
@@ -0,0 +1,363 @@
+"""
+QUASE-DUPLICADOS — MinHash/LSH sobre os items dos extractores
+═══════════════════════════════════════════════════════════════════════════
+
+A deduplicação exacta (normalize_and_hash / (tipo, valor)) deixa passar o
+mesmo facto escrito por palavras diferentes pelos 7 extractores; cada cópia
+vai para o prompt de todos os auditores da Fase 2.
+
+Aqui cada item elegível vira um conjunto de shingles (palavras sem acentos nem
+stopwords, cortadas a um radical de 5 letras, + bigramas) e uma assinatura
+MinHash. O LSH (bandas × linhas, escolhidas para ~95% de recall no limiar)
+propõe candidatos; cada candidato é confirmado com o Jaccard exacto dos shingles e
+só é fundido se tiver as mesmas marcas que o representante: números (datas,
+valores, artigos), negações ("não", "nunca", "sem", ...), nomes próprios
+("Lisboa" ≠ "Porto") e as partes pela mesma ordem ("o autor ... a ré" ≠ "a ré
+... o autor"). A fusão é como na deduplicação exacta: os source_spans do
+duplicado passam para o primeiro item do grupo.
+
+Sem dependências externas: os valores de hash de cada shingle vêm de um
+único shake_128 (cacheado por chamada) e a assinatura é o mínimo por coluna.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+from array import array
+from typing import Any, Iterable, Optional
+
+from src.config import NEAR_DUP_NUM_PERM, NEAR_DUP_THRESHOLD, NEAR_DUP_TYPES
+from src.pipeline.schema_unified import EvidenceItem
+
+logger = logging.getLogger(__name__)
+
+_PALAVRA = re.compile(r"\w+")
+_AMOSTRA_TOKENS = 500  # entradas contadas para estimar os tokens poupados (formato uniforme)
+_RADICAL = 5  # "assinou" / "assinado" / "assinatura" → "assin"
+# Sem palavras de negação/polaridade ("nao", "sem", "com", ...): mudam o sentido do facto
+_STOPWORDS = frozenset({
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das",
+    "em", "no", "na", "nos", "nas", "por", "pelo", "pela", "pelos", "pelas", "para",
+    "ao", "aos", "e", "ou", "que", "se", "foi", "ser", "sido", "seu",
+    "sua", "seus", "suas", "este", "esta", "esse", "essa", "ja", "tambem",
+})
+# Negações: como os números, têm de coincidir ("pagou" ≠ "não pagou", "com" ≠ "sem capacete")
+_NEGACOES = frozenset({
+    "nao", "nem", "nunca", "jamais", "sem", "nenhum", "nenhuma", "nenhuns", "nenhumas",
+    "ninguem", "nada", "tampouco",
+})
+# Partes processuais (sem acentos) → papel: quem faz o quê muda o facto
+_PARTES = {
+    variante: papel
+    for papel, variantes in {
+        "autor": ("autor", "autora", "autores", "autoras", "demandante", "demandantes"),
+        "reu": ("reu", "re", "reus", "res", "demandado", "demandada", "demandados", "demandadas"),
+        "arguido": ("arguido", "arguida", "arguidos", "arguidas"),
+        "assistente": ("assistente", "assistentes", "ofendido", "ofendida", "ofendidos", "ofendidas"),
+        "interveniente": ("interveniente", "intervenientes", "chamado", "chamada", "chamados", "chamadas"),
+        "requerente": ("requerente", "requerentes"),
+        "requerido": ("requerido", "requerida", "requeridos", "requeridas"),
+        "recorrente": ("recorrente", "recorrentes", "apelante", "apelantes"),
+        "recorrido": ("recorrido", "recorrida", "recorridos", "recorridas", "apelado", "apelada", "apelados", "apeladas"),
+        "exequente": ("exequente", "exequentes", "embargado", "embargada", "embargados", "embargadas"),
+        "executado": ("executado", "executada", "executados", "executadas", "embargante", "embargantes"),
+        "senhorio": ("senhorio", "senhoria", "senhorios", "senhorias", "locador", "locadora"),
+        "arrendatario": ("arrendatario", "arrendataria", "arrendatarios", "arrendatarias", "inquilino", "inquilina", "locatario", "locataria"),
+        "testemunha": ("testemunha", "testemunhas"),
+    }.items()
+    for variante in variantes
+}
+_FIM_FRASE = ".!?:;\n"
+
+
+# ============================================================================
+# SHINGLES E ASSINATURAS
+# ============================================================================
+
+def _palavras(texto: str) -> list[tuple[str, bool]]:
+    """(palavra em minúsculas, é nome próprio) — maiúscula inicial fora do início de frase."""
+    # NFKD + ASCII: tira acentos (e símbolos como €/º, irrelevantes para shingles)
+    sem_acentos = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    palavras = []
+    fim = None  # fim da palavra anterior (None: início do texto)
+    for m in _PALAVRA.finditer(sem_acentos):
+        p = m.group()
+        inicio_frase = fim is None or any(c in _FIM_FRASE for c in sem_acentos[fim:m.start()])
+        palavras.append((p.lower(), p[0].isupper() and not inicio_frase))
+        fim = m.end()
+    return palavras
+
+
+def caracteristicas(texto: str) -> tuple[frozenset[str], tuple]:
+    """
+    (shingles, marcas) do texto.
+
+    Shingles: radicais (sem stopwords) + bigramas de radicais consecutivos.
+    Marcas: grupos de dígitos (datas, valores, artigos), negações e nomes
+    próprios, mais a sequência das partes (autor, réu, arguido, ...) — têm de
+    coincidir para dois items serem fundidos.
+    """
+    palavras = _palavras(texto)
+    radicais = [p if p.isdigit() else p[:_RADICAL] for p, _nome in palavras if p not in _STOPWORDS]
+    conjunto = frozenset(radicais + [f"{a} {b}" for a, b in zip(radicais, radicais[1:], strict=False)])
+    marcas = frozenset(
+        p for p, nome in palavras
+        if p.isdigit() or p in _NEGACOES or (nome and p not in _STOPWORDS and p not in _PARTES)
+    )
+    partes: list[str] = []
+    for p, _nome in palavras:
+        papel = _PARTES.get(p)
+        if papel is not None and (not partes or partes[-1] != papel):
+            partes.append(papel)
+    return conjunto, (marcas, tuple(partes))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def lsh_params(threshold: float, num_perm: int, recall: float = 0.95) -> tuple[int, int]:
+    """
+    (bandas, linhas) com bandas × linhas ≤ num_perm.
+
+    O maior nº de linhas por banda (menos candidatos falsos) que ainda propõe
+    um par com Jaccard = threshold com probabilidade ≥ recall:
+    1 - (1 - threshold^linhas)^bandas.
+    """
+    melhor = (num_perm, 1)
+    for linhas in range(1, num_perm + 1):
+        bandas = num_perm // linhas
+        if 1.0 - (1.0 - threshold ** linhas) ** bandas < recall:
+            break
+        melhor = (bandas, linhas)
+    return melhor
+
+
+class MinHasher:
+    """Assinaturas MinHash com num_perm funções de hash (valores de 32 bits)."""
+
+    def __init__(self, num_perm: int = NEAR_DUP_NUM_PERM):
+        self.num_perm = num_perm
+        self._cache: dict[str, array] = {}
+
+    def _hashes(self, shingle: str) -> array:
+        valores = self._cache.get(shingle)
+        if valores is None:
+            valores = array("I", hashlib.shake_128(shingle.encode()).digest(4 * self.num_perm))
+            self._cache[shingle] = valores
+        return valores
+
+    def signature(self, conjunto: Iterable[str]) -> tuple[int, ...]:
+        return tuple(map(min, zip(*(self._hashes(s) for s in conjunto), strict=True)))
+
+
+# ============================================================================
+# FUSÃO
+# ============================================================================
+
+def _entrada_prompt(item: EvidenceItem) -> dict:
+    """Forma compacta com que cada union_item entra no prompt dos auditores (Fase 2)."""
+    span = item.source_spans[0] if item.source_spans else None
+    return {
+        "item_id": item.item_id,
+        "item_type": item.item_type.value,
+        "value": item.value_normalized,
+        "page": span.page_num if span else None,
+        "start_char": span.start_char if span else None,
+        "end_char": span.end_char if span else None,
+    }
+
+
+def _tokens_prompt(entradas: list[dict]) -> int:
+    """Tokens que as entradas ocupariam no prompt (acima de _AMOSTRA_TOKENS: extrapolado)."""
+    if not entradas:
+        return 0
+    from src.token_counter import contar_tokens
+    amostra = entradas[:_AMOSTRA_TOKENS]
+    tokens = contar_tokens(json.dumps(amostra, ensure_ascii=False, indent=2))
+    return round(tokens * len(entradas) / len(amostra))
+
+
+def merge_near_duplicates(
+    items: list[EvidenceItem],
+    threshold: Optional[float] = None,
+    tipos: Optional[set[str]] = None,
+    excluir: Optional[set[str]] = None,
+    num_perm: Optional[int] = None,
+) -> tuple[list[EvidenceItem], dict[str, Any]]:
+    """
+    Funde quase-duplicados (Jaccard ≥ threshold) entre items do mesmo tipo.
+
+    Args:
+        items: items já deduplicados pela via exacta (ordem preservada)
+        threshold: Jaccard mínimo (default NEAR_DUP_THRESHOLD)
+        tipos: item_type elegíveis (default NEAR_DUP_TYPES)
+        excluir: item_ids a não tocar (ex: já envolvidos em conflitos)
+        num_perm: permutações MinHash (default NEAR_DUP_NUM_PERM)
+
+    Returns:
+        (items sem os duplicados fundidos, relatório)
+    """
+    threshold = NEAR_DUP_THRESHOLD if threshold is None else threshold
+    tipos = NEAR_DUP_TYPES if tipos is None else tipos
+    excluir = excluir or set()
+    hasher = MinHasher(num_perm or NEAR_DUP_NUM_PERM)
+    bandas, linhas = lsh_params(threshold, hasher.num_perm)
+
+    # Elegíveis, agrupados por shingles + marcas idênticos (uma assinatura por grupo)
+    unicos: list[tuple[str, frozenset, tuple, list[int]]] = []  # (tipo, shingles, marcas, posições)
+    por_conjunto: dict[tuple[str, frozenset, tuple], int] = {}
+    elegiveis = 0
+    for pos, item in enumerate(items):
+        tipo = item.item_type.value
+        if tipo not in tipos or item.item_id in excluir:
+            continue
+        conjunto, marcas = caracteristicas(item.value_normalized or item.raw_text or "")
+        if not conjunto:
+            continue
+        elegiveis += 1
+        u = por_conjunto.get((tipo, conjunto, marcas))
+        if u is None:
+            por_conjunto[(tipo, conjunto, marcas)] = len(unicos)
+            unicos.append((tipo, conjunto, marcas, [pos]))
+        else:
+            unicos[u][3].append(pos)
+
+    # LSH: bucket por (tipo, banda, fatia da assinatura)
+    buckets: dict[tuple, list[int]] = {}
+    chaves: list[list[tuple]] = []
+    for u, (tipo, conjunto, _marcas, _posicoes) in enumerate(unicos):
+        assinatura = hasher.signature(conjunto)
+        chaves_u = [(tipo, b, assinatura[b * linhas:(b + 1) * linhas]) for b in range(bandas)]
+        chaves.append(chaves_u)
+        for chave in chaves_u:
+            buckets.setdefault(chave, []).append(u)
+
+    # Clusters em estrela: cada candidato é comparado com o representante
+    # (o primeiro pela ordem), nunca por transitividade
+    atribuido: set[int] = set()
+    grupos: dict[int, list[tuple[int, float]]] = {}  # posição do representante → [(posição, similaridade)]
+    for u, (_tipo, conjunto, marcas, posicoes) in enumerate(unicos):
+        if u in atribuido:
+            continue
+        membros = [(pos, 1.0) for pos in posicoes[1:]]
+        candidatos = sorted({v for chave in chaves[u] for v in buckets[chave] if v > u and v not in atribuido})
+        for v in candidatos:
+            _tipo_v, conjunto_v, marcas_v, posicoes_v = unicos[v]
+            if marcas_v != marcas:
+                continue
+            similaridade = jaccard(conjunto, conjunto_v)
+            if similaridade >= threshold:
+                atribuido.add(v)
+                membros.extend((pos, similaridade) for pos in posicoes_v)
+        if membros:
+            grupos[posicoes[0]] = sorted(membros)
+
+    removidos: set[int] = set()
+    entradas_removidas: list[dict] = []
+    for pos_base, duplicados in grupos.items():
+        base = items[pos_base]
+        registos = base.metadata.setdefault("near_duplicates", [])
+        for pos_j, similaridade in duplicados:
+            dup = items[pos_j]
+            base.source_spans.extend(dup.source_spans)
+            entrada = _entrada_prompt(dup)
+            entradas_removidas.append(entrada)
+            registos.append({
+                **entrada,
+                "extractor_ids": sorted(dup.extractor_ids),
+                "similarity": round(similaridade, 3),
+            })
+            removidos.add(pos_j)
+        fontes = sorted(base.extractor_ids)
+        tag = f"[{','.join(fontes)}] quase_duplicados:{len(duplicados) + 1}"
+        base.context = tag + (" " + base.context if base.context else "")
+
+    resultado = [item for pos, item in enumerate(items) if pos not in removidos]
+    relatorio = {
+        "threshold": threshold,
+        "bands": bandas,
+        "rows": linhas,
+        "elegiveis": elegiveis,
+        "clusters": len(grupos),
+        "items_fundidos": len(removidos),
+        "tokens_poupados_por_prompt": _tokens_prompt(entradas_removidas),
+    }
+    _metrics.registar(relatorio)
+    if removidos:
+        logger.info(
+            f"[NEAR-DUP] {len(removidos)} quase-duplicados fundidos em {len(grupos)} grupos "
+            f"(limiar {threshold}, {bandas}×{linhas}); "
+            f"~{relatorio['tokens_poupados_por_prompt']} tokens a menos por prompt da Fase 2"
+        )
+    return resultado, relatorio
+
+
+def resumo_quase_duplicados(items: list[EvidenceItem], consumidores: int = 1) -> dict[str, Any]:
+    """
+    Resumo das fusões registadas em metadata["near_duplicates"] dos items.
+
+    consumidores: quantos prompts recebem a lista de items (ex: nº de
+    auditores da Fase 2) — os tokens poupados multiplicam por eles.
+    """
+    entradas = [
+        {k: registo.get(k) for k in ("item_id", "item_type", "value", "page", "start_char", "end_char")}
+        for item in items
+        for registo in item.metadata.get("near_duplicates", [])
+    ]
+    por_prompt = _tokens_prompt(entradas)
+    return {
+        "items_fundidos": len(entradas),
+        "clusters": sum(1 for item in items if item.metadata.get("near_duplicates")),
+        "tokens_poupados_por_prompt": por_prompt,
+        "consumidores": consumidores,
+        "tokens_poupados_total": por_prompt * consumidores,
+    }
+
+
+# ============================================================================
+# MÉTRICAS
+# ============================================================================
+
+class _NearDupMetrics:
+    """Totais do processo: items analisados, fundidos e tokens poupados por prompt."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.elegiveis = 0
+        self.clusters = 0
+        self.items_fundidos = 0
+        self.tokens_poupados_por_prompt = 0
+
+    def registar(self, relatorio: dict[str, Any]) -> None:
+        with self._lock:
+            self.runs += 1
+            self.elegiveis += relatorio["elegiveis"]
+            self.clusters += relatorio["clusters"]
+            self.items_fundidos += relatorio["items_fundidos"]
+            self.tokens_poupados_por_prompt += relatorio["tokens_poupados_por_prompt"]
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "elegiveis": self.elegiveis,
+                "clusters": self.clusters,
+                "items_fundidos": self.items_fundidos,
+                "taxa_fusao": round(self.items_fundidos / self.elegiveis, 3) if self.elegiveis else 0.0,
+                "tokens_poupados_por_prompt": self.tokens_poupados_por_prompt,
+            }
+
+
+_metrics = _NearDupMetrics()
+
+
+def get_near_dup_metrics() -> dict[str, Any]:
+    """Métricas de fusão de quase-duplicados deste processo (diagnóstico)."""
+    return _metrics.snapshot()
@@ -8,9 +8,12 @@ Suporta dois modos:
 """
 
 import re
+import bisect
 import logging
 from dataclasses import dataclass, field
-from typing import Optional, Any
+from typing import Optional, Any, Union
+
+from src.pipeline.evidence_store import EvidenceStore
 
 
 logger = logging.getLogger(__name__)
@@ -51,6 +54,8 @@ class CharToPageMapper:
     total_pages: int = 0
     doc_id: str = ""
     source: str = ""  # "pdf_safe" | "markers" | "unknown"
+    # Inícios/fins das páginas para bisect (None se os boundaries não estão ordenados)
+    _limites: Optional[tuple[list[int], list[int]]] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
         if self.boundaries:
@@ -225,6 +230,13 @@ class CharToPageMapper:
         Returns:
             Lista de números de página (ordenada, sem duplicados)
         """
+        limites = self._limites_ordenados()
+        if limites is not None:
+            inicios, fins = limites
+            lo = bisect.bisect_right(fins, start_char)
+            hi = bisect.bisect_left(inicios, end_char)
+            return sorted({b.page_num for b in self.boundaries[lo:hi]})
+
         pages = set()
 
         for boundary in self.boundaries:
@@ -234,6 +246,19 @@ class CharToPageMapper:
 
         return sorted(pages)
 
+    def _limites_ordenados(self) -> Optional[tuple[list[int], list[int]]]:
+        """Inícios e fins (ordenados) para bisect; None se as páginas se sobrepõem/desordenam."""
+        if self._limites is not None and len(self._limites[0]) == len(self.boundaries):
+            return self._limites
+        inicios = [b.start_char for b in self.boundaries]
+        fins = [b.end_char for b in self.boundaries]
+        ordenados = all(
+            inicios[i] <= inicios[i + 1] and fins[i] <= fins[i + 1] and fins[i] <= inicios[i + 1]
+            for i in range(len(inicios) - 1)
+        )
+        self._limites = (inicios, fins) if ordenados else None
+        return self._limites
+
     def get_boundary(self, page_num: int) -> Optional[PageBoundary]:
         """Retorna o boundary para uma página específica."""
         for boundary in self.boundaries:
@@ -253,16 +278,19 @@ class CharToPageMapper:
             if b.status in ["SUSPEITA", "SEM_TEXTO", "VISUAL_ONLY"]
         ]
 
-    def get_coverage_by_pages(self, char_ranges: list[tuple[int, int]]) -> dict:
+    def get_coverage_by_pages(self, char_ranges: Union[list[tuple[int, int]], EvidenceStore]) -> dict:
         """
         Calcula cobertura por páginas dado um conjunto de intervalos de caracteres.
 
         Args:
-            char_ranges: Lista de (start_char, end_char)
+            char_ranges: Lista de (start_char, end_char) ou EvidenceStore (spans)
 
         Returns:
             Dict com métricas de cobertura por página
         """
+        if isinstance(char_ranges, EvidenceStore):
+            char_ranges = char_ranges.merged_ranges()
+
         pages_touched = set()
         for start, end in char_ranges:
             pages_touched.update(self.get_pages_for_range(start, end))
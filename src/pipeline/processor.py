@@ -33,6 +33,9 @@ import uuid
 import base64
 
 from src.cost_controller import CostController, BudgetExceededError
+from src.token_counter import contar_tokens, get_token_counter
+from src.pipeline.artefact_store import get_artefact_store
+from src.utils.run_index import get_run_index, resumo_resultado
 from src.wallet_manager import InsufficientCreditsError
 from src.config import (
     EXTRATOR_MODELS,
@@ -64,6 +67,11 @@ from src.config import (
     META_INTEGRITY_CITATION_COUNT_TOLERANCE,
     # Confidence Policy config
     APPLY_CONFIDENCE_POLICY,
+    # Grafo de estágios
+    PIPELINE_STAGE_GRAPH,
+    PIPELINE_STAGE_WORKERS,
+    # Output estruturado
+    STRUCTURED_OUTPUT_ENABLED,
 )
 from src.pipeline.schema_unified import (
     Chunk,
@@ -75,6 +83,9 @@ from src.pipeline.schema_unified import (
     DocumentMeta,
     UnifiedExtractionResult,
 )
+from src.pipeline.json_stream import IncrementalItemParser
+from src.pipeline.evidence_store import EvidenceStore
+from src.pipeline.near_dup import resumo_quase_duplicados
 from src.pipeline.extractor_unified import (
     SYSTEM_EXTRATOR_UNIFIED,
     build_unified_prompt,
@@ -86,6 +97,7 @@ from src.pipeline.extractor_unified import (
     render_agregado_markdown_from_json,
 )
 from src.pipeline.page_mapper import CharToPageMapper
+from src.pipeline.stage_graph import Stage, StageGraph, StageScheduler
 from src.pipeline.schema_audit import (
     AuditReport,
     JudgeOpinion,
@@ -129,18 +141,14 @@ REASONING_MODELS = {"openai/o1-pro", "openai/o1", "openai/o3-pro", "openai/o3-mi
 
 logger = logging.getLogger(__name__)
 
-
-def _safe_json_default(obj):
-    """Fallback para json.dump — converte tipos não-serializáveis."""
-    if isinstance(obj, (bytes, bytearray)):
-        return f"<{len(obj)} bytes>"
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    if hasattr(obj, "to_dict"):
-        return obj.to_dict()
-    if hasattr(obj, "__dict__"):
-        return {k: v for k, v in obj.__dict__.items() if not isinstance(v, (bytes, bytearray))}
-    return str(obj)
+# v5.3: Campos do checkpoint de cada fase entregues ao cliente como resultado parcial
+# (o bruto de cada fase fica só no checkpoint)
+CAMPOS_PARCIAIS = {
+    1: ("consolidado_f1",),
+    2: ("consolidado_f2", "audit_reports"),
+    3: ("judge_opinions", "respostas_qa"),
+    4: ("presidente", "final_decision", "verificacoes_legais"),
+}
 
 
 @dataclass
@@ -218,6 +226,8 @@ class PipelineResult:
     fase0_triage: Optional[dict] = None
     # Metadata genérico (usado pelo engine para settlement warnings, etc.)
     metadata: Optional[dict] = None
+    # v5.3: Spans dos estágios do pipeline + caminho crítico
+    tempos_estagios: Optional[dict] = None
 
     def to_dict(self) -> dict:
         return {
@@ -263,6 +273,7 @@ class PipelineResult:
             "documento_palavras": self.documento.num_words if self.documento else 0,
             "documento_paginas": getattr(self.documento, 'num_pages', None) if self.documento else None,
             "metadata": self.metadata,
+            "tempos_estagios": self.tempos_estagios,
         }
 
 
@@ -753,8 +764,7 @@ REVISTO:"""
     def _aplicar_rlm(self, texto: str, tipo_fase: str) -> str:
         if tipo_fase not in ["auditoria", "relatoria"]:
             return texto
-        # Rough token estimate (actual ratio for Portuguese is ~3-5 chars/token)
-        tokens = len(texto) // 4
+        tokens = contar_tokens(texto)
         if tokens < 25000:
             logger.info(f"[RLM] {tipo_fase}: {tokens:,} < 25k → SKIP")
             return texto
@@ -767,7 +777,7 @@ REVISTO:"""
                 temperature=0.0,
                 enable_cache=False,
             )
-            tokens_depois = len(resultado.content) // 4 if resultado else tokens
+            tokens_depois = contar_tokens(resultado.content) if resultado else tokens
             logger.info(f"[RLM] {tokens:,} → {tokens_depois:,}")
             # FIX 2026-02-14: Registar custo do RLM (antes era invisível)
             if hasattr(self, '_cost_controller') and self._cost_controller and resultado:
@@ -803,6 +813,7 @@ REVISTO:"""
         chefe_model: str = None,
         callback_progresso: Optional[Callable] = None,
         analysis_id: Optional[str] = None,
+        callback_parcial: Optional[Callable] = None,
     ):
         # v4.0 FIX: deepcopy de TODAS as listas de modelos para thread-safety
         self.extrator_models = copy.deepcopy(extrator_models) if extrator_models else copy.deepcopy(EXTRATOR_MODELS)
@@ -812,6 +823,8 @@ REVISTO:"""
         self.agregador_model = agregador_model or AGREGADOR_MODEL
         self.chefe_model = chefe_model or CHEFE_MODEL
         self.callback_progresso = callback_progresso
+        # v5.3: callback_parcial(fase_num, fase_nome, dados) — resultado parcial de cada fase
+        self.callback_parcial = callback_parcial
 
         # FIX 2026-02-14: Cópia local de LLM_CONFIGS para thread-safety
         # v5.1: Filtrar extractores com base em extrator_models (Bronze skip E4)
@@ -837,6 +850,11 @@ REVISTO:"""
         self._unified_result: Optional[UnifiedExtractionResult] = None
         self._cost_controller = None
         self._perf_tracker = None
+        self._hedge_spend_usd = 0.0
+        self._hedge_lock = threading.Lock()
+        self._hedge_cond = threading.Condition(self._hedge_lock)
+        self._hedge_reservas: dict[int, dict] = {}  # id → custo estimado de duplicados em curso
+        self._hedge_seq = 0
 
     def _reportar_progresso(self, fase: str, progresso: int, mensagem: str):
         """Reporta progresso ao callback."""
@@ -847,20 +865,66 @@ REVISTO:"""
         except Exception as e:
             logger.debug(f"Erro ao reportar progresso: {e}")
 
+    def _publicar_parcial(self, fase_num: int, fase_nome: str, phase_data: Optional[dict]):
+        """Entrega ao callback_parcial os dados da fase que o cliente pode mostrar já."""
+        callback = getattr(self, "callback_parcial", None)
+        if not callback or not phase_data:
+            return
+        try:
+            dados = {}
+            for campo in CAMPOS_PARCIAIS.get(fase_num, ()):
+                valor = phase_data.get(campo)
+                if isinstance(valor, list):
+                    valor = [v.to_dict() if hasattr(v, "to_dict") else v for v in valor]
+                elif hasattr(valor, "to_dict"):
+                    valor = valor.to_dict()
+                dados[campo] = valor
+            callback(fase_num, fase_nome, dados)
+        except Exception as e:
+            logger.debug(f"Erro ao publicar resultado parcial da fase {fase_num}: {e}")
+
     def _setup_run(self) -> str:
         """Configura uma nova execução."""
         self._run_id = f"{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
         self._output_dir = OUTPUT_DIR / self._run_id
         self._output_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            get_run_index().registar_run(self._run_id, estado="running")
+        except Exception as e:
+            logger.warning(f"[RUN-INDEX] Falha ao registar run: {e}")
         logger.info(f"Run iniciado: {self._run_id}")
         return self._run_id
 
-    def _log_to_file(self, filename: str, content: str):
-        """Guarda conteúdo num ficheiro de log."""
+    def _log_to_file(self, filename: str, content):
+        """Guarda conteúdo num ficheiro de log (escrita em background; content pode ser callable)."""
+        if self._output_dir:
+            get_artefact_store().write_text(self._output_dir / filename, content)
+
+    def _write_artefact(self, filename: str, obj, items: bool = False):
+        """Guarda um artefacto JSON da run (NDJSON se items=True) via ArtefactStore."""
         if self._output_dir:
-            filepath = self._output_dir / filename
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(content)
+            store = get_artefact_store()
+            if items:
+                store.write_items(self._output_dir / filename, obj)
+            else:
+                store.write_json(self._output_dir / filename, obj)
+
+    def _read_artefact(self, filename: str):
+        """Lê um artefacto JSON da run (inclui escritas ainda em fila). None se não existir."""
+        if not self._output_dir:
+            return None
+        try:
+            return get_artefact_store().read_json(self._output_dir / filename)
+        except Exception as e:
+            logger.warning(f"[ARTEFACT] Erro ao ler {filename}: {e}")
+            return None
+
+    def _registar_estagios(self, result: PipelineResult, report) -> None:
+        """Guarda os spans do grafo de estágios no resultado e em pipeline_stages.json."""
+        if report is None:
+            return
+        result.tempos_estagios = report.to_dict()
+        self._write_artefact("pipeline_stages.json", result.tempos_estagios)
 
     def _save_checkpoint(
         self,
@@ -875,8 +939,15 @@ REVISTO:"""
         - Salva JSON local no output_dir
         - Tenta actualizar blocked_credits com fase_atual (graceful failure)
         - Upsert dados reais da fase no Supabase (analysis_checkpoints) para resume
+
+        Serializa aqui (snapshot) e persiste em background (CheckpointWriter):
+        a transição de fase não espera por I/O de rede.
         """
-        import json as _json
+        from src.config import CHECKPOINT_COMPRESS_LOCAL
+        from src.pipeline.checkpoint_writer import CheckpointJob, get_checkpoint_writer
+
+        self._publicar_parcial(fase_num, fase_nome, phase_data)
+
         checkpoint = {
             "analysis_id": self._analysis_id,
             "run_id": self._run_id,
@@ -886,62 +957,62 @@ REVISTO:"""
             "resumo": data_resumo,
         }
 
-        # 1. Salvar ficheiro local
-        if self._output_dir:
-            try:
-                cp_path = self._output_dir / f"checkpoint_fase{fase_num}.json"
-                with open(cp_path, "w", encoding="utf-8") as f:
-                    _json.dump(checkpoint, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                logger.warning(f"[CHECKPOINT] Erro ao salvar ficheiro: {e}")
+        writer = get_checkpoint_writer()
+        try:
+            local_bytes, remote = writer.serialize(
+                checkpoint,
+                phase_data if self._analysis_id else None,
+                pipeline_context,
+                compress_local=CHECKPOINT_COMPRESS_LOCAL,
+            )
+        except Exception as e:
+            logger.warning(f"[CHECKPOINT] Erro ao serializar fase {fase_num}: {e}")
+            return
 
-        # 2. Tentar actualizar Supabase (blocked_credits.fase_atual)
-        if self._analysis_id:
-            try:
-                from auth_service import get_supabase_admin
-                sb = get_supabase_admin()
-                sb.table("blocked_credits").update({
-                    "fase_atual": fase_num,
-                }).eq("analysis_id", self._analysis_id).eq("status", "blocked").execute()
-                logger.info(
-                    f"[CHECKPOINT] Fase {fase_num} ({fase_nome}) salva — "
-                    f"analysis={self._analysis_id[:8]}..."
-                )
-            except Exception as e:
-                # Graceful: coluna pode não existir ainda na tabela
-                logger.debug(f"[CHECKPOINT] Supabase update falhou (non-blocking): {e}")
-                logger.info(
-                    f"[CHECKPOINT] Fase {fase_num} ({fase_nome}) salva localmente — "
-                    f"run={self._run_id}"
-                )
+        local_path = None
+        if self._output_dir:
+            sufixo = ".json.gz" if CHECKPOINT_COMPRESS_LOCAL else ".json"
+            local_path = self._output_dir / f"checkpoint_fase{fase_num}{sufixo}"
+
+        writer.submit(CheckpointJob(
+            analysis_id=self._analysis_id,
+            run_id=self._run_id,
+            user_id=self._user_id,
+            fase_num=fase_num,
+            fase_nome=fase_nome,
+            local_path=local_path,
+            local_bytes=local_bytes,
+            remote=remote,
+        ))
+        if not self._analysis_id:
+            logger.info(f"[CHECKPOINT] Fase {fase_num} ({fase_nome}) salva localmente — run={self._run_id}")
+
+    def _flush_checkpoints(self, timeout: float = 60.0):
+        """Espera pelos checkpoints pendentes desta análise (fim de run / erro)."""
+        try:
+            from src.pipeline.checkpoint_writer import get_checkpoint_writer
+            writer = get_checkpoint_writer()
+            writer.flush(self._analysis_id or self._run_id, timeout=timeout)
+            m = writer.get_metrics()
+            logger.info(
+                f"[CHECKPOINT] Flush: {m['persisted']}/{m['submitted']} persistidos | "
+                f"lag médio {m['lag_ms_avg']:.0f}ms (max {m['lag_ms_max']:.0f}ms) | "
+                f"serialização média {m['serialize_ms_avg']:.1f}ms"
+            )
+        except Exception as e:
+            logger.warning(f"[CHECKPOINT] Erro no flush: {e}")
 
-        # 3. Upsert dados reais da fase no Supabase (para resume)
-        if self._analysis_id and phase_data is not None:
-            try:
-                from auth_service import get_supabase_admin
-                sb = get_supabase_admin()
-                row = {
-                    "analysis_id": self._analysis_id,
-                    "user_id": self._user_id,
-                    "fase_num": fase_num,
-                    "fase_nome": fase_nome,
-                    "phase_data": phase_data,
-                    "pipeline_context": pipeline_context or {},
-                }
-                sb.table("analysis_checkpoints").upsert(
-                    row,
-                    on_conflict="analysis_id,fase_num",
-                ).execute()
-                data_size = len(_json.dumps(phase_data, default=str))
-                logger.info(
-                    f"[CHECKPOINT] Fase {fase_num} dados reais ({data_size:,} bytes) "
-                    f"salvos no Supabase — analysis={self._analysis_id[:8]}..."
-                )
-            except Exception as e:
-                logger.warning(
-                    f"[CHECKPOINT] Supabase upsert (analysis_checkpoints) falhou "
-                    f"(non-blocking): {e}"
-                )
+    def _flush_artefactos(self, timeout: float = 60.0):
+        """Espera pelos artefactos pendentes desta run (antes de os ler do disco / fim de run)."""
+        if not self._output_dir:
+            return
+        store = get_artefact_store()
+        store.flush(self._output_dir, timeout=timeout)
+        m = store.get_metrics()
+        logger.info(
+            f"[ARTEFACT] Flush: {m['files']} ficheiros, {m['bytes']:,} bytes | "
+            f"encode médio {m['encode_ms_avg']:.1f}ms (max {m['encode_ms_max']:.0f}ms) | erros {m['errors']}"
+        )
 
     def _call_llm(
         self,
@@ -962,14 +1033,20 @@ REVISTO:"""
         from src.performance_tracker import (
             check_response_quality, build_retry_prompt, classify_error,
         )
+        from src.pipeline.structured_output import schema_for_role, registar_chamada
 
         # Failover automatico: se documento grande, trocar modelo
+        # (tokens contados localmente, com cache por hash — o documento é contado uma vez)
         doc_chars = len(self._document_text) if self._document_text else 0
-        modelo_final = selecionar_modelo_com_failover(model, doc_chars, role_name)
+        doc_tokens = contar_tokens(self._document_text) if self._document_text else 0
+        modelo_final = selecionar_modelo_com_failover(model, doc_chars, role_name, doc_tokens=doc_tokens)
 
-        # max_tokens dinamico se nao especificado
+        # max_tokens dinamico se nao especificado (limitado ao contexto que sobra)
         if max_tokens is None:
-            max_tokens = calcular_max_tokens(doc_chars, modelo_final, role_name)
+            max_tokens = calcular_max_tokens(
+                doc_chars, modelo_final, role_name,
+                prompt_tokens=get_token_counter().count_messages(prompt, system_prompt),
+            )
 
         if modelo_final != model:
             logger.info(
@@ -1005,6 +1082,10 @@ REVISTO:"""
         # === CHAMADA LLM ===
         effective_temp = temperature
 
+        # Output estruturado: JSON Schema do papel (auditor/relator/presidente/consolidador)
+        schema_papel = schema_for_role(role_name)
+        response_schema = schema_papel if STRUCTURED_OUTPUT_ENABLED else None
+
         # FIX C2 v2: Guardar prompt original para não acumular system_instructions em retries
         _original_prompt = prompt
 
@@ -1015,13 +1096,61 @@ REVISTO:"""
                 effective_system = None
             effective_temp = None  # Reasoning models don't accept temperature
 
-        response = self.llm_client.chat_simple(
-            model=modelo_final,
-            prompt=prompt,
-            system_prompt=effective_system,
-            temperature=effective_temp,
-            max_tokens=max_tokens,
-        )
+        plano_hedge = self._plano_hedge(role_name, modelo_final, perf_tracker)
+        if plano_hedge:
+            # Hedging: duplicado para o substituto se o primário passar o p95
+            hedge_model, hedge_after_s = plano_hedge
+            hedge_prompt, hedge_system, hedge_temp = _original_prompt, system_prompt, temperature
+            if hedge_model in REASONING_MODELS:
+                if hedge_system:
+                    hedge_prompt = f"<system_instructions>\n{hedge_system}\n</system_instructions>\n\n{_original_prompt}"
+                    hedge_system = None
+                hedge_temp = None
+            # Custo do pedido descartado reservado no arranque do duplicado e
+            # liquidado pelo custo real quando ele terminar
+            reserva: list[int] = []
+
+            def reservar_hedge() -> bool:
+                rid = self._reservar_hedge(
+                    role_name, (modelo_final, hedge_model),
+                    get_token_counter().count_messages(prompt, effective_system), max_tokens,
+                )
+                if rid is not None:
+                    reserva.append(rid)
+                return rid is not None
+
+            response, modelo_vencedor = self.llm_client.chat_hedged(
+                primary={"model": modelo_final, "prompt": prompt, "system_prompt": effective_system,
+                         "temperature": effective_temp, "max_tokens": max_tokens,
+                         "response_schema": response_schema},
+                hedge={"model": hedge_model, "prompt": hedge_prompt, "system_prompt": hedge_system,
+                       "temperature": hedge_temp, "max_tokens": max_tokens,
+                       "response_schema": response_schema},
+                hedge_after_s=hedge_after_s,
+                allow_hedge=reservar_hedge,
+                on_discarded=lambda m, r: self._registar_custo_hedge(role_name, m, r, reserva[0] if reserva else None),
+            )
+            if modelo_vencedor != modelo_final:
+                modelo_final, prompt, effective_temp = hedge_model, hedge_prompt, hedge_temp
+                effective_system = hedge_system
+                adaptive_hint_text, adaptive_hints_used = "", []  # hints eram do primário
+        else:
+            response = self.llm_client.chat_simple(
+                model=modelo_final,
+                prompt=prompt,
+                system_prompt=effective_system,
+                temperature=effective_temp,
+                max_tokens=max_tokens,
+                response_schema=response_schema,
+            )
+
+        # Erro da contagem local vs usage real (reportado por run)
+        if getattr(self, '_cost_controller', None) and response.prompt_tokens:
+            self._cost_controller.register_token_estimate(
+                estimated_tokens=get_token_counter().count_messages(prompt, effective_system),
+                actual_tokens=response.prompt_tokens,
+                prompt_chars=len(prompt) + len(effective_system or ""),
+            )
 
         # FIX 2026-02-14: Acumular tokens de TODAS as chamadas (incluindo retries)
         _accumulated_prompt_tokens = response.prompt_tokens or 0
@@ -1046,6 +1175,8 @@ REVISTO:"""
             )
             MAX_RETRIES = 0  # Não fazer retry nenhum
 
+        _retries_feitos = 0
+        _falhas_json = 0
         for retry_num in range(1, MAX_RETRIES + 1):
             if not response.success or not response.content:
                 # FIX 2026-02-18: Distinguir output truncado de falha generica
@@ -1061,6 +1192,8 @@ REVISTO:"""
 
             if not quality_issue or not quality_issue.get("critical"):
                 break  # Qualidade OK
+            if quality_issue["code"].startswith("JSON_"):
+                _falhas_json += 1
 
             logger.warning(
                 f"[QUALITY-GATE] {role_name}: {quality_issue['code']} "
@@ -1132,7 +1265,9 @@ REVISTO:"""
                 system_prompt=retry_system,
                 temperature=retry_temp,
                 max_tokens=max_tokens,
+                response_schema=response_schema,
             )
+            _retries_feitos += 1
             logger.info(
                 f"[QUALITY-GATE] {role_name}: Retry {retry_num} completado "
                 f"(success={response.success}, len={len(response.content or '')})"
@@ -1142,6 +1277,14 @@ REVISTO:"""
             _accumulated_prompt_tokens += response.prompt_tokens or 0
             _accumulated_completion_tokens += response.completion_tokens or 0
 
+        if schema_papel is not None:
+            registar_chamada(
+                self._normalize_role_for_perf(role_name),
+                estruturado=getattr(response, "estruturado", False) is True,
+                retries=_retries_feitos,
+                falhas_json=_falhas_json,
+            )
+
         # === TOKENS (usar acumulados para custo total real) ===
         prompt_tokens = response.prompt_tokens
         completion_tokens = response.completion_tokens
@@ -1149,8 +1292,8 @@ REVISTO:"""
 
         # Se API não retornou tokens, estimar com WARNING
         if total_tokens == 0 and response.content:
-            prompt_tokens = len(prompt) // 4
-            completion_tokens = len(response.content) // 4
+            prompt_tokens = contar_tokens(prompt)
+            completion_tokens = contar_tokens(response.content)
             total_tokens = prompt_tokens + completion_tokens
             logger.warning(
                 f"[CUSTO-ESTIMATIVA] {role_name}/{model}: API não retornou usage. "
@@ -1223,6 +1366,113 @@ REVISTO:"""
             erro=response.error,
         )
 
+    def _plano_hedge(self, role_name: str, model: str, perf_tracker) -> Optional[tuple[str, float]]:
+        """
+        Decide se a chamada de um auditor/relator leva hedging.
+
+        Returns:
+            (modelo substituto, segundos até ao duplicado) ou None
+        """
+        from src import config
+
+        if not config.HEDGING_ENABLED or perf_tracker is None:
+            return None
+        m = re.match(r"(auditor|relator)_(\d)", role_name)
+        if not m:
+            return None
+        subs = AUDITOR_SUBSTITUTES if m.group(1) == "auditor" else JUDGE_SUBSTITUTES
+        prefixo = "A" if m.group(1) == "auditor" else "J"
+        hedge_model = next((sub for sub in subs.get(f"{prefixo}{m.group(2)}", []) if sub != model), None)
+        if not hedge_model:
+            return None
+        p95_ms = perf_tracker.get_latency_p95(model, min_samples=config.HEDGE_MIN_SAMPLES)
+        if p95_ms is None:
+            return None
+        return hedge_model, max(config.HEDGE_MIN_DELAY_S, p95_ms / 1000.0)
+
+    def _reservar_hedge(
+        self, role_name: str, modelos: tuple[str, ...], prompt_tokens: int, max_tokens: int,
+    ) -> Optional[int]:
+        """
+        Reserva (atomicamente) o custo estimado do pedido que vai ser descartado.
+
+        A estimativa é a do modelo mais caro com max_tokens de output — o
+        perdedor tanto pode ser o primário como o substituto. Devolve o id da
+        reserva, ou None se o gasto + reservas + estimativa passa o limite do tier.
+        """
+        from src import config
+
+        limite = config.HEDGE_MAX_SPEND_USD.get(getattr(self, '_tier', 'bronze'), 0.0)
+        estimativas = [
+            (self._cost_controller.calculate_cost(m, prompt_tokens, max_tokens) if self._cost_controller else 0.0, m)
+            for m in modelos
+        ]
+        estimado, modelo = max(estimativas)
+        with self._hedge_lock:
+            comprometido = self._hedge_spend_usd + sum(r["usd"] for r in self._hedge_reservas.values())
+            if comprometido + estimado > limite:
+                logger.info(
+                    f"[HEDGE] Limite de gasto em hedging atingido (${comprometido:.4f} + "
+                    f"${estimado:.4f} > ${limite:.2f}) — sem duplicado"
+                )
+                return None
+            self._hedge_seq += 1
+            self._hedge_reservas[self._hedge_seq] = {
+                "usd": estimado, "role": role_name, "model": modelo,
+                "prompt_tokens": prompt_tokens, "completion_tokens": max_tokens,
+            }
+            return self._hedge_seq
+
+    def _registar_custo_hedge(self, role_name: str, model: str, response, reserva: Optional[int] = None):
+        """
+        Liquida a reserva com o custo real do pedido descartado (pode correr
+        numa thread em background). response=None: duplicado cancelado, sem custo.
+        """
+        with self._hedge_cond:
+            if reserva is not None and self._hedge_reservas.pop(reserva, None) is None:
+                return  # já liquidada pela estimativa em _liquidar_hedges_pendentes
+            try:
+                pt = (response.prompt_tokens or 0) if response is not None else 0
+                ct = (response.completion_tokens or 0) if response is not None else 0
+                if not (pt or ct) or not self._cost_controller:
+                    return
+                usage = self._cost_controller.register_usage(
+                    phase=f"{role_name}_hedge",
+                    model=model,
+                    prompt_tokens=pt,
+                    completion_tokens=ct,
+                    raise_on_exceed=False,  # a resposta já foi descartada — só contabilizar
+                )
+                self._hedge_spend_usd += usage.cost_usd
+            finally:
+                self._hedge_cond.notify_all()
+        logger.info(f"[HEDGE] {role_name}: pedido descartado de {model} custou ${usage.cost_usd:.4f}")
+
+    def _liquidar_hedges_pendentes(self, timeout: float = 30.0):
+        """
+        Antes do finalize do custo: espera pelos pedidos descartados ainda em
+        curso; os que não terminarem a tempo são cobrados pela reserva estimada
+        (a liquidação tardia é ignorada, para não cobrar duas vezes).
+        """
+        with self._hedge_cond:
+            if not self._hedge_cond.wait_for(lambda: not self._hedge_reservas, timeout=timeout):
+                pendentes = list(self._hedge_reservas.values())
+                self._hedge_reservas.clear()
+                logger.warning(
+                    f"[HEDGE] {len(pendentes)} pedidos descartados ainda em curso após {timeout:.0f}s "
+                    f"— cobrados pela estimativa"
+                )
+                for r in pendentes:
+                    if self._cost_controller:
+                        self._cost_controller.register_usage(
+                            phase=f"{r['role']}_hedge_estimado",
+                            model=r["model"],
+                            prompt_tokens=r["prompt_tokens"],
+                            completion_tokens=r["completion_tokens"],
+                            raise_on_exceed=False,
+                        )
+                    self._hedge_spend_usd += r["usd"]
+
     @staticmethod
     def _normalize_role_for_perf(role_name: str) -> str:
         """Normaliza role name para performance tracking."""
@@ -1759,29 +2009,18 @@ REVISTO:"""
                 "extractors_count": 1,
             },
             "entity_registry": entity_registry.to_dict() if entity_registry else {},
+            "near_duplicates": resumo_quase_duplicados(union_items, consumidores=len(self.auditor_models)),
         }
 
-        agregado_json_path = self._output_dir / "fase1_agregado_consolidado.json"
-        try:
-            with open(agregado_json_path, 'w', encoding='utf-8') as f:
-                json.dump(agregado_json, f, ensure_ascii=False, indent=2)
-            logger.info(f"[v4.2] JSON guardado: {agregado_json_path.absolute()} ({len(union_items)} items)")
-        except Exception as e:
-            logger.error(f"[v4.2] Falha ao escrever JSON: {e}")
+        self._write_artefact("fase1_agregado_consolidado.json", agregado_json)
+        logger.info(f"[v4.2] JSON enfileirado: fase1_agregado_consolidado.json ({len(union_items)} items)")
 
         # 5. Guardar coverage report
-        coverage_path = self._output_dir / "fase1_coverage_report.json"
-        try:
-            with open(coverage_path, 'w', encoding='utf-8') as f:
-                json.dump(agregado_json["coverage_report"], f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.warning(f"[v4.2] Falha ao escrever coverage report: {e}")
+        self._write_artefact("fase1_coverage_report.json", agregado_json["coverage_report"])
 
         # 6. Guardar unified result JSON
-        unified_json_path = self._output_dir / "fase1_unified_result.json"
         try:
-            with open(unified_json_path, 'w', encoding='utf-8') as f:
-                json.dump(unified_result.to_dict(), f, ensure_ascii=False, indent=2)
+            self._write_artefact("fase1_unified_result.json", unified_result.to_dict())
         except Exception as e:
             logger.warning(f"[v4.2] Falha ao escrever unified result: {e}")
 
@@ -1940,294 +2179,367 @@ REVISTO:"""
         all_unreadable = []
         resultados = []  # FaseResult para compatibilidade
 
-        # 5. Processar cada extrator em todos os chunks (PARALELO com retry)
-        def _run_extractor(i, cfg):
-            """Executa um extrator em todos os chunks. Thread-safe."""
+        # 5. Processar (extrator × chunk) em PARALELO: orçamento global de concorrência,
+        #    limite de chamadas simultâneas por provider e remontagem por extrator em
+        #    ordem de chunk. Um documento de 10 chunks já não custa 10 latências seguidas.
+        from src.config import (
+            EXTRACTOR_SUBSTITUTES,
+            MODEL_MAX_OUTPUT,
+            EXTRACTION_MAX_CONCURRENCY,
+            EXTRACTION_PROVIDER_CONCURRENCY,
+            EXTRACTOR_CALL_TIMEOUT,
+            EXTRACTOR_MAX_RETRIES,
+            EXTRACTOR_RETRY_DEADLINE,
+            EXTRACTOR_STALL_TIMEOUT,
+            EXTRACTOR_SUBSTITUTE_RETRIES,
+            EXTRACTOR_STREAMING,
+        )
+        from src.pipeline.structured_output import SCHEMAS as _SCHEMAS_OUTPUT, registar_chamada
+        schema_extraccao = _SCHEMAS_OUTPUT["extraccao"] if STRUCTURED_OUTPUT_ENABLED else None
+
+        provider_slots: dict[str, threading.BoundedSemaphore] = {}
+        provider_slots_lock = threading.Lock()
+
+        def _provider_slot(model_name):
+            """Semáforo do provider (prefixo antes de '/') — limita chamadas simultâneas."""
+            provider = model_name.split("/")[0] if "/" in model_name else model_name
+            with provider_slots_lock:
+                if provider not in provider_slots:
+                    provider_slots[provider] = threading.BoundedSemaphore(EXTRACTION_PROVIDER_CONCURRENCY)
+                return provider_slots[provider]
+
+        abortar = threading.Event()  # budget excedido / timeout: chunks ainda em fila não arrancam
+
+        estados = {}
+        for cfg in extractor_configs:
+            estados[cfg["id"]] = {
+                "cfg": cfg,
+                "model": cfg["model"],  # passa a suplente quando o titular morre
+                "lock": threading.Lock(),
+                "run": ExtractionRun(
+                    run_id=f"run_{cfg['id']}_{doc_id}",
+                    extractor_id=cfg["id"],
+                    model_name=cfg["model"],
+                    method=ExtractionMethod.TEXT,
+                    status=ExtractionStatus.PENDING,
+                ),
+                "descartado": False,  # titular + suplentes falharam
+                "excepcao": False,    # excepção inesperada num chunk
+                "chunks": [None] * num_chunks,
+                "pendentes": num_chunks,
+            }
+
+        def _run_chunk(estado, chunk_idx, chunk):
+            """Executa um extrator num chunk. Thread-safe; resultado fica em estado["chunks"]."""
+            cfg = estado["cfg"]
             extractor_id = cfg["id"]
-            model = cfg["model"]
             role = cfg["role"]
             instructions = cfg["instructions"]
             temperature = cfg.get("temperature", 0.0)
+            run = estado["run"]
 
-            run = ExtractionRun(
-                run_id=f"run_{extractor_id}_{doc_id}",
-                extractor_id=extractor_id,
-                model_name=model,
-                method=ExtractionMethod.TEXT,
-                status=ExtractionStatus.PENDING,
-            )
+            with estado["lock"]:
+                if estado["descartado"] or estado["excepcao"] or abortar.is_set():
+                    return None
+                model = estado["model"]
 
-            extractor_items = []
-            extractor_content_parts = []
-            chunk_errors = []
-            local_unreadable = []
-            extractor_total_tokens = 0
-            extractor_prompt_tokens = 0
-            extractor_completion_tokens = 0
+            chunk_info = f" (chunk {chunk_idx+1}/{num_chunks})" if num_chunks > 1 else ""
 
-            # v5.1: Todos os extractores usam os mesmos chunks (micro-chunking removido — Nova Pro substituído)
-            extractor_chunks = chunks
+            logger.info(f"=== {extractor_id}{chunk_info} [{chunk.start_char:,}-{chunk.end_char:,}] - {model} ===")
 
-            for chunk_idx, chunk in enumerate(extractor_chunks):
-                chunk_info = f" (chunk {chunk_idx+1}/{len(extractor_chunks)})" if len(extractor_chunks) > 1 else ""
+            # Construir prompt unificado com metadados do chunk
+            prompt = build_unified_prompt(chunk, area, extractor_id)
 
-                logger.info(f"=== {extractor_id}{chunk_info} [{chunk.start_char:,}-{chunk.end_char:,}] - {model} ===")
-
-                # Construir prompt unificado com metadados do chunk
-                prompt = build_unified_prompt(chunk, area, extractor_id)
-
-                # System prompt combinado — v4.0: visual extractors (E2, E7) use PROMPT_EXTRATOR_VISUAL
-                is_visual = cfg.get("visual", False)
-                base_prompt = PROMPT_EXTRATOR_VISUAL if is_visual else SYSTEM_EXTRATOR_UNIFIED
-                sys_prompt = f"""{base_prompt}
+            # System prompt combinado — v4.0: visual extractors (E2, E7) use PROMPT_EXTRATOR_VISUAL
+            is_visual = cfg.get("visual", False)
+            base_prompt = PROMPT_EXTRATOR_VISUAL if is_visual else SYSTEM_EXTRATOR_UNIFIED
+            sys_prompt = f"""{base_prompt}
 
 INSTRUÇÕES ESPECÍFICAS DO EXTRATOR {extractor_id} ({role}):
 {instructions}"""
 
-                # Determinar se este chunk tem páginas escaneadas E o modelo suporta visão
-                chunk_scanned_images = []
-                if scanned_images_b64 and model in VISION_CAPABLE_MODELS:
-                    for pg_num, b64_img in scanned_images_b64.items():
-                        if chunk.page_start is not None and chunk.page_end is not None:
-                            if chunk.page_start <= pg_num <= chunk.page_end:
-                                chunk_scanned_images.append((pg_num, b64_img))
-                        else:
+            # Determinar se este chunk tem páginas escaneadas E o modelo suporta visão
+            chunk_scanned_images = []
+            if scanned_images_b64 and model in VISION_CAPABLE_MODELS:
+                for pg_num, b64_img in scanned_images_b64.items():
+                    if chunk.page_start is not None and chunk.page_end is not None:
+                        if chunk.page_start <= pg_num <= chunk.page_end:
                             chunk_scanned_images.append((pg_num, b64_img))
-
-                # FIX 2026-02-18: Calcular max_tokens adequado ao modelo
-                # Extractores produzem JSON extenso (~66K chars para chunk 50K)
-                # Cap 65K para modelos com output grande; modelos pequenos usam seu limite real
-                from src.config import MODEL_MAX_OUTPUT
-                extractor_max_tokens = min(65_536, MODEL_MAX_OUTPUT.get(model, 16_384))
-                logger.info(f"[MAX_TOKENS] {extractor_id}: modelo={model} → max_tokens={extractor_max_tokens:,}")
-
-                # Chamar LLM com retry (com ou sem imagens)
-                def _do_llm_call(
-                    _model=model, _prompt=prompt, _sys=sys_prompt, _temp=temperature,
-                    _images=chunk_scanned_images, _eid=extractor_id,
-                    _max_tokens=extractor_max_tokens,
-                ):
-                    if _images:
-                        pages_info = ", ".join(str(pg) for pg, _ in _images)
-                        vision_note = (
-                            f"\n\nNOTA IMPORTANTE: Este documento contém {len(_images)} "
-                            f"página(s) digitalizada(s) (página(s) {pages_info}). "
-                            f"As imagens dessas páginas estão anexas abaixo. "
-                            f"DEVES analisar as imagens e extrair TODO o texto e informação visível: "
-                            f"datas, valores, nomes, moradas, referências legais, assinaturas, "
-                            f"carimbos, tabelas. Transcreve fielmente o conteúdo das imagens."
-                        )
-                        content_blocks = [{"type": "text", "text": _prompt + vision_note}]
-                        for pg_num, b64_img in _images:
-                            content_blocks.append({"type": "text", "text": f"\n--- Imagem da Página {pg_num} ---"})
-                            content_blocks.append({
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/png;base64,{b64_img}"}
-                            })
-                        messages = [{"role": "user", "content": content_blocks}]
-                        logger.info(f"📸 {_eid}: enviando {len(_images)} imagem(ns) para análise visual")
+                    else:
+                        chunk_scanned_images.append((pg_num, b64_img))
+
+            # FIX 2026-02-18: Calcular max_tokens adequado ao modelo
+            # Extractores produzem JSON extenso (~66K chars para chunk 50K)
+            # Cap 65K para modelos com output grande; modelos pequenos usam seu limite real
+            extractor_max_tokens = min(65_536, MODEL_MAX_OUTPUT.get(model, 16_384))
+            logger.info(f"[MAX_TOKENS] {extractor_id}: modelo={model} → max_tokens={extractor_max_tokens:,}")
+
+            # Parser incremental: consome o output em streaming (items prontos
+            # quando a resposta acaba; truncagem detectada sem re-parsear)
+            parser = IncrementalItemParser() if EXTRACTOR_STREAMING else None
+
+            # Chamar LLM com retry (com ou sem imagens)
+            def _do_llm_call(
+                _model=model, _prompt=prompt, _sys=sys_prompt, _temp=temperature,
+                _images=chunk_scanned_images, _eid=extractor_id,
+                _max_tokens=extractor_max_tokens, _parser=parser, _schema=schema_extraccao,
+            ):
+                if _images:
+                    pages_info = ", ".join(str(pg) for pg, _ in _images)
+                    vision_note = (
+                        f"\n\nNOTA IMPORTANTE: Este documento contém {len(_images)} "
+                        f"página(s) digitalizada(s) (página(s) {pages_info}). "
+                        f"As imagens dessas páginas estão anexas abaixo. "
+                        f"DEVES analisar as imagens e extrair TODO o texto e informação visível: "
+                        f"datas, valores, nomes, moradas, referências legais, assinaturas, "
+                        f"carimbos, tabelas. Transcreve fielmente o conteúdo das imagens."
+                    )
+                    content_blocks = [{"type": "text", "text": _prompt + vision_note}]
+                    for pg_num, b64_img in _images:
+                        content_blocks.append({"type": "text", "text": f"\n--- Imagem da Página {pg_num} ---"})
+                        content_blocks.append({
+                            "type": "image_url",
+                            "image_url": {"url": f"data:image/png;base64,{b64_img}"}
+                        })
+                    messages = [{"role": "user", "content": content_blocks}]
+                    logger.info(f"📸 {_eid}: enviando {len(_images)} imagem(ns) para análise visual")
+                    with _provider_slot(_model):
                         return self.llm_client.chat(
                             model=_model, messages=messages,
                             system_prompt=_sys, temperature=_temp,
-                            max_tokens=_max_tokens, timeout=120,
+                            max_tokens=_max_tokens, timeout=EXTRACTOR_CALL_TIMEOUT,
+                            stream_consumer=_parser, response_schema=_schema,
                         )
-                    else:
+                else:
+                    with _provider_slot(_model):
                         return self.llm_client.chat_simple(
                             model=_model, prompt=_prompt,
                             system_prompt=_sys, temperature=_temp,
-                            max_tokens=_max_tokens, timeout=120,
+                            max_tokens=_max_tokens, timeout=EXTRACTOR_CALL_TIMEOUT,
+                            stream_consumer=_parser, response_schema=_schema,
                         )
 
-                # FIX 2026-02-18: Extractores com timeout 120s, 2 retries, deadline 250s
-                response = _call_with_retry(
-                    _do_llm_call,
-                    func_name=f"{extractor_id}-chunk{chunk_idx}",
-                    max_retries=2,
-                    backoff_times=[5],
-                    deadline=250,
-                )
+            # FIX 2026-02-18: Extractores com timeout 120s, 2 retries, deadline 250s
+            response = _call_with_retry(
+                _do_llm_call,
+                func_name=f"{extractor_id}-chunk{chunk_idx}",
+                max_retries=EXTRACTOR_MAX_RETRIES,
+                backoff_times=[5],
+                deadline=EXTRACTOR_RETRY_DEADLINE,
+            )
 
-                # v5.1: Suplentes universais — se titular falha, suplente assume TODOS os chunks restantes
-                from src.config import EXTRACTOR_SUBSTITUTES
-                if response is None or not response.content or not getattr(response, 'success', True):
-                    fail_reason = ""
-                    if response and hasattr(response, 'finish_reason') and response.finish_reason:
-                        fail_reason = f" (finish_reason={response.finish_reason})"
-                    elif response and hasattr(response, 'error') and response.error:
-                        fail_reason = f" ({response.error[:80]})"
-
-                    # Tentar suplentes universais (gpt-5-mini → gemini-2.5-flash)
-                    suplente_ok = False
-                    for sub_model in EXTRACTOR_SUBSTITUTES:
-                        if sub_model == model:
-                            continue  # Não usar o mesmo modelo como suplente
-                        logger.warning(
-                            f"[SUPLENTE] {extractor_id} chunk {chunk_idx+1}: "
-                            f"{model} falhou{fail_reason} → tentando {sub_model}"
-                        )
-                        sub_max_tokens = min(65_536, MODEL_MAX_OUTPUT.get(sub_model, 16_384))
-
-                        # v5.1: Suplente com suporte a imagens (se visual e modelo capaz)
-                        def _do_sub_call(
-                            _model=sub_model, _prompt=prompt, _sys=sys_prompt,
-                            _temp=temperature, _max_tokens=sub_max_tokens,
-                            _images=chunk_scanned_images, _eid=extractor_id,
-                        ):
-                            if _images and _model in VISION_CAPABLE_MODELS:
-                                pages_info = ", ".join(str(pg) for pg, _ in _images)
-                                vision_note = (
-                                    f"\n\nNOTA IMPORTANTE: Este documento contém {len(_images)} "
-                                    f"página(s) digitalizada(s) (página(s) {pages_info}). "
-                                    f"Analisa as imagens e extrai TODO o texto e informação visível."
-                                )
-                                content_blocks = [{"type": "text", "text": _prompt + vision_note}]
-                                for pg_num, b64_img in _images:
-                                    content_blocks.append({"type": "text", "text": f"\n--- Imagem da Página {pg_num} ---"})
-                                    content_blocks.append({
-                                        "type": "image_url",
-                                        "image_url": {"url": f"data:image/png;base64,{b64_img}"}
-                                    })
-                                messages = [{"role": "user", "content": content_blocks}]
-                                logger.info(f"📸 {_eid} [SUPLENTE]: enviando {len(_images)} imagem(ns) para {_model}")
+            # v5.1: Suplentes universais — se titular falha, suplente assume TODOS os chunks restantes
+            if response is None or not response.content or not getattr(response, 'success', True):
+                fail_reason = ""
+                if response and hasattr(response, 'finish_reason') and response.finish_reason:
+                    fail_reason = f" (finish_reason={response.finish_reason})"
+                elif response and hasattr(response, 'error') and response.error:
+                    fail_reason = f" ({response.error[:80]})"
+
+                # Tentar suplentes universais (gpt-5-mini → gemini-2.5-flash)
+                suplente_ok = False
+                for sub_model in EXTRACTOR_SUBSTITUTES:
+                    if sub_model == model:
+                        continue  # Não usar o mesmo modelo como suplente
+                    logger.warning(
+                        f"[SUPLENTE] {extractor_id} chunk {chunk_idx+1}: "
+                        f"{model} falhou{fail_reason} → tentando {sub_model}"
+                    )
+                    sub_max_tokens = min(65_536, MODEL_MAX_OUTPUT.get(sub_model, 16_384))
+
+                    # v5.1: Suplente com suporte a imagens (se visual e modelo capaz)
+                    def _do_sub_call(
+                        _model=sub_model, _prompt=prompt, _sys=sys_prompt,
+                        _temp=temperature, _max_tokens=sub_max_tokens,
+                        _images=chunk_scanned_images, _eid=extractor_id,
+                        _parser=parser, _schema=schema_extraccao,
+                    ):
+                        if _images and _model in VISION_CAPABLE_MODELS:
+                            pages_info = ", ".join(str(pg) for pg, _ in _images)
+                            vision_note = (
+                                f"\n\nNOTA IMPORTANTE: Este documento contém {len(_images)} "
+                                f"página(s) digitalizada(s) (página(s) {pages_info}). "
+                                f"Analisa as imagens e extrai TODO o texto e informação visível."
+                            )
+                            content_blocks = [{"type": "text", "text": _prompt + vision_note}]
+                            for pg_num, b64_img in _images:
+                                content_blocks.append({"type": "text", "text": f"\n--- Imagem da Página {pg_num} ---"})
+                                content_blocks.append({
+                                    "type": "image_url",
+                                    "image_url": {"url": f"data:image/png;base64,{b64_img}"}
+                                })
+                            messages = [{"role": "user", "content": content_blocks}]
+                            logger.info(f"📸 {_eid} [SUPLENTE]: enviando {len(_images)} imagem(ns) para {_model}")
+                            with _provider_slot(_model):
                                 return self.llm_client.chat(
                                     model=_model, messages=messages,
                                     system_prompt=_sys, temperature=_temp,
-                                    max_tokens=_max_tokens, timeout=120,
+                                    max_tokens=_max_tokens, timeout=EXTRACTOR_CALL_TIMEOUT,
+                                    stream_consumer=_parser, response_schema=_schema,
                                 )
-                            else:
+                        else:
+                            with _provider_slot(_model):
                                 return self.llm_client.chat_simple(
                                     model=_model, prompt=_prompt,
                                     system_prompt=_sys, temperature=_temp,
-                                    max_tokens=_max_tokens, timeout=120,
+                                    max_tokens=_max_tokens, timeout=EXTRACTOR_CALL_TIMEOUT,
+                                    stream_consumer=_parser, response_schema=_schema,
                                 )
 
-                        response = _call_with_retry(
-                            _do_sub_call,
-                            func_name=f"{extractor_id}-chunk{chunk_idx}-sub-{sub_model.split('/')[-1]}",
-                            max_retries=1,
+                    response = _call_with_retry(
+                        _do_sub_call,
+                        func_name=f"{extractor_id}-chunk{chunk_idx}-sub-{sub_model.split('/')[-1]}",
+                        max_retries=EXTRACTOR_SUBSTITUTE_RETRIES,
+                    )
+                    if response and response.content and getattr(response, 'success', True):
+                        logger.info(
+                            f"[SUPLENTE] {extractor_id} chunk {chunk_idx+1}: "
+                            f"{sub_model.split('/')[-1]} OK ({len(response.content):,} chars) "
+                            f"→ assume TODOS os chunks restantes"
                         )
-                        if response and response.content and getattr(response, 'success', True):
-                            logger.info(
-                                f"[SUPLENTE] {extractor_id} chunk {chunk_idx+1}: "
-                                f"{sub_model.split('/')[-1]} OK ({len(response.content):,} chars) "
-                                f"→ assume TODOS os chunks restantes"
-                            )
-                            # TITULAR MORTO: suplente assume todos os chunks restantes
-                            model = sub_model
+                        # TITULAR MORTO: suplente assume todos os chunks ainda não iniciados
+                        model = sub_model
+                        with estado["lock"]:
+                            estado["model"] = sub_model
                             run.model_name = sub_model  # FIX: actualizar model_name para custo/tracking
-                            suplente_ok = True
-                            break
-                        else:
-                            logger.warning(
-                                f"[SUPLENTE] {extractor_id} chunk {chunk_idx+1}: "
-                                f"{sub_model.split('/')[-1]} também falhou"
-                            )
-
-                    if not suplente_ok:
-                        chunk_errors.append(f"{extractor_id} chunk {chunk_idx}: titular + suplentes falharam")
-                        logger.error(
-                            f"✗ {extractor_id} chunk {chunk_idx+1}: TODOS os modelos falharam "
-                            f"(titular={cfg['model']}, suplentes={EXTRACTOR_SUBSTITUTES}) — extrator descartado"
-                        )
-                        run.status = ExtractionStatus.FAILED
-                        run.errors.append("Titular + todos os suplentes falharam")
-                        extraction_runs.append(run)
-                        return  # Descartar este extrator inteiro
-
-                # Acumular tokens REAIS da resposta
-                r_prompt = response.prompt_tokens
-                r_completion = response.completion_tokens
-                r_total = response.total_tokens
-                if r_total == 0 and response.content:
-                    r_prompt = len(prompt) // 4
-                    r_completion = len(response.content) // 4
-                    r_total = r_prompt + r_completion
-                    logger.warning(f"[CUSTO-ESTIMATIVA] {extractor_id}-chunk{chunk_idx}: API sem usage")
-                extractor_prompt_tokens += r_prompt
-                extractor_completion_tokens += r_completion
-                extractor_total_tokens += r_total
-
-                # Registar no CostController
-                if hasattr(self, '_cost_controller') and self._cost_controller:
-                    try:
-                        self._cost_controller.register_usage(
-                            phase=f"fase1_{extractor_id}_chunk{chunk_idx}",
-                            model=model,
-                            prompt_tokens=r_prompt,
-                            completion_tokens=r_completion,
-                            raise_on_exceed=True,
-                        )
-                    except Exception as e:
-                        if "Limit" in type(e).__name__ or "Budget" in type(e).__name__:
-                            logger.error(f"[CUSTO-BLOQUEIO] Limite excedido em {extractor_id}-chunk{chunk_idx}: {e}")
-                            raise
-                        logger.warning(f"[CUSTO] Erro ao registar {extractor_id}-chunk{chunk_idx}: {e}")
-
-                # Registar no PerformanceTracker (Fase 1 — extrator)
-                perf_tracker = getattr(self, '_perf_tracker', None)
-                if perf_tracker:
-                    try:
-                        _cost_usd_ext = 0.0
-                        _pricing_src_ext = ""
-                        if hasattr(self, '_cost_controller') and self._cost_controller:
-                            _usage = getattr(self._cost_controller, 'usage', None)
-                            if _usage and hasattr(_usage, 'phases') and _usage.phases:
-                                _last_p = _usage.phases[-1]
-                                _cost_usd_ext = getattr(_last_p, 'cost_usd', 0)
-                                _pricing_src_ext = getattr(_last_p, 'pricing_source', '')
-                        from src.llm_client import classify_error
-                        perf_tracker.record_call(
-                            run_id=getattr(self, '_run_id', ''),
-                            model=model,
-                            phase="extrator",
-                            role=self._normalize_role_for_perf(f"extrator_{extractor_id}"),
-                            tier=getattr(self, '_tier', 'bronze'),
-                            prompt_tokens=r_prompt,
-                            completion_tokens=r_completion,
-                            total_tokens=r_total,
-                            cost_usd=_cost_usd_ext,
-                            pricing_source=_pricing_src_ext,
-                            latency_ms=getattr(response, 'latency_ms', 0) or 0,
-                            success=getattr(response, 'success', True),
-                            error_message=getattr(response, 'error', None),
-                            error_type=classify_error(response.error) if getattr(response, 'error', None) else None,
-                            was_retry=False,
-                            retry_number=0,
-                            cached_tokens=getattr(response, 'cached_tokens', 0) or 0,
-                            reasoning_tokens=getattr(response, 'reasoning_tokens', 0) or 0,
-                            finish_reason=getattr(response, 'finish_reason', '') or '',
-                            api_used=getattr(response, 'api_used', '') or '',
+                        suplente_ok = True
+                        break
+                    else:
+                        logger.warning(
+                            f"[SUPLENTE] {extractor_id} chunk {chunk_idx+1}: "
+                            f"{sub_model.split('/')[-1]} também falhou"
                         )
-                    except Exception as _perf_err:
-                        logger.debug(f"[PERF] Erro ao registar extrator: {_perf_err}")
-
-                # Parsear output e criar EvidenceItems com source_spans
-                items, unreadable, errors = parse_unified_output(
-                    output=response.content,
-                    chunk=chunk,
-                    extractor_id=extractor_id,
-                    model_name=model,
-                    page_mapper=page_mapper,
-                )
 
-                extractor_items.extend(items)
-                local_unreadable.extend(unreadable)
-                chunk_errors.extend(errors)
-                run.chunks_processed += 1
+                if not suplente_ok:
+                    logger.error(
+                        f"✗ {extractor_id} chunk {chunk_idx+1}: TODOS os modelos falharam "
+                        f"(titular={cfg['model']}, suplentes={EXTRACTOR_SUBSTITUTES}) — extrator descartado"
+                    )
+                    with estado["lock"]:
+                        if not estado["descartado"]:
+                            estado["descartado"] = True
+                            run.status = ExtractionStatus.FAILED
+                            run.errors.append("Titular + todos os suplentes falharam")
+                    return None  # Descartar este extrator inteiro
+
+            # Acumular tokens REAIS da resposta
+            r_prompt = response.prompt_tokens
+            r_completion = response.completion_tokens
+            r_total = response.total_tokens
+            if r_total == 0 and response.content:
+                r_prompt = contar_tokens(prompt)
+                r_completion = contar_tokens(response.content)
+                r_total = r_prompt + r_completion
+                logger.warning(f"[CUSTO-ESTIMATIVA] {extractor_id}-chunk{chunk_idx}: API sem usage")
+
+            # Registar no CostController
+            if hasattr(self, '_cost_controller') and self._cost_controller:
+                try:
+                    self._cost_controller.register_usage(
+                        phase=f"fase1_{extractor_id}_chunk{chunk_idx}",
+                        model=model,
+                        prompt_tokens=r_prompt,
+                        completion_tokens=r_completion,
+                        raise_on_exceed=True,
+                    )
+                except Exception as e:
+                    if "Limit" in type(e).__name__ or "Budget" in type(e).__name__:
+                        logger.error(f"[CUSTO-BLOQUEIO] Limite excedido em {extractor_id}-chunk{chunk_idx}: {e}")
+                        raise
+                    logger.warning(f"[CUSTO] Erro ao registar {extractor_id}-chunk{chunk_idx}: {e}")
 
-                # Converter para markdown para compatibilidade
-                md_content = items_to_markdown(items, include_provenance=True)
-                if num_chunks > 1:
-                    extractor_content_parts.append(
-                        f"### Chunk {chunk_idx+1} [{chunk.start_char:,}-{chunk.end_char:,}]\n{md_content}"
+            # Registar no PerformanceTracker (Fase 1 — extrator)
+            perf_tracker = getattr(self, '_perf_tracker', None)
+            if perf_tracker:
+                try:
+                    _cost_usd_ext = 0.0
+                    _pricing_src_ext = ""
+                    if hasattr(self, '_cost_controller') and self._cost_controller:
+                        _usage = getattr(self._cost_controller, 'usage', None)
+                        if _usage and hasattr(_usage, 'phases') and _usage.phases:
+                            _last_p = _usage.phases[-1]
+                            _cost_usd_ext = getattr(_last_p, 'cost_usd', 0)
+                            _pricing_src_ext = getattr(_last_p, 'pricing_source', '')
+                    from src.llm_client import classify_error
+                    perf_tracker.record_call(
+                        run_id=getattr(self, '_run_id', ''),
+                        model=model,
+                        phase="extrator",
+                        role=self._normalize_role_for_perf(f"extrator_{extractor_id}"),
+                        tier=getattr(self, '_tier', 'bronze'),
+                        prompt_tokens=r_prompt,
+                        completion_tokens=r_completion,
+                        total_tokens=r_total,
+                        cost_usd=_cost_usd_ext,
+                        pricing_source=_pricing_src_ext,
+                        latency_ms=getattr(response, 'latency_ms', 0) or 0,
+                        success=getattr(response, 'success', True),
+                        error_message=getattr(response, 'error', None),
+                        error_type=classify_error(response.error) if getattr(response, 'error', None) else None,
+                        was_retry=False,
+                        retry_number=0,
+                        cached_tokens=getattr(response, 'cached_tokens', 0) or 0,
+                        reasoning_tokens=getattr(response, 'reasoning_tokens', 0) or 0,
+                        finish_reason=getattr(response, 'finish_reason', '') or '',
+                        api_used=getattr(response, 'api_used', '') or '',
                     )
-                else:
-                    extractor_content_parts.append(md_content)
+                except Exception as _perf_err:
+                    logger.debug(f"[PERF] Erro ao registar extrator: {_perf_err}")
 
-                logger.info(
-                    f"✓ {extractor_id} chunk {chunk_idx}: {len(items)} items extraídos, "
-                    f"{len(unreadable)} secções ilegíveis"
-                )
+            registar_chamada(
+                extractor_id,
+                estruturado=getattr(response, "estruturado", False) is True,
+            )
+
+            # Parsear output e criar EvidenceItems com source_spans
+            items, unreadable, errors = parse_unified_output(
+                output=response.content,
+                chunk=chunk,
+                extractor_id=extractor_id,
+                model_name=model,
+                page_mapper=page_mapper,
+                parser=parser,
+            )
+
+            # Converter para markdown para compatibilidade
+            md_content = items_to_markdown(items, include_provenance=True)
+            if num_chunks > 1:
+                md_content = f"### Chunk {chunk_idx+1} [{chunk.start_char:,}-{chunk.end_char:,}]\n{md_content}"
+
+            logger.info(
+                f"✓ {extractor_id} chunk {chunk_idx}: {len(items)} items extraídos, "
+                f"{len(unreadable)} secções ilegíveis"
+            )
+
+            estado["chunks"][chunk_idx] = {
+                "items": items,
+                "unreadable": unreadable,
+                "errors": errors,
+                "md": md_content,
+                "prompt_tokens": r_prompt,
+                "completion_tokens": r_completion,
+                "total_tokens": r_total,
+            }
+
+        def _finalizar_extrator(estado):
+            """Remonta os chunks de um extrator (por ordem) e grava os ficheiros."""
+            cfg = estado["cfg"]
+            extractor_id = cfg["id"]
+            role = cfg["role"]
+            model = estado["model"]
+            run = estado["run"]
+
+            if estado["excepcao"]:
+                return None
+            if estado["descartado"]:
+                extraction_runs.append(run)
+                return None
+
+            partes = [c for c in estado["chunks"] if c is not None]
+            extractor_items = [item for c in partes for item in c["items"]]
+            local_unreadable = [u for c in partes for u in c["unreadable"]]
+            chunk_errors = [e for c in partes for e in c["errors"]]
+            run.chunks_processed = len(partes)
 
             # Finalizar run deste extrator
             run.items_extracted = len(extractor_items)
@@ -2236,29 +2548,26 @@ INSTRUÇÕES ESPECÍFICAS DO EXTRATOR {extractor_id} ({role}):
             run.finished_at = datetime.now(timezone.utc)
 
             # Criar FaseResult para compatibilidade (com tokens REAIS)
-            full_content = "\n\n".join(extractor_content_parts)
+            full_content = "\n\n".join(c["md"] for c in partes)
             resultado = FaseResult(
                 fase="extrator",
                 modelo=model,
                 role=f"extrator_{extractor_id}",
                 conteudo=full_content,
-                tokens_usados=extractor_total_tokens,
-                prompt_tokens=extractor_prompt_tokens,
-                completion_tokens=extractor_completion_tokens,
+                tokens_usados=sum(c["total_tokens"] for c in partes),
+                prompt_tokens=sum(c["prompt_tokens"] for c in partes),
+                completion_tokens=sum(c["completion_tokens"] for c in partes),
                 latencia_ms=0,
                 sucesso=run.status != ExtractionStatus.FAILED,
             )
 
-            # Guardar ficheiros (thread-safe: cada extrator escreve os seus)
             self._log_to_file(
                 f"fase1_extrator_{extractor_id}.md",
                 f"# Extrator {extractor_id}: {role}\n## Modelo: {model}\n## Items: {len(extractor_items)}\n\n{full_content}"
             )
 
             items_json = [item.to_dict() for item in extractor_items]
-            json_path = self._output_dir / f"fase1_extractor_{extractor_id}_items.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(items_json, f, ensure_ascii=False, indent=2)
+            self._write_artefact(f"fase1_extractor_{extractor_id}_items.json", items_json, items=True)
 
             logger.info(f"✓ Extrator {extractor_id} completo: {len(extractor_items)} items totais")
 
@@ -2270,58 +2579,90 @@ INSTRUÇÕES ESPECÍFICAS DO EXTRATOR {extractor_id} ({role}):
                 "resultado": resultado,
             }
 
-        # Executar extratores em PARALELO (timeout de segurança — ABORTA se exceder)
-        from src.config import EXTRACTOR_TIMEOUT_PER_CHUNK, EXTRACTOR_TIMEOUT_MIN
-        EXTRACTOR_TIMEOUT_SECONDS = max(EXTRACTOR_TIMEOUT_MIN, num_chunks * EXTRACTOR_TIMEOUT_PER_CHUNK)
-        logger.info(f"[PARALELO] Lançando {len(extractor_configs)} extratores em paralelo "
-                    f"(timeout={EXTRACTOR_TIMEOUT_SECONDS}s = {num_chunks} chunks × {EXTRACTOR_TIMEOUT_PER_CHUNK}s)...")
-        _extraction_lock = threading.Lock()
-        with ThreadPoolExecutor(max_workers=min(10, len(extractor_configs))) as executor:
-            futures = {}
-            for i, cfg in enumerate(extractor_configs):
-                future = executor.submit(_run_extractor, i, cfg)
-                futures[future] = cfg["id"]
-
-            try:
-                for future in as_completed(futures, timeout=EXTRACTOR_TIMEOUT_SECONDS):
-                    eid = futures[future]
+        # Executar (extrator × chunk) em PARALELO — ordem chunk-major para que todos os
+        # extratores avancem a par. Deadline por progresso: ABORTA se nenhum chunk
+        # terminar em EXTRACTOR_STALL_TIMEOUT segundos (cada chamada já tem o seu deadline).
+        total_tarefas = num_chunks * len(extractor_configs)
+        max_workers = max(1, min(EXTRACTION_MAX_CONCURRENCY, total_tarefas))
+        logger.info(
+            f"[PARALELO] Lançando {total_tarefas} tarefas (extrator × chunk): "
+            f"concorrência={max_workers}, por provider={EXTRACTION_PROVIDER_CONCURRENCY}, "
+            f"deadline de progresso={EXTRACTOR_STALL_TIMEOUT}s"
+        )
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fase1")
+        futures = {}
+        for chunk_idx, chunk in enumerate(chunks):
+            for cfg in extractor_configs:
+                future = executor.submit(_run_chunk, estados[cfg["id"]], chunk_idx, chunk)
+                futures[future] = (cfg["id"], chunk_idx)
+
+        pendentes = set(futures)
+        concluidas = 0
+        try:
+            while pendentes:
+                done, pendentes = concurrent.futures.wait(
+                    pendentes, timeout=EXTRACTOR_STALL_TIMEOUT,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                if not done:
+                    raise concurrent.futures.TimeoutError()
+                for future in done:
+                    eid, chunk_idx = futures[future]
+                    estado = estados[eid]
                     try:
-                        result = future.result()
+                        future.result()
+                    except Exception as exc:
+                        if "Budget" in type(exc).__name__ or "Limit" in type(exc).__name__:
+                            raise  # Re-raise budget/limit errors immediately
+                        logger.error(f"[PARALELO] {eid} chunk {chunk_idx} excepção: {exc}")
+                        with estado["lock"]:
+                            estado["excepcao"] = True
+
+                    concluidas += 1
+                    estado["pendentes"] -= 1
+                    if estado["pendentes"] == 0:
+                        result = _finalizar_extrator(estado)
                         if result is not None:
-                            with _extraction_lock:
-                                items_by_extractor[result["extractor_id"]] = result["items"]
-                                all_unreadable.extend(result["unreadable"])
-                                extraction_runs.append(result["run"])
-                                resultados.append(result["resultado"])
+                            items_by_extractor[result["extractor_id"]] = result["items"]
+                            all_unreadable.extend(result["unreadable"])
+                            extraction_runs.append(result["run"])
+                            resultados.append(result["resultado"])
                             logger.info(f"[PARALELO] {eid} concluído: {len(result['items'])} items")
                         else:
                             logger.warning(f"[PARALELO] {eid} retornou None - ignorado")
-                    except Exception as exc:
-                        if "Budget" in type(exc).__name__ or "Limit" in type(exc).__name__:
-                            raise  # Re-raise budget/limit errors immediately
-                        logger.error(f"[PARALELO] {eid} excepção: {exc}")
-            except (TimeoutError, concurrent.futures.TimeoutError):
-                # v4.1: Continuar se ≥5 extractores terminaram (71%+)
-                timed_out = [eid for f, eid in futures.items() if not f.done()]
-                for f in futures:
-                    if not f.done():
-                        f.cancel()
-                completed_count = len(items_by_extractor)
-                total_count = len(futures)
-                min_required = max(2, total_count - 2)  # Permitir até 2 falhas
-                if completed_count >= min_required:
-                    logger.warning(
-                        f"TIMEOUT: {len(timed_out)} extratores não acabaram em "
-                        f"{EXTRACTOR_TIMEOUT_SECONDS}s: {timed_out}. "
-                        f"Continuando com {completed_count}/{total_count} extractores."
-                    )
-                else:
-                    raise Exception(
-                        f"TIMEOUT CRÍTICO: {len(timed_out)} extratores não acabaram em "
-                        f"{EXTRACTOR_TIMEOUT_SECONDS}s: {timed_out}. "
-                        f"Apenas {completed_count}/{total_count} completaram "
-                        f"(mínimo {min_required})."
+                if num_chunks > 1:
+                    self._reportar_progresso(
+                        "fase1", 10 + (20 * concluidas) // total_tarefas,
+                        f"Extração: {concluidas}/{total_tarefas} chunks concluídos",
                     )
+        except (TimeoutError, concurrent.futures.TimeoutError):
+            # v4.1: Continuar se ≥5 extractores terminaram (71%+)
+            abortar.set()
+            timed_out = sorted({futures[f][0] for f in pendentes})
+            for f in pendentes:
+                f.cancel()
+            completed_count = len(items_by_extractor)
+            total_count = len(extractor_configs)
+            min_required = max(2, total_count - 2)  # Permitir até 2 falhas
+            if completed_count >= min_required:
+                logger.warning(
+                    f"TIMEOUT: nenhum chunk concluído em {EXTRACTOR_STALL_TIMEOUT}s; "
+                    f"extratores por terminar: {timed_out}. "
+                    f"Continuando com {completed_count}/{total_count} extractores."
+                )
+            else:
+                raise Exception(
+                    f"TIMEOUT CRÍTICO: nenhum chunk concluído em {EXTRACTOR_STALL_TIMEOUT}s; "
+                    f"extratores por terminar: {timed_out}. "
+                    f"Apenas {completed_count}/{total_count} completaram "
+                    f"(mínimo {min_required})."
+                )
+        except BaseException:
+            abortar.set()
+            raise
+        finally:
+            # Não esperar por chamadas presas após timeout/budget; tarefas em fila são canceladas
+            executor.shutdown(wait=not abortar.is_set(), cancel_futures=True)
 
         if len(items_by_extractor) < 2:
             raise Exception(
@@ -2344,6 +2685,15 @@ INSTRUÇÕES ESPECÍFICAS DO EXTRATOR {extractor_id} ({role}):
         )
 
         logger.info(f"Agregação: {len(union_items)} items unidos, {len(conflicts)} conflitos detetados")
+        near_dup = resumo_quase_duplicados(union_items, consumidores=len(self.auditor_models))
+        if near_dup["items_fundidos"]:
+            logger.info(
+                f"[NEAR-DUP] {near_dup['items_fundidos']} quase-duplicados fundidos: "
+                f"~{near_dup['tokens_poupados_total']:,} tokens a menos nos prompts da Fase 2 "
+                f"({near_dup['consumidores']} auditores)"
+            )
+        evidence_store = EvidenceStore.from_items(union_items)
+        logger.info(f"[EVIDENCE-STORE] {evidence_store.stats()}")
 
         # 7. Calcular cobertura (chars e páginas)
         coverage_data = calculate_coverage(
@@ -2352,6 +2702,7 @@ INSTRUÇÕES ESPECÍFICAS DO EXTRATOR {extractor_id} ({role}):
             total_chars=doc_meta.total_chars,
             page_mapper=page_mapper,
             total_pages=doc_meta.total_pages,
+            store=evidence_store,
         )
 
         # Log de cobertura (chars)
@@ -2390,14 +2741,10 @@ INSTRUÇÕES ESPECÍFICAS DO EXTRATOR {extractor_id} ({role}):
             logger.warning(f"Validação do resultado unificado: {validation_errors}")
 
         # 10. Guardar resultado unificado
-        unified_json_path = self._output_dir / "fase1_unified_result.json"
-        with open(unified_json_path, 'w', encoding='utf-8') as f:
-            json.dump(unified_result.to_dict(), f, ensure_ascii=False, indent=2)
+        self._write_artefact("fase1_unified_result.json", unified_result.to_dict())
 
         # Guardar relatório de cobertura
-        coverage_path = self._output_dir / "fase1_coverage_report.json"
-        with open(coverage_path, 'w', encoding='utf-8') as f:
-            json.dump(coverage_data, f, ensure_ascii=False, indent=2)
+        self._write_artefact("fase1_coverage_report.json", coverage_data)
 
         # 11. Criar bruto para compatibilidade
         # v5.2 fix H4: Usar role/modelo do próprio FaseResult (não index posicional)
@@ -2448,6 +2795,7 @@ INSTRUÇÕES ESPECÍFICAS DO EXTRATOR {extractor_id} ({role}):
             "unreadable_parts": unreadable_parts,
             "conflicts": conflicts,
             "conflicts_count": len(conflicts),
+            "near_duplicates": near_dup,
             "extraction_runs": [run.to_dict() for run in extraction_runs],
             "errors": all_errors,
             "warnings": all_warnings,
@@ -2462,14 +2810,8 @@ INSTRUÇÕES ESPECÍFICAS DO EXTRATOR {extractor_id} ({role}):
         }
 
         # CRÍTICO: Escrever JSON estruturado (fonte de verdade)
-        agregado_json_path = self._output_dir / "fase1_agregado_consolidado.json"
-        logger.info(f"[JSON-WRITE] Escrevendo fase1_agregado_consolidado.json em: {agregado_json_path.absolute()}")
-        try:
-            with open(agregado_json_path, 'w', encoding='utf-8') as f:
-                json.dump(agregado_json, f, ensure_ascii=False, indent=2)
-            logger.info(f"✓ Agregado JSON guardado: {agregado_json_path.absolute()} ({len(union_items)} items, {len(unreadable_parts)} ilegíveis)")
-        except Exception as e:
-            logger.error(f"[JSON-WRITE-ERROR] Falha ao escrever fase1_agregado_consolidado.json: {e}")
+        self._write_artefact("fase1_agregado_consolidado.json", agregado_json)
+        logger.info(f"✓ Agregado JSON enfileirado: fase1_agregado_consolidado.json ({len(union_items)} items, {len(unreadable_parts)} ilegíveis)")
 
         # 11c. DERIVAR Markdown do JSON (JSON é fonte de verdade)
         consolidado = render_agregado_markdown_from_json(agregado_json)
@@ -2735,11 +3077,8 @@ CRÍTICO: Preservar TODOS os dados numéricos, datas, valores e referências de
                     logger.info("=== DETETOR: verificar_cobertura_sinais executado ===")
 
                     # Guardar relatório de sinais
-                    signal_report_path = self._output_dir / "signals_coverage_report.json"
-                    logger.info(f"=== DETETOR: A guardar em {signal_report_path} ===")
-                    with open(signal_report_path, 'w', encoding='utf-8') as f:
-                        json.dump(signal_report, f, ensure_ascii=False, indent=2)
-                    logger.info(f"=== DETETOR: Relatório GUARDADO com sucesso em {signal_report_path} ===")
+                    self._write_artefact("signals_coverage_report.json", signal_report)
+                    logger.info("=== DETETOR: Relatório enfileirado (signals_coverage_report.json) ===")
 
                     # Log de sinais não cobertos
                     if signal_report["uncovered_signals"]:
@@ -2841,8 +3180,8 @@ IMPORTANTE: Só usa page_num que existam no batch acima."""
                         r_pt = response.prompt_tokens
                         r_ct = response.completion_tokens
                         if response.total_tokens == 0 and response.content:
-                            r_pt = len(prompt) // 4
-                            r_ct = len(response.content) // 4
+                            r_pt = contar_tokens(prompt)
+                            r_ct = contar_tokens(response.content)
                         try:
                             self._cost_controller.register_usage(
                                 phase=f"fase1_{extractor_id}_batch{batch_idx}" + (f"_retry{attempt}" if attempt > 0 else ""),
@@ -2921,9 +3260,7 @@ Devolve o JSON completo no mesmo formato."""
             self._log_to_file(f"fase1_extrator_{extractor_id}.md", f"# Extrator {extractor_id}: {role}\n## Modelo: {model}\n\n{full_content}")
 
             # Guardar JSON para auditoria
-            json_path = self._output_dir / f"fase1_extractor_{extractor_id}.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(extractor_json_results, f, ensure_ascii=False, indent=2)
+            self._write_artefact(f"fase1_extractor_{extractor_id}.json", extractor_json_results)
 
         # Criar matriz de cobertura
         coverage = CoverageMatrix()
@@ -2946,9 +3283,7 @@ Devolve o JSON completo no mesmo formato."""
         signal_report = verificar_cobertura_sinais(pages, extractor_outputs)
 
         # Guardar relatório de sinais
-        signal_report_path = self._output_dir / "signals_coverage_report.json"
-        with open(signal_report_path, 'w', encoding='utf-8') as f:
-            json.dump(signal_report, f, ensure_ascii=False, indent=2)
+        self._write_artefact("signals_coverage_report.json", signal_report)
 
         # Log de sinais não cobertos
         if signal_report["uncovered_signals"]:
@@ -3137,13 +3472,9 @@ TAREFA: Consolida TODOS os batches numa extração FINAL LOSSLESS.
         # Carregar informação de cobertura se disponível
         coverage_info = ""
         if self._output_dir and USE_UNIFIED_PROVENANCE:
-            coverage_path = self._output_dir / "fase1_coverage_report.json"
-            if coverage_path.exists():
+            coverage_data = self._read_artefact("fase1_coverage_report.json")
+            if coverage_data is not None:
                 try:
-                    import json as _json
-                    with open(coverage_path, encoding='utf-8') as f:
-                        coverage_data = _json.load(f)
-
                     coverage_info = f"""
 
 ## RELATÓRIO DE COBERTURA DA EXTRAÇÃO
@@ -3296,11 +3627,9 @@ Consolida estas {n_auditores} auditorias numa única auditoria LOSSLESS.
         agregado_json = None
         union_items_json = "[]"
         if self._output_dir and USE_UNIFIED_PROVENANCE:
-            agregado_json_path = self._output_dir / "fase1_agregado_consolidado.json"
-            if agregado_json_path.exists():
+            agregado_json = self._read_artefact("fase1_agregado_consolidado.json")
+            if agregado_json is not None:
                 try:
-                    with open(agregado_json_path, encoding='utf-8') as f:
-                        agregado_json = json.load(f)
                     # Extrair union_items para o prompt
                     union_items = agregado_json.get("union_items", [])
                     # Criar versão compacta para o prompt (apenas campos essenciais)
@@ -3332,11 +3661,9 @@ Consolida estas {n_auditores} auditorias numa única auditoria LOSSLESS.
 """
         elif self._output_dir:
             # Fallback: carregar de ficheiro separado
-            coverage_path = self._output_dir / "fase1_coverage_report.json"
-            if coverage_path.exists():
+            coverage_data = self._read_artefact("fase1_coverage_report.json")
+            if coverage_data is not None:
                 try:
-                    with open(coverage_path, encoding='utf-8') as f:
-                        coverage_data = json.load(f)
                     coverage_info = f"""
 ## COBERTURA DA EXTRAÇÃO
 - Total chars: {coverage_data.get('total_chars', 0):,}
@@ -3446,11 +3773,8 @@ OUTPUT: Same JSON format as other auditors, plus include a "devils_advocate_conc
                 report = self._integrity_validator.validate_and_annotate_audit(report)
 
             # Guardar JSON do auditor individual
-            json_path = self._output_dir / f"fase2_auditor_{i+1}.json"
             try:
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
-                logger.info(f"[JSON-WRITE] Auditor {auditor_id} JSON guardado: {json_path.absolute()}")
+                self._write_artefact(f"fase2_auditor_{i+1}.json", report.to_dict())
             except Exception as e:
                 logger.error(f"[JSON-WRITE-ERROR] Falha ao escrever auditor {auditor_id} JSON: {e}")
 
@@ -3567,9 +3891,7 @@ You are the final quality gate before the Judges."""
                     bruto_parts.append("\n---\n")
 
                     # Guardar JSON A5
-                    a5_json_path = self._output_dir / "fase2_auditor_5_senior.json"
-                    with open(a5_json_path, 'w', encoding='utf-8') as f:
-                        json.dump(a5_report.to_dict(), f, ensure_ascii=False, indent=2)
+                    self._write_artefact("fase2_auditor_5_senior.json", a5_report.to_dict())
 
                     logger.info(f"[ELITE] A5 Opus: {len(a5_report.findings)} findings")
                 else:
@@ -3648,12 +3970,9 @@ CRITICAL: Respond with ONLY the JSON object. Do NOT include any text, explanatio
         )
 
         # CRITICO: Guardar JSON do Consolidador (fonte de verdade)
-        chefe_json_path = self._output_dir / "fase2_consolidador_consolidado.json"
-        logger.info(f"[JSON-WRITE] Escrevendo fase2_consolidador_consolidado.json em: {chefe_json_path.absolute()}")
         try:
-            with open(chefe_json_path, 'w', encoding='utf-8') as f:
-                json.dump(chefe_report.to_dict(), f, ensure_ascii=False, indent=2)
-            logger.info(f"✓ Consolidador JSON guardado: {chefe_json_path.absolute()}")
+            self._write_artefact("fase2_consolidador_consolidado.json", chefe_report.to_dict())
+            logger.info("✓ Consolidador JSON enfileirado: fase2_consolidador_consolidado.json")
         except Exception as e:
             logger.error(f"[JSON-WRITE-ERROR] Falha ao escrever fase2_consolidador_consolidado.json: {e}")
 
@@ -3672,12 +3991,7 @@ CRITICAL: Respond with ONLY the JSON object. Do NOT include any text, explanatio
         )
 
         # Guardar todos os reports JSON num ficheiro
-        all_reports_path = self._output_dir / "fase2_all_audit_reports.json"
-        with open(all_reports_path, 'w', encoding='utf-8') as f:
-            json.dump(
-                [r.to_dict() for r in audit_reports],
-                f, ensure_ascii=False, indent=2
-            )
+        self._write_artefact("fase2_all_audit_reports.json", [r.to_dict() for r in audit_reports])
 
         # =====================================================================
         # CONSENSUS ENGINE: Validação determinística + consenso adaptativo
@@ -3831,9 +4145,7 @@ CRITICAL: Respond with ONLY the JSON object. Do NOT include any text, explanatio
                 opinion = self._integrity_validator.validate_and_annotate_judge(opinion)
 
             # Guardar JSON
-            json_path = self._output_dir / f"fase3_relator_{i+1}.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(opinion.to_dict(), f, ensure_ascii=False, indent=2)
+            self._write_artefact(f"fase3_relator_{i+1}.json", opinion.to_dict())
 
             # Guardar Markdown
             md_content = opinion.to_markdown()
@@ -3905,12 +4217,7 @@ CRITICAL: Respond with ONLY the JSON object. Do NOT include any text, explanatio
             self._log_to_file("fase3_qa_respostas.md", qa_content)
 
         # Guardar todos os opinions JSON
-        all_opinions_path = self._output_dir / "fase3_all_judge_opinions.json"
-        with open(all_opinions_path, 'w', encoding='utf-8') as f:
-            json.dump(
-                [o.to_dict() for o in judge_opinions],
-                f, ensure_ascii=False, indent=2
-            )
+        self._write_artefact("fase3_all_judge_opinions.json", [o.to_dict() for o in judge_opinions])
 
         return judge_opinions, respostas_qa
 
@@ -4025,10 +4332,8 @@ CRITICAL: Respond with ONLY the JSON object. Do NOT include any text, explanatio
         decision.auditors_consulted = [f"A{i+1}" for i in range(len(self.auditor_models))]
 
         # Guardar JSON (fonte de verdade da Fase 4)
-        json_path = self._output_dir / "fase4_decisao_final.json"
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(decision.to_dict(), f, ensure_ascii=False, indent=2)
-        logger.info(f"[JSON-WRITE] fase4_decisao_final.json guardado: {json_path.absolute()}")
+        self._write_artefact("fase4_decisao_final.json", decision.to_dict())
+        logger.info("[JSON-WRITE] fase4_decisao_final.json enfileirado")
 
         # Gerar e guardar Markdown
         md_content = decision.generate_markdown()
@@ -4661,6 +4966,8 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             budget_limit_usd=budget,
             token_limit=token_limit,
         )
+        self._hedge_spend_usd = 0.0
+        self._hedge_reservas.clear()
         logger.info(
             f"[CUSTO] CostController inicializado: run={run_id}, tier={tier_name}, "
             f"budget=${budget:.2f}, token_limit={token_limit:,} "
@@ -4686,331 +4993,424 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
         judge_opinions = None
 
         try:
-            # ===== FASE 0: TRIAGEM (v4.0 Handover) =====
-            fase0_triage = None
-            try:
-                from src.pipeline.triage import TriageProcessor, inject_page_markers
-                triage_proc = TriageProcessor(
-                    llm_client=self.llm_client,
-                    cost_controller=self._cost_controller,
-                )
-                self._reportar_progresso("fase0", 2, "Triagem: classificando domínio jurídico...")
-                import time as _time_triage
-                _triage_start = _time_triage.time()
-                fase0_triage = triage_proc.run(
-                    text=documento.text,
-                    filename=documento.filename,
-                    num_pages=getattr(documento, 'num_pages', 0),
-                )
-                _triage_ms = (_time_triage.time() - _triage_start) * 1000
+            # v5.3: Pipeline como grafo de estágios (src/pipeline/stage_graph.py).
+            # Fases LLM em cadeia; data dos factos, page mapper e pré-carregamento
+            # de legislação sobrepõem-se a elas.
 
-                # v5.1: Logging explícito da Fase 0 (sempre visível nos logs)
-                logger.info(
-                    f"[FASE0] Triagem concluída em {_triage_ms:.0f}ms — "
-                    f"domínio='{fase0_triage.domain}' "
-                    f"(confiança={fase0_triage.domain_confidence:.0%}, "
-                    f"consenso={fase0_triage.consensus})"
-                )
-                logger.info(
-                    f"[FASE0] Votos: {fase0_triage.votes} | "
-                    f"Fotos estimadas: {fase0_triage.photo_estimate} | "
-                    f"User input: '{area_direito}'"
-                )
+            # ===== FASE 0: TRIAGEM (v4.0 Handover) =====
+            def _st_triagem(v):
+                fase0_triage = None
+                try:
+                    from src.pipeline.triage import TriageProcessor, inject_page_markers
+                    triage_proc = TriageProcessor(
+                        llm_client=self.llm_client,
+                        cost_controller=self._cost_controller,
+                    )
+                    self._reportar_progresso("fase0", 2, "Triagem: classificando domínio jurídico...")
+                    import time as _time_triage
+                    _triage_start = _time_triage.time()
+                    fase0_triage = triage_proc.run(
+                        text=documento.text,
+                        filename=documento.filename,
+                        num_pages=getattr(documento, 'num_pages', 0),
+                    )
+                    _triage_ms = (_time_triage.time() - _triage_start) * 1000
 
-                # Se triagem detectou domínio com confiança, usar em vez do user input
-                if fase0_triage.domain_confidence >= 0.75 and area_direito in ("Civil", ""):
+                    # v5.1: Logging explícito da Fase 0 (sempre visível nos logs)
                     logger.info(
-                        f"[FASE0] Triagem sugere domínio '{fase0_triage.domain}' "
-                        f"(confiança={fase0_triage.domain_confidence:.0%}), "
-                        f"user input='{area_direito}'"
+                        f"[FASE0] Triagem concluída em {_triage_ms:.0f}ms — "
+                        f"domínio='{fase0_triage.domain}' "
+                        f"(confiança={fase0_triage.domain_confidence:.0%}, "
+                        f"consenso={fase0_triage.consensus})"
                     )
-                # Injectar marcadores de página se necessário
-                documento_text_orig = documento.text
-                documento.text = inject_page_markers(documento.text)
-                if documento.text != documento_text_orig:
-                    logger.info("[FASE0] Marcadores [Pág_X] injectados no texto")
-                # Photo warning
-                if fase0_triage.photo_warning == "queue_mode":
-                    logger.warning(
-                        f"[FASE0] ALERTA: {fase0_triage.photo_estimate} fotos estimadas — "
-                        f"modo fila recomendado"
+                    logger.info(
+                        f"[FASE0] Votos: {fase0_triage.votes} | "
+                        f"Fotos estimadas: {fase0_triage.photo_estimate} | "
+                        f"User input: '{area_direito}'"
                     )
-                self._reportar_progresso("fase0", 8, f"Triagem concluída: {fase0_triage.domain}")
-            except Exception as e:
-                logger.warning(f"[FASE0] Triagem falhou (non-blocking): {e}")
 
-            # Fase 1: Extração (SEM perguntas) + Agregador LOSSLESS
-            unified_result = None
-            if USE_PIPELINE_V42:
-                # Pipeline v4.2: Eden AI OCR + modular extraction
-                logger.info("=== Pipeline v4.2 ATIVADO: Eden AI OCR + extracção modular ===")
-                extracoes, bruto_f1, consolidado_f1, unified_result = self._fase1_pipeline_v42(
-                    documento, area_direito
-                )
-            elif USE_UNIFIED_PROVENANCE:
-                # NOVO: Modo unificado com proveniência e cobertura
-                logger.info("Modo UNIFICADO de proveniência ativado")
-                extracoes, bruto_f1, consolidado_f1, unified_result = self._fase1_extracao_unified(
-                    documento, area_direito
-                )
+                    # Se triagem detectou domínio com confiança, usar em vez do user input
+                    if fase0_triage.domain_confidence >= 0.75 and area_direito in ("Civil", ""):
+                        logger.info(
+                            f"[FASE0] Triagem sugere domínio '{fase0_triage.domain}' "
+                            f"(confiança={fase0_triage.domain_confidence:.0%}), "
+                            f"user input='{area_direito}'"
+                        )
+                    # Injectar marcadores de página se necessário
+                    documento_text_orig = documento.text
+                    documento.text = inject_page_markers(documento.text)
+                    if documento.text != documento_text_orig:
+                        logger.info("[FASE0] Marcadores [Pág_X] injectados no texto")
+                    # Photo warning
+                    if fase0_triage.photo_warning == "queue_mode":
+                        logger.warning(
+                            f"[FASE0] ALERTA: {fase0_triage.photo_estimate} fotos estimadas — "
+                            f"modo fila recomendado"
+                        )
+                    self._reportar_progresso("fase0", 8, f"Triagem concluída: {fase0_triage.domain}")
+                except Exception as e:
+                    logger.warning(f"[FASE0] Triagem falhou (non-blocking): {e}")
+                # v4.0: Guardar resultado da triagem
+                if fase0_triage:
+                    result.fase0_triage = fase0_triage.to_dict()
+                return {"fase0_triage": fase0_triage, "texto_marcado": documento.text}
 
-                # Verificar cobertura mínima
-                if unified_result:
-                    coverage_path = self._output_dir / "fase1_coverage_report.json"
-                    if coverage_path.exists():
-                        import json as _json
-                        with open(coverage_path, encoding='utf-8') as f:
-                            coverage_data = _json.load(f)
-                        if coverage_data.get('coverage_percent', 0) < COVERAGE_MIN_THRESHOLD:
-                            logger.warning(
-                                f"ALERTA: Cobertura {coverage_data['coverage_percent']:.1f}% "
-                                f"< {COVERAGE_MIN_THRESHOLD}%"
-                            )
-            else:
-                # Modo legacy
-                extracoes, bruto_f1, consolidado_f1 = self._fase1_extracao(documento, area_direito)
+            # Data dos factos (detecção temporal) — só depende do texto original
+            def _st_data_factos(v):
+                return {"data_factos": self._extrair_data_factos(v["texto_original"] or "")}
 
-            # v4.0: Guardar resultado da triagem
-            if fase0_triage:
-                result.fase0_triage = fase0_triage.to_dict()
+            # Fase 1: Extração (SEM perguntas) + Agregador LOSSLESS
+            def _st_fase1(v):
+                unified_result = None
+                if USE_PIPELINE_V42:
+                    # Pipeline v4.2: Eden AI OCR + modular extraction
+                    logger.info("=== Pipeline v4.2 ATIVADO: Eden AI OCR + extracção modular ===")
+                    extracoes, bruto_f1, consolidado_f1, unified_result = self._fase1_pipeline_v42(
+                        documento, area_direito
+                    )
+                elif USE_UNIFIED_PROVENANCE:
+                    # NOVO: Modo unificado com proveniência e cobertura
+                    logger.info("Modo UNIFICADO de proveniência ativado")
+                    extracoes, bruto_f1, consolidado_f1, unified_result = self._fase1_extracao_unified(
+                        documento, area_direito
+                    )
 
-            result.fase1_extracoes = extracoes
-            result.fase1_agregado_bruto = bruto_f1
-            result.fase1_agregado_consolidado = consolidado_f1
-            result.fase1_agregado = consolidado_f1  # Backwards compat
-
-            # v5.2 fix H5: Guard — mínimo 2 extractores com sucesso
-            successful_extractors = sum(1 for e in extracoes if e.sucesso)
-            if successful_extractors < 2 and not consolidado_f1:
-                raise ValueError(
-                    f"Extracção insuficiente: apenas {successful_extractors} extractores "
-                    f"com sucesso (mínimo: 2). Pipeline abortado."
-                )
+                    # Verificar cobertura mínima
+                    if unified_result:
+                        coverage_data = self._read_artefact("fase1_coverage_report.json")
+                        if coverage_data is not None:
+                            if coverage_data.get('coverage_percent', 0) < COVERAGE_MIN_THRESHOLD:
+                                logger.warning(
+                                    f"ALERTA: Cobertura {coverage_data['coverage_percent']:.1f}% "
+                                    f"< {COVERAGE_MIN_THRESHOLD}%"
+                                )
+                else:
+                    # Modo legacy
+                    extracoes, bruto_f1, consolidado_f1 = self._fase1_extracao(documento, area_direito)
 
-            # v5.3: Checkpoint após Fase 1 — gravar dados reais + contexto pipeline
-            _pipeline_ctx = {
-                "area_direito": area_direito,
-                "perguntas_raw": perguntas_raw,
-                "titulo": self._titulo,
-                "tier": getattr(self, '_tier', 'bronze'),
-                "run_id": self._run_id,
-                "documento_text": documento.text or "",
-                "documento_filename": documento.filename or "",
-                "num_chars": documento.num_chars,
-                "num_words": documento.num_words,
-                "num_pages": getattr(documento, 'num_pages', 0),
-            }
-            self._save_checkpoint(1, "extracao", {
-                "extractores": len(extracoes),
-                "agregado_chars": len(consolidado_f1) if consolidado_f1 else 0,
-            }, phase_data={
-                "consolidado_f1": consolidado_f1 or "",
-                "bruto_f1": bruto_f1 or "",
-            }, pipeline_context=_pipeline_ctx)
-
-            # Guardar referência ao documento para consensus engine
-            self._documento = documento
+                result.fase1_extracoes = extracoes
+                result.fase1_agregado_bruto = bruto_f1
+                result.fase1_agregado_consolidado = consolidado_f1
+                result.fase1_agregado = consolidado_f1  # Backwards compat
 
-            # Inicializar IntegrityValidator para validações nas fases 2-4
-            if USE_UNIFIED_PROVENANCE:
-                self._document_text = documento.text
-                self._unified_result = unified_result
+                # v5.2 fix H5: Guard — mínimo 2 extractores com sucesso
+                successful_extractors = sum(1 for e in extracoes if e.sucesso)
+                if successful_extractors < 2 and not consolidado_f1:
+                    raise ValueError(
+                        f"Extracção insuficiente: apenas {successful_extractors} extractores "
+                        f"com sucesso (mínimo: 2). Pipeline abortado."
+                    )
+
+                # v5.3: Checkpoint após Fase 1 — gravar dados reais + contexto pipeline
+                _pipeline_ctx = {
+                    "area_direito": area_direito,
+                    "perguntas_raw": perguntas_raw,
+                    "titulo": self._titulo,
+                    "tier": getattr(self, '_tier', 'bronze'),
+                    "run_id": self._run_id,
+                    "documento_text": documento.text or "",
+                    "documento_filename": documento.filename or "",
+                    "num_chars": documento.num_chars,
+                    "num_words": documento.num_words,
+                    "num_pages": getattr(documento, 'num_pages', 0),
+                }
+                self._save_checkpoint(1, "extracao", {
+                    "extractores": len(extracoes),
+                    "agregado_chars": len(consolidado_f1) if consolidado_f1 else 0,
+                }, phase_data={
+                    "consolidado_f1": consolidado_f1 or "",
+                    "bruto_f1": bruto_f1 or "",
+                }, pipeline_context=_pipeline_ctx)
+
+                # Guardar referência ao documento para consensus engine
+                self._documento = documento
+                return {
+                    "extracoes": extracoes,
+                    "bruto_f1": bruto_f1,
+                    "consolidado_f1": consolidado_f1,
+                    "unified_result": unified_result,
+                }
 
-                # Criar page_mapper se PDFSafe disponível
+            # Page mapper (PDFSafe ou marcadores [Pág_X]) — em paralelo com a Fase 1
+            def _st_page_mapper(v):
+                if not USE_UNIFIED_PROVENANCE:
+                    return {"page_mapper": None}
+                page_mapper = None
                 if documento.pdf_safe_result:
-                    self._page_mapper = CharToPageMapper.from_pdf_safe_result(
+                    page_mapper = CharToPageMapper.from_pdf_safe_result(
                         documento.pdf_safe_result, f"doc_{run_id[:8]}"
                     )
                 elif documento.text:
-                    self._page_mapper = CharToPageMapper.from_text_markers(
+                    page_mapper = CharToPageMapper.from_text_markers(
                         documento.text, f"doc_{run_id[:8]}"
                     )
+                return {"page_mapper": page_mapper}
+
+            # Inicializar IntegrityValidator para validações nas fases 2-4
+            def _st_validador(v):
+                if not USE_UNIFIED_PROVENANCE:
+                    return {"integrity_validator": None}
+                self._document_text = documento.text
+                self._unified_result = v["unified_result"]
+                if v["page_mapper"] is not None:
+                    self._page_mapper = v["page_mapper"]
 
                 self._integrity_validator = IntegrityValidator(
                     run_id=run_id,
                     document_text=documento.text,
                     total_chars=documento.num_chars,
                     page_mapper=self._page_mapper,
-                    unified_result=unified_result,
+                    unified_result=v["unified_result"],
                 )
                 logger.info("✓ IntegrityValidator inicializado")
+                return {"integrity_validator": self._integrity_validator}
 
             # Fase 2: Auditoria (SEM perguntas) + Consolidador LOSSLESS
-            audit_reports = None
-            chefe_report = None
-            if USE_UNIFIED_PROVENANCE:
-                # MODO UNIFIED: JSON estruturado com proveniência
-                audit_reports, bruto_f2, consolidado_f2, chefe_report = self._fase2_auditoria_unified(
-                    consolidado_f1, area_direito, run_id
-                )
-                # Criar FaseResult para compatibilidade
-                # Tokens reais vêm do CostController (registados em _call_llm)
-                auditorias = []
-                for r in audit_reports:
-                    # Procurar tokens reais no CostController
-                    fase_tokens = 0
-                    fase_prompt = 0
-                    fase_completion = 0
-                    # auditor_id = "A1" → número = "1", phase = "auditor_1_json"
-                    aid_num = r.auditor_id.replace("A", "").replace("a", "")
-                    if hasattr(self, '_cost_controller') and self._cost_controller:
-                        for pu in self._cost_controller.usage.phases:
-                            if f"auditor_{aid_num}" in pu.phase:
-                                fase_tokens += pu.total_tokens
-                                fase_prompt += pu.prompt_tokens
-                                fase_completion += pu.completion_tokens
-                    if fase_tokens == 0:
-                        fase_tokens = len(r.to_markdown()) // 3  # fallback
-                    # FIX 2026-02-14: Só contar erros reais (não INTEGRITY_WARNING) para sucesso
-                    real_errors = [e for e in r.errors if not str(e).startswith("INTEGRITY_WARNING:")]
-                    auditorias.append(FaseResult(
-                        fase="auditoria",
-                        modelo=r.model_name,
-                        role=f"auditor_{r.auditor_id}",
-                        conteudo=r.to_markdown(),
-                        tokens_usados=fase_tokens,
-                        prompt_tokens=fase_prompt,
-                        completion_tokens=fase_completion,
-                        latencia_ms=0,
-                        sucesso=len(real_errors) == 0,
-                    ))
-            else:
-                auditorias, bruto_f2, consolidado_f2 = self._fase2_auditoria(consolidado_f1, area_direito)
-
-            result.fase2_auditorias = auditorias
-            result.fase2_auditorias_brutas = bruto_f2
-            result.fase2_chefe_consolidado = consolidado_f2
-            result.fase2_chefe = consolidado_f2  # Backwards compat
+            def _st_fase2(v):
+                consolidado_f1 = v["consolidado_f1"]
+                audit_reports = None
+                chefe_report = None
+                if USE_UNIFIED_PROVENANCE:
+                    # MODO UNIFIED: JSON estruturado com proveniência
+                    audit_reports, bruto_f2, consolidado_f2, chefe_report = self._fase2_auditoria_unified(
+                        consolidado_f1, area_direito, run_id
+                    )
+                    # Criar FaseResult para compatibilidade
+                    # Tokens reais vêm do CostController (registados em _call_llm)
+                    auditorias = []
+                    for r in audit_reports:
+                        # Procurar tokens reais no CostController
+                        fase_tokens = 0
+                        fase_prompt = 0
+                        fase_completion = 0
+                        # auditor_id = "A1" → número = "1", phase = "auditor_1_json"
+                        aid_num = r.auditor_id.replace("A", "").replace("a", "")
+                        if hasattr(self, '_cost_controller') and self._cost_controller:
+                            for pu in self._cost_controller.usage.phases:
+                                if f"auditor_{aid_num}" in pu.phase:
+                                    fase_tokens += pu.total_tokens
+                                    fase_prompt += pu.prompt_tokens
+                                    fase_completion += pu.completion_tokens
+                        if fase_tokens == 0:
+                            fase_tokens = len(r.to_markdown()) // 3  # fallback
+                        # FIX 2026-02-14: Só contar erros reais (não INTEGRITY_WARNING) para sucesso
+                        real_errors = [e for e in r.errors if not str(e).startswith("INTEGRITY_WARNING:")]
+                        auditorias.append(FaseResult(
+                            fase="auditoria",
+                            modelo=r.model_name,
+                            role=f"auditor_{r.auditor_id}",
+                            conteudo=r.to_markdown(),
+                            tokens_usados=fase_tokens,
+                            prompt_tokens=fase_prompt,
+                            completion_tokens=fase_completion,
+                            latencia_ms=0,
+                            sucesso=len(real_errors) == 0,
+                        ))
+                else:
+                    auditorias, bruto_f2, consolidado_f2 = self._fase2_auditoria(consolidado_f1, area_direito)
 
-            # v5.3: Checkpoint após Fase 2 — gravar dados reais
-            _audit_reports_ser = []
-            if audit_reports:
-                _audit_reports_ser = [r.to_dict() for r in audit_reports]
-            self._save_checkpoint(2, "auditoria", {
-                "auditores": len(auditorias),
-                "consolidado_chars": len(consolidado_f2) if consolidado_f2 else 0,
-            }, phase_data={
-                "consolidado_f2": consolidado_f2 or "",
-                "bruto_f2": bruto_f2 or "",
-                "audit_reports": _audit_reports_ser,
-            })
+                result.fase2_auditorias = auditorias
+                result.fase2_auditorias_brutas = bruto_f2
+                result.fase2_chefe_consolidado = consolidado_f2
+                result.fase2_chefe = consolidado_f2  # Backwards compat
+
+                # v5.3: Checkpoint após Fase 2 — gravar dados reais
+                _audit_reports_ser = []
+                if audit_reports:
+                    _audit_reports_ser = [r.to_dict() for r in audit_reports]
+                self._save_checkpoint(2, "auditoria", {
+                    "auditores": len(auditorias),
+                    "consolidado_chars": len(consolidado_f2) if consolidado_f2 else 0,
+                }, phase_data={
+                    "consolidado_f2": consolidado_f2 or "",
+                    "bruto_f2": bruto_f2 or "",
+                    "audit_reports": _audit_reports_ser,
+                })
 
-            # FALLBACK: Se Consolidador produziu 0 findings, usar auditorias individuais
-            if chefe_report and hasattr(chefe_report, 'consolidated_findings'):
-                if not chefe_report.consolidated_findings or len(chefe_report.consolidated_findings) == 0:
-                    logger.warning(
-                        "Consolidador Auditor com 0 findings consolidados - "
-                        "usando auditorias individuais (bruto) como input para Fase 3"
-                    )
-                    consolidado_f2 = bruto_f2
-                    if audit_reports:
-                        # Tentar reconstruir markdown dos auditores individuais
-                        partes = []
-                        for r in audit_reports:
-                            md = r.to_markdown() if hasattr(r, 'to_markdown') else str(r)
-                            partes.append(md)
-                        if partes:
-                            consolidado_f2 = (
-                                "# AUDITORIAS INDIVIDUAIS (fallback - Consolidador com 0 findings)\n\n"
-                                + "\n\n---\n\n".join(partes)
-                            )
-                            logger.info(
-                                f"Fallback: {len(audit_reports)} auditorias individuais "
-                                f"usadas como input para Fase 3"
-                            )
+                # FALLBACK: Se Consolidador produziu 0 findings, usar auditorias individuais
+                if chefe_report and hasattr(chefe_report, 'consolidated_findings'):
+                    if not chefe_report.consolidated_findings or len(chefe_report.consolidated_findings) == 0:
+                        logger.warning(
+                            "Consolidador Auditor com 0 findings consolidados - "
+                            "usando auditorias individuais (bruto) como input para Fase 3"
+                        )
+                        consolidado_f2 = bruto_f2
+                        if audit_reports:
+                            # Tentar reconstruir markdown dos auditores individuais
+                            partes = []
+                            for r in audit_reports:
+                                md = r.to_markdown() if hasattr(r, 'to_markdown') else str(r)
+                                partes.append(md)
+                            if partes:
+                                consolidado_f2 = (
+                                    "# AUDITORIAS INDIVIDUAIS (fallback - Consolidador com 0 findings)\n\n"
+                                    + "\n\n---\n\n".join(partes)
+                                )
+                                logger.info(
+                                    f"Fallback: {len(audit_reports)} auditorias individuais "
+                                    f"usadas como input para Fase 3"
+                                )
+                return {"audit_reports": audit_reports, "auditorias": auditorias, "consolidado_f2": consolidado_f2}
 
             # Fase 3: Relatoria (COM perguntas)
-            judge_opinions = None
-            if USE_UNIFIED_PROVENANCE:
-                # MODO UNIFIED: JSON estruturado
-                judge_opinions, respostas_qa = self._fase3_relatoria_unified(
-                    consolidado_f2, area_direito, perguntas, run_id
-                )
-                # Criar FaseResult para compatibilidade
-                # Tokens reais vêm do CostController (registados em _call_llm)
-                pareceres = []
-                for o in judge_opinions:
-                    fase_tokens = 0
-                    fase_prompt = 0
-                    fase_completion = 0
-                    # judge_id = "J1" -> numero = "1", phase = "relator_1_json"
-                    jid_num = o.judge_id.replace("J", "").replace("j", "")
-                    if hasattr(self, '_cost_controller') and self._cost_controller:
-                        for pu in self._cost_controller.usage.phases:
-                            if f"relator_{jid_num}" in pu.phase:
-                                fase_tokens += pu.total_tokens
-                                fase_prompt += pu.prompt_tokens
-                                fase_completion += pu.completion_tokens
-                    if fase_tokens == 0:
-                        fase_tokens = len(o.to_markdown()) // 3  # fallback
-                    # FIX 2026-02-14: Só contar erros reais (não INTEGRITY_WARNING) para sucesso
-                    real_errors_j = [e for e in o.errors if not str(e).startswith("INTEGRITY_WARNING:")]
-                    pareceres.append(FaseResult(
-                        fase="relatoria",
-                        modelo=o.model_name,
-                        role=f"relator_{o.judge_id}",
-                        conteudo=o.to_markdown(),
-                        tokens_usados=fase_tokens,
-                        prompt_tokens=fase_prompt,
-                        completion_tokens=fase_completion,
-                        latencia_ms=0,
-                        sucesso=len(real_errors_j) == 0,
-                    ))
-            else:
-                pareceres, respostas_qa = self._fase3_relatoria(consolidado_f2, area_direito, perguntas)
+            def _st_fase3(v):
+                consolidado_f2 = v["consolidado_f2"]
+                judge_opinions = None
+                if USE_UNIFIED_PROVENANCE:
+                    # MODO UNIFIED: JSON estruturado
+                    judge_opinions, respostas_qa = self._fase3_relatoria_unified(
+                        consolidado_f2, area_direito, perguntas, run_id
+                    )
+                    # Criar FaseResult para compatibilidade
+                    # Tokens reais vêm do CostController (registados em _call_llm)
+                    pareceres = []
+                    for o in judge_opinions:
+                        fase_tokens = 0
+                        fase_prompt = 0
+                        fase_completion = 0
+                        # judge_id = "J1" -> numero = "1", phase = "relator_1_json"
+                        jid_num = o.judge_id.replace("J", "").replace("j", "")
+                        if hasattr(self, '_cost_controller') and self._cost_controller:
+                            for pu in self._cost_controller.usage.phases:
+                                if f"relator_{jid_num}" in pu.phase:
+                                    fase_tokens += pu.total_tokens
+                                    fase_prompt += pu.prompt_tokens
+                                    fase_completion += pu.completion_tokens
+                        if fase_tokens == 0:
+                            fase_tokens = len(o.to_markdown()) // 3  # fallback
+                        # FIX 2026-02-14: Só contar erros reais (não INTEGRITY_WARNING) para sucesso
+                        real_errors_j = [e for e in o.errors if not str(e).startswith("INTEGRITY_WARNING:")]
+                        pareceres.append(FaseResult(
+                            fase="relatoria",
+                            modelo=o.model_name,
+                            role=f"relator_{o.judge_id}",
+                            conteudo=o.to_markdown(),
+                            tokens_usados=fase_tokens,
+                            prompt_tokens=fase_prompt,
+                            completion_tokens=fase_completion,
+                            latencia_ms=0,
+                            sucesso=len(real_errors_j) == 0,
+                        ))
+                else:
+                    pareceres, respostas_qa = self._fase3_relatoria(consolidado_f2, area_direito, perguntas)
 
-            result.fase3_pareceres = pareceres
-            result.respostas_juizes_qa = respostas_qa
+                result.fase3_pareceres = pareceres
+                result.respostas_juizes_qa = respostas_qa
 
-            # v5.3: Checkpoint após Fase 3 — gravar dados reais
-            _judge_opinions_ser = []
-            if judge_opinions:
-                _judge_opinions_ser = [o.to_dict() for o in judge_opinions]
-            self._save_checkpoint(3, "relatoria", {
-                "juizes": len(pareceres),
-                "qa_respostas": len(respostas_qa) if respostas_qa else 0,
-            }, phase_data={
-                "judge_opinions": _judge_opinions_ser,
-                "respostas_qa": respostas_qa or [],
-            })
+                # v5.3: Checkpoint após Fase 3 — gravar dados reais
+                _judge_opinions_ser = []
+                if judge_opinions:
+                    _judge_opinions_ser = [o.to_dict() for o in judge_opinions]
+                self._save_checkpoint(3, "relatoria", {
+                    "juizes": len(pareceres),
+                    "qa_respostas": len(respostas_qa) if respostas_qa else 0,
+                }, phase_data={
+                    "judge_opinions": _judge_opinions_ser,
+                    "respostas_qa": respostas_qa or [],
+                })
+                return {"judge_opinions": judge_opinions, "pareceres": pareceres, "respostas_qa": respostas_qa}
 
             # Fase 4: Conselheiro-Mor (COM perguntas)
-            final_decision = None
-            if USE_UNIFIED_PROVENANCE and judge_opinions:
-                # MODO UNIFIED: JSON estruturado
-                final_decision = self._fase4_presidente_unified(
-                    judge_opinions, perguntas, respostas_qa, run_id
-                )
-                presidente = final_decision.output_markdown
-            else:
-                presidente = self._fase4_presidente(pareceres, perguntas, respostas_qa)
+            def _st_fase4(v):
+                final_decision = None
+                if USE_UNIFIED_PROVENANCE and v["judge_opinions"]:
+                    # MODO UNIFIED: JSON estruturado
+                    final_decision = self._fase4_presidente_unified(
+                        v["judge_opinions"], perguntas, v["respostas_qa"], run_id
+                    )
+                    presidente = final_decision.output_markdown
+                else:
+                    presidente = self._fase4_presidente(v["pareceres"], perguntas, v["respostas_qa"])
 
-            result.fase3_presidente = presidente
-            result.respostas_finais_qa = presidente if perguntas else ""
+                result.fase3_presidente = presidente
+                result.respostas_finais_qa = presidente if perguntas else ""
+                return {"final_decision": final_decision, "presidente": presidente}
+
+            # Pré-carregamento dos diplomas citados na extracção (PGDL) enquanto
+            # as Fases 2-4 correm; a verificação final encontra-os já em memória
+            def _st_legislacao_prefetch(v):
+                try:
+                    if v["data_factos"]:
+                        self.legal_verifier.set_data_factos(v["data_factos"])
+                    return {"legislacao_prefetch": self.legal_verifier.prefetch_texto(v["consolidado_f1"] or "")}
+                finally:
+                    self.legal_verifier.set_data_factos(None)
 
             # Verificação Legal (com detecção temporal automática)
-            data_factos = self._extrair_data_factos(self._document_text or "")
+            def _st_verificacao_legal(v):
+                data_factos = v["data_factos"]
+                try:
+                    if data_factos:
+                        self.legal_verifier.set_data_factos(data_factos)
+                        logger.info(f"[LEGAL] Data dos factos: {data_factos.strftime('%d/%m/%Y')}")
+                    verificacoes = self._verificar_legislacao(v["presidente"])
+                    result.verificacoes_legais = verificacoes
+                finally:
+                    # Limpar SEMPRE (mesmo em excepção) para não contaminar próximas runs
+                    self.legal_verifier.set_data_factos(None)
+
+                # v5.3: Checkpoint após Fase 4 — gravar dados reais
+                presidente = v["presidente"]
+                _final_decision_ser = v["final_decision"].to_dict() if v["final_decision"] else {}
+                self._save_checkpoint(4, "presidente", {
+                    "veredicto": "pending",
+                    "verificacoes_legais": len(verificacoes) if verificacoes else 0,
+                    "presidente_chars": len(presidente) if presidente else 0,
+                }, phase_data={
+                    "presidente": presidente or "",
+                    "final_decision": _final_decision_ser,
+                    "verificacoes_legais": verificacoes or [],
+                })
+                return {"verificacoes": verificacoes}
+
+            # ===== FASE 5: CURADORIA SÉNIOR =====
+            def _st_curadoria(v):
+                self._reportar_progresso("fase5", 92, "Curador Sénior: redigindo parecer final...")
+                return {"relatorio_curador": self._fase5_curadoria(
+                    final_decision=v["final_decision"],
+                    verificacoes=v["verificacoes"],
+                    area_direito=area_direito,
+                    fase0_triage=v["fase0_triage"],
+                    perguntas=perguntas,
+                    documento=documento,
+                    presidente_texto=v["presidente"],
+                )}
+
+            grafo = StageGraph([
+                Stage("triagem", _st_triagem, (), ("fase0_triage", "texto_marcado")),
+                Stage("data_factos", _st_data_factos, ("texto_original",), ("data_factos",)),
+                Stage("fase1", _st_fase1, ("texto_marcado",),
+                      ("extracoes", "bruto_f1", "consolidado_f1", "unified_result")),
+                Stage("page_mapper", _st_page_mapper, ("texto_marcado",), ("page_mapper",)),
+                Stage("validador", _st_validador, ("unified_result", "page_mapper"), ("integrity_validator",)),
+                Stage("fase2", _st_fase2, ("consolidado_f1", "integrity_validator"),
+                      ("audit_reports", "auditorias", "consolidado_f2")),
+                Stage("fase3", _st_fase3, ("consolidado_f2",), ("judge_opinions", "pareceres", "respostas_qa")),
+                Stage("fase4", _st_fase4, ("judge_opinions", "pareceres", "respostas_qa"),
+                      ("final_decision", "presidente")),
+                Stage("legislacao_prefetch", _st_legislacao_prefetch, ("consolidado_f1", "data_factos"),
+                      ("legislacao_prefetch",), critico=False),
+                Stage("verificacao_legal", _st_verificacao_legal,
+                      ("presidente", "final_decision", "data_factos", "legislacao_prefetch"), ("verificacoes",)),
+                Stage("curadoria", _st_curadoria,
+                      ("final_decision", "verificacoes", "fase0_triage", "presidente"),
+                      ("relatorio_curador",), critico=False),
+            ])
+            scheduler = StageScheduler(max_workers=PIPELINE_STAGE_WORKERS if PIPELINE_STAGE_GRAPH else 1)
             try:
-                if data_factos:
-                    self.legal_verifier.set_data_factos(data_factos)
-                    logger.info(f"[LEGAL] Data dos factos: {data_factos.strftime('%d/%m/%Y')}")
-                verificacoes = self._verificar_legislacao(presidente)
-                result.verificacoes_legais = verificacoes
-            finally:
-                # Limpar SEMPRE (mesmo em excepção) para não contaminar próximas runs
-                self.legal_verifier.set_data_factos(None)
-
-            # v5.3: Checkpoint após Fase 4 — gravar dados reais
-            _final_decision_ser = final_decision.to_dict() if final_decision else {}
-            self._save_checkpoint(4, "presidente", {
-                "veredicto": "pending",
-                "verificacoes_legais": len(verificacoes) if verificacoes else 0,
-                "presidente_chars": len(presidente) if presidente else 0,
-            }, phase_data={
-                "presidente": presidente or "",
-                "final_decision": _final_decision_ser,
-                "verificacoes_legais": verificacoes or [],
-            })
+                valores, stage_report = scheduler.run(grafo, {"texto_original": self._document_text})
+            except BaseException as e:
+                self._registar_estagios(result, getattr(e, "stage_report", None))
+                raise
+            self._registar_estagios(result, stage_report)
+
+            extracoes = valores["extracoes"]
+            audit_reports = valores["audit_reports"]
+            auditorias = valores["auditorias"]
+            judge_opinions = valores["judge_opinions"]
+            pareceres = valores["pareceres"]
+            final_decision = valores["final_decision"]
+            presidente = valores["presidente"]
 
             # Determinar parecer — preferir decision_type do JSON (mais fiável)
             if final_decision and hasattr(final_decision, 'decision_type'):
@@ -5070,31 +5470,19 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
                 }
             result.resumo_por_ia = resumo_ia
 
-            # ===== FASE 5: CURADORIA SÉNIOR =====
-            self._reportar_progresso("fase5", 92, "Curador Sénior: redigindo parecer final...")
+            # ===== FASE 5: CURADORIA SÉNIOR (estágio "curadoria") =====
             raw_presidente = result.fase3_presidente  # Guardar output bruto do presidente
-            try:
-                relatorio_curador = self._fase5_curadoria(
-                    final_decision=final_decision,
-                    verificacoes=result.verificacoes_legais,
-                    area_direito=area_direito,
-                    fase0_triage=fase0_triage,
-                    perguntas=perguntas,
-                    documento=documento,
-                    presidente_texto=raw_presidente,
-                )
-                if relatorio_curador and relatorio_curador.strip():
-                    result.fase3_presidente = relatorio_curador  # Substituir com relatório profissional
-                    logger.info(f"[CURADOR] Relatório profissional: {len(relatorio_curador)} chars")
-                    resumo_ia["curador_senior"] = {
-                        "tipo": "curador_senior",
-                        "modelo": self.presidente_model,
-                        "sucesso": True,
-                    }
-                else:
-                    logger.warning("[CURADOR] Output vazio, mantendo output do presidente")
-            except Exception as e:
-                logger.warning(f"[CURADOR] Falhou (non-blocking): {e}. Mantendo output do presidente.")
+            relatorio_curador = valores["relatorio_curador"]
+            if relatorio_curador and relatorio_curador.strip():
+                result.fase3_presidente = relatorio_curador  # Substituir com relatório profissional
+                logger.info(f"[CURADOR] Relatório profissional: {len(relatorio_curador)} chars")
+                resumo_ia["curador_senior"] = {
+                    "tipo": "curador_senior",
+                    "modelo": self.presidente_model,
+                    "sucesso": True,
+                }
+            else:
+                logger.warning("[CURADOR] Output vazio ou falhou — mantendo output do presidente")
 
             # Guardar output raw do presidente para debug
             self._log_to_file("fase4_presidente_raw.md", raw_presidente)
@@ -5102,6 +5490,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
 
             # Calcular totais via CostController (tokens REAIS das APIs)
             if self._cost_controller:
+                self._liquidar_hedges_pendentes()
                 run_usage = self._cost_controller.finalize()
                 result.total_tokens = run_usage.total_tokens
 
@@ -5147,9 +5536,11 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             result.sucesso = False
             result.erro = str(e)
             self._documento = None  # Cleanup on error
+            self._flush_checkpoints()  # checkpoints ficam disponíveis para resume
             raise  # Re-raise budget/credit errors - must not be swallowed
         except KeyboardInterrupt:
             self._documento = None  # Cleanup on interrupt
+            self._flush_checkpoints()
             raise
         except Exception as e:
             logger.error(f"Erro no pipeline: {e}")
@@ -5157,6 +5548,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             result.erro = str(e)
 
         result.timestamp_fim = datetime.now(timezone.utc)
+        self._flush_checkpoints()
 
         # Guardar IntegrityReport se validator ativo
         if USE_UNIFIED_PROVENANCE and hasattr(self, '_integrity_validator') and self._integrity_validator:
@@ -5166,7 +5558,8 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             except Exception as e:
                 logger.warning(f"Erro ao guardar IntegrityReport: {e}")
 
-        # Executar MetaIntegrity Validation
+        # Executar MetaIntegrity Validation (lê os artefactos do disco)
+        self._flush_artefactos()
         if USE_META_INTEGRITY or ALWAYS_GENERATE_META_REPORT:
             try:
                 # Obter doc_id do documento
@@ -5206,19 +5599,8 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
                 # Aplicar Confidence Policy se habilitado
                 if APPLY_CONFIDENCE_POLICY and final_decision and hasattr(final_decision, 'confidence'):
                     # Calcular penalty
-                    integrity_report_path = self._output_dir / "integrity_report.json"
-                    coverage_report_path = self._output_dir / "fase1_coverage_report.json"
-
-                    integrity_data = None
-                    coverage_data = None
-
-                    if integrity_report_path.exists():
-                        with open(integrity_report_path, encoding='utf-8') as f:
-                            integrity_data = json.load(f)
-
-                    if coverage_report_path.exists():
-                        with open(coverage_report_path, encoding='utf-8') as f:
-                            coverage_data = json.load(f)
+                    integrity_data = self._read_artefact("integrity_report.json")
+                    coverage_data = self._read_artefact("fase1_coverage_report.json")
 
                     # Coletar erros das fases
                     all_errors = []
@@ -5243,9 +5625,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
                         )
 
                         # Guardar penalty info
-                        penalty_path = self._output_dir / "confidence_penalty.json"
-                        with open(penalty_path, 'w', encoding='utf-8') as f:
-                            json.dump(penalty_result.to_dict(), f, ensure_ascii=False, indent=2)
+                        self._write_artefact("confidence_penalty.json", penalty_result.to_dict())
 
             except Exception as e:
                 logger.warning(f"Erro na validação MetaIntegrity: {e}")
@@ -5254,6 +5634,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
 
         # Guardar resultado completo
         self._guardar_resultado(result)
+        self._flush_artefactos()
 
         # Cleanup: release large document reference to avoid memory leak
         self._documento = None
@@ -5280,6 +5661,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             titulo: Título do projecto
             resume_from_phase: Última fase completa (1-4). Retoma a partir da seguinte.
             checkpoint_data: Dict com dados das fases completas (phase_data por fase_num)
+                (dict ou LazyCheckpoints — cada fase só é lida quando acedida)
             existing_run_id: Run ID original (para manter consistência)
 
         Returns:
@@ -5342,6 +5724,8 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             budget_limit_usd=budget,
             token_limit=token_limit,
         )
+        self._hedge_spend_usd = 0.0
+        self._hedge_reservas.clear()
 
         # PerformanceTracker
         self._perf_tracker = None
@@ -5389,6 +5773,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
                 result.fase1_agregado_bruto = bruto_f1
                 result.fase1_agregado = consolidado_f1
                 self._reportar_progresso("resume", 10, "Fase 1 (extração) restaurada do checkpoint")
+                self._publicar_parcial(1, "extracao", f1)
                 logger.info(f"[RESUME] Fase 1 restaurada: {len(consolidado_f1):,} chars")
 
             # Fase 2 data
@@ -5412,6 +5797,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
                 result.fase2_chefe_consolidado = consolidado_f2
                 result.fase2_chefe = consolidado_f2
                 self._reportar_progresso("resume", 30, "Fase 2 (auditoria) restaurada do checkpoint")
+                self._publicar_parcial(2, "auditoria", f2)
                 logger.info(f"[RESUME] Fase 2 restaurada: {len(consolidado_f2):,} chars, {len(audit_reports)} reports")
 
             # Fase 3 data
@@ -5432,6 +5818,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
                 result.fase3_pareceres = pareceres
                 result.respostas_juizes_qa = respostas_qa
                 self._reportar_progresso("resume", 60, "Fase 3 (relatoria) restaurada do checkpoint")
+                self._publicar_parcial(3, "relatoria", f3)
                 logger.info(f"[RESUME] Fase 3 restaurada: {len(judge_opinions or [])} opinions")
 
             # Fase 4 data
@@ -5444,6 +5831,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
                 result.fase3_presidente = presidente
                 result.verificacoes_legais = verificacoes_raw if isinstance(verificacoes_raw, list) else []
                 self._reportar_progresso("resume", 85, "Fase 4 (presidente) restaurada do checkpoint")
+                self._publicar_parcial(4, "presidente", f4)
                 logger.info(f"[RESUME] Fase 4 restaurada: {len(presidente):,} chars")
 
             # Guardar referência ao documento
@@ -5618,6 +6006,7 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
 
             # Custos
             if self._cost_controller:
+                self._liquidar_hedges_pendentes()
                 run_usage = self._cost_controller.finalize()
                 result.total_tokens = run_usage.total_tokens
                 MARGEM = 2.0
@@ -5649,9 +6038,11 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             result.sucesso = False
             result.erro = str(e)
             self._documento = None
+            self._flush_checkpoints()
             raise
         except KeyboardInterrupt:
             self._documento = None
+            self._flush_checkpoints()
             raise
         except Exception as e:
             logger.error(f"[RESUME] Erro no pipeline: {e}")
@@ -5659,7 +6050,10 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             result.erro = str(e)
 
         result.timestamp_fim = datetime.now(timezone.utc)
+        # Antes de o engine apagar os checkpoints (sucesso): nada pode chegar depois
+        self._flush_checkpoints()
         self._guardar_resultado(result)
+        self._flush_artefactos()
         self._documento = None
         return result
 
@@ -5668,25 +6062,25 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
         if self._output_dir:
             try:
                 result_dict = result.to_dict()
+                store = get_artefact_store()
+
+                # JSON completo + cópia no histórico (serializado uma vez)
+                store.write_json(
+                    self._output_dir / "resultado.json",
+                    result_dict,
+                    extra_paths=(HISTORICO_DIR / f"{result.run_id}.json",),
+                )
 
-                # JSON completo
-                json_path = self._output_dir / "resultado.json"
-                with open(json_path, "w", encoding="utf-8") as f:
-                    json.dump(result_dict, f, ensure_ascii=False, indent=2, default=_safe_json_default)
-
-                # Markdown resumido
-                md_path = self._output_dir / "RESUMO.md"
-                md_content = self._gerar_resumo_md(result)
-                with open(md_path, "w", encoding="utf-8") as f:
-                    f.write(md_content)
-
-                # Copiar para histórico
-                historico_path = HISTORICO_DIR / f"{result.run_id}.json"
-                with open(historico_path, "w", encoding="utf-8") as f:
-                    json.dump(result_dict, f, ensure_ascii=False, indent=2, default=_safe_json_default)
+                # Markdown resumido (renderizado na thread de escrita)
+                store.write_text(self._output_dir / "RESUMO.md", lambda: self._gerar_resumo_md(result))
             except OSError as e:
                 logger.error(f"Erro ao guardar resultado em disco: {e}")
 
+            try:
+                get_run_index().registar_run(result.run_id, **resumo_resultado(result_dict))
+            except Exception as e:
+                logger.warning(f"[RUN-INDEX] Falha ao actualizar run: {e}")
+
             # ← NOVO: Guardar metadata (título, descrição, etc.)
             guardar_metadata(
                 run_id=result.run_id,
@@ -5794,13 +6188,31 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
         )
         return self.processar(documento, area_direito, perguntas_raw)
 
-    def listar_runs(self) -> list[dict]:
-        """Lista todas as execuções no histórico."""
+    def listar_runs(self, limite: Optional[int] = None, offset: int = 0) -> list[dict]:
+        """Lista as execuções concluídas (mais recentes primeiro), paginadas pelo índice de runs."""
+        try:
+            return [
+                {
+                    "run_id": row["run_id"],
+                    "timestamp": row["timestamp_inicio"],
+                    "documento": row["documento"],
+                    "veredicto": row["veredicto"],
+                    "simbolo": row["simbolo"],
+                    "perguntas": row["perguntas"],
+                }
+                for row in get_run_index().listar(
+                    limite=limite, offset=offset,
+                    ordenar_por="timestamp_inicio", apenas_com_resultado=True,
+                )
+            ]
+        except Exception as e:
+            logger.warning(f"[RUN-INDEX] Falha na consulta, a varrer o histórico: {e}")
+
         runs = []
         for filepath in HISTORICO_DIR.glob("*.json"):
             try:
-                with open(filepath, encoding="utf-8") as f:
-                    data = json.load(f)
+                data = get_artefact_store().read_json(filepath)
+                if data is not None:
                     runs.append({
                         "run_id": data.get("run_id"),
                         "timestamp": data.get("timestamp_inicio"),
@@ -5812,15 +6224,12 @@ Analisa os pareceres, verifica as citações legais, e emite o PARECER FINAL.{bl
             except Exception as e:
                 logger.warning(f"Erro ao ler {filepath}: {e}")
 
-        return sorted(runs, key=lambda x: x.get("timestamp", ""), reverse=True)
+        runs = sorted(runs, key=lambda x: x.get("timestamp", ""), reverse=True)
+        return runs[offset:None if limite is None else offset + limite]
 
     def carregar_run(self, run_id: str) -> Optional[dict]:
         """Carrega os detalhes de uma execução."""
-        filepath = HISTORICO_DIR / f"{run_id}.json"
-        if filepath.exists():
-            with open(filepath, encoding="utf-8") as f:
-                return json.load(f)
-        return None
+        return get_artefact_store().read_json(HISTORICO_DIR / f"{run_id}.json")
 
 
 # Backward compatibility alias
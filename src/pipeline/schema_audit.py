@@ -17,6 +17,7 @@ CHANGELOG:
 - 2026-02-10: Fix Bug #4 — confidence dinâmica baseada em evidência quando LLM não envia valor
 """
 
+import json
 import uuid
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
@@ -863,20 +864,43 @@ class FinalDecision:
 # PARSING JSON COM FALLBACK
 # ============================================================================
 
-def parse_json_safe(output: str, context: str = "unknown") -> tuple[Optional[dict], list[str]]:
-    """Tenta extrair JSON de output LLM de forma robusta."""
+def parse_json_safe(
+    output: str, context: str = "unknown", role: Optional[str] = None,
+) -> tuple[Optional[dict], list[str]]:
+    """
+    Tenta extrair JSON de output LLM de forma robusta.
+
+    Output estruturado (response_format) chega como JSON puro: json.loads
+    directo. Só o resto passa pela extracção/reparação de extractor_json.
+    role: papel para as métricas de parse (A1, J2, PRESIDENTE, ...).
+    """
     from src.pipeline.extractor_json import extract_json_from_text
+    from src.pipeline.structured_output import registar_parse
     errors = []
+    texto = (output or "").strip()
+    if texto.startswith("{"):
+        try:
+            result = json.loads(texto)
+            if isinstance(result, dict):
+                if role:
+                    registar_parse(role, "directo")
+                return result, errors
+        except ValueError:
+            pass
     result = extract_json_from_text(output)
     if result is not None:
+        if role:
+            registar_parse(role, "reparado")
         return result, errors
+    if role:
+        registar_parse(role, "falhou")
     errors.append(f"Não foi possível extrair JSON válido ({context})")
     return None, errors
 
 
 def parse_audit_report(output: str, auditor_id: str, model_name: str, run_id: str) -> AuditReport:
     """Parseia output do auditor para AuditReport. Se falhar, cria relatório mínimo com erro."""
-    json_data, errors = parse_json_safe(output, f"auditor {auditor_id}")
+    json_data, errors = parse_json_safe(output, f"auditor {auditor_id}", role=auditor_id)
     if json_data:
         try:
             report = AuditReport.from_dict({**json_data, "auditor_id": auditor_id, "model_name": model_name, "run_id": run_id})
@@ -893,7 +917,7 @@ def parse_audit_report(output: str, auditor_id: str, model_name: str, run_id: st
 
 def parse_judge_opinion(output: str, judge_id: str, model_name: str, run_id: str) -> JudgeOpinion:
     """Parseia output do juiz para JudgeOpinion. Se falhar, cria parecer mínimo com erro."""
-    json_data, errors = parse_json_safe(output, f"juiz {judge_id}")
+    json_data, errors = parse_json_safe(output, f"juiz {judge_id}", role=judge_id)
     if json_data:
         try:
             opinion = JudgeOpinion.from_dict({**json_data, "judge_id": judge_id, "model_name": model_name, "run_id": run_id})
@@ -910,7 +934,7 @@ def parse_judge_opinion(output: str, judge_id: str, model_name: str, run_id: str
 
 def parse_final_decision(output: str, model_name: str, run_id: str) -> FinalDecision:
     """Parseia output do presidente para FinalDecision. Se falhar, cria decisão mínima com erro."""
-    json_data, errors = parse_json_safe(output, "presidente")
+    json_data, errors = parse_json_safe(output, "presidente", role="PRESIDENTE")
     if json_data:
         try:
             decision = FinalDecision.from_dict({**json_data, "model_name": model_name, "run_id": run_id})
@@ -1082,7 +1106,7 @@ class ChefeConsolidatedReport:
 
 def parse_chefe_report(output: str, model_name: str, run_id: str) -> ChefeConsolidatedReport:
     """Parseia output do Chefe para ChefeConsolidatedReport. Se falhar, cria relatório mínimo."""
-    json_data, errors = parse_json_safe(output, "chefe")
+    json_data, errors = parse_json_safe(output, "chefe", role="CONSOLIDADOR")
     if json_data:
         try:
             report = ChefeConsolidatedReport.from_dict({**json_data, "model_name": model_name, "run_id": run_id})
@@ -0,0 +1,243 @@
+# ============================================================================
+# Pipeline v5.3 — Grafo de estágios (DAG) do LexForumProcessor.processar
+# ============================================================================
+# Cada estágio declara os valores que consome (inputs) e os que produz
+# (outputs). O scheduler corre em paralelo os estágios cujos inputs já
+# existem — ex.: data dos factos e pré-carregamento de legislação enquanto
+# as Fases 2-4 (LLM) decorrem — e regista um span por estágio.
+#
+# No fim reporta o caminho crítico (cadeia de dependências mais longa em
+# tempo): é esse o limite inferior da latência da run; encurtá-lo é o que
+# reduz o tempo total.
+#
+# Estágios críticos que falham abortam a run (a excepção original é
+# relançada depois de os estágios em curso terminarem). Estágios não
+# críticos que falham produzem None nos seus outputs.
+# ============================================================================
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """Um estágio do pipeline: fn(inputs) → dict com os outputs declarados."""
+    nome: str
+    fn: Callable[[dict], Optional[dict]]
+    inputs: tuple = ()
+    outputs: tuple = ()
+    critico: bool = True
+
+
+@dataclass
+class StageSpan:
+    nome: str
+    inicio_ms: float
+    fim_ms: float
+    thread: str
+    ok: bool = True
+    erro: Optional[str] = None
+
+    @property
+    def duracao_ms(self) -> float:
+        return self.fim_ms - self.inicio_ms
+
+    def to_dict(self) -> dict:
+        return {
+            "nome": self.nome,
+            "inicio_ms": round(self.inicio_ms, 1),
+            "fim_ms": round(self.fim_ms, 1),
+            "duracao_ms": round(self.duracao_ms, 1),
+            "thread": self.thread,
+            "ok": self.ok,
+            "erro": self.erro,
+        }
+
+
+@dataclass
+class StageRunReport:
+    """Spans de uma execução do grafo + caminho crítico."""
+    spans: list = field(default_factory=list)
+    total_ms: float = 0.0
+    caminho_critico: list = field(default_factory=list)
+    caminho_critico_ms: float = 0.0
+    max_workers: int = 1
+
+    @property
+    def soma_ms(self) -> float:
+        return sum(s.duracao_ms for s in self.spans)
+
+    def to_dict(self) -> dict:
+        return {
+            "total_ms": round(self.total_ms, 1),
+            "soma_estagios_ms": round(self.soma_ms, 1),
+            "paralelismo": round(self.soma_ms / self.total_ms, 2) if self.total_ms > 0 else 0.0,
+            "caminho_critico": list(self.caminho_critico),
+            "caminho_critico_ms": round(self.caminho_critico_ms, 1),
+            "max_workers": self.max_workers,
+            "estagios": [s.to_dict() for s in sorted(self.spans, key=lambda s: s.inicio_ms)],
+        }
+
+
+class StageGraph:
+    """Conjunto de estágios validado: nomes únicos, um produtor por valor, sem ciclos."""
+
+    def __init__(self, stages: list[Stage]):
+        self.stages: dict[str, Stage] = {}
+        self.produtor: dict[str, str] = {}
+        for st in stages:
+            if st.nome in self.stages:
+                raise ValueError(f"Estágio duplicado: {st.nome}")
+            self.stages[st.nome] = st
+            for out in st.outputs:
+                if out in self.produtor:
+                    raise ValueError(f"Valor '{out}' produzido por {self.produtor[out]} e {st.nome}")
+                self.produtor[out] = st.nome
+        self.ordem = self._ordenar()
+
+    def dependencias(self, nome: str) -> set[str]:
+        """Estágios de que `nome` depende (produtores dos seus inputs)."""
+        return {self.produtor[i] for i in self.stages[nome].inputs if i in self.produtor}
+
+    def _ordenar(self) -> list[str]:
+        ordem, estado = [], {}
+
+        def visitar(nome: str, caminho: tuple):
+            if estado.get(nome) == 2:
+                return
+            if estado.get(nome) == 1:
+                raise ValueError(f"Ciclo no grafo de estágios: {' → '.join(caminho + (nome,))}")
+            estado[nome] = 1
+            for dep in sorted(self.dependencias(nome)):
+                visitar(dep, caminho + (nome,))
+            estado[nome] = 2
+            ordem.append(nome)
+
+        for nome in self.stages:
+            visitar(nome, ())
+        return ordem
+
+    def validar_inputs(self, iniciais: dict) -> None:
+        for st in self.stages.values():
+            em_falta = [i for i in st.inputs if i not in self.produtor and i not in iniciais]
+            if em_falta:
+                raise ValueError(f"Estágio {st.nome}: inputs sem produtor {em_falta}")
+
+    def caminho_critico(self, duracoes: dict[str, float]) -> tuple[list[str], float]:
+        """Cadeia de dependências com maior soma de durações."""
+        melhor: dict[str, tuple[float, Optional[str]]] = {}
+        for nome in self.ordem:
+            if nome not in duracoes:
+                continue
+            base, anterior = 0.0, None
+            for dep in self.dependencias(nome):
+                if dep in melhor and melhor[dep][0] > base:
+                    base, anterior = melhor[dep][0], dep
+            melhor[nome] = (base + duracoes[nome], anterior)
+        if not melhor:
+            return [], 0.0
+        fim = max(melhor, key=lambda n: melhor[n][0])
+        total = melhor[fim][0]
+        caminho = []
+        while fim is not None:
+            caminho.append(fim)
+            fim = melhor[fim][1]
+        return list(reversed(caminho)), total
+
+
+class StageScheduler:
+    """Executa um StageGraph, sobrepondo estágios independentes (thread pool)."""
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max(1, max_workers)
+
+    def run(self, graph: StageGraph, iniciais: Optional[dict] = None) -> tuple[dict, StageRunReport]:
+        """
+        Returns:
+            (valores, relatório) — valores inclui os iniciais e todos os outputs.
+
+        Raises:
+            A excepção do primeiro estágio crítico que falhar.
+        """
+        valores: dict[str, Any] = dict(iniciais or {})
+        graph.validar_inputs(valores)
+        report = StageRunReport(max_workers=self.max_workers)
+        lock = threading.Lock()
+        t0 = time.perf_counter()
+        pendentes = list(graph.ordem)  # ordem topológica = prioridade
+        concluidos: set[str] = set()
+        erro_fatal: Optional[BaseException] = None
+
+        def executar(st: Stage, args: dict):
+            inicio = (time.perf_counter() - t0) * 1000
+            try:
+                saida = st.fn(args) or {}
+                desconhecidos = set(saida) - set(st.outputs)
+                if desconhecidos:
+                    raise ValueError(f"Estágio {st.nome} produziu outputs não declarados: {sorted(desconhecidos)}")
+                return saida, None
+            except BaseException as e:  # noqa: BLE001 — relançada no thread do chamador
+                return None, e
+            finally:
+                fim = (time.perf_counter() - t0) * 1000
+                with lock:
+                    report.spans.append(StageSpan(st.nome, inicio, fim, threading.current_thread().name))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as pool:
+            em_curso: dict = {}
+            while pendentes or em_curso:
+                if erro_fatal is None:
+                    for nome in list(pendentes):
+                        if len(em_curso) >= self.max_workers:
+                            break
+                        if graph.dependencias(nome) <= concluidos:
+                            st = graph.stages[nome]
+                            args = {i: valores.get(i) for i in st.inputs}
+                            em_curso[pool.submit(executar, st, args)] = st
+                            pendentes.remove(nome)
+                elif not em_curso:
+                    break
+                if not em_curso:
+                    break
+                feitos, _ = wait(list(em_curso), return_when=FIRST_COMPLETED)
+                for fut in feitos:
+                    st = em_curso.pop(fut)
+                    saida, erro = fut.result()
+                    if erro is not None:
+                        self._marcar_erro(report, st.nome, erro, lock)
+                        if st.critico and erro_fatal is None:
+                            logger.error(f"[STAGES] Estágio crítico '{st.nome}' falhou: {erro}")
+                            erro_fatal = erro
+                        elif not st.critico:
+                            logger.warning(f"[STAGES] Estágio '{st.nome}' falhou (non-blocking): {erro}")
+                        saida = {}
+                    for out in st.outputs:
+                        valores[out] = saida.get(out)
+                    concluidos.add(st.nome)
+
+        report.total_ms = (time.perf_counter() - t0) * 1000
+        duracoes = {s.nome: s.duracao_ms for s in report.spans}
+        report.caminho_critico, report.caminho_critico_ms = graph.caminho_critico(duracoes)
+        logger.info(
+            f"[STAGES] {len(report.spans)} estágios em {report.total_ms:.0f}ms "
+            f"(soma {report.soma_ms:.0f}ms) | caminho crítico {report.caminho_critico_ms:.0f}ms: "
+            f"{' → '.join(report.caminho_critico)}"
+        )
+        if erro_fatal is not None:
+            erro_fatal.stage_report = report  # para o chamador registar os spans até à falha
+            raise erro_fatal
+        return valores, report
+
+    @staticmethod
+    def _marcar_erro(report: StageRunReport, nome: str, erro: BaseException, lock) -> None:
+        with lock:
+            for span in report.spans:
+                if span.nome == nome:
+                    span.ok = False
+                    span.erro = f"{type(erro).__name__}: {erro}"
@@ -0,0 +1,236 @@
+"""
+OUTPUT ESTRUTURADO — JSON Schema dos extractores, auditores e juízes
+═══════════════════════════════════════════════════════════════════════════
+
+Os schemas são derivados dos dataclasses de schema_unified / schema_audit
+(tipos, enums, campos obrigatórios) e enviados como response_format quando
+o provider o suporta (ver llm_client.supports_structured_output). O output
+passa a ser JSON válido à primeira, sem a cadeia de reparação; quando o
+schema não é enviado ou é rejeitado, tudo continua como antes.
+
+Métricas por papel (E1, A1, J1, PRESIDENTE, ...): chamadas com/sem schema,
+retries do quality gate, falhas de JSON e resultado do parse (directo,
+reparado, falhou) — para medir os retries eliminados.
+"""
+
+import dataclasses
+import threading
+import typing
+from datetime import datetime
+from enum import Enum
+from typing import Any, Optional
+
+from src.pipeline.schema_unified import ItemType
+from src.pipeline.schema_audit import (
+    AuditReport,
+    ChefeConsolidatedReport,
+    FinalDecision,
+    JudgeOpinion,
+)
+
+# Campos preenchidos pelo pipeline (não pedidos ao modelo)
+_CAMPOS_PIPELINE = {
+    "auditor_id", "judge_id", "chefe_id", "model_name", "run_id",
+    "errors", "warnings", "timestamp", "output_markdown", "decision_id",
+}
+
+_TIPOS_SIMPLES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+
+# ============================================================================
+# SCHEMAS
+# ============================================================================
+
+def _schema_tipo(tipo: Any) -> dict:
+    origem = typing.get_origin(tipo)
+    if origem is typing.Union:
+        args = [a for a in typing.get_args(tipo) if a is not type(None)]
+        if len(args) != 1:
+            return {}
+        schema = _schema_tipo(args[0])
+        if isinstance(schema.get("type"), str) and "enum" not in schema:
+            schema = {**schema, "type": [schema["type"], "null"]}  # Optional[X]: aceita null
+        return schema
+    if origem in (list, tuple, set):
+        args = typing.get_args(tipo)
+        return {"type": "array", "items": _schema_tipo(args[0]) if args else {}}
+    if origem is dict or tipo is dict:
+        return {"type": "object"}
+    if isinstance(tipo, type) and issubclass(tipo, Enum):
+        return {"type": "string", "enum": [e.value for e in tipo]}
+    if dataclasses.is_dataclass(tipo):
+        return schema_from_dataclass(tipo)
+    if tipo in _TIPOS_SIMPLES:
+        return {"type": _TIPOS_SIMPLES[tipo]}
+    return {}
+
+
+def schema_from_dataclass(cls: type) -> dict:
+    """
+    JSON Schema (objecto) de um dataclass.
+
+    Obrigatórios = campos sem default. Não fecha additionalProperties: os
+    modelos podem acrescentar campos (ex: "challenges" do A4) e os from_dict
+    já os ignoram.
+    """
+    hints = typing.get_type_hints(cls)
+    propriedades: dict[str, Any] = {}
+    obrigatorios: list[str] = []
+    for f in dataclasses.fields(cls):
+        if f.name in _CAMPOS_PIPELINE or hints.get(f.name) is datetime:
+            continue
+        propriedades[f.name] = _schema_tipo(hints[f.name])
+        if f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING:
+            obrigatorios.append(f.name)
+    schema: dict[str, Any] = {"type": "object", "properties": propriedades}
+    if obrigatorios:
+        schema["required"] = obrigatorios
+    return schema
+
+
+def _schema_extraccao() -> dict:
+    """Formato do SYSTEM_EXTRATOR_UNIFIED (items com offsets relativos ao chunk)."""
+    item = {
+        "type": "object",
+        "properties": {
+            "item_type": {"type": "string", "enum": [t.value for t in ItemType]},
+            "value_normalized": {"type": "string"},
+            "raw_text": {"type": "string"},
+            "offset_start": {"type": "integer"},
+            "offset_end": {"type": "integer"},
+            "confidence": {"type": "number"},
+            "context": {"type": "string"},
+        },
+        "required": ["item_type", "value_normalized", "raw_text", "offset_start", "offset_end"],
+    }
+    ilegivel = {
+        "type": "object",
+        "properties": {
+            "offset_start": {"type": "integer"},
+            "offset_end": {"type": "integer"},
+            "reason": {"type": "string"},
+        },
+        "required": ["offset_start", "offset_end", "reason"],
+    }
+    return {
+        "type": "object",
+        "properties": {
+            "chunk_id": {"type": "string"},
+            "items": {"type": "array", "items": item},
+            "unreadable_sections": {"type": "array", "items": ilegivel},
+            "chunk_summary": {"type": "string"},
+            "status": {"type": "string"},
+            "last_item_id": {"type": "integer"},
+        },
+        "required": ["items"],
+    }
+
+
+SCHEMAS: dict[str, dict] = {
+    "extraccao": {"name": "extraccao", "schema": _schema_extraccao()},
+    "auditoria": {"name": "audit_report", "schema": schema_from_dataclass(AuditReport)},
+    "consolidacao": {"name": "chefe_report", "schema": schema_from_dataclass(ChefeConsolidatedReport)},
+    "parecer": {"name": "judge_opinion", "schema": schema_from_dataclass(JudgeOpinion)},
+    "decisao": {"name": "final_decision", "schema": schema_from_dataclass(FinalDecision)},
+}
+
+
+def schema_for_role(role_name: str) -> Optional[dict]:
+    """
+    Schema ({"name", "schema"}) do papel, ou None se o papel não produz JSON
+    (agregador, auditores/relatores em Markdown, curador, ...).
+    """
+    r = role_name.lower()
+    if r.startswith("extrator") or r.startswith("extractor"):
+        return SCHEMAS["extraccao"]
+    if "_json" not in r:
+        return None
+    if r.startswith("auditor"):
+        return SCHEMAS["auditoria"]
+    if r.startswith("consolidador") or r.startswith("chefe"):
+        return SCHEMAS["consolidacao"]
+    if r.startswith("relator") or r.startswith("juiz"):
+        return SCHEMAS["parecer"]
+    if r.startswith("presidente") or r.startswith("conselheiro"):
+        return SCHEMAS["decisao"]
+    return None
+
+
+# ============================================================================
+# MÉTRICAS
+# ============================================================================
+
+class _StructuredOutputMetrics:
+    """Falhas de parse e retries por papel, separadas por chamadas com/sem schema."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._papeis: dict[str, dict[str, int]] = {}
+        self.rejeicoes: dict[str, int] = {}  # schema recusado pelo provider, por modelo
+
+    def _papel(self, papel: str) -> dict[str, int]:
+        return self._papeis.setdefault(papel, {
+            "chamadas_schema": 0, "chamadas_livres": 0,
+            "retries_schema": 0, "retries_livres": 0,
+            "falhas_json_schema": 0, "falhas_json_livres": 0,
+            "parse_directo": 0, "parse_reparado": 0, "parse_falhou": 0,
+        })
+
+    def registar_chamada(self, papel: str, estruturado: bool, retries: int, falhas_json: int) -> None:
+        sufixo = "schema" if estruturado else "livres"
+        with self._lock:
+            m = self._papel(papel)
+            m[f"chamadas_{sufixo}"] += 1
+            m[f"retries_{sufixo}"] += retries
+            m[f"falhas_json_{sufixo}"] += falhas_json
+
+    def registar_parse(self, papel: str, resultado: str) -> None:
+        """resultado: "directo" (json.loads à primeira), "reparado" ou "falhou"."""
+        with self._lock:
+            self._papel(papel)[f"parse_{resultado}"] += 1
+
+    def registar_rejeicao(self, modelo: str) -> None:
+        with self._lock:
+            self.rejeicoes[modelo] = self.rejeicoes.get(modelo, 0) + 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            papeis = {}
+            for papel, m in sorted(self._papeis.items()):
+                parses = m["parse_directo"] + m["parse_reparado"] + m["parse_falhou"]
+                papeis[papel] = {
+                    **m,
+                    "taxa_falha_parse": round((m["parse_reparado"] + m["parse_falhou"]) / parses, 3) if parses else 0.0,
+                    "retries_por_chamada_schema": (
+                        round(m["retries_schema"] / m["chamadas_schema"], 3) if m["chamadas_schema"] else None
+                    ),
+                    "retries_por_chamada_livres": (
+                        round(m["retries_livres"] / m["chamadas_livres"], 3) if m["chamadas_livres"] else None
+                    ),
+                }
+            return {"papeis": papeis, "schema_rejeitado": dict(self.rejeicoes)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._papeis.clear()
+            self.rejeicoes.clear()
+
+
+_metrics = _StructuredOutputMetrics()
+
+
+def get_structured_output_metrics() -> dict[str, Any]:
+    """Métricas de output estruturado deste processo (diagnóstico)."""
+    return _metrics.snapshot()
+
+
+def registar_chamada(papel: str, estruturado: bool, retries: int = 0, falhas_json: int = 0) -> None:
+    _metrics.registar_chamada(papel, estruturado, retries, falhas_json)
+
+
+def registar_parse(papel: str, resultado: str) -> None:
+    _metrics.registar_parse(papel, resultado)
+
+
+def registar_rejeicao(modelo: str) -> None:
+    _metrics.registar_rejeicao(modelo)
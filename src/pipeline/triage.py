@@ -7,16 +7,29 @@ Classifica o domínio jurídico do documento via 3 IAs baratas em paralelo:
   T3: Llama 4 8B
 
 Votação: 2/3 concordam → domínio definido. Empate → "multi-dominio"
+Quórum: assim que 2 votos coincidem a votação está decidida — o 3º modelo
+deixa de ser esperado (o voto é ignorado; o custo só é registado se a
+chamada chegar a terminar).
+Pré-classificador local (palavras-chave/regex): se o texto for inequívoco,
+a triagem LLM nem é chamada.
 Detecção de fotos: ≤20 OK, >20 aviso, >50 modo fila
 """
 
 import logging
 import re
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
 from typing import Optional, Any
 
+from src.config import (
+    TRIAGE_EARLY_EXIT,
+    TRIAGE_PRECLASSIFIER,
+    TRIAGE_PRECLASS_MIN_CONFIDENCE,
+    TRIAGE_PRECLASS_MIN_HITS,
+)
 from src.pipeline.extractor_json import extract_json_from_text
 
 logger = logging.getLogger(__name__)
@@ -53,6 +66,160 @@ OUTPUT FORMAT (JSON only):
 
 Respond with ONLY the JSON. No text before or after."""
 
+# Pré-classificador: termos característicos de cada domínio (peso 1 por ocorrência,
+# peso 3 para diplomas/tribunais específicos). Civil fica com os termos de
+# processo civil genéricos — só ganha se nada mais específico aparecer.
+_PRE_TERMOS: dict[str, list[tuple[str, int]]] = {
+    "Penal": [
+        (r"\barguid[oa]s?\b", 1), (r"\bMinist[ée]rio P[úu]blico\b", 1), (r"\bcrimes?\b", 1),
+        (r"\bpena de pris[ãa]o\b", 1), (r"\bacusa[çc][ãa]o\b", 1), (r"\bofendid[oa]s?\b", 1),
+        (r"\bC[óo]digo Penal\b", 3), (r"\bC[óo]digo de Processo Penal\b", 3), (r"\bCPP\b", 3),
+    ],
+    "Trabalho": [
+        (r"\btrabalhador(?:a|es)?\b", 1), (r"\bentidade empregadora\b", 1), (r"\bdespedimento\b", 1),
+        (r"\bcontrato de trabalho\b", 1), (r"\bretribui[çc][ãa]o\b", 1), (r"\bjusta causa\b", 1),
+        (r"\bC[óo]digo do Trabalho\b", 3), (r"\bTribunal do Trabalho\b", 3), (r"\bJu[íi]zo do Trabalho\b", 3),
+    ],
+    "Família": [
+        (r"\bdiv[óo]rcio\b", 1), (r"\bc[ôo]njuges?\b", 1), (r"\bmenor(?:es)?\b", 1),
+        (r"\bresponsabilidades parentais\b", 3), (r"\bpens[ãa]o de alimentos\b", 1),
+        (r"\bJu[íi]zo de Fam[íi]lia\b", 3), (r"\bregula[çc][ãa]o do exerc[íi]cio\b", 3),
+    ],
+    "Administrativo": [
+        (r"\bacto administrativo\b", 1), (r"\bato administrativo\b", 1), (r"\bentidade demandada\b", 1),
+        (r"\bcontra-interessad[oa]s?\b", 1), (r"\bCPTA\b", 3), (r"\bTribunal Administrativo\b", 3),
+        (r"\bC[óo]digo do Procedimento Administrativo\b", 3),
+    ],
+    "Tributário": [
+        (r"\bAutoridade Tribut[áa]ria\b", 1), (r"\bliquida[çc][ãa]o adicional\b", 1), (r"\bIRS\b", 1),
+        (r"\bIRC\b", 1), (r"\bIVA\b", 1), (r"\bimpugna[çc][ãa]o judicial\b", 1), (r"\bexecu[çc][ãa]o fiscal\b", 1),
+        (r"\bCPPT\b", 3), (r"\bLei Geral Tribut[áa]ria\b", 3), (r"\bLGT\b", 3),
+    ],
+    "Comercial": [
+        (r"\binsolv[êe]ncia\b", 1), (r"\bsociedade comercial\b", 1), (r"\bgerentes?\b", 1),
+        (r"\badministrador(?:es)? da insolv[êe]ncia\b", 3), (r"\bCIRE\b", 3),
+        (r"\bC[óo]digo das Sociedades Comerciais\b", 3), (r"\bJu[íi]zo de Com[ée]rcio\b", 3),
+    ],
+    "Consumidor": [
+        (r"\bconsumidor(?:es)?\b", 1), (r"\bbens de consumo\b", 1), (r"\bdireito de livre resolu[çc][ãa]o\b", 1),
+        (r"\bLei de Defesa do Consumidor\b", 3), (r"\bcl[áa]usulas contratuais gerais\b", 3),
+    ],
+    "Ambiental": [
+        (r"\bambient(?:e|al)\b", 1), (r"\bpolui[çc][ãa]o\b", 1), (r"\bres[íi]duos\b", 1),
+        (r"\bLei de Bases do Ambiente\b", 3), (r"\bavalia[çc][ãa]o de impacte ambiental\b", 3),
+    ],
+    "Constitucional": [
+        (r"\binconstitucionalidade\b", 1), (r"\bfiscaliza[çc][ãa]o (?:concreta|abstracta|abstrata)\b", 3),
+        (r"\bTribunal Constitucional\b", 3), (r"\bLei do Tribunal Constitucional\b", 3),
+    ],
+    "Civil": [
+        (r"\barrendat[áa]ri[oa]s?\b", 1), (r"\bsenhori[oa]s?\b", 1), (r"\bresponsabilidade civil\b", 1),
+        (r"\bcompra e venda\b", 1), (r"\bindemniza[çc][ãa]o\b", 1), (r"\bdanos\b", 1),
+        (r"\bC[óo]digo Civil\b", 3), (r"\bC[óo]digo de Processo Civil\b", 3), (r"\bCPC\b", 3),
+    ],
+}
+_PRE_REGEX = {
+    dominio: [(re.compile(padrao, re.IGNORECASE), peso) for padrao, peso in termos]
+    for dominio, termos in _PRE_TERMOS.items()
+}
+_FOTO_NUMERADA = re.compile(r"\b(?:fotografia|foto|fotograma|imagem)s?\s*(?:n\.?\s*[ºo°]\s*)?(\d{1,4})\b", re.IGNORECASE)
+_FOTO_MENCAO = re.compile(r"\b(?:fotografia|foto|fotograma)s?\b", re.IGNORECASE)
+
+# Texto analisado pelo pré-classificador (início do documento, onde estão
+# cabeçalho, partes e pedido)
+_PRE_MAX_CHARS = 20_000
+
+
+def pre_classificar(text: str) -> tuple[Optional[str], float, dict[str, int], list[str]]:
+    """
+    Classificação local por palavras-chave.
+
+    Returns:
+        (domínio vencedor ou None, confiança = pontos do vencedor / total,
+         pontos por domínio, termos encontrados do vencedor)
+    """
+    amostra = text[:_PRE_MAX_CHARS]
+    pontos: dict[str, int] = {}
+    termos: dict[str, list[str]] = {}
+    for dominio, padroes in _PRE_REGEX.items():
+        total = 0
+        for regex, peso in padroes:
+            ocorrencias = regex.findall(amostra)
+            if ocorrencias:
+                total += peso * len(ocorrencias)
+                termos.setdefault(dominio, []).append(ocorrencias[0])
+        if total:
+            pontos[dominio] = total
+    if not pontos:
+        return None, 0.0, pontos, []
+    vencedor = max(pontos, key=pontos.get)
+    return vencedor, pontos[vencedor] / sum(pontos.values()), pontos, termos.get(vencedor, [])
+
+
+def estimar_fotos(text: str) -> int:
+    """Estimativa local de fotos: maior número de fotografia referido, senão nº de menções."""
+    numeros = [int(n) for n in _FOTO_NUMERADA.findall(text)]
+    if numeros:
+        return max(numeros)
+    return len(_FOTO_MENCAO.findall(text))
+
+
+class _TriageMetrics:
+    """Métricas de triagem do processo (latência poupada por quórum e pré-classificador)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.por_metodo: dict[str, int] = {}
+        self.early_exits = 0
+        self.saved_ms_total = 0.0
+        self._llm_ms_ewma: Optional[float] = None  # duração de uma triagem LLM completa
+        self._modelo_ms: dict[str, float] = {}  # EWMA da latência de cada modelo
+
+    def registar_modelo(self, tid: str, ms: float) -> None:
+        with self._lock:
+            anterior = self._modelo_ms.get(tid)
+            self._modelo_ms[tid] = ms if anterior is None else 0.8 * anterior + 0.2 * ms
+
+    def estimar_modelo_ms(self, tid: str) -> Optional[float]:
+        with self._lock:
+            return self._modelo_ms.get(tid)
+
+    def estimar_llm_ms(self) -> Optional[float]:
+        with self._lock:
+            return self._llm_ms_ewma
+
+    def registar_run(self, metodo: str, duracao_ms: float, saved_ms: float, early_exit: bool) -> None:
+        with self._lock:
+            self.runs += 1
+            self.por_metodo[metodo] = self.por_metodo.get(metodo, 0) + 1
+            self.saved_ms_total += saved_ms
+            if early_exit:
+                self.early_exits += 1
+            if metodo == "llm":
+                total = duracao_ms + saved_ms
+                self._llm_ms_ewma = total if self._llm_ms_ewma is None else 0.8 * self._llm_ms_ewma + 0.2 * total
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "por_metodo": dict(self.por_metodo),
+                "early_exits": self.early_exits,
+                "latency_saved_ms_total": round(self.saved_ms_total, 1),
+                "latency_saved_ms_avg": round(self.saved_ms_total / self.runs, 1) if self.runs else 0.0,
+                "llm_triage_ms_ewma": round(self._llm_ms_ewma, 1) if self._llm_ms_ewma else None,
+                "modelo_ms_ewma": {k: round(v, 1) for k, v in self._modelo_ms.items()},
+            }
+
+
+_metrics = _TriageMetrics()
+
+
+def get_triage_metrics() -> dict[str, Any]:
+    """Métricas de triagem deste processo (diagnóstico)."""
+    return _metrics.snapshot()
+
 
 @dataclass
 class TriageResult:
@@ -66,6 +233,10 @@ class TriageResult:
     consensus: str = "none"  # "unanimous", "majority", "split"
     duration_ms: float = 0.0
     cost_usd: float = 0.0
+    method: str = "llm"  # "llm" ou "keywords" (pré-classificador)
+    early_exit: bool = False  # quórum atingido antes de todos os modelos responderem
+    skipped_models: list[str] = field(default_factory=list)
+    latency_saved_ms: float = 0.0  # estimativa face a esperar por todos os modelos
 
     def to_dict(self) -> dict[str, Any]:
         return {
@@ -78,6 +249,10 @@ class TriageResult:
             "consensus": self.consensus,
             "duration_ms": self.duration_ms,
             "cost_usd": round(self.cost_usd, 4),
+            "method": self.method,
+            "early_exit": self.early_exit,
+            "skipped_models": self.skipped_models,
+            "latency_saved_ms": round(self.latency_saved_ms, 1),
         }
 
 
@@ -112,6 +287,13 @@ class TriageProcessor:
             TriageResult com domínio, keywords e alertas
         """
         start_time = time.time()
+
+        # Pré-classificador local: texto inequívoco dispensa a triagem LLM
+        if TRIAGE_PRECLASSIFIER:
+            pre = self._run_pre_classificador(text, start_time)
+            if pre is not None:
+                return pre
+
         result = TriageResult()
 
         # Criar snippet para classificação (primeiros ~3000 chars + últimos ~1000)
@@ -121,11 +303,13 @@ class TriageProcessor:
         votes = {}
         all_keywords = []
         photo_estimates = []
+        decidido = threading.Event()
 
         def _classify(triage_model):
             tid = triage_model["id"]
             model = triage_model["model"]
             try:
+                t0 = time.time()
                 response = self.llm_client.chat_simple(
                     model=model,
                     prompt=snippet,
@@ -133,8 +317,9 @@ class TriageProcessor:
                     temperature=0.0,
                     max_tokens=256,
                 )
+                _metrics.registar_modelo(tid, (time.time() - t0) * 1000)
 
-                # Registar custos
+                # Registar custos (só chamadas que terminaram — incluindo as que chegam após o quórum)
                 if self.cost_controller:
                     pt = response.prompt_tokens or (len(snippet) // 4)
                     ct = response.completion_tokens or (len(response.content) // 4)
@@ -147,6 +332,9 @@ class TriageProcessor:
                         )
                     except Exception as e:
                         logger.warning(f"[TRIAGE] Falha ao registar custo {tid}: {e}")
+                if decidido.is_set():
+                    logger.info(f"[TRIAGE] {tid} ({model}): respondeu após o quórum — voto ignorado")
+                    return tid, None, [], 0
 
                 # Parse JSON response
                 parsed = extract_json_from_text(response.content)
@@ -163,24 +351,50 @@ class TriageProcessor:
                 logger.error(f"[TRIAGE] {tid} ({model}) failed: {e}")
                 return tid, None, [], 0
 
-        # Executar em paralelo
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            futures = {executor.submit(_classify, m): m["id"] for m in TRIAGE_MODELS}
-            for future in as_completed(futures):
-                tid = futures[future]
-                try:
-                    tid_result, domain, kws, photos = future.result()
-                    if domain is not None:
-                        # Normalizar domínio
-                        domain = self._normalize_domain(domain)
-                        votes[tid_result] = domain
-                        all_keywords.extend(kws)
-                        photo_estimates.append(photos)
-                        logger.info(f"[TRIAGE] {tid_result}: domain={domain}, keywords={kws[:3]}")
-                    else:
-                        logger.warning(f"[TRIAGE] {tid_result}: falhou - voto não contabilizado")
-                except Exception as e:
-                    logger.error(f"[TRIAGE] {tid} exception: {e}")
+        # Executar em paralelo; parar de esperar assim que houver maioria
+        quorum = len(TRIAGE_MODELS) // 2 + 1
+        executor = ThreadPoolExecutor(max_workers=3)
+        futures = {executor.submit(_classify, m): m["id"] for m in TRIAGE_MODELS}
+        pendentes = set(futures)
+        try:
+            while pendentes:
+                feitos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for future in feitos:
+                    tid = futures[future]
+                    try:
+                        tid_result, domain, kws, photos = future.result()
+                        if domain is not None:
+                            # Normalizar domínio
+                            domain = self._normalize_domain(domain)
+                            votes[tid_result] = domain
+                            all_keywords.extend(kws)
+                            photo_estimates.append(photos)
+                            logger.info(f"[TRIAGE] {tid_result}: domain={domain}, keywords={kws[:3]}")
+                        else:
+                            logger.warning(f"[TRIAGE] {tid_result}: falhou - voto não contabilizado")
+                    except Exception as e:
+                        logger.error(f"[TRIAGE] {tid} exception: {e}")
+                if TRIAGE_EARLY_EXIT and pendentes and votes and \
+                        Counter(votes.values()).most_common(1)[0][1] >= quorum:
+                    break
+        finally:
+            if pendentes:
+                decidido.set()
+            # Não esperar pelos restantes: terminam em background (ou nem começam)
+            executor.shutdown(wait=not pendentes, cancel_futures=True)
+
+        if pendentes:
+            decorrido_ms = (time.time() - start_time) * 1000
+            result.early_exit = True
+            result.skipped_models = sorted(futures[f] for f in pendentes)
+            estimativas = [_metrics.estimar_modelo_ms(t) for t in result.skipped_models]
+            estimativas = [e for e in estimativas if e is not None]
+            if estimativas:
+                result.latency_saved_ms = max(0.0, max(estimativas) - decorrido_ms)
+            logger.info(
+                f"[TRIAGE] Quórum atingido em {decorrido_ms:.0f}ms — sem esperar por "
+                f"{', '.join(result.skipped_models)} (~{result.latency_saved_ms:.0f}ms poupados)"
+            )
 
         # Votação por maioria
         result.votes = votes
@@ -228,13 +442,10 @@ class TriageProcessor:
 
         # Photo estimation
         if photo_estimates:
-            result.photo_estimate = max(photo_estimates)
-            if result.photo_estimate > 50:
-                result.photo_warning = "queue_mode"
-            elif result.photo_estimate > 20:
-                result.photo_warning = "warning"
+            self._aplicar_fotos(result, max(photo_estimates))
 
         result.duration_ms = (time.time() - start_time) * 1000
+        _metrics.registar_run("llm", result.duration_ms, result.latency_saved_ms, result.early_exit)
 
         logger.info(
             f"[TRIAGE] Resultado: domain={result.domain} ({result.consensus}), "
@@ -244,6 +455,45 @@ class TriageProcessor:
 
         return result
 
+    def _run_pre_classificador(self, text: str, start_time: float) -> Optional[TriageResult]:
+        """Triagem só por palavras-chave; None se o texto não for inequívoco."""
+        dominio, confianca, pontos, termos = pre_classificar(text)
+        if dominio is None or pontos[dominio] < TRIAGE_PRECLASS_MIN_HITS \
+                or confianca < TRIAGE_PRECLASS_MIN_CONFIDENCE:
+            logger.info(
+                f"[TRIAGE] Pré-classificador inconclusivo (pontos={pontos}, "
+                f"confiança={confianca:.0%}) — triagem LLM"
+            )
+            return None
+
+        result = TriageResult(
+            domain=dominio,
+            domain_confidence=round(confianca, 2),
+            keywords=termos[:10],
+            votes={"keywords": dominio},
+            consensus="keywords",
+            method="keywords",
+        )
+        self._aplicar_fotos(result, estimar_fotos(text))
+        result.duration_ms = (time.time() - start_time) * 1000
+        estimativa = _metrics.estimar_llm_ms()
+        if estimativa:
+            result.latency_saved_ms = max(0.0, estimativa - result.duration_ms)
+        _metrics.registar_run("keywords", result.duration_ms, result.latency_saved_ms, False)
+        logger.info(
+            f"[TRIAGE] Pré-classificador: domain={dominio} (confiança={confianca:.0%}, "
+            f"pontos={pontos[dominio]}) em {result.duration_ms:.0f}ms — triagem LLM dispensada"
+        )
+        return result
+
+    @staticmethod
+    def _aplicar_fotos(result: TriageResult, estimativa: int) -> None:
+        result.photo_estimate = estimativa
+        if estimativa > 50:
+            result.photo_warning = "queue_mode"
+        elif estimativa > 20:
+            result.photo_warning = "warning"
+
     def _create_snippet(self, text: str, filename: str, num_pages: int) -> str:
         """Cria snippet representativo do documento para classificação."""
         # Primeiros 3000 chars + últimos 1000 chars
@@ -0,0 +1,145 @@
+"""
+TOKEN COUNTER - Contagem Local de Tokens (BPE aproximado)
+==========================================================
+Substitui as estimativas "chars // 4" no orçamento de prompts
+(failover, max_tokens, custo por tier, bloqueio de créditos).
+
+Aproximação de um tokenizer BPE (família cl100k/o200k): o texto é
+pré-tokenizado como o BPE faz (palavras com espaço inicial, grupos de
+até 3 dígitos, pontuação, espaços) e cada pré-token é pontuado pelo
+número de merges que tipicamente sobrevive:
+  - palavras até 6 letras: 1 token
+  - palavras longas: +1 token por cada 4 letras extra
+  - letras acentuadas e MAIÚSCULAS partem mais (vocabulário inglês)
+
+Contagens são cacheadas por hash do texto (o documento é contado uma
+vez por run e reutilizado em todas as chamadas). O erro real vs usage
+da API é reportado por run no CostController.
+"""
+
+import hashlib
+import logging
+import math
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_ENTRIES = 4096
+CACHE_MIN_CHARS = 256  # textos curtos são mais baratos de contar do que de hashear
+OVERHEAD_POR_MENSAGEM = 4  # tokens de template por mensagem (role, separadores)
+
+# Pré-tokenização ao estilo cl100k: contracções, palavras, grupos de 1-3
+# dígitos, pontuação, espaços
+_PRE_TOKEN = re.compile(
+    r"'(?:[sdmt]|ll|ve|re)"
+    r"| ?[^\W\d_]+"
+    r"| ?\d{1,3}"
+    r"| ?[^\s\w]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+
+def _tokens_palavra(palavra: str) -> int:
+    """Tokens de uma palavra (sem o espaço inicial)."""
+    n = len(palavra)
+    if n <= 6:
+        base = 1
+    else:
+        base = 1 + math.ceil((n - 6) / 4)
+    if not palavra.isascii():
+        # Cada letra acentuada tende a partir a palavra (á, ç, õ...)
+        base += math.ceil(sum(1 for c in palavra if ord(c) > 127) / 2)
+    if n > 2 and palavra.isupper():
+        # Palavras em maiúsculas quase não têm merges no vocabulário
+        base = max(base, math.ceil(n / 2.5))
+    return base
+
+
+def estimar_tokens_por_chars(num_chars: int) -> int:
+    """Estimativa antiga (chars / 4) — referência no relatório de erro do CostController."""
+    return max(0, num_chars) // 4
+
+
+class TokenCounter:
+    """
+    Contador de tokens com cache LRU por hash de texto.
+
+    Thread-safe: partilhado por todas as análises do processo.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self._cache: OrderedDict[bytes, int] = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _contar(texto: str) -> int:
+        total = 0
+        for m in _PRE_TOKEN.finditer(texto):
+            pre = m.group()
+            c = pre[-1]
+            if c.isalpha():
+                total += _tokens_palavra(pre.lstrip(" "))
+            elif c.isdigit() or c.isspace():
+                total += 1
+            else:
+                # Pontuação: pares frequentes ("..", "--", ").") fundem-se
+                total += max(1, math.ceil(len(pre.strip()) / 2))
+        return total
+
+    def count(self, texto: Optional[str]) -> int:
+        """Número (aproximado) de tokens do texto."""
+        if not texto:
+            return 0
+        if len(texto) < CACHE_MIN_CHARS:
+            return self._contar(texto)
+
+        chave = hashlib.blake2b(texto.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with self._lock:
+            cached = self._cache.get(chave)
+            if cached is not None:
+                self._cache.move_to_end(chave)
+                self.hits += 1
+                return cached
+
+        total = self._contar(texto)
+        with self._lock:
+            self.misses += 1
+            self._cache[chave] = total
+            if len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+        return total
+
+    def count_messages(self, *textos: Optional[str]) -> int:
+        """Tokens de prompt para um conjunto de mensagens (inclui overhead de template)."""
+        presentes = [t for t in textos if t]
+        return sum(self.count(t) for t in presentes) + OVERHEAD_POR_MENSAGEM * len(presentes)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+_counter: Optional[TokenCounter] = None
+_counter_lock = Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """Retorna o contador de tokens do processo (singleton)."""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = TokenCounter()
+    return _counter
+
+
+def contar_tokens(texto: Optional[str]) -> int:
+    """Atalho para get_token_counter().count(texto)."""
+    return get_token_counter().count(texto)
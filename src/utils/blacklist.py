@@ -0,0 +1,97 @@
+"""
+BLACKLIST - matcher compilado (emails, IPs/redes, domínios)
+═══════════════════════════════════════════════════════════════════════════
+
+O snapshot é imutável: o refresh em background constrói um novo e troca a
+referência global de uma vez, por isso o middleware lê sem locks e nunca
+espera pelo Supabase.
+
+- emails: match exacto (lowercase)
+- ips: match exacto; entradas com "/" são redes CIDR (ex: 10.0.0.0/8)
+- domínios: o domínio do email e todos os domínios-pai
+  ("mail.spam.com" é bloqueado por "spam.com")
+"""
+
+import ipaddress
+import logging
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BlacklistSnapshot:
+    """Blacklist compilada; nunca é alterada depois de construída."""
+
+    emails: frozenset = frozenset()
+    ips: frozenset = frozenset()
+    redes: tuple = ()
+    dominios: frozenset = frozenset()
+    carregado_em: float = 0.0
+    total: int = field(default=0)
+
+    def ip_bloqueado(self, ip: Optional[str]) -> bool:
+        if not ip:
+            return False
+        if ip in self.ips:
+            return True
+        if not self.redes:
+            return False
+        try:
+            endereco = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(endereco.version == rede.version and endereco in rede for rede in self.redes)
+
+    def email_bloqueado(self, email: str) -> bool:
+        return bool(email) and email in self.emails
+
+    def dominio_bloqueado(self, email: str) -> Optional[str]:
+        """
+        Domínio (ou domínio-pai) bloqueado para este email, ou None.
+
+        Os pais só contam com pelo menos dois rótulos: uma linha "com" ou
+        "pt" não bloqueia todos os endereços debaixo desse TLD.
+        """
+        if not self.dominios or "@" not in email:
+            return None
+        dominio = email.rsplit("@", 1)[1]
+        if dominio in self.dominios:
+            return dominio
+        _, _, dominio = dominio.partition(".")
+        while dominio.count(".") >= 1:
+            if dominio in self.dominios:
+                return dominio
+            _, _, dominio = dominio.partition(".")
+        return None
+
+
+def compilar_blacklist(rows: Iterable[dict], carregado_em: float = 0.0) -> BlacklistSnapshot:
+    """Constrói o snapshot a partir das linhas da tabela blacklist (type, value)."""
+    emails, ips, dominios, redes = set(), set(), set(), []
+    for row in rows:
+        valor = (row.get("value") or "").lower().strip()
+        tipo = row.get("type", "")
+        if not valor:
+            continue
+        if tipo == "email":
+            emails.add(valor)
+        elif tipo == "ip":
+            if "/" in valor:
+                try:
+                    redes.append(ipaddress.ip_network(valor, strict=False))
+                except ValueError:
+                    logger.warning(f"[BLACKLIST] Rede inválida ignorada: {valor}")
+            else:
+                ips.add(valor)
+        elif tipo == "domain":
+            dominios.add(valor.lstrip("@").rstrip("."))
+    return BlacklistSnapshot(
+        emails=frozenset(emails),
+        ips=frozenset(ips),
+        redes=tuple(redes),
+        dominios=frozenset(dominios),
+        carregado_em=carregado_em,
+        total=len(emails) + len(ips) + len(redes) + len(dominios),
+    )
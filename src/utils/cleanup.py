@@ -49,16 +49,27 @@ def get_folder_age(folder: Path) -> timedelta:
     return datetime.now(timezone.utc) - mtime
 
 
-def get_folder_size(folder: Path) -> int:
+def get_folder_size(folder: Path, use_cache: bool = True) -> int:
     """
     Calcula tamanho total de uma pasta em bytes.
 
+    Com use_cache, o valor fica no índice de runs da pasta-mãe e só é
+    recalculado quando a run volta a ser escrita (ou o mtime da pasta muda).
+
     Args:
         folder: Path da pasta
+        use_cache: Usar/actualizar a cache do índice de runs
 
     Returns:
         Tamanho em bytes
     """
+    if use_cache:
+        try:
+            from src.utils.run_index import get_run_index
+            return get_run_index(folder.parent).tamanho_pasta(folder)
+        except Exception as e:
+            logger.debug(f"[RUN-INDEX] Cache de tamanhos indisponível: {e}")
+
     total = 0
     for item in folder.rglob("*"):
         if item.is_file():
@@ -92,8 +103,18 @@ def is_valid_run(folder: Path) -> bool:
     if folder.name.startswith("temp_"):
         return False
 
-    resultado_path = folder / "resultado.json"
-    return resultado_path.exists()
+    from src.pipeline.artefact_store import get_artefact_store
+
+    # Aceita resultado.json.gz (ARTEFACT_COMPRESS)
+    return get_artefact_store().exists(folder / "resultado.json")
+
+
+def _esquecer_pasta(folder: Path):
+    try:
+        from src.utils.run_index import get_run_index
+        get_run_index(folder.parent).esquecer_pasta(folder.name)
+    except Exception as e:
+        logger.debug(f"[RUN-INDEX] Falha ao esquecer {folder.name}: {e}")
 
 
 def cleanup_temp_folders(
@@ -139,6 +160,7 @@ def cleanup_temp_folders(
             else:
                 try:
                     shutil.rmtree(folder)
+                    _esquecer_pasta(folder)
                     messages.append(f"[OK] Removido: {folder.name} ({size_str}, {age_str})")
                     removed += 1
                     bytes_freed += size
@@ -9,6 +9,7 @@ FUNCIONALIDADES:
 - Listar análises com títulos
 - Editar títulos de análises antigas
 - Compatibilidade com análises sem metadata
+- Listagens servidas pelo índice SQLite (src/utils/run_index.py)
 """
 
 import json
@@ -22,6 +23,34 @@ from src.utils.sanitize import sanitize_run_id
 logger = logging.getLogger(__name__)
 
 
+def _indice(output_dir: Path):
+    """RunIndex da pasta (None se o índice não estiver disponível → varrimento)."""
+    try:
+        from src.utils.run_index import get_run_index
+        return get_run_index(output_dir)
+    except Exception as e:
+        logger.warning(f"[RUN-INDEX] Índice indisponível ({output_dir}): {e}")
+        return None
+
+
+def _indexar_metadata(metadata: dict, output_dir: Path):
+    indice = _indice(output_dir)
+    if indice is None:
+        return
+    try:
+        indice.registar_run(
+            metadata["run_id"],
+            titulo=metadata.get("titulo", ""),
+            descricao=metadata.get("descricao", ""),
+            area_direito=metadata.get("area_direito", ""),
+            num_documentos=metadata.get("num_documentos", 0),
+            data_criacao=metadata.get("data_criacao"),
+            tem_metadata=1,
+        )
+    except Exception as e:
+        logger.warning(f"[RUN-INDEX] Falha ao indexar metadata de {metadata.get('run_id')}: {e}")
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 # FUNÇÕES DE METADATA
 # ═══════════════════════════════════════════════════════════════════════════
@@ -69,6 +98,7 @@ def guardar_metadata(
             json.dump(metadata, f, indent=2, ensure_ascii=False)
 
         logger.info(f"✓ Metadata guardada: {titulo}")
+        _indexar_metadata(metadata, output_dir)
 
     except Exception as e:
         logger.error(f"Erro ao guardar metadata: {e}")
@@ -148,27 +178,73 @@ def atualizar_metadata(
             json.dump(metadata, f, indent=2, ensure_ascii=False)
 
         logger.info(f"✓ Metadata atualizada: {metadata['titulo']}")
+        _indexar_metadata(metadata, output_dir)
 
     except Exception as e:
         logger.error(f"Erro ao atualizar metadata: {e}")
 
 
-def listar_analises_com_titulos(output_dir: Path) -> list[tuple[str, str, str]]:
+def listar_analises_com_titulos(
+    output_dir: Path,
+    limite: Optional[int] = None,
+    offset: int = 0,
+) -> list[tuple[str, str, str]]:
     """
-    Lista todas as análises com títulos.
-    
+    Lista as análises com títulos (página limite/offset; None = todas).
+
     Args:
         output_dir: Pasta outputs
-    
+        limite: Máximo de análises a devolver
+        offset: Análises a saltar (paginação)
+
     Returns:
         Lista de tuplos: [(run_id, titulo_display, data), ...]
         Ordenado por data (mais recente primeiro)
     """
-    analises = []
-
     if not output_dir.exists():
         return []
 
+    indice = _indice(output_dir)
+    if indice is not None:
+        try:
+            return _listar_do_indice(indice, output_dir, limite, offset)
+        except Exception as e:
+            logger.warning(f"[RUN-INDEX] Falha na consulta, a varrer {output_dir}: {e}")
+
+    analises = _varrer_analises(output_dir)
+    fim = None if limite is None else offset + limite
+    return analises[offset:fim]
+
+
+def _listar_do_indice(indice, output_dir: Path, limite: Optional[int], offset: int) -> list[tuple[str, str, str]]:
+    from src.utils.run_index import data_do_run_id
+
+    analises = []
+    for row in indice.listar(limite=limite, offset=offset):
+        run_id = row["run_id"]
+        if not (output_dir / run_id).is_dir():
+            # Pasta apagada fora da aplicação
+            indice.remover_run(run_id)
+            continue
+        try:
+            data_obj = datetime.strptime(row["data_criacao"], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            data_obj = datetime.now(timezone.utc)
+        data_display = data_obj.strftime("%d/%m/%Y")
+        if row["tem_metadata"]:
+            titulo_display = f"{row['titulo'] or run_id} ({data_display})"
+        elif data_do_run_id(run_id) is None:
+            titulo_display = run_id
+        else:
+            titulo_display = f"[Sem título] {run_id[:15]}... ({data_display})"
+        analises.append((run_id, titulo_display, data_obj.strftime("%Y-%m-%d")))
+    return analises
+
+
+def _varrer_analises(output_dir: Path) -> list[tuple[str, str, str]]:
+    """Varrimento directo de outputs/ (sem índice)."""
+    analises = []
+
     # Procurar pastas de análises
     for item in output_dir.iterdir():
         if not item.is_dir() or item.name.startswith('.') or item.name.startswith('temp'):
@@ -272,6 +348,13 @@ def contar_analises_sem_titulo(output_dir: Path) -> int:
     if not output_dir.exists():
         return 0
 
+    indice = _indice(output_dir)
+    if indice is not None:
+        try:
+            return indice.contar(sem_titulo=True)
+        except Exception as e:
+            logger.warning(f"[RUN-INDEX] Falha na contagem, a varrer {output_dir}: {e}")
+
     count = 0
 
     for item in output_dir.iterdir():
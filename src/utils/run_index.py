@@ -0,0 +1,323 @@
+"""
+ÍNDICE DE RUNS - SQLite em outputs/.run_index.db
+═══════════════════════════════════════════════════════════════════════════
+
+Evita varrer outputs/ (e abrir o JSON de cada run) para listar o histórico.
+
+MANTIDO EM:
+- início da run (LexForumProcessor._setup_run)
+- metadata guardada/editada (metadata_manager)
+- fim da run (LexForumProcessor._guardar_resultado)
+- remoção de runs (UI, cleanup)
+
+Na primeira utilização sobre uma pasta de outputs já existente, o índice é
+construído uma vez a partir dos ficheiros (metadata.json / resultado.json).
+Tamanhos de pastas ficam em cache até a run voltar a ser escrita: o
+registo no índice e os writers de artefactos/checkpoints invalidam a
+entrada (invalidar_tamanho); o mtime da pasta só cobre o primeiro nível.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".run_index.db"
+
+_COLUNAS = (
+    "titulo", "descricao", "area_direito", "num_documentos", "data_criacao",
+    "timestamp_inicio", "documento", "veredicto", "simbolo", "perguntas",
+    "estado", "tem_resultado", "tem_metadata",
+)
+
+# Colunas da constante acima; os valores vão sempre por parâmetro
+_INSERT_RUN_COMPLETA = (
+    f"INSERT INTO runs (run_id, {', '.join(_COLUNAS)}, atualizado_em) "  # noqa: S608 — colunas de _COLUNAS
+    f"VALUES ({', '.join('?' for _ in range(len(_COLUNAS) + 2))})"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    titulo TEXT DEFAULT '',
+    descricao TEXT DEFAULT '',
+    area_direito TEXT DEFAULT '',
+    num_documentos INTEGER DEFAULT 0,
+    data_criacao TEXT,
+    timestamp_inicio TEXT,
+    documento TEXT,
+    veredicto TEXT,
+    simbolo TEXT,
+    perguntas INTEGER DEFAULT 0,
+    estado TEXT DEFAULT 'running',
+    tem_resultado INTEGER DEFAULT 0,
+    tem_metadata INTEGER DEFAULT 0,
+    atualizado_em REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_data ON runs (data_criacao DESC);
+CREATE INDEX IF NOT EXISTS idx_runs_inicio ON runs (timestamp_inicio DESC);
+CREATE TABLE IF NOT EXISTS folder_sizes (
+    nome TEXT PRIMARY KEY,
+    size_bytes INTEGER,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+
+def data_do_run_id(run_id: str) -> Optional[str]:
+    """'20260203_154057_891a6226' → '2026-02-03 15:40:57' (None se não for desse formato)."""
+    try:
+        data = datetime.strptime(run_id[:15], "%Y%m%d_%H%M%S").replace(tzinfo=timezone.utc)
+        return data.strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        try:
+            data = datetime.strptime(run_id[:8], "%Y%m%d").replace(tzinfo=timezone.utc)
+            return data.strftime("%Y-%m-%d 00:00:00")
+        except ValueError:
+            return None
+
+
+def _e_pasta_de_run(item: Path) -> bool:
+    return item.is_dir() and not item.name.startswith('.') and not item.name.startswith('temp')
+
+
+class RunIndex:
+    """Índice SQLite das runs de uma pasta de outputs (thread-safe)."""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.output_dir / INDEX_FILENAME
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+        self._pronto = False
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+
+    def registar_run(self, run_id: str, **campos) -> None:
+        """Cria ou actualiza a entrada da run (só os campos indicados)."""
+        desconhecidos = set(campos) - set(_COLUNAS)
+        if desconhecidos:
+            raise ValueError(f"Campos desconhecidos no índice de runs: {sorted(desconhecidos)}")
+        if not campos.get("data_criacao"):
+            campos.pop("data_criacao", None)
+        # Nomes de colunas só a partir de _COLUNAS (nunca das chaves recebidas)
+        atualizar = [c for c in _COLUNAS if c in campos] + ["atualizado_em"]
+        inserir = dict(campos, atualizado_em=time.time())
+        # Só na criação: data derivada do run_id (ou agora)
+        inserir.setdefault(
+            "data_criacao",
+            data_do_run_id(run_id) or datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        colunas = ["run_id"] + [c for c in _COLUNAS if c in inserir] + ["atualizado_em"]
+        sql = (
+            f"INSERT INTO runs ({', '.join(colunas)}) VALUES ({', '.join('?' for _ in colunas)}) "  # noqa: S608 — colunas de _COLUNAS, valores por parâmetro
+            f"ON CONFLICT(run_id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in atualizar)}"
+        )
+        with self._lock, self._conn:
+            self._conn.execute(sql, [run_id] + [inserir[c] for c in colunas[1:]])
+            self._conn.execute("DELETE FROM folder_sizes WHERE nome = ?", (run_id,))
+
+    def remover_run(self, run_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            self._conn.execute("DELETE FROM folder_sizes WHERE nome = ?", (run_id,))
+
+    def esquecer_pasta(self, nome: str) -> None:
+        """Remove o tamanho em cache de uma pasta (apagada ou reescrita)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM folder_sizes WHERE nome = ?", (nome,))
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def listar(
+        self,
+        limite: Optional[int] = None,
+        offset: int = 0,
+        ordenar_por: str = "data_criacao",
+        apenas_com_resultado: bool = False,
+    ) -> list[dict]:
+        """Runs ordenadas (mais recentes primeiro), paginadas."""
+        if ordenar_por not in ("data_criacao", "timestamp_inicio", "titulo"):
+            raise ValueError(f"Ordenação inválida: {ordenar_por}")
+        self._garantir_construido()
+        sql = "SELECT * FROM runs"
+        if apenas_com_resultado:
+            sql += " WHERE tem_resultado = 1"
+        direcao = "ASC" if ordenar_por == "titulo" else "DESC"
+        sql += f" ORDER BY {ordenar_por} {direcao}, run_id DESC LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (-1 if limite is None else limite, offset)).fetchall()
+        return [dict(r) for r in rows]
+
+    def contar(self, sem_titulo: bool = False) -> int:
+        self._garantir_construido()
+        sql = "SELECT COUNT(*) FROM runs"
+        if sem_titulo:
+            sql += " WHERE tem_metadata = 0"
+        with self._lock:
+            return self._conn.execute(sql).fetchone()[0]
+
+    def tamanho_pasta(self, folder: Path) -> int:
+        """Tamanho da pasta em bytes; recalcula se a run foi escrita desde o cálculo ou o mtime mudou."""
+        folder = Path(folder)
+        mtime = folder.stat().st_mtime
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size_bytes, mtime FROM folder_sizes WHERE nome = ?", (folder.name,)
+            ).fetchone()
+        if row is not None and row["mtime"] == mtime:
+            return row["size_bytes"]
+        total = sum(item.stat().st_size for item in folder.rglob("*") if item.is_file())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO folder_sizes (nome, size_bytes, mtime) VALUES (?, ?, ?)",
+                (folder.name, total, mtime),
+            )
+        return total
+
+    # ------------------------------------------------------------------
+    # Construção inicial
+    # ------------------------------------------------------------------
+
+    def _garantir_construido(self) -> None:
+        if self._pronto:
+            return
+        with self._lock:
+            feito = self._conn.execute("SELECT valor FROM meta WHERE chave = 'construido'").fetchone()
+        if feito is None:
+            self.reconstruir()
+        self._pronto = True
+
+    def reconstruir(self) -> int:
+        """Reconstrói o índice a partir das pastas de outputs. Retorna o nº de runs."""
+        from src.pipeline.artefact_store import get_artefact_store
+        from src.utils.metadata_manager import carregar_metadata
+
+        inicio = time.perf_counter()
+        store = get_artefact_store()
+        linhas = []
+        for item in self.output_dir.iterdir():
+            if not _e_pasta_de_run(item):
+                continue
+            run_id = item.name
+            campos = {"titulo": "", "descricao": "", "area_direito": "", "num_documentos": 0,
+                      "data_criacao": data_do_run_id(run_id), "timestamp_inicio": None,
+                      "documento": None, "veredicto": None, "simbolo": None, "perguntas": 0,
+                      "estado": "running", "tem_resultado": 0, "tem_metadata": 0}
+            metadata = carregar_metadata(run_id, self.output_dir)
+            if metadata:
+                campos.update(
+                    titulo=metadata.get("titulo", run_id),
+                    descricao=metadata.get("descricao", ""),
+                    area_direito=metadata.get("area_direito", ""),
+                    num_documentos=metadata.get("num_documentos", 0),
+                    data_criacao=metadata.get("data_criacao") or campos["data_criacao"],
+                    tem_metadata=1,
+                )
+            try:
+                resultado = store.read_json(item / "resultado.json")
+            except Exception as e:
+                logger.warning(f"[RUN-INDEX] Erro ao ler resultado de {run_id}: {e}")
+                resultado = None
+            if resultado:
+                campos.update(resumo_resultado(resultado))
+            if not campos["data_criacao"]:
+                campos["data_criacao"] = datetime.fromtimestamp(
+                    item.stat().st_mtime, tz=timezone.utc
+                ).strftime("%Y-%m-%d %H:%M:%S")
+            linhas.append((run_id,) + tuple(campos[c] for c in _COLUNAS) + (time.time(),))
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM runs")
+            self._conn.executemany(_INSERT_RUN_COMPLETA, linhas)
+            self._conn.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('construido', ?)",
+                               (datetime.now(timezone.utc).isoformat(),))
+        self._pronto = True
+        logger.info(
+            f"[RUN-INDEX] Índice reconstruído: {len(linhas)} runs em "
+            f"{(time.perf_counter() - inicio) * 1000:.0f}ms ({self.db_path})"
+        )
+        return len(linhas)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def resumo_resultado(resultado: dict) -> dict:
+    """Campos do índice a partir de um resultado (PipelineResult.to_dict())."""
+    return {
+        "timestamp_inicio": resultado.get("timestamp_inicio"),
+        "documento": (resultado.get("documento") or {}).get("filename"),
+        "veredicto": resultado.get("veredicto_final"),
+        "simbolo": resultado.get("simbolo_final"),
+        "perguntas": len(resultado.get("perguntas_utilizador") or []),
+        "estado": "done" if resultado.get("sucesso", True) else "failed",
+        "tem_resultado": 1,
+    }
+
+
+_indices: dict[str, RunIndex] = {}
+_indices_lock = threading.Lock()
+
+
+def invalidar_tamanho(path: Path) -> None:
+    """
+    Invalida o tamanho em cache da run que contém path.
+
+    Chamado pelos writers depois de cada ficheiro gravado: escritas em
+    subpastas, ou por cima de um ficheiro existente, não mudam o mtime da
+    pasta da run. Só actua nos índices já abertos neste processo (a cache
+    vive no SQLite partilhado, por isso vale para os outros processos).
+    """
+    if not _indices:
+        return
+    try:
+        absoluto = Path(path).resolve()
+    except OSError:
+        return
+    for chave, indice in list(_indices.items()):
+        try:
+            relativo = absoluto.relative_to(chave)
+        except ValueError:
+            continue
+        if len(relativo.parts) > 1:
+            try:
+                indice.esquecer_pasta(relativo.parts[0])
+            except sqlite3.Error as e:
+                logger.debug(f"[RUN-INDEX] Falha ao invalidar tamanho de {relativo.parts[0]}: {e}")
+
+
+def get_run_index(output_dir: Optional[Path] = None) -> RunIndex:
+    """Índice da pasta de outputs (por omissão OUTPUT_DIR) — um por pasta, por processo."""
+    if output_dir is None:
+        from src.config import OUTPUT_DIR
+        output_dir = OUTPUT_DIR
+    chave = str(Path(output_dir).resolve())
+    indice = _indices.get(chave)
+    if indice is None:
+        with _indices_lock:
+            indice = _indices.get(chave)
+            if indice is None:
+                indice = RunIndex(Path(output_dir))
+                _indices[chave] = indice
+    return indice
@@ -7,6 +7,7 @@ inputs que são usados em caminhos de ficheiros.
 
 import re
 import logging
+from datetime import datetime
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -152,3 +153,16 @@ def safe_join_path(base_dir: Path, *parts: str) -> Path:
             raise ValueError("Caminho resultante fora do diretório base")
 
     return result
+
+
+def sanitize_for_json(obj):
+    """Remove bytes e outros tipos não-serializáveis de dicts/lists recursivamente."""
+    if isinstance(obj, dict):
+        return {k: sanitize_for_json(v) for k, v in obj.items() if not isinstance(v, (bytes, bytearray))}
+    if isinstance(obj, list):
+        return [sanitize_for_json(item) for item in obj]
+    if isinstance(obj, (bytes, bytearray)):
+        return f"<{len(obj)} bytes>"
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return obj
@@ -555,6 +555,139 @@ class TestLLMClientLogic:
         assert requires_manual_cache("anthropic/claude-sonnet-4.5") is True
         assert requires_manual_cache("openai/gpt-5.2") is False
 
+    def test_rate_governor_caps_concurrency_across_threads(self):
+        from src.llm_client import RateGovernor
+        gov = RateGovernor(limits={"openrouter": {"concurrency": 2}}, max_wait=10)
+        lock = threading.Lock()
+        ativos = [0]
+        pico = [0]
+
+        def chamada():
+            with gov.acquire("openrouter", "x/model", 100):
+                with lock:
+                    ativos[0] += 1
+                    pico[0] = max(pico[0], ativos[0])
+                time.sleep(0.03)
+                with lock:
+                    ativos[0] -= 1
+
+        threads = [threading.Thread(target=chamada) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        metrics = gov.get_metrics()["openrouter"]
+        assert pico[0] == 2
+        assert metrics["requests"] == 8
+        assert metrics["in_flight"] == 0
+        assert metrics["waited_requests"] > 0
+
+    def test_rate_governor_rpm_bucket_waits_and_records_queue_time(self):
+        from src.llm_client import RateGovernor
+        gov = RateGovernor(limits={"openai:gpt-5.2": {"rpm": 60}}, max_wait=5)
+        gov.acquire("openai", "gpt-5.2").__exit__(None, None, None)
+        gov._keys["openai:gpt-5.2"].rpm.tokens = 0.0  # esgota o bucket
+        start = time.monotonic()
+        with gov.acquire("openai", "gpt-5.2"):
+            pass
+        assert time.monotonic() - start >= 0.5
+        metrics = gov.get_metrics()
+        assert metrics["openai:gpt-5.2"]["wait_max_s"] >= 0.5
+        assert metrics["openai"]["requests"] == 2
+        # Modelo sem limite configurado não cria chave própria
+        with gov.acquire("openai", "gpt-4.1"):
+            pass
+        assert "openai:gpt-4.1" not in gov.get_metrics()
+
+    def test_rate_governor_honours_retry_after_from_openrouter(self):
+        import httpx
+        from src.llm_client import OpenRouterClient, RateGovernor
+
+        gov = RateGovernor(limits={}, max_wait=5)
+        respostas = [
+            httpx.Response(429, headers={"retry-after": "0.4"}, json={"error": {"message": "rate limited"}}),
+            httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}],
+                                      "usage": {"total_tokens": 12}}),
+        ]
+        client = OpenRouterClient(api_key="test-key")
+        client._client = httpx.Client(transport=httpx.MockTransport(lambda req: respostas.pop(0)))
+
+        with patch("src.llm_client.get_rate_governor", return_value=gov):
+            with pytest.raises(httpx.HTTPStatusError):
+                # Uma só tentativa (sem o backoff do tenacity)
+                client._make_request.__wrapped__(client, "anthropic/claude-opus-4.6",
+                                                 [{"role": "user", "content": "x"}])
+            assert gov.get_metrics()["openrouter"]["throttled_429"] == 1
+            assert gov.get_metrics()["openrouter"]["blocked_for_s"] > 0
+            start = time.monotonic()
+            data = client._make_request("anthropic/claude-opus-4.6", [{"role": "user", "content": "x"}])
+            assert time.monotonic() - start >= 0.3
+
+        assert data["usage"]["total_tokens"] == 12
+        assert gov.get_metrics()["openrouter"]["requests"] == 2
+
+    def test_chat_hedged_substitute_wins_and_loser_is_reported(self):
+        from src.llm_client import UnifiedLLMClient, LLMResponse
+
+        client = UnifiedLLMClient(openai_api_key="k", openrouter_api_key="k")
+        libertar = threading.Event()
+
+        def fake_chat_simple(model, prompt, **kwargs):
+            if model == "slow/primary":
+                libertar.wait(5)
+            return LLMResponse(content=f"resposta {model}", model=model, role="assistant",
+                               prompt_tokens=100, completion_tokens=50, total_tokens=150)
+
+        descartados = []
+        with patch.object(client, "chat_simple", side_effect=fake_chat_simple):
+            resp, vencedor = client.chat_hedged(
+                primary={"model": "slow/primary", "prompt": "p"},
+                hedge={"model": "fast/sub", "prompt": "p"},
+                hedge_after_s=0.05,
+                on_discarded=lambda m, r: descartados.append((m, r.total_tokens)),
+            )
+            assert vencedor == "fast/sub"
+            assert resp.content == "resposta fast/sub"
+            libertar.set()
+            deadline = time.monotonic() + 5
+            while not descartados and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        assert descartados == [("slow/primary", 150)]  # custo do perdedor contabilizado
+        stats = client.get_stats()["hedging"]
+        assert stats["hedges_launched"] == 1 and stats["hedge_wins"] == 1
+        client.close()
+
+    def test_chat_hedged_no_duplicate_when_fast_or_budget_exhausted(self):
+        from src.llm_client import UnifiedLLMClient, LLMResponse
+
+        client = UnifiedLLMClient(openai_api_key="k", openrouter_api_key="k")
+        chamados = []
+
+        def fake_chat_simple(model, prompt, **kwargs):
+            chamados.append(model)
+            if model == "slow/primary":
+                time.sleep(0.15)
+            return LLMResponse(content="ok", model=model, role="assistant")
+
+        with patch.object(client, "chat_simple", side_effect=fake_chat_simple):
+            _, vencedor = client.chat_hedged(
+                primary={"model": "fast/primary", "prompt": "p"},
+                hedge={"model": "fast/sub", "prompt": "p"}, hedge_after_s=1.0,
+            )
+            assert vencedor == "fast/primary"
+            _, vencedor = client.chat_hedged(
+                primary={"model": "slow/primary", "prompt": "p"},
+                hedge={"model": "fast/sub", "prompt": "p"}, hedge_after_s=0.01,
+                allow_hedge=lambda: False,
+            )
+            assert vencedor == "slow/primary"
+
+        assert chamados == ["fast/primary", "slow/primary"]
+        assert client.get_stats()["hedging"]["hedges_launched"] == 0
+        client.close()
+
 
 # ============================================================
 # 5. COST CONTROLLER TESTS
@@ -640,6 +773,54 @@ class TestCostController:
         assert pricing["input"] == HARDCODED_PRICING["default"]["input"]
         assert pricing["output"] == HARDCODED_PRICING["default"]["output"]
 
+    def test_price_index_matches_linear_heuristics(self):
+        """_PriceIndex (normalized map + trie + memo) resolves exactly like the old linear scans."""
+        import random
+        from src.cost_controller import DynamicPricing, _PriceIndex
+
+        def linear_lookup(cache, model_clean):
+            if model_clean in cache:
+                return model_clean
+            model_norm = DynamicPricing._normalize(model_clean)
+            for key in cache:
+                if DynamicPricing._normalize(key) == model_norm:
+                    return key
+            best_key, best_len_diff = None, float("inf")
+            model_name = model_clean.split("/")[-1]
+            for key in cache:
+                key_name = key.split("/")[-1]
+                if key_name.startswith(model_name) or model_name.startswith(key_name):
+                    diff = abs(len(key) - len(model_clean))
+                    if diff < 5 and diff < best_len_diff:
+                        best_len_diff, best_key = diff, key
+            return best_key
+
+        rng = random.Random(7)  # noqa: S311 — dados de teste, não criptografia
+        providers = ["openai/", "anthropic/", "google/", "x-ai/", "qwen/", ""]
+        names = ["gpt-5", "gpt-5-nano", "gpt-5-mini", "gpt-5.2", "gpt-5.2-pro", "gpt-4o", "gpt-4o-mini",
+                 "claude-3.5-haiku", "claude-3-5-haiku", "claude-opus-4.6", "gemini-2.5-flash",
+                 "gemini-2.5-pro", "grok-4", "qwen3-max", "o1", "o1-pro"]
+        cache = {}
+        for _ in range(300):
+            key = rng.choice(providers) + rng.choice(names) + rng.choice(["", "", "-preview", ":free", "-2", "_x"])
+            cache.setdefault(key, {"input": 1.0, "output": 2.0})
+        index = _PriceIndex(cache)
+        queries = list(cache) + [
+            rng.choice(providers) + rng.choice(names)[:rng.randint(0, 14)] + rng.choice(["", "-1", ".5", "-b"])
+            for _ in range(2000)
+        ]
+        for q in queries:
+            assert index.resolve(q) == linear_lookup(cache, q), q
+            assert index.resolve(q) == linear_lookup(cache, q), q  # memoizado
+
+    def test_lookup_hardcoded_memoized(self):
+        """Hardcoded resolution is memoized and keeps closest-length substring match."""
+        from src.cost_controller import DynamicPricing, HARDCODED_PRICING
+        assert DynamicPricing._lookup_hardcoded("openai/gpt-4o") == HARDCODED_PRICING["openai/gpt-4o"]
+        assert DynamicPricing._lookup_hardcoded("openai/gpt-4o-mini-v2") == HARDCODED_PRICING["openai/gpt-4o-mini"]
+        assert DynamicPricing._lookup_hardcoded("zzz/unknown") == HARDCODED_PRICING["default"]
+        assert DynamicPricing._hardcoded_resolved["openai/gpt-4o-mini-v2"] == "openai/gpt-4o-mini"
+
     def test_register_usage_zero_tokens(self):
         """register_usage with 0 tokens works without error."""
         from src.cost_controller import CostController
@@ -807,24 +988,22 @@ class TestConcurrency:
     """Tests for thread safety of shared data structures."""
 
     def test_active_user_analyses_concurrent_access(self):
-        """_active_user_analyses dict handles concurrent reads/writes."""
-        from main import _active_user_analyses
+        """Per-user job guard admits exactly one holder under concurrent acquires."""
+        from src.pipeline.jobs import InMemoryJobStore
+        store = InMemoryJobStore()
         errors = []
-        # Save initial state and restore after test
-        original = dict(_active_user_analyses)
-        _active_user_analyses.clear()
+        vencedores = []
 
-        def writer(user_id, count):
+        def worker(holder):
             try:
-                for i in range(count):
-                    _active_user_analyses[f"{user_id}_{i}"] = f"analysis_{i}"
-                    time.sleep(0.001)
-                    _active_user_analyses.pop(f"{user_id}_{i}", None)
+                if store.acquire_user("user_x", holder, ttl=60) is None:
+                    vencedores.append(holder)
+                assert not store.release_user("user_x", f"outro_{holder}")
             except Exception as e:
                 errors.append(e)
 
         threads = [
-            threading.Thread(target=writer, args=(f"user_{t}", 50))
+            threading.Thread(target=worker, args=(f"job_{t}",))
             for t in range(10)
         ]
         for t in threads:
@@ -832,36 +1011,43 @@ class TestConcurrency:
         for t in threads:
             t.join(timeout=10)
 
-        _active_user_analyses.clear()
-        _active_user_analyses.update(original)
         assert len(errors) == 0, f"Errors during concurrent access: {errors}"
+        assert len(vencedores) == 1
+        assert store.active_users() == {"user_x": vencedores[0]}
+        assert store.release_user("user_x", vencedores[0])
+        assert store.acquire_user("user_x", "job_novo", ttl=60) is None
 
     def test_blacklist_cache_thread_safety(self):
-        """_blacklist_cache handles concurrent reads safely."""
-        from main import _blacklist_cache, _blacklist_lock
+        """Blacklist snapshot is read lock-free while refreshes swap it."""
+        import main
+        from src.utils.blacklist import compilar_blacklist
         errors = []
-        original_loaded_at = _blacklist_cache["loaded_at"]
+        original = main._blacklist_snapshot
 
         def reader(count):
             try:
                 for _ in range(count):
-                    with _blacklist_lock:
-                        _ = _blacklist_cache["emails"].copy()
-                        _ = _blacklist_cache["ips"].copy()
-                        _ = _blacklist_cache["domains"].copy()
+                    snapshot = main._blacklist_snapshot
+                    _ = snapshot.ip_bloqueado("1.2.3.4")
+                    _ = snapshot.email_bloqueado("a@b.com")
+                    _ = snapshot.dominio_bloqueado("a@b.com")
             except Exception as e:
                 errors.append(e)
 
+        def writer(count):
+            for i in range(count):
+                main._blacklist_snapshot = compilar_blacklist([{"type": "ip", "value": f"1.2.3.{i % 255}"}])
+
         threads = [
             threading.Thread(target=reader, args=(100,))
             for _ in range(10)
-        ]
+        ] + [threading.Thread(target=writer, args=(100,))]
         for t in threads:
             t.start()
         for t in threads:
             t.join(timeout=10)
 
-        _blacklist_cache["loaded_at"] = original_loaded_at
+        main._blacklist_snapshot = original
         assert len(errors) == 0, f"Errors during concurrent read: {errors}"
 
     def test_token_cache_eviction(self):
@@ -962,6 +1148,91 @@ class TestConcurrency:
 
         assert len(errors) == 0, f"Errors during concurrent pricing lookup: {errors}"
 
+    def test_register_usage_never_blocks_on_price_refresh(self):
+        """Expired cache: register_usage returns immediately, a single fetch runs in background."""
+        from src.cost_controller import CostController, DynamicPricing
+        DynamicPricing.wait_for_refresh(timeout=20)
+        DynamicPricing.reset()
+        release = threading.Event()
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            release.wait(10)
+            return False
+
+        with patch.object(DynamicPricing, "fetch_openrouter_prices", side_effect=slow_fetch):
+            controller = CostController(run_id="swr_test", budget_limit_usd=1_000.0)
+            t0 = time.perf_counter()
+            threads = [
+                threading.Thread(target=controller.register_usage, args=(f"t{i}", "openai/gpt-5.2", 100, 50))
+                for i in range(20)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(timeout=5)
+            elapsed = time.perf_counter() - t0
+            release.set()
+            assert DynamicPricing.wait_for_refresh(timeout=5)
+
+        assert elapsed < 2.0
+        assert len(calls) == 1  # single-flight
+        assert len(controller.usage.phases) == 20
+        assert all(p.pricing_source == "hardcoded" for p in controller.usage.phases)
+
+    def test_price_snapshot_persisted_and_loaded_at_startup(self, tmp_path):
+        """Successful fetch is persisted and reloaded (stale) after a restart."""
+        from datetime import timezone
+        from src.cost_controller import DynamicPricing
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"data": [
+            {"id": "openai/gpt-5.2", "pricing": {"prompt": "0.000002", "completion": "0.00001"}},
+        ]}
+        client = MagicMock()
+        client.__enter__.return_value.get.return_value = response
+        snapshot = tmp_path / "prices.json"
+        DynamicPricing.wait_for_refresh(timeout=20)
+
+        with patch.object(DynamicPricing, "SNAPSHOT_PATH", snapshot), \
+                patch("src.cost_controller.httpx.Client", return_value=client):
+            assert DynamicPricing.fetch_openrouter_prices()
+            assert snapshot.exists()
+
+            # "Reinício": cache vazio, snapshot ainda não carregado
+            DynamicPricing.reset()
+            DynamicPricing._snapshot_loaded = False
+            pricing = DynamicPricing.get_pricing("openai/gpt-5.2")
+            assert pricing["input"] == 2.0
+            assert pricing["output"] == 10.0
+            assert pricing["fonte"] == "openrouter_live"
+
+            # Snapshot expirado: continua a servir o preço (stale) sem bloquear
+            DynamicPricing._cache_timestamp = datetime.now(timezone.utc) - timedelta(hours=30)
+            with patch.object(DynamicPricing, "fetch_openrouter_prices", return_value=False):
+                pricing = DynamicPricing.get_pricing("openai/gpt-5.2")
+                DynamicPricing.wait_for_refresh(timeout=5)
+            assert pricing["input"] == 2.0
+            assert pricing["fonte"].startswith("cache_")
+
+            # Chamadas concorrentes ao primeiro carregamento esperam pelo snapshot
+            DynamicPricing.reset()
+            DynamicPricing._snapshot_loaded = False
+            conteudo = snapshot.read_text(encoding="utf-8")
+            disco_lento = MagicMock()
+            disco_lento.read_text.side_effect = lambda **kw: time.sleep(0.1) or conteudo
+
+            resultados = []
+            with patch.object(DynamicPricing, "SNAPSHOT_PATH", disco_lento), \
+                    patch.object(DynamicPricing, "refresh_async"):
+                threads = [threading.Thread(target=lambda: resultados.append(
+                    DynamicPricing.get_pricing("openai/gpt-5.2")["input"])) for _ in range(4)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+            assert resultados == [2.0] * 4
+
 
 # ============================================================
 # 8. ENGINE EDGE CASES
@@ -1370,3 +1641,1718 @@ class TestStress:
                 p = DynamicPricing.get_pricing("openai/gpt-5.2")
                 assert p["fonte"] == "hardcoded"
                 assert p["input"] == 1.75
+
+
+# ============================================================
+# LEGAL VERIFIER (PGDL) TESTS — no network
+# ============================================================
+
+class TestLegalVerifier:
+    """Tests for src/legal_verifier.py with a temporary SQLite DB."""
+
+    def _make_verifier(self, tmp_path, **kwargs):
+        from src.legal_verifier import LegalVerifier
+        verifier = LegalVerifier(db_path=tmp_path / "legislacao_test.db", **kwargs)
+        # Qualquer chamada HTTP é um erro nestes testes
+        verifier._http_client = MagicMock()
+        verifier._http_client.get.side_effect = AssertionError("network access")
+        return verifier
+
+    def test_offline_verification_reads_snapshot(self, tmp_path):
+        """Offline mode verifies from the local snapshot without touching the network."""
+        verifier = self._make_verifier(tmp_path, offline=True)
+        verifier._save_snapshot_articles(775, None, {"1", "483", "1022"})
+        verifier.flush()
+        citacao = verifier.normalizar_citacao("artigo 1022º do Código Civil")
+        result = verifier.verificar_citacao(citacao)
+        assert result.status == "aprovado"
+        assert verifier.get_stats()["snapshot_hits"] == 1
+        verifier._http_client.get.assert_not_called()
+
+    def test_offline_without_snapshot_is_attention(self, tmp_path):
+        """Offline mode without snapshot returns 'atencao', never network."""
+        verifier = self._make_verifier(tmp_path, offline=True)
+        citacao = verifier.normalizar_citacao("artigo 131º do Código Penal")
+        result = verifier.verificar_citacao(citacao)
+        assert result.status == "atencao"
+        verifier._http_client.get.assert_not_called()
+
+    def test_snapshot_survives_restart(self, tmp_path):
+        """A new verifier instance reuses the persisted snapshot."""
+        first = self._make_verifier(tmp_path, offline=False)
+        with patch.object(first, "_fetch_pgdl_articles", return_value={"1", "2"}) as fetch:
+            assert first._load_pgdl_articles(109) == {"1", "2"}
+            assert fetch.call_count == 1
+        first.flush()
+        second = self._make_verifier(tmp_path, offline=False)
+        assert second._load_pgdl_articles(109) == {"1", "2"}
+
+    def test_expired_current_snapshot_used_when_pgdl_down(self, tmp_path):
+        """Stale snapshot of the current version is a fallback when PGDL fails."""
+        import sqlite3
+        verifier = self._make_verifier(tmp_path, offline=False)
+        verifier._save_snapshot_articles(109, None, {"131"})
+        verifier.flush()
+        with sqlite3.connect(str(verifier.db_path)) as conn:
+            conn.execute("UPDATE pgdl_articles_snapshot SET fetched_at = '2000-01-01T00:00:00+00:00'")
+        assert verifier._load_snapshot_articles(109, None) is None
+        with patch.object(verifier, "_fetch_pgdl_articles", return_value=None):
+            assert verifier._load_pgdl_articles(109) == {"131"}
+
+    def test_refresh_and_import_snapshot(self, tmp_path):
+        """refresh_snapshot stores articles + history; import_snapshot copies them."""
+        from datetime import timezone
+        source = self._make_verifier(tmp_path, offline=False)
+        versions = [
+            (1, "Lei 1/2000", datetime(2000, 1, 1, tzinfo=timezone.utc)),
+            (2, "Lei 2/2010", datetime(2010, 1, 1, tzinfo=timezone.utc)),
+        ]
+        with patch.object(source, "_fetch_pgdl_articles", return_value={"1", "2", "3"}), \
+                patch.object(source, "_fetch_version_history", return_value=versions):
+            resumo = source.refresh_snapshot(nids=[775], incluir_historico=True)
+        assert resumo["diplomas"] == 1
+        assert resumo["versoes"] == 1
+        assert resumo["falhados"] == []
+
+        target_dir = tmp_path / "target"
+        target_dir.mkdir()
+        target = self._make_verifier(target_dir, offline=True)
+        counts = target.import_snapshot(source.db_path)
+        assert counts["pgdl_articles_snapshot"] == 2
+        assert target._load_pgdl_articles(775, 1) == {"1", "2", "3"}
+        assert [v[0] for v in target._load_version_history(775)] == [1, 2]
+        assert target.snapshot_info()["diplomas"] == 1
+
+    def test_verificar_multiplas_dedup_and_order(self, tmp_path):
+        """Batch verification fetches each diploma once and keeps input order."""
+        from datetime import timezone
+        verifier = self._make_verifier(tmp_path, offline=False)
+        verifier._last_discovery = datetime.now(timezone.utc)
+        arts = {775: {"483", "1022"}, 109: {"131"}}
+        calls = []
+
+        def fake_fetch(nid, nversao=None):
+            calls.append((nid, nversao))
+            return arts[nid]
+
+        textos = [
+            "artigo 483º do Código Civil",
+            "artigo 131º do Código Penal",
+            "artigo 483º do Código Civil",
+            "artigo 9999º do Código Civil",
+        ]
+        citacoes = [verifier.normalizar_citacao(t) for t in textos]
+        with patch.object(verifier, "_fetch_pgdl_articles", side_effect=fake_fetch):
+            results = verifier.verificar_multiplas(citacoes)
+
+        assert sorted(calls) == [(109, None), (775, None)]
+        assert [r.citacao for r in results] == citacoes
+        assert [r.status for r in results] == ["aprovado", "aprovado", "aprovado", "rejeitado"]
+        batch = verifier.get_stats()["batch"]
+        assert batch["lotes"] == 1
+        assert batch["duplicadas"] == 1
+        assert batch["ultimo_lote"]["unicas"] == 3
+        assert batch["downloads_prefetch"] == 2
+
+    def test_storage_uses_wal_and_covering_index(self, tmp_path):
+        """Persistent connection runs in WAL mode; cache lookup uses the covering index."""
+        verifier = self._make_verifier(tmp_path)
+        try:
+            assert verifier._db.fetchone("PRAGMA journal_mode")[0] == "wal"
+            plan = verifier._db.fetchall(
+                "EXPLAIN QUERY PLAN SELECT texto, fonte, timestamp, hash FROM legislacao_cache "
+                "WHERE diploma = ? AND artigo = ? AND timestamp > datetime('now', '-30 days')",
+                ("Código Civil", "1º"),
+            )
+            assert any("COVERING INDEX idx_cache_lookup" in row[-1] for row in plan)
+        finally:
+            verifier.close()
+
+    def test_write_behind_cache_visible_after_flush(self, tmp_path):
+        """_guardar_cache is queued and becomes readable after flush()."""
+        from src.legal_verifier import VerificacaoLegal
+        verifier = self._make_verifier(tmp_path)
+        citacao = verifier.normalizar_citacao("artigo 483º do Código Civil")
+        verifier._guardar_cache(citacao, VerificacaoLegal(
+            citacao=citacao, existe=True, texto_encontrado="Artigo 483º", fonte="pgdl_online",
+        ))
+        verifier.flush()
+        cached = verifier._verificar_cache(citacao)
+        assert cached is not None and cached.existe is True
+        verifier.close()
+
+    def test_benchmark_cache_lookups_8_threads(self, tmp_path):
+        """8-thread lookup benchmark completes without 'database is locked'."""
+        from src.legal_verifier import benchmark_cache_lookups
+        result = benchmark_cache_lookups(
+            db_path=tmp_path / "bench.db", threads=8, lookups_per_thread=200, num_entradas=50,
+        )
+        assert result["erros"] == []
+        assert result["hits"] == result["lookups"]
+        assert result["lookups_por_segundo"] > 0
+
+    def test_temporal_cache_keyed_by_resolved_version(self, tmp_path):
+        """Facts-dated runs hit the cache per (diploma, artigo, nversao)."""
+        from datetime import timezone
+        versions = [
+            (1, "Lei 1/2000", datetime(2000, 1, 1, tzinfo=timezone.utc)),
+            (2, "Lei 2/2010", datetime(2010, 1, 1, tzinfo=timezone.utc)),
+            (3, "Versão actual", datetime(2020, 1, 1, tzinfo=timezone.utc)),
+        ]
+        arts = {None: {"483"}, 1: {"483"}, 2: {"483", "484"}}
+
+        first = self._make_verifier(tmp_path, offline=False)
+        first._last_discovery = datetime.now(timezone.utc)
+        first.set_data_factos(datetime(2005, 6, 1, tzinfo=timezone.utc))
+        citacao = first.normalizar_citacao("artigo 483º do Código Civil")
+        with patch.object(first, "_fetch_version_history", return_value=versions), \
+                patch.object(first, "_fetch_pgdl_articles", side_effect=lambda nid, nv=None: arts[nv]):
+            online = first.verificar_citacao(citacao)
+        assert online.fonte == "pgdl_online_temporal"
+        assert online.existe_data_factos is True and online.existe_actual is True
+        first.flush()
+
+        # Nova instância, outra data na MESMA versão (v1): servida do cache
+        second = self._make_verifier(tmp_path, offline=False)
+        second.set_data_factos(datetime(2008, 3, 15, tzinfo=timezone.utc))
+        with patch.object(second, "_fetch_pgdl_articles", side_effect=AssertionError("fetch")):
+            cached = second.verificar_citacao(citacao)
+        assert cached.fonte.startswith("cache_local")
+        assert cached.status == online.status
+        assert cached.versao_data_factos == online.versao_data_factos
+        assert "Data factos (15/03/2008)" in cached.mensagem
+        assert second.get_stats()["cache_hits_temporal"] == 1
+
+        # Data que resolve para outra versão (v2): falha de cache, vai ao PGDL
+        second.set_data_factos(datetime(2015, 1, 1, tzinfo=timezone.utc))
+        with patch.object(second, "_fetch_pgdl_articles", side_effect=lambda nid, nv=None: arts[nv]) as fetch:
+            second.verificar_citacao(citacao)
+        assert fetch.called
+
+    def test_extrair_citacoes_matches_golden_corpus(self):
+        """Single-pass extractor reproduces the frozen output of the 3-pattern version."""
+        import json
+        from src.legal_verifier import LegalVerifier
+        golden_path = Path(__file__).parent / "tests" / "fixtures" / "citacoes_golden.json"
+        golden = json.loads(golden_path.read_text(encoding="utf-8"))
+        verifier = LegalVerifier.__new__(LegalVerifier)
+        campos = ("diploma", "artigo", "numero", "alinea", "texto_original", "texto_normalizado")
+        for caso in golden:
+            obtido = [{k: getattr(c, k) for k in campos} for c in verifier.extrair_citacoes(caso["texto"])]
+            assert obtido == caso["citacoes"], caso["texto"][:80]
+
+    def test_identificar_diploma_keeps_pattern_priority(self):
+        """Prefix-gated lookup keeps DIPLOMA_PATTERNS order (first pattern wins)."""
+        from src.legal_verifier import LegalVerifier
+        verifier = LegalVerifier.__new__(LegalVerifier)
+        # "cpc" aparece antes no texto, mas "código civil" tem prioridade no dict
+        assert verifier._identificar_diploma("cpc e código civil") == "Código Civil"
+        assert verifier._identificar_diploma("dl 48/2011") == "Decreto-Lei n.º 48/2011"
+        assert verifier._identificar_diploma("sem diploma") is None
+
+    def test_failed_write_batch_keeps_valid_rows(self, tmp_path):
+        """A failing statement in a deferred batch only drops its own row."""
+        from src.legal_verifier import LegislacaoDB
+        db = LegislacaoDB(tmp_path / "lote.db")
+        try:
+            db.execute_now("CREATE TABLE t (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+            db.write_many("INSERT INTO t VALUES (?, ?)", [("a", "1"), ("b", None), ("c", "3")])
+            db.write("INSERT INTO t VALUES (?, ?)", ("d", "4"))
+            db.flush(timeout=5)
+            assert db.fetchall("SELECT k FROM t ORDER BY k") == [("a",), ("c",), ("d",)]
+            assert db.escritas_perdidas == 1
+        finally:
+            db.close()
+
+    def test_benchmark_extracao_citacoes(self):
+        """Extraction benchmark runs offline and reports throughput."""
+        from src.legal_verifier import benchmark_extracao_citacoes
+        result = benchmark_extracao_citacoes(tamanho=50_000)
+        assert result["citacoes"] > 0
+        assert result["mb_por_segundo"] > 0
+
+
+# ============================================================
+# CHECKPOINTS — WRITE-BEHIND
+# ============================================================
+
+class _FakeSupabase:
+    """Cliente Supabase mínimo: regista operações, com latência configurável."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.ops = []
+        self.rows = {}  # (analysis_id, fase_num) → linha de analysis_checkpoints
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        fake = self
+
+        class _Query:
+            def __init__(self):
+                self.op = None
+                self.filtros = {}
+
+            def update(self, data):
+                self.op = (name, "update", data)
+                return self
+
+            def upsert(self, row, on_conflict=None):
+                self.op = (name, "upsert", row)
+                return self
+
+            def select(self, cols):
+                self.op = (name, "select", [c.strip() for c in cols.split(",")])
+                return self
+
+            def eq(self, col, valor):
+                self.filtros[col] = valor
+                return self
+
+            def order(self, col):
+                return self
+
+            def execute(self):
+                time.sleep(fake.delay)
+                with fake._lock:
+                    fake.ops.append(self.op)
+                    _, tipo, arg = self.op
+                    if tipo == "upsert":
+                        fake.rows[(arg["analysis_id"], arg["fase_num"])] = dict(arg)
+                    if tipo == "select":
+                        linhas = [
+                            {c: r.get(c) for c in arg} for r in sorted(fake.rows.values(), key=lambda r: r["fase_num"])
+                            if all(r.get(k) == v for k, v in self.filtros.items())
+                        ]
+                        return MagicMock(data=linhas)
+                return MagicMock(data=[])
+
+        return _Query()
+
+
+class TestCheckpointWriter:
+    """Tests for src/pipeline/checkpoint_writer.py and LexForumProcessor._save_checkpoint."""
+
+    def _processor(self, tmp_path, analysis_id):
+        from src.pipeline.processor import LexForumProcessor
+        proc = LexForumProcessor.__new__(LexForumProcessor)
+        proc._analysis_id = analysis_id
+        proc._run_id = f"run-{analysis_id}"
+        proc._user_id = "user-1"
+        proc._output_dir = tmp_path
+        return proc
+
+    def test_save_checkpoint_does_not_wait_for_network_and_keeps_order(self, tmp_path):
+        import json
+        from src.pipeline.checkpoint_codec import decode_payload
+        from src.pipeline.checkpoint_writer import CheckpointWriter
+
+        sb = _FakeSupabase(delay=0.1)
+        writer = CheckpointWriter(max_workers=2, supabase_factory=lambda: sb)
+        proc = self._processor(tmp_path, "analysis-aaaa-1111")
+
+        with patch("src.pipeline.checkpoint_writer.get_checkpoint_writer", return_value=writer):
+            start = time.monotonic()
+            for fase in (1, 2, 3):
+                proc._save_checkpoint(fase, f"fase{fase}", {"n": fase}, phase_data={"texto": "x" * 1000 * fase})
+            assert time.monotonic() - start < 0.1  # 6 chamadas de rede de 0.1s ficaram em background
+            assert writer.flush("analysis-aaaa-1111", timeout=10)
+
+        upserts = [op[2] for op in sb.ops if op[1] == "upsert"]
+        assert [u["fase_num"] for u in upserts] == [1, 2, 3]  # entrega ordenada
+        assert decode_payload(upserts[2]["phase_data"]) == {"texto": "x" * 3000}
+        local = json.loads((tmp_path / "checkpoint_fase2.json").read_text(encoding="utf-8"))
+        assert local["resumo"] == {"n": 2}
+        metrics = writer.get_metrics()
+        assert metrics["persisted"] == 3 and metrics["pending"] == 0
+        assert metrics["lag_ms_max"] >= 200  # a 3.ª fase esperou pelas duas anteriores
+        writer.shutdown()
+
+    def test_analyses_persist_in_parallel_and_flush_all(self, tmp_path):
+        from src.pipeline.checkpoint_writer import CheckpointWriter, CheckpointJob
+
+        sb = _FakeSupabase(delay=0.15)
+        writer = CheckpointWriter(max_workers=4, supabase_factory=lambda: sb)
+        start = time.monotonic()
+        for aid in ("a1-xxxxxxxx", "a2-xxxxxxxx", "a3-xxxxxxxx"):
+            local, remote = writer.serialize({"fase_num": 1}, {"k": aid}, None)
+            writer.submit(CheckpointJob(aid, None, None, 1, "extracao", None, local, remote))
+        assert writer.flush(timeout=10)
+        # 3 análises × 2 operações × 0.15s em série seriam 0.9s
+        assert time.monotonic() - start < 0.6
+        assert len(sb.ops) == 6
+        writer.shutdown()
+
+    def test_synchronous_mode_and_compressed_local_file(self, tmp_path):
+        import gzip
+        import json
+        from src.pipeline.checkpoint_writer import CheckpointWriter
+
+        writer = CheckpointWriter(synchronous=True, supabase_factory=lambda: _FakeSupabase())
+        proc = self._processor(tmp_path, None)  # sem analysis_id: só ficheiro local
+        with patch("src.pipeline.checkpoint_writer.get_checkpoint_writer", return_value=writer), \
+                patch("src.config.CHECKPOINT_COMPRESS_LOCAL", True):
+            proc._save_checkpoint(1, "extracao", {"extractores": 3}, phase_data={"big": "y" * 10_000})
+        data = json.loads(gzip.decompress((tmp_path / "checkpoint_fase1.json.gz").read_bytes()))
+        assert data["resumo"] == {"extractores": 3}
+        assert writer.get_metrics()["persisted"] == 1
+
+
+class TestCheckpointCodec:
+    """Tests for src/pipeline/checkpoint_codec.py (compressão, dedup, resume lazy)."""
+
+    def test_encode_decode_roundtrip_and_legacy_payloads(self):
+        from src.pipeline.checkpoint_codec import decode_payload, encode_payload, is_encoded
+
+        dados = {"consolidado_f1": "Facto provado. " * 2000, "lista": [{"a": 1}, "curto"], "n": 3}
+        env, novos = encode_payload(dados, 1, {}, codec="gzip", min_chars=1000)
+        assert is_encoded(env) and len(novos) == 1
+        assert decode_payload(env) == dados
+        assert len(str(env)) < len(str(dados)) / 10
+        legado = {"consolidado_f1": "texto antigo"}
+        assert decode_payload(legado) is legado
+
+    def test_blobs_deduplicated_across_phases_and_resume_is_lazy(self):
+        from src.pipeline.checkpoint_codec import LazyCheckpoints, tamanho_envelope
+        from src.pipeline.checkpoint_writer import CheckpointJob, CheckpointWriter
+
+        agregado = "Artigo 483.º do Código Civil — responsabilidade. " * 500
+        sb = _FakeSupabase()
+        writer = CheckpointWriter(synchronous=True, supabase_factory=lambda: sb, codec="gzip", blob_min_chars=1000)
+        fases = {
+            1: ({"consolidado_f1": agregado, "bruto_f1": agregado}, {"documento_text": "doc " * 2000, "tier": "gold"}),
+            2: ({"consolidado_f2": agregado, "bruto_f2": "auditoria " * 300}, None),
+            3: ({"respostas_qa": ["sim"]}, None),
+        }
+        for fase, (dados, contexto) in fases.items():
+            _, remote = writer.serialize({"fase_num": fase}, dados, contexto)
+            # O writer só comprime: nada é re-serializado nem re-lido fora da thread do pipeline
+            with patch("src.pipeline.checkpoint_codec.json") as json_codec, \
+                    patch("src.pipeline.checkpoint_writer.json") as json_writer:
+                writer.submit(CheckpointJob("analysis-dedup", None, "u1", fase, f"f{fase}", None, b"", remote))
+            assert json_codec.mock_calls == [] and json_writer.mock_calls == []
+
+        m = writer.get_metrics()
+        assert m["blobs_deduped"] == 1  # o agregado da fase 1 é referenciado pela fase 2
+        assert m["remote_stored_bytes"] < m["remote_raw_bytes"] / 5
+        assert sb.rows[("analysis-dedup", 2)]["phase_data"]["refs"]
+
+        sb.ops.clear()
+        lazy = LazyCheckpoints(sb, "analysis-dedup")
+        assert list(lazy) == [1, 2, 3] and lazy.last_phase == 3 and 2 in lazy
+        assert lazy.rows_fetched == 0  # só a lista de fases foi lida
+        assert lazy[3] == {"respostas_qa": ["sim"]}
+        assert lazy.rows_fetched == 1
+        assert lazy.bytes_fetched == tamanho_envelope(sb.rows[("analysis-dedup", 3)]["phase_data"])
+        assert lazy[2]["consolidado_f2"] == agregado  # blob resolvido na linha da fase 1
+        assert lazy.rows_fetched == 3
+        assert lazy.pipeline_context()["tier"] == "gold"
+        writer.shutdown()
+
+
+class TestArtefactStore:
+    """Tests for src/pipeline/artefact_store.py."""
+
+    def test_compact_ndjson_and_pending_reads(self, tmp_path):
+        from src.pipeline.artefact_store import ArtefactStore
+
+        store = ArtefactStore()
+        bloqueio = threading.Event()
+        store.write_text(tmp_path / "lento.md", lambda: bloqueio.wait(5) and "# ok")
+        items = [{"item_id": i, "value": "Artigo 483.º"} for i in range(50)]
+        store.write_items(tmp_path / "fase1_extractor_E1_items.json", items)
+        store.write_json(tmp_path / "resultado.json", {"run_id": "r1"}, extra_paths=(tmp_path / "hist" / "r1.json",))
+
+        # Ainda em fila (a thread está presa no 1.º job): leitura vem da memória
+        assert store.read_json(tmp_path / "fase1_extractor_E1_items.json") == items
+        assert store.exists(tmp_path / "resultado.json")
+        assert not store.flush(tmp_path, timeout=0.05)
+        bloqueio.set()
+        assert store.flush(tmp_path, timeout=5)
+
+        ndjson = (tmp_path / "fase1_extractor_E1_items.ndjson").read_text(encoding="utf-8")
+        assert len(ndjson.splitlines()) == 50 and "\n  " not in ndjson
+        assert (tmp_path / "resultado.json").read_text(encoding="utf-8") == '{"run_id":"r1"}'
+        assert (tmp_path / "hist" / "r1.json").exists()
+        assert store.read_json(tmp_path / "fase1_extractor_E1_items.json") == items
+        assert (tmp_path / "lento.md").read_text(encoding="utf-8") == "# ok"
+        assert store.get_metrics()["files"] == 4
+
+    def test_compressed_artefacts_are_resolved_by_logical_name(self, tmp_path):
+        from src.pipeline.artefact_store import ArtefactStore, nome_logico
+        from src.pipeline.meta_integrity import MetaIntegrityValidator
+
+        store = ArtefactStore(compress=True, synchronous=True)
+        store.write_json(tmp_path / "fase1_coverage_report.json", {"coverage_percent": 97.5})
+        store.write_items(tmp_path / "fase1_extractor_E1_items.json", [{"a": 1}])
+        assert (tmp_path / "fase1_coverage_report.json.gz").exists()
+        assert store.read_json(tmp_path / "fase1_coverage_report.json") == {"coverage_percent": 97.5}
+        assert store.read_json(tmp_path / "fase1_extractor_E1_items.json") == [{"a": 1}]
+        assert nome_logico("fase1_extractor_E1_items.ndjson.gz") == "fase1_extractor_E1_items.json"
+
+        with patch("src.pipeline.meta_integrity.get_artefact_store", return_value=store):
+            validator = MetaIntegrityValidator(run_id="r1", output_dir=tmp_path)
+            validator._check_files()
+            assert validator._load_json("fase1_coverage_report.json") == {"coverage_percent": 97.5}
+        assert "fase1_coverage_report.json" in validator.report.files_check.present
+
+        # Leitores fora do pipeline também resolvem a variante .gz
+        from src.perguntas.pipeline_perguntas import carregar_fase1_existente
+        store.write_text(tmp_path / "run1" / "fase1_agregado.md", "# Fase 1")
+        assert (tmp_path / "run1" / "fase1_agregado.md.gz").exists()
+        with patch("src.perguntas.pipeline_perguntas.get_artefact_store", return_value=store):
+            assert carregar_fase1_existente("run1", tmp_path) == "# Fase 1"
+
+    def test_writer_thread_registers_exit_flush(self, tmp_path):
+        from src.pipeline.artefact_store import ArtefactStore
+
+        store = ArtefactStore()
+        with patch("src.pipeline.artefact_store.atexit.register") as registar:
+            store.write_text(tmp_path / "a.md", "a")
+            store.write_text(tmp_path / "b.md", "b")
+        registar.assert_called_once_with(store._flush_at_exit)
+        store._flush_at_exit()
+        assert (tmp_path / "b.md").read_text(encoding="utf-8") == "b"
+
+
+class TestRunIndex:
+    """Tests for src/utils/run_index.py and the listings it serves."""
+
+    def test_index_bootstraps_from_folders_then_tracks_updates(self, tmp_path):
+        from src.utils.metadata_manager import (
+            atualizar_metadata, contar_analises_sem_titulo, guardar_metadata, listar_analises_com_titulos,
+        )
+        from src.utils.run_index import RunIndex
+
+        for run_id in ("20260101_100000_aaaaaaaa", "20260301_100000_bbbbbbbb", "20260201_100000_cccccccc"):
+            (tmp_path / run_id).mkdir()
+        (tmp_path / "temp_upload").mkdir()
+
+        with patch("src.utils.run_index._indices", {}):
+            guardar_metadata("20260201_100000_cccccccc", tmp_path, "Contrato de arrendamento")
+            analises = listar_analises_com_titulos(tmp_path)
+            # Metadata guardada agora → data de criação mais recente
+            assert [a[0] for a in analises] == [
+                "20260201_100000_cccccccc", "20260301_100000_bbbbbbbb", "20260101_100000_aaaaaaaa",
+            ]
+            assert analises[2][1].startswith("[Sem título]")
+            assert contar_analises_sem_titulo(tmp_path) == 2
+
+            # Actualizações passam pelo índice, sem novo varrimento
+            with patch.object(RunIndex, "reconstruir", side_effect=AssertionError("varrimento")):
+                atualizar_metadata("20260101_100000_aaaaaaaa", tmp_path, titulo="Herança")
+                titulos = {run_id: titulo for run_id, titulo, _ in listar_analises_com_titulos(tmp_path)}
+                assert titulos["20260101_100000_aaaaaaaa"].startswith("Herança (")
+                pagina = listar_analises_com_titulos(tmp_path, limite=1, offset=2)
+                assert pagina[0][0] == "20260301_100000_bbbbbbbb"
+                assert contar_analises_sem_titulo(tmp_path) == 1
+
+                # Pasta apagada fora da aplicação desaparece da listagem
+                import shutil
+                shutil.rmtree(tmp_path / "20260301_100000_bbbbbbbb")
+                assert len(listar_analises_com_titulos(tmp_path)) == 2
+
+    def test_listar_runs_and_cached_folder_sizes(self, tmp_path):
+        from src.pipeline.artefact_store import ArtefactStore
+        from src.pipeline.processor import LexForumProcessor
+        from src.utils.cleanup import get_folder_size
+        from src.utils.run_index import RunIndex, resumo_resultado
+
+        indice = RunIndex(tmp_path)
+        indice.reconstruir()
+        for i, veredicto in enumerate(["PROCEDENTE", "IMPROCEDENTE"]):
+            run_id = f"2026010{i + 1}_120000_0000000{i}"
+            (tmp_path / run_id).mkdir()
+            indice.registar_run(run_id, estado="running")
+            indice.registar_run(run_id, **resumo_resultado({
+                "timestamp_inicio": f"2026-01-0{i + 1}T12:00:00", "documento": {"filename": "a.pdf"},
+                "veredicto_final": veredicto, "perguntas_utilizador": ["q"], "sucesso": True,
+            }))
+        indice.registar_run("20260105_120000_00000009", estado="running")  # sem resultado
+
+        proc = LexForumProcessor.__new__(LexForumProcessor)
+        with patch("src.pipeline.processor.get_run_index", return_value=indice):
+            runs = proc.listar_runs()
+            assert [r["veredicto"] for r in runs] == ["IMPROCEDENTE", "PROCEDENTE"]
+            assert proc.listar_runs(limite=1, offset=1)[0]["run_id"] == "20260101_120000_00000000"
+
+        pasta = tmp_path / "temp_x"
+        pasta.mkdir()
+        (pasta / "f.bin").write_bytes(b"x" * 1000)
+        assert get_folder_size(pasta) == 1000
+        with patch("pathlib.Path.rglob", side_effect=AssertionError("recalculou")):
+            assert get_folder_size(pasta) == 1000  # cache válida (mtime igual)
+        (pasta / "g.bin").write_bytes(b"y" * 500)
+        assert get_folder_size(pasta) == 1500
+
+        # Escrita numa subpasta não muda o mtime da run: o writer invalida a cache
+        (pasta / "fase1").mkdir()
+        assert get_folder_size(pasta) == 1500
+        ArtefactStore(synchronous=True).write_text(pasta / "fase1" / "log.md", "z" * 200)
+        assert get_folder_size(pasta) == 1700
+        indice.close()
+
+
+class TestSecuritySnapshots:
+    """Tests for the blacklist/JWKS snapshots read by the security middleware."""
+
+    def test_compiled_blacklist_and_check_never_touches_supabase(self):
+        import main
+        from fastapi import HTTPException
+        from src.utils.blacklist import compilar_blacklist
+
+        snapshot = compilar_blacklist([
+            {"type": "ip", "value": "1.2.3.4"},
+            {"type": "ip", "value": "10.0.0.0/8"},
+            {"type": "ip", "value": "not-a-net/99"},
+            {"type": "email", "value": " Spam@Example.com "},
+            {"type": "domain", "value": "evil.org"},
+        ])
+        assert snapshot.total == 4
+        assert snapshot.ip_bloqueado("1.2.3.4") and snapshot.ip_bloqueado("10.20.30.40")
+        assert not snapshot.ip_bloqueado("11.0.0.1") and not snapshot.ip_bloqueado("::1")
+        assert snapshot.email_bloqueado("spam@example.com")
+        assert snapshot.dominio_bloqueado("a@mail.evil.org") == "evil.org"
+        assert snapshot.dominio_bloqueado("a@notevil.org") is None
+        tld = compilar_blacklist([{"type": "domain", "value": "pt"}, {"type": "domain", "value": "co.uk"}])
+        assert tld.dominio_bloqueado("a@tribunal.pt") is None  # TLD sozinho não bloqueia subdomínios
+        assert tld.dominio_bloqueado("a@x.co.uk") == "co.uk"
+
+        request = MagicMock()
+        with patch.object(main, "_blacklist_snapshot", snapshot), \
+             patch.object(main, "get_supabase_admin", side_effect=AssertionError("Supabase no pedido")), \
+             patch.object(main, "get_remote_address", return_value="10.1.1.1"):
+            with pytest.raises(HTTPException) as exc:
+                main._check_blacklist(request)
+            assert exc.value.status_code == 403
+
+        with patch.object(main, "_blacklist_snapshot", snapshot), \
+             patch.object(main, "get_remote_address", return_value="8.8.8.8"):
+            main._check_blacklist(request)
+            with pytest.raises(HTTPException):
+                main._check_blacklist(request, {"email": "x@sub.evil.org"})
+
+        # Falha no refresh mantém o snapshot anterior
+        with patch.object(main, "_blacklist_snapshot", snapshot), \
+             patch.object(main, "get_supabase_admin", side_effect=RuntimeError("offline")):
+            assert main._load_blacklist() is snapshot
+
+    def test_jwks_snapshot_served_without_network(self):
+        import auth_service
+
+        chaves = ({"kid": "k1", "kty": "EC", "use": "sig"},)
+        with patch.object(auth_service, "_jwks_keys", chaves), \
+             patch.object(auth_service, "_jwks_fetched_at", time.time()), \
+             patch.object(auth_service, "_jwks_attempted_at", time.time()), \
+             patch.object(auth_service.httpx, "get", side_effect=AssertionError("rede no pedido")):
+            assert auth_service._fetch_jwks() == list(chaves)
+
+        # Snapshot expirado: devolve as chaves antigas e agenda refresh em background
+        with patch.object(auth_service, "_jwks_keys", chaves), \
+             patch.object(auth_service, "_jwks_fetched_at", 1.0), \
+             patch.object(auth_service, "_jwks_attempted_at", 1.0), \
+             patch.object(auth_service, "_refresh_jwks_background") as agendar, \
+             patch.object(auth_service.httpx, "get", side_effect=AssertionError("rede no pedido")):
+            assert auth_service._fetch_jwks() == list(chaves)
+            agendar.assert_called_once()
+
+
+class TestAnalysisJobs:
+    """Tests for src/pipeline/jobs.py (in-process backend) and the /analyze submission path."""
+
+    @staticmethod
+    def _backend():
+        from src.pipeline.jobs import InMemoryJobStore, InProcessJobBackend
+        return InProcessJobBackend(InMemoryJobStore(), max_workers=1, user_lock_ttl=60)
+
+    def test_job_runs_with_progress_events_and_releases_user(self):
+        import asyncio
+        from src.engine import InvalidDocumentError
+
+        def fake_analise(**kwargs):
+            assert kwargs["file_bytes"] == b"%PDF" and kwargs["analysis_id"] == "an-1"
+            kwargs["callback_progresso"]("fase1", 10, "M1")
+            kwargs["callback_progresso"]("fase2", 60, "Auditores")
+            return MagicMock(sucesso=True, to_dict=lambda: {"run_id": "r1", "raw": b"xx"})
+
+        backend = self._backend()
+        params = {"user_id": "user-1", "filename": "a.pdf", "area_direito": "Civil", "perguntas_raw": "",
+                  "titulo": "", "tier": "bronze", "analysis_id": "an-1", "doc_id": None}
+        with patch("src.engine.executar_analise_documento", side_effect=fake_analise), \
+             patch("src.pipeline.jobs._guardar_documento_analise") as guardar, \
+             patch("src.pipeline.jobs.marcar_documento_erro"):
+            job_id, _ = backend.reservar_utilizador("user-1")
+            assert backend.reservar_utilizador("user-1") == (None, job_id)
+            backend.submit(job_id, "analyze", params, b"%PDF")
+            job = asyncio.run(backend.aguardar(job_id, timeout=10))
+
+        assert job["state"] == "done" and job["progresso"] == 100
+        assert job["result"] == {"run_id": "r1"}  # bytes removidos
+        guardar.assert_called_once()
+        eventos = backend.events(job_id)
+        assert [(e["seq"], e["fase"]) for e in eventos] == [(1, "fase1"), (2, "fase2")]
+        assert backend.events(job_id, after=1)[0]["mensagem"] == "Auditores"
+        assert "result" not in backend.status(job_id)
+        assert backend.store.active_users() == {}
+
+        # Erros do engine ficam registados com o código HTTP que a API devolve
+        with patch("src.engine.executar_analise_documento", side_effect=InvalidDocumentError("vazio")), \
+             patch("src.pipeline.jobs.marcar_documento_erro") as marcar:
+            job_id, _ = backend.reservar_utilizador("user-1")
+            backend.submit(job_id, "analyze", dict(params, doc_id="doc-9"), b"%PDF")
+            job = asyncio.run(backend.aguardar(job_id, timeout=10))
+        assert job["state"] == "failed"
+        assert job["error"] == {"status_code": 422, "detail": "vazio"}
+        marcar.assert_called_once_with("doc-9")
+        assert backend.store.active_users() == {}
+        backend.shutdown()
+
+    def test_analyze_endpoint_submits_job_and_guards_user(self):
+        from fastapi.testclient import TestClient
+
+        import main
+
+        backend = self._backend()
+        main.app.dependency_overrides[main.get_current_user] = lambda: {"id": "user-2", "email": "u@x.pt"}
+        sb = MagicMock()
+        sb.table.return_value.insert.return_value.execute.return_value = MagicMock(data=[{"id": "doc-1"}])
+        try:
+            with patch.object(main, "get_job_backend", return_value=backend), \
+                 patch.object(main, "get_supabase_admin", return_value=sb), \
+                 patch.object(backend, "_enqueue") as enqueue:
+                main.limiter.reset()
+                client = TestClient(main.app)
+                resp = client.post("/analyze", files={"file": ("a.pdf", b"%PDF-1.4", "application/pdf")},
+                                   data={"aguardar": "false"})
+                assert resp.status_code == 202
+                job_id = resp.json()["job_id"]
+                _, kind, params, file_bytes = enqueue.call_args[0]
+                assert (kind, params["doc_id"], file_bytes) == ("analyze", "doc-1", b"%PDF-1.4")
+
+                # Segundo pedido do mesmo utilizador enquanto o job corre
+                resp = client.post("/analyze", files={"file": ("b.pdf", b"%PDF", "application/pdf")})
+                assert resp.status_code == 429
+
+                backend.store.add_event(job_id, "fase1", 20, "M3")
+                eventos = client.get(f"/jobs/{job_id}/events").json()
+                assert eventos["next"] == 1 and eventos["events"][0]["progresso"] == 20
+                assert client.get(f"/jobs/{job_id}").json()["state"] == "queued"
+
+                # Ficheiro inválido: o lock do utilizador é libertado
+                backend.store.release_user("user-2", job_id)
+                resp = client.post("/analyze", files={"file": ("a.exe", b"MZ", "application/octet-stream")})
+                assert resp.status_code == 422
+                assert backend.store.active_users() == {}
+        finally:
+            main.app.dependency_overrides.clear()
+            main.limiter.reset()
+            backend.shutdown()
+
+    def test_partial_results_streamed_over_sse_and_resumable(self):
+        import asyncio
+        import json
+        from src.pipeline.processor import LexForumProcessor
+
+        def fake_analise(**kwargs):
+            proc = LexForumProcessor.__new__(LexForumProcessor)
+            proc.callback_parcial = kwargs["callback_parcial"]
+            kwargs["callback_progresso"]("fase1", 40, "M7")
+            proc._publicar_parcial(1, "extracao", {"consolidado_f1": "# Factos", "bruto_f1": "x" * 5000})
+            proc._publicar_parcial(2, "auditoria", {"consolidado_f2": "# Auditoria",
+                                                    "audit_reports": [MagicMock(to_dict=lambda: {"auditor_id": "A1"})]})
+            return MagicMock(sucesso=True, to_dict=lambda: {"run_id": "r2"})
+
+        def mensagens(chunks):
+            return [dict(linha.split(": ", 1) for linha in c.strip().split("\n")) for c in chunks if not c.startswith(":")]
+
+        async def recolher(backend, job_id, after):
+            return [c async for c in backend.stream(job_id, after, intervalo=0.01)]
+
+        backend = self._backend()
+        params = {"user_id": "user-3", "filename": "a.pdf", "area_direito": "Civil", "perguntas_raw": "",
+                  "titulo": "", "tier": "bronze", "analysis_id": "an-3", "doc_id": None}
+        try:
+            with patch("src.engine.executar_analise_documento", side_effect=fake_analise), \
+                 patch("src.pipeline.jobs._guardar_documento_analise"), \
+                 patch("src.pipeline.jobs.marcar_documento_erro"):
+                job_id, _ = backend.reservar_utilizador("user-3")
+                backend.submit(job_id, "analyze", params, b"%PDF")
+                todas = mensagens(asyncio.run(recolher(backend, job_id, 0)))
+        finally:
+            backend.shutdown()
+
+        assert [m["event"] for m in todas] == ["progresso", "parcial", "parcial", "done"]
+        assert [m.get("id") for m in todas] == ["1", "2", "3", None]
+        fase1 = json.loads(todas[1]["data"])
+        assert fase1["dados"] == {"consolidado_f1": "# Factos"}  # o bruto fica só no checkpoint
+        assert fase1["fase"] == "fase1" and fase1["progresso"] == 40
+        assert json.loads(todas[2]["data"])["dados"]["audit_reports"] == [{"auditor_id": "A1"}]
+        assert json.loads(todas[3]["data"])["result"] == {"run_id": "r2"}
+
+        # Reconexão com Last-Event-ID = 2: só o que faltou
+        retoma = mensagens(asyncio.run(recolher(backend, job_id, 2)))
+        assert [(m["event"], m.get("id")) for m in retoma] == [("parcial", "3"), ("done", None)]
+
+
+    def test_concurrent_events_get_unique_seq_and_reads_are_by_seq(self):
+        import asyncio
+        from src.pipeline.jobs import MAX_EVENTOS_JOB, InMemoryJobStore, InProcessJobBackend
+
+        store = InMemoryJobStore()
+        store.create("j1", "analyze", "u1")
+        threads = [threading.Thread(target=lambda: [store.add_event("j1", "fase1", i, "m") for i in range(100)])
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert [e["seq"] for e in store.events("j1")] == list(range(1, 801))
+        assert [e["seq"] for e in store.events("j1", 797)] == [798, 799, 800]
+
+        # Acima do limite só ficam os parciais: a leitura continua por seq
+        for _ in range(MAX_EVENTOS_JOB):
+            store.add_event("j1", "fase2", 50, "m")
+        parcial = store.add_event("j1", "fase2", 60, "p", dados={"x": 1})
+        assert [e["seq"] for e in store.events("j1", MAX_EVENTOS_JOB - 1)] == [MAX_EVENTOS_JOB, parcial]
+
+        # O stream só carrega o job (com resultado) quando está final
+        store.update("j1", state="done", result={"run_id": "r"})
+        backend = InProcessJobBackend(store, max_workers=1, user_lock_ttl=60)
+        try:
+            with patch.object(backend, "status", wraps=backend.status) as status:
+                chunks = asyncio.run(self._recolher(backend, "j1", parcial))
+        finally:
+            backend.shutdown()
+        assert status.call_count == 1 and chunks[-1].startswith("event: done")
+
+    def test_dead_worker_job_is_closed_and_wait_is_bounded(self):
+        import asyncio
+        from src.pipeline import jobs
+        from src.pipeline.jobs import InMemoryJobStore, RedisJobStore, _JobBackendBase
+
+        with pytest.raises(TypeError):
+            _JobBackendBase(InMemoryJobStore())
+
+        backend = self._backend()
+        job_id, _ = backend.reservar_utilizador("user-4")
+        backend.store.create(job_id, "analyze", "user-4", analysis_id="an-4", document_id="doc-4")
+        backend.store.update(job_id, state="running", worker="celery@w1")
+
+        # Worker morto a meio (sem o finally de executar_job): task_failure no processo principal
+        with patch.object(jobs, "get_job_backend", return_value=backend), \
+             patch.object(jobs, "marcar_documento_interrompido") as interrompido:
+            if jobs.celery_app is not None:
+                jobs._on_task_failure(sender=jobs.analysis_job_task, task_id=job_id,
+                                      exception=RuntimeError("WorkerLostError"))
+            else:
+                jobs.interromper_job(backend.store, job_id, "worker perdido")
+            assert not jobs.interromper_job(backend.store, job_id, "de novo")
+        interrompido.assert_called_once()
+        assert interrompido.call_args[0][0]["document_id"] == "doc-4"
+        job = backend.store.get(job_id)
+        assert job["state"] == "failed" and job["error"]["status_code"] == 503
+        assert backend.store.active_users() == {}
+
+        # Espera com limite: devolve o job ainda em curso
+        backend.store.create("j-lento", "analyze", "user-5")
+        job = asyncio.run(backend.aguardar("j-lento", timeout=0.05))
+        assert job["state"] == "queued"
+        backend.shutdown()
+
+        # Upload guardado em bytes crus no cliente binário
+        texto, binario = MagicMock(), MagicMock()
+        store = RedisJobStore(texto, client_bytes=binario)
+        store.put_upload("j1", b"%PDF\xff\xfe")
+        binario.set.assert_called_once_with("lexforum:job:j1:upload", b"%PDF\xff\xfe", ex=86400)
+        texto.set.assert_not_called()
+
+    @staticmethod
+    async def _recolher(backend, job_id, after):
+        return [c async for c in backend.stream(job_id, after, intervalo=0.01)]
+
+
+class TestStageGraph:
+    """Tests for src/pipeline/stage_graph.py (pipeline DAG scheduler)."""
+
+    def test_independent_stages_overlap_and_critical_path(self):
+        import time as _t
+        from src.pipeline.stage_graph import Stage, StageGraph, StageScheduler
+
+        def dormir(ms, saida):
+            def fn(v):
+                _t.sleep(ms / 1000)
+                return {saida: (v, ms)}
+            return fn
+
+        grafo = StageGraph([
+            Stage("fase4", dormir(10, "decisao"), ("relatorio",), ("decisao",)),
+            Stage("fase1", dormir(60, "relatorio"), ("texto",), ("relatorio",)),
+            Stage("prefetch", dormir(60, "leis"), ("texto",), ("leis",), critico=False),
+            Stage("verificacao", dormir(5, "verificacoes"), ("decisao", "leis"), ("verificacoes",)),
+        ])
+        assert grafo.ordem.index("fase1") < grafo.ordem.index("fase4") < grafo.ordem.index("verificacao")
+
+        valores, report = StageScheduler(max_workers=2).run(grafo, {"texto": "doc"})
+        assert valores["verificacoes"][0] == {"decisao": valores["decisao"], "leis": valores["leis"]}
+        spans = {s.nome: s for s in report.spans}
+        # fase1 e prefetch sobrepõem-se
+        assert spans["prefetch"].inicio_ms < spans["fase1"].fim_ms
+        assert report.total_ms < report.soma_ms
+        assert report.caminho_critico[-1] == "verificacao"
+        assert report.to_dict()["estagios"][0]["nome"] in ("fase1", "prefetch")
+
+    def test_cycle_and_failures(self):
+        from src.pipeline.stage_graph import Stage, StageGraph, StageScheduler
+
+        with pytest.raises(ValueError, match="Ciclo"):
+            StageGraph([Stage("a", dict, ("y",), ("x",)), Stage("b", dict, ("x",), ("y",))])
+        with pytest.raises(ValueError, match="produzido por"):
+            StageGraph([Stage("a", dict, (), ("x",)), Stage("b", dict, (), ("x",))])
+
+        def falhar(v):
+            raise RuntimeError("sem rede")
+
+        chamados = []
+        grafo = StageGraph([
+            Stage("opcional", falhar, (), ("leis",), critico=False),
+            Stage("uso", lambda v: chamados.append(v) or {"ok": True}, ("leis",), ("ok",)),
+        ])
+        valores, report = StageScheduler(max_workers=1).run(grafo)
+        assert chamados == [{"leis": None}] and valores["ok"] is True
+        assert [s.ok for s in sorted(report.spans, key=lambda s: s.inicio_ms)] == [False, True]
+
+        grafo = StageGraph([
+            Stage("fase1", falhar, (), ("relatorio",)),
+            Stage("fase2", lambda v: chamados.append("fase2"), ("relatorio",), ()),
+        ])
+        with pytest.raises(RuntimeError, match="sem rede") as exc:
+            StageScheduler(max_workers=2).run(grafo)
+        assert "fase2" not in chamados
+        assert exc.value.stage_report.spans[0].erro == "RuntimeError: sem rede"
+
+
+class TestTriageQuorum:
+    """Tests for quorum early-exit and the keyword pre-classifier in src/pipeline/triage.py."""
+
+    def test_majority_returns_without_waiting_for_straggler(self):
+        from src.pipeline.triage import TriageProcessor
+
+        def chat_simple(model, **kwargs):
+            if "llama" in model:
+                time.sleep(0.6)
+                return MagicMock(content='{"domain": "Penal"}', prompt_tokens=100, completion_tokens=10)
+            return MagicMock(content='{"domain": "Civil", "keywords": ["renda"]}', prompt_tokens=100,
+                             completion_tokens=10)
+
+        cost = MagicMock()
+        proc = TriageProcessor(MagicMock(chat_simple=MagicMock(side_effect=chat_simple)), cost_controller=cost)
+        inicio = time.monotonic()
+        result = proc.run("Documento sem termos característicos.", filename="a.pdf")
+        assert time.monotonic() - inicio < 0.4
+        assert result.domain == "Civil" and result.consensus == "majority"
+        assert result.early_exit is True and result.skipped_models == ["T3"]
+        assert set(result.votes) == {"T1", "T2"}
+        assert result.method == "llm"
+
+        # O straggler termina em background: custo registado, voto ignorado
+        time.sleep(0.8)
+        fases = sorted(c.kwargs["phase"] for c in cost.register_usage.call_args_list)
+        assert fases == ["triage_T1", "triage_T2", "triage_T3"]
+        assert set(result.votes) == {"T1", "T2"}
+
+    def test_keyword_preclassifier_skips_llm_when_unambiguous(self):
+        from src.pipeline.triage import TriageProcessor, get_triage_metrics, pre_classificar
+
+        texto = (
+            "Processo comum singular. O Ministério Público deduziu acusação contra o arguido "
+            "pela prática de um crime de furto, p. e p. pelo art. 203.º do Código Penal. "
+            "O arguido prestou declarações; o ofendido apresentou queixa. Nos termos do "
+            "Código de Processo Penal, o arguido foi condenado em pena de prisão. Ver fotografia n.º 23."
+        )
+        dominio, confianca, pontos, termos = pre_classificar(texto)
+        assert dominio == "Penal" and confianca > 0.9 and pontos["Penal"] >= 12
+
+        llm = MagicMock()
+        antes = get_triage_metrics()["por_metodo"].get("keywords", 0)
+        result = TriageProcessor(llm).run(texto)
+        llm.chat_simple.assert_not_called()
+        assert result.method == "keywords" and result.domain == "Penal"
+        assert result.photo_estimate == 23 and result.photo_warning == "warning"
+        assert get_triage_metrics()["por_metodo"]["keywords"] == antes + 1
+
+        # Texto misto: o pré-classificador não decide, vai para os modelos
+        assert pre_classificar("O trabalhador e o arguido; contrato de trabalho; crime.")[1] < 0.8
+
+
+class TestIncrementalJsonParser:
+    """Tests for src/pipeline/json_stream.py and the streamed extractor path."""
+
+    DOC = {
+        "items": [
+            {"item_type": "date", "value_normalized": f"2024-01-{i:02d}",
+             "raw_text": 'a "citação" \\ {x} [y], z:', "offset_start": i, "offset_end": i + 10}
+            for i in range(1, 13)
+        ],
+        "unreadable_sections": [{"offset_start": 1, "offset_end": 5, "reason": "ilegível"}],
+        "status": "to_be_continued",
+        "last_item_id": 12,
+    }
+
+    def _chunk(self):
+        from src.pipeline.schema_unified import Chunk, ExtractionMethod
+        texto = "x" * 200
+        return Chunk(doc_id="doc", chunk_id="doc_c0000", chunk_index=0, total_chunks=1,
+                     start_char=0, end_char=len(texto), overlap=0, text=texto,
+                     method=ExtractionMethod.TEXT)
+
+    def test_items_emitted_as_objects_close_across_split_feeds(self):
+        import json
+        from src.pipeline.json_stream import IncrementalItemParser
+
+        texto = "Aqui está:\n```json\n" + json.dumps(self.DOC, ensure_ascii=False, indent=2) + "\n```"
+        vistos = []
+        parser = IncrementalItemParser(on_item=vistos.append)
+        emitidos = []
+        # Pedaços de 3 chars: escapes, aspas e chavetas partidos entre deltas
+        for i in range(0, len(texto), 3):
+            emitidos.extend(parser.feed(texto[i:i + 3]))
+            if 0 < len(emitidos) < len(self.DOC["items"]):
+                assert not parser.completo  # items disponíveis antes do fim do texto
+        parser.finish()
+
+        assert emitidos == vistos == self.DOC["items"]
+        assert parser.unreadable == self.DOC["unreadable_sections"]
+        assert parser.completo and not parser.truncado
+        assert parser.continuacao == 12
+        assert parser.chars == len(texto)
+        assert len(parser._texto) < 300  # texto já consumido é descartado
+
+        # Array na raiz com marcador de controlo
+        arr = json.dumps([{"type": "date", "content": "2024-01-01"}, {"status": "to_be_continued", "last_item_id": 1}])
+        p2 = IncrementalItemParser()
+        p2.feed(arr)
+        assert p2.finish().items == [{"type": "date", "content": "2024-01-01"}]
+        assert p2.continuacao == 1
+
+    def test_truncated_stream_keeps_complete_items_and_continues(self):
+        import json
+        from src.pipeline.extractor_unified import parse_unified_output, recursive_extraction
+        from src.pipeline.json_stream import parse_items_text
+
+        completo = json.dumps({"items": self.DOC["items"]})
+        cortado = completo[:completo.index('"2024-01-08"')]
+        parser = parse_items_text(cortado)
+        assert parser.truncado and len(parser.items) == 7
+
+        items, unreadable, errors = parse_unified_output(cortado, self._chunk(), "E1", "m", parser=parser)
+        assert [i.value_normalized for i in items] == [f"2024-01-{d:02d}" for d in range(1, 8)]
+        assert errors == []
+
+        # Output completo: o mesmo resultado que sem parser explícito
+        com, _, _ = parse_unified_output(completo, self._chunk(), "E1", "m")
+        assert len(com) == 12
+
+        # recursive_extraction retoma depois do último item completo
+        prompts = []
+
+        def chat_simple(prompt, stream_consumer=None, **kwargs):
+            prompts.append(prompt)
+            conteudo = cortado if len(prompts) == 1 else json.dumps({"items": self.DOC["items"][7:]})
+            stream_consumer.reset()
+            stream_consumer.feed(conteudo)
+            return MagicMock(content=conteudo)
+
+        todos, _, _ = recursive_extraction(MagicMock(chat_simple=chat_simple), "m", self._chunk(),
+                                           "Civil", "E1", "sys")
+        assert len(prompts) == 2 and "item ID 8" in prompts[1]
+        assert len(todos) == 12
+
+    def test_brackets_in_preamble_are_not_taken_as_root(self):
+        import json
+        from src.pipeline.extractor_unified import parse_unified_output
+        from src.pipeline.json_stream import IncrementalItemParser
+
+        corpo = json.dumps({"items": self.DOC["items"][:3]})
+        texto = "Segue o resultado [JSON] {ver abaixo}:\n```json\n" + corpo + "\n```"
+        parser = IncrementalItemParser()
+        for i in range(0, len(texto), 2):
+            parser.feed(texto[i:i + 2])
+        parser.finish()
+        assert parser.utilizavel and parser.items == self.DOC["items"][:3]
+
+        items, _, errors = parse_unified_output(texto, self._chunk(), "E1", "m")
+        assert len(items) == 3 and errors == []
+
+        # "[{" na prosa ainda engana o parser: 0 items → cadeia de extracção
+        texto = "Formato: [{...}]\n```json\n" + corpo + "\n```"
+        items, _, _ = parse_unified_output(texto, self._chunk(), "E1", "m")
+        assert [i.value_normalized for i in items] == ["2024-01-01", "2024-01-02", "2024-01-03"]
+
+    def test_openrouter_stream_feeds_consumer_and_returns_full_response(self):
+        import json
+        import httpx
+        from src.llm_client import OpenRouterClient
+        from src.pipeline.json_stream import IncrementalItemParser
+
+        texto = json.dumps({"items": self.DOC["items"][:3]})
+        linhas = [": OPENROUTER PROCESSING", ""]
+        for i in range(0, len(texto), 20):
+            chunk = {"model": "google/gemini-3-pro", "choices": [{"delta": {"content": texto[i:i + 20]}}]}
+            linhas += [f"data: {json.dumps(chunk)}", ""]
+        linhas += [
+            "data: " + json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}],
+                                   "usage": {"prompt_tokens": 10, "completion_tokens": 30, "total_tokens": 40}}),
+            "", "data: [DONE]", "",
+        ]
+        pedidos = []
+
+        def responder(req):
+            pedidos.append(json.loads(req.content))
+            return httpx.Response(200, text="\n".join(linhas), headers={"content-type": "text/event-stream"})
+
+        client = OpenRouterClient(api_key="test-key")
+        client._client = httpx.Client(transport=httpx.MockTransport(responder))
+        parser = IncrementalItemParser()
+        resp = client.chat_simple("google/gemini-3-pro", "extrai", stream_consumer=parser)
+
+        assert pedidos[0]["stream"] is True
+        assert resp.success and resp.content == texto and resp.finish_reason == "stop"
+        assert resp.total_tokens == 40
+        assert parser.completo and parser.items == self.DOC["items"][:3]
+
+
+class TestStructuredOutput:
+    """Tests for src/pipeline/structured_output.py and the response_format path in UnifiedLLMClient."""
+
+    def test_schemas_follow_dataclasses_and_roles(self):
+        from src.pipeline.structured_output import SCHEMAS, schema_for_role
+
+        audit = SCHEMAS["auditoria"]["schema"]
+        finding = audit["properties"]["findings"]["items"]
+        assert finding["properties"]["severity"]["enum"] == ["critico", "alto", "medio", "baixo"]
+        assert set(finding["required"]) == {"finding_id", "claim", "finding_type", "severity", "citations"}
+        # Campos preenchidos pelo pipeline não são pedidos ao modelo
+        assert "auditor_id" not in audit["properties"] and "timestamp" not in audit["properties"]
+        citation = finding["properties"]["citations"]["items"]
+        assert citation["properties"]["page_num"]["type"] == ["integer", "null"]
+
+        assert schema_for_role("auditor_2_json") is SCHEMAS["auditoria"]
+        assert schema_for_role("auditor_5_json_senior") is SCHEMAS["auditoria"]
+        assert schema_for_role("relator_3_json") is SCHEMAS["parecer"]
+        assert schema_for_role("presidente_json_fallback_1") is SCHEMAS["decisao"]
+        assert schema_for_role("consolidador_json") is SCHEMAS["consolidacao"]
+        assert schema_for_role("extrator_E1_chunk0") is SCHEMAS["extraccao"]
+        for role in ("auditor_1", "presidente", "agregador", "curador_senior"):
+            assert schema_for_role(role) is None
+
+    def test_schema_sent_when_supported_and_dropped_when_rejected(self):
+        import json
+        import httpx
+        from src.llm_client import UnifiedLLMClient
+        from src.pipeline.structured_output import SCHEMAS, get_structured_output_metrics
+
+        pedidos = []
+
+        def responder(req):
+            body = json.loads(req.content)
+            pedidos.append(body)
+            if "response_format" in body and body["model"].startswith("google/gemini-old"):
+                return httpx.Response(400, json={"error": {"message": "response_format not supported"}})
+            return httpx.Response(200, json={"choices": [{"message": {"content": '{"findings": []}'},
+                                                          "finish_reason": "stop"}],
+                                             "usage": {"total_tokens": 5}})
+
+        client = UnifiedLLMClient(openai_api_key="k", openrouter_api_key="k")
+        client.openrouter_client._client = httpx.Client(transport=httpx.MockTransport(responder))
+        schema = SCHEMAS["auditoria"]
+
+        resp = client.chat_simple("google/gemini-3-pro", "p", response_schema=schema)
+        assert resp.success and resp.estruturado
+        assert pedidos[-1]["response_format"]["json_schema"]["name"] == "audit_report"
+
+        # Provider sem suporte declarado: schema não é enviado
+        resp = client.chat_simple("anthropic/claude-opus-4.6", "p", response_schema=schema)
+        assert "response_format" not in pedidos[-1] and not resp.estruturado
+
+        # Provider recusa o schema: repete sem ele
+        antes = get_structured_output_metrics()["schema_rejeitado"].get("google/gemini-old", 0)
+        n = len(pedidos)
+        resp = client.chat_simple("google/gemini-old", "p", response_schema=schema)
+        assert resp.success and len(pedidos) == n + 2
+        assert not resp.estruturado  # a resposta usada veio da repetição sem schema
+        assert "response_format" in pedidos[n] and "response_format" not in pedidos[n + 1]
+        assert get_structured_output_metrics()["schema_rejeitado"]["google/gemini-old"] == antes + 1
+
+        # Outros 400 não são rejeição do schema (nem se repetem sem ele)
+        from src.llm_client import _schema_rejeitado
+        assert _schema_rejeitado("Client error '400 Bad Request' | {\"error\": \"Invalid schema for response_format\"}")
+        assert _schema_rejeitado("Client error '422 Unprocessable Entity' | output schema not supported")
+        assert not _schema_rejeitado("Client error '400 Bad Request' | maximum context length is 128000 tokens")
+        assert not _schema_rejeitado("Client error '400 Bad Request' | x-ai/grok-9 is not a valid model ID")
+
+    def test_parse_outcomes_and_retries_are_tracked_per_role(self):
+        from src.pipeline.schema_audit import parse_audit_report
+        from src.pipeline.structured_output import get_structured_output_metrics, registar_chamada
+
+        def papel():
+            return get_structured_output_metrics()["papeis"].get("A9", {})
+
+        base = dict(papel())
+        puro = '{"findings": [{"finding_id": "F1", "claim": "x", "finding_type": "facto", "severity": "alto", "citations": []}]}'
+        assert len(parse_audit_report(puro, "A9", "m", "r").findings) == 1
+        parse_audit_report("Aqui está:\n```json\n" + puro + "\n```", "A9", "m", "r")
+        parse_audit_report("sem json nenhum", "A9", "m", "r")
+        m = papel()
+        assert m["parse_directo"] == base.get("parse_directo", 0) + 1
+        assert m["parse_reparado"] == base.get("parse_reparado", 0) + 1
+        assert m["parse_falhou"] == base.get("parse_falhou", 0) + 1
+
+        registar_chamada("A9", estruturado=True, retries=0)
+        registar_chamada("A9", estruturado=False, retries=2, falhas_json=1)
+        m = papel()
+        assert m["chamadas_schema"] == base.get("chamadas_schema", 0) + 1
+        assert m["retries_livres"] == base.get("retries_livres", 0) + 2
+        assert m["falhas_json_livres"] == base.get("falhas_json_livres", 0) + 1
+        assert 0 < m["taxa_falha_parse"] <= 1
+
+
+class TestEntityLockScanner:
+    """Tests for the single-pass scanner and interval index in m5_entity_lock."""
+
+    TEXTO = (
+        "Em 12/03/2021 o réu (NIF 123456789) pagou 12.500,00 € nos termos do art. 483º, n.º 1 "
+        "do Código Civil. Proc. n.º 1234/21.5TBLSB; Lei n.º 23/2007; desde 5 de janeiro de 2020, "
+        "EUR 250,50 e 3.000 euros."
+    )
+
+    def test_single_pass_matches_separate_patterns(self):
+        from src.pipeline import m5_entity_lock as m5
+
+        esperado = {
+            (tipo, mt.start(), mt.end())
+            for tipo, padrao in m5._PADROES_REGEX
+            for mt in padrao.finditer(self.TEXTO)
+        }
+        bounds = {1: (0, 100), 2: (100, len(self.TEXTO))}
+        reg = m5.lock_entities(self.TEXTO, page_boundaries=bounds)
+        assert {(e.entity_type, e.start_char, e.end_char) for e in reg.entities} == esperado
+        assert {e.entity_type for e in reg.entities} == {"date", "amount", "legal_ref", "process_number", "nif"}
+        for e in reg.entities:
+            assert e.page_num == (1 if e.start_char < 100 else 2)
+            assert e.page_num == m5._char_to_page_num(e.start_char, bounds)
+
+        # IDs deterministas e únicos
+        again = m5.lock_entities(self.TEXTO, page_boundaries=bounds)
+        assert [e.entity_id for e in reg.entities] == [e.entity_id for e in again.entities]
+        assert len({e.entity_id for e in reg.entities}) == reg.count
+
+    def test_range_index_matches_linear_scan(self):
+        import random
+        from types import SimpleNamespace
+        from src.pipeline.m5_entity_lock import EntityRegistry, LockedEntity, lock_entities
+
+        rnd = random.Random(7)  # noqa: S311 — dados de teste, não criptografia
+        reg = EntityRegistry()
+        for i in range(400):
+            start = rnd.randrange(0, 5_000)
+            reg.add(LockedEntity(
+                entity_id=f"e{i}", entity_type="date", text="x", normalized="x", page_num=0,
+                start_char=start, end_char=start + rnd.randrange(1, 300), source="regex", confidence=1.0,
+            ))
+        for _ in range(300):
+            a = rnd.randrange(-50, 5_300)
+            b = a + rnd.randrange(0, 400)
+            linear = [e for e in reg.entities if e.start_char < b and e.end_char > a]
+            assert reg.get_in_range(a, b) == linear
+            assert reg.has_in_range(a, b) == bool(linear)
+
+        # NER coberta por regex (ou por outra NER) não é acrescentada
+        ner = [
+            SimpleNamespace(entity_type="PERSON", value="réu", start=17, end=20, page_num=1, confidence=0.0),
+            SimpleNamespace(entity_type="DATE", value="12/03", start=3, end=8, page_num=1, confidence=0.9),
+            SimpleNamespace(entity_type="PER", value="ré", start=17, end=19, page_num=1, confidence=0.9),
+        ]
+        reg = lock_entities(self.TEXTO, ner_entities=ner)
+        ner_added = [e for e in reg.entities if e.source == "ner"]
+        assert [(e.entity_type, e.start_char, e.confidence) for e in ner_added] == [("person", 17, 0.7)]
+
+    def test_benchmark_small(self):
+        from src.pipeline.m5_entity_lock import benchmark_lock_entities
+
+        result = benchmark_lock_entities(tamanho_chars=100_000, chars_por_pagina=2_000)
+        assert result["chars"] == 100_000 and result["paginas"] == 50
+        assert result["entidades_regex"] > 1_000
+        assert 0 < result["entidades_ner"] < result["ner_recebidas"]
+        assert result["ids_unicos"] and result["ids_deterministas"]
+        assert result["chars_por_segundo"] > 0
+
+
+class TestEvidenceStore:
+    """Tests for src/pipeline/evidence_store.py and the consumers that query it."""
+
+    @staticmethod
+    def _item(item_id, item_type, value, start, end, extractor, page=None, doc="d1"):
+        from src.pipeline.schema_unified import EvidenceItem, SourceSpan
+        return EvidenceItem(
+            item_id=item_id, item_type=item_type, value_normalized=value,
+            source_spans=[SourceSpan(doc_id=doc, chunk_id="c0", start_char=start, end_char=end,
+                                     extractor_id=extractor, page_num=page)],
+        )
+
+    def test_interval_index_matches_linear_scan(self):
+        import random
+        from src.pipeline.evidence_store import IntervalIndex
+
+        for seed in range(30):
+            rnd = random.Random(seed)  # noqa: S311 — dados de teste, não criptografia
+            intervals = []
+            for i in range(rnd.randrange(0, 400)):
+                s = rnd.randrange(0, 5_000)
+                intervals.append((s, s + rnd.choice([0, 1, 7, 60, 900, 4_000]), i))
+            index = IntervalIndex(intervals)
+            for _ in range(40):
+                a = rnd.randrange(-100, 5_200)
+                b = a + rnd.randrange(0, 700)
+                esperado = [i for s, e, i in sorted(intervals) if s < b and e > a]
+                assert index.overlapping(a, b) == esperado
+            if intervals:
+                s, e, i = intervals[0]
+                if e > s:
+                    assert i in index.containing(s)
+
+    def test_store_queries_and_aggregation_conflicts(self):
+        from src.pipeline.evidence_store import EvidenceStore
+        from src.pipeline.extractor_unified import aggregate_with_provenance, calculate_coverage
+        from src.pipeline.schema_unified import ItemType
+
+        items = [
+            self._item("a", ItemType.DATE, "2024-01-15", 10, 20, "E1", page=1),
+            self._item("b", ItemType.DATE, "2024-01-16", 30, 40, "E2", page=1),
+            self._item("c", ItemType.AMOUNT, "1500.00", 150, 160, "E1", page=2),
+            self._item("d", ItemType.FACT, "contrato assinado", 500, 900, "E3", page=3),
+        ]
+        store = EvidenceStore.from_items(items)
+        assert len(store) == 4 and store.stats()["bytes_colunas"] > 0
+        assert [it.item_id for it in store.items_overlapping(15, 155)] == ["a", "b", "c"]
+        assert [it.item_id for it in store.items_overlapping(600, 601)] == ["d"]
+        assert store.span_counts_by_extractor() == {"E1": 2, "E2": 1, "E3": 1}
+        assert store.merged_ranges() == [(10, 20), (30, 40), (150, 160), (500, 900)]
+        assert store.merged_ranges("E1") == [(10, 20), (150, 160)]
+        assert store.has_value("amount", "1500.00") and not store.has_value("date", "1500.00")
+
+        # Mesmo bloco de 100 chars, mesmo tipo, valores diferentes → conflito
+        union, conflicts = aggregate_with_provenance({"E1": [items[0], items[2]], "E2": [items[1]]})
+        assert len(union) == 3
+        assert [c["span_key"] for c in conflicts] == ["date:d1:0"]
+        assert {v["extractor_id"] for v in conflicts[0]["values"]} == {"E1", "E2"}
+        _u, legacy = aggregate_with_provenance({"X": [items[0]], "Y": [items[1]]}, deduplicate=False)
+        assert [v["extractor_id"] for v in legacy[0]["values"]] == ["X", "Y"]
+
+        cov = calculate_coverage([], items, total_chars=1_000)
+        assert cov["coverage_by_extractor"] == {"E1": 2, "E2": 1, "E3": 1}
+
+    def test_page_and_chunk_lookups_use_indexes(self):
+        from src.pipeline.evidence_store import EvidenceStore
+        from src.pipeline.m5_entity_lock import lock_entities
+        from src.pipeline.m7b_consolidation import ConsolidationResult, _add_locked_entities
+        from src.pipeline.page_mapper import CharToPageMapper, PageBoundary
+        from src.pipeline.schema_unified import Chunk, ItemType
+
+        mapper = CharToPageMapper(boundaries=[
+            PageBoundary(page_num=p, start_char=(p - 1) * 100, end_char=p * 100, char_count=100)
+            for p in range(1, 11)
+        ])
+        for a, b in [(0, 1), (99, 101), (150, 150), (250, 620), (990, 5_000), (-5, 0)]:
+            linear = sorted(
+                bd.page_num for bd in mapper.boundaries
+                if not (bd.end_char <= a or bd.start_char >= b)
+            )
+            assert mapper.get_pages_for_range(a, b) == linear
+
+        store = EvidenceStore.from_items([
+            self._item("a", ItemType.DATE, "x", 120, 130, "E1"),
+            self._item("b", ItemType.FACT, "y", 250, 420, "E2"),
+        ])
+        cov = mapper.get_coverage_by_pages(store)
+        assert cov["pages_covered_list"] == [2, 3, 4, 5]
+
+        # Chunks sobrepostos: fica o primeiro da lista que contém a entidade
+        texto = "x" * 40 + " em 12/03/2021 e 5.000 € pagos."
+        chunks = [
+            Chunk(doc_id="d1", chunk_id=f"d1_c{i:04d}", chunk_index=i, total_chunks=2,
+                  start_char=s, end_char=e, overlap=20, text="")
+            for i, (s, e) in enumerate([(0, 50), (30, len(texto))])
+        ]
+        result = ConsolidationResult(
+            union_items=[self._item("z", ItemType.AMOUNT, "5000.00", 0, 1, "E1")],
+            conflicts=[], total_items=1, total_chunks_processed=2,
+        )
+        _add_locked_entities(result, lock_entities(texto), "d1", chunks)
+        added = {it.metadata["entity_type"]: it for it in result.union_items[1:]}
+        assert set(added) == {"date"}  # o valor já existia
+        assert added["date"].source_spans[0].chunk_id == "d1_c0000"
+
+
+class TestNearDuplicates:
+    """Tests for src/pipeline/near_dup.py (MinHash/LSH) in aggregation and M7B dedup."""
+
+    @staticmethod
+    def _item(item_id, item_type, value, start, end, extractor):
+        from src.pipeline.schema_unified import EvidenceItem, SourceSpan
+        return EvidenceItem(
+            item_id=item_id, item_type=item_type, value_normalized=value,
+            source_spans=[SourceSpan(doc_id="d1", chunk_id="c0", start_char=start, end_char=end,
+                                     extractor_id=extractor)],
+        )
+
+    def test_paraphrases_merge_across_extractors(self):
+        from src.pipeline.extractor_unified import aggregate_with_provenance
+        from src.pipeline.near_dup import lsh_params, resumo_quase_duplicados
+        from src.pipeline.schema_unified import ItemType
+
+        assert lsh_params(0.8, 64) == (10, 6)
+        por_extractor = {
+            "E1": [self._item("a", ItemType.FACT, "O réu celebrou contrato de arrendamento com a autora em Lisboa", 100, 160, "E1")],
+            "E2": [self._item("b", ItemType.FACT, "O Réu celebrou o contrato de arrendamento com a Autora, em Lisboa.", 5102, 5165, "E2")],
+            "E3": [self._item("c", ItemType.FACT, "O réu celebrou contrato de compra e venda com a autora no Porto", 900, 960, "E3")],
+        }
+        union, _conflicts = aggregate_with_provenance(por_extractor)
+        assert [it.item_id for it in union] == ["a", "c"]
+        base = union[0]
+        assert base.extractor_ids == {"E1", "E2"}
+        assert [r["item_id"] for r in base.metadata["near_duplicates"]] == ["b"]
+        assert base.metadata["near_duplicates"][0]["extractor_ids"] == ["E2"]
+        assert base.context.startswith("[E1,E2] quase_duplicados:2")
+
+        resumo = resumo_quase_duplicados(union, consumidores=3)
+        assert resumo["items_fundidos"] == 1 and resumo["clusters"] == 1
+        assert resumo["tokens_poupados_por_prompt"] > 0
+        assert resumo["tokens_poupados_total"] == 3 * resumo["tokens_poupados_por_prompt"]
+
+        # Desligado por parâmetro: só a via exacta
+        sem, _ = aggregate_with_provenance({k: [self._item(it.item_id, it.item_type, it.value_normalized, 0, 10, k) for it in v]
+                                            for k, v in por_extractor.items()}, near_duplicates=False)
+        assert len(sem) == 3
+
+    def test_numbers_types_and_exclusions_are_kept_apart(self):
+        from src.pipeline.near_dup import merge_near_duplicates
+        from src.pipeline.schema_unified import ItemType
+
+        items = [
+            self._item("a", ItemType.FACT, "O réu pagou 1500 euros de renda à autora em março", 0, 50, "E1"),
+            self._item("b", ItemType.FACT, "O réu pagou 2000 euros de renda à autora em março", 0, 50, "E2"),
+            self._item("c", ItemType.ENTITY, "Banco Comercial Português SA", 60, 90, "E1"),
+            self._item("d", ItemType.ENTITY, "Banco Comercial Português, S.A.", 60, 90, "E2"),
+            self._item("e", ItemType.FACT, "A autora entregou as chaves do locado ao réu", 100, 140, "E1"),
+            self._item("f", ItemType.FACT, "A Autora entregou as chaves do locado ao Réu.", 100, 140, "E2"),
+        ]
+        resultado, relatorio = merge_near_duplicates(items, excluir={"f"})
+        assert [it.item_id for it in resultado] == ["a", "b", "c", "d", "e", "f"]
+        assert relatorio["items_fundidos"] == 0
+        assert relatorio["elegiveis"] == 3  # entity fora de NEAR_DUP_TYPES, "f" excluído
+
+        resultado, relatorio = merge_near_duplicates(items)
+        assert [it.item_id for it in resultado] == ["a", "b", "c", "d", "e"]
+        assert relatorio["clusters"] == 1 and relatorio["tokens_poupados_por_prompt"] > 0
+
+    def test_negation_and_polarity_are_kept_apart(self):
+        from src.pipeline.near_dup import caracteristicas, jaccard, merge_near_duplicates
+        from src.pipeline.schema_unified import ItemType
+
+        pares = [
+            ("O réu pagou a renda de março ao senhorio", "O réu não pagou a renda de março ao senhorio"),
+            ("A testemunha viu o arguido sem capacete", "A testemunha viu o arguido com capacete"),
+            ("O arrendatário nunca foi notificado da resolução", "O arrendatário foi notificado da resolução"),
+        ]
+        for texto_a, texto_b in pares:
+            items = [self._item("a", ItemType.FACT, texto_a, 0, 40, "E1"),
+                     self._item("b", ItemType.FACT, texto_b, 0, 40, "E2")]
+            resultado, relatorio = merge_near_duplicates(items)
+            assert [it.item_id for it in resultado] == ["a", "b"], texto_b
+            assert relatorio["items_fundidos"] == 0
+        assert jaccard(caracteristicas(pares[0][0])[0], caracteristicas(pares[0][1])[0]) < 1.0
+
+    def test_places_names_and_parties_are_kept_apart(self):
+        from src.pipeline.extractor_unified import aggregate_with_provenance
+        from src.pipeline.near_dup import caracteristicas, jaccard, merge_near_duplicates
+        from src.pipeline.schema_unified import ItemType
+
+        pares = [
+            ("O contrato de arrendamento habitacional foi celebrado entre as partes no cartório notarial da Rua Augusta em Lisboa",
+             "O contrato de arrendamento habitacional foi celebrado entre as partes no cartório notarial da Rua Augusta em Porto"),
+            ("Por carta registada com aviso de receção a autora comunicou a resolução do contrato de arrendamento ao réu "
+             "invocando a falta de pagamento das rendas vencidas e a realização de obras não autorizadas no locado",
+             "Por carta registada com aviso de receção o réu comunicou a resolução do contrato de arrendamento à autora "
+             "invocando a falta de pagamento das rendas vencidas e a realização de obras não autorizadas no locado"),
+            ("O autor requereu a junção aos autos do relatório pericial sobre o estado de conservação do imóvel arrendado "
+             "e das infiltrações na cozinha",
+             "O interveniente requereu a junção aos autos do relatório pericial sobre o estado de conservação do imóvel "
+             "arrendado e das infiltrações na cozinha"),
+        ]
+        for texto_a, texto_b in pares:
+            assert jaccard(caracteristicas(texto_a)[0], caracteristicas(texto_b)[0]) >= 0.8
+            items = [self._item("a", ItemType.FACT, texto_a, 0, 80, "E1"),
+                     self._item("b", ItemType.FACT, texto_b, 5000, 5080, "E2")]
+            resultado, relatorio = merge_near_duplicates(items)
+            assert [it.item_id for it in resultado] == ["a", "b"], texto_b
+        # Maiúscula de início de frase não é nome próprio
+        assert caracteristicas("Contrato celebrado. Lisboa")[1] == caracteristicas("contrato celebrado. Lisboa")[1]
+
+        # Mesmo span, extractores divergem: fica o conflito, sem fusão
+        por_extractor = {
+            "E1": [self._item("a", ItemType.FACT, pares[0][0], 100, 180, "E1")],
+            "E2": [self._item("b", ItemType.FACT, pares[0][1], 100, 180, "E2")],
+        }
+        for near in (False, True):
+            union, conflicts = aggregate_with_provenance(
+                {k: [self._item(it.item_id, it.item_type, it.value_normalized, 100, 180, k) for it in v]
+                 for k, v in por_extractor.items()},
+                near_duplicates=near,
+            )
+            assert [it.item_id for it in union] == ["a", "b"] and len(conflicts) == 1
+
+    def test_cross_batch_dedup_merges_paraphrases(self):
+        from src.pipeline.m7b_consolidation import _cross_batch_dedup
+        from src.pipeline.near_dup import get_near_dup_metrics
+        from src.pipeline.schema_unified import ItemType
+
+        antes = get_near_dup_metrics()["items_fundidos"]
+        items = [
+            self._item("a", ItemType.FACT, "A testemunha confirmou a entrega do veículo na oficina", 0, 60, "E1"),
+            self._item("b", ItemType.FACT, "A testemunha confirmou a entrega do veículo na oficina", 5000, 5060, "E1"),
+            self._item("c", ItemType.FACT, "Testemunha confirmou a entrega do veiculo na oficina.", 5000, 5060, "E2"),
+        ]
+        unicos, conflicts = _cross_batch_dedup(items)
+        assert [it.item_id for it in unicos] == ["a"] and conflicts == []
+        assert len(unicos[0].source_spans) == 3
+        assert get_near_dup_metrics()["items_fundidos"] == antes + 1
+
+        # Items em conflitos dos lotes ficam fora da fusão aproximada
+        items = [
+            self._item("x", ItemType.FACT, "A testemunha confirmou a entrega do veículo na oficina", 0, 60, "E1"),
+            self._item("y", ItemType.FACT, "Testemunha confirmou a entrega do veiculo na oficina.", 5000, 5060, "E2"),
+        ]
+        unicos, _ = _cross_batch_dedup(items, excluir={"y"})
+        assert [it.item_id for it in unicos] == ["x", "y"]
+
+
+# ============================================================
+# TOKEN COUNTER — ORÇAMENTO POR TOKENS
+# ============================================================
+
+class TestTokenCounter:
+    """Tests for src/token_counter.py and its use in failover/max_tokens/cost reporting."""
+
+    def test_count_is_cached_by_text_hash(self):
+        from src.token_counter import TokenCounter
+        counter = TokenCounter()
+        texto = "O Tribunal da Relação de Lisboa decidiu, nos termos do artigo 342.º do Código Civil. " * 50
+        n = counter.count(texto)
+        assert counter.count(texto) == n
+        assert counter.get_stats() == {"entries": 1, "hits": 1, "misses": 1}
+        assert counter.count("") == 0
+        # Português jurídico: ~3 chars/token (chars//4 subestima)
+        assert 2.5 < len(texto) / n < 4.0
+        assert counter.count_messages("abc", None, "def") == counter.count("abc") + counter.count("def") + 8
+
+    def test_failover_and_max_tokens_use_token_counts(self):
+        from src.config import (
+            selecionar_modelo_com_failover, calcular_max_tokens, LIMITE_NIVEL1_CHARS,
+            FALLBACK_MODEL_NIVEL2, MODEL_CONTEXT_LIMITS,
+        )
+        doc_chars = LIMITE_NIVEL1_CHARS + 100_000
+        # Por chars seria failover; com 250K tokens cabe nos 400K do GPT-5.2
+        assert selecionar_modelo_com_failover("openai/gpt-5.2", doc_chars, "A1") == FALLBACK_MODEL_NIVEL2
+        assert selecionar_modelo_com_failover("openai/gpt-5.2", doc_chars, "A1", doc_tokens=250_000) == "openai/gpt-5.2"
+        assert selecionar_modelo_com_failover("openai/gpt-5.2", 10_000, "A1", doc_tokens=300_000) == FALLBACK_MODEL_NIVEL2
+
+        sem_limite = calcular_max_tokens(600_000, "openai/gpt-4.1")
+        assert calcular_max_tokens(600_000, "openai/gpt-4.1", prompt_tokens=10_000) == sem_limite
+        contexto = MODEL_CONTEXT_LIMITS["deepseek/deepseek-r1"]
+        limitado = calcular_max_tokens(10_000, "deepseek/deepseek-r1", prompt_tokens=contexto - 5_000)
+        assert limitado < calcular_max_tokens(10_000, "deepseek/deepseek-r1")
+        assert limitado <= 5_000
+
+    def test_cost_controller_reports_token_estimation_error(self):
+        from src.cost_controller import CostController
+        cc = CostController(run_id="tok-test", budget_limit_usd=10.0)
+        assert cc.get_token_estimate_report() == {"calls": 0}
+        cc.register_token_estimate(estimated_tokens=1_050, actual_tokens=1_000, prompt_chars=3_000)
+        cc.register_token_estimate(estimated_tokens=980, actual_tokens=1_000, prompt_chars=3_200)
+        cc.register_token_estimate(estimated_tokens=500, actual_tokens=0, prompt_chars=100)  # sem usage: ignorado
+        report = cc.get_summary()["token_estimation"]
+        assert report["calls"] == 2
+        assert report["bias_pct"] == 1.5
+        assert report["abs_error_pct"] == 3.5
+        assert report["chars_bias_pct"] == -22.5
+        assert cc.finalize().timestamp_end is not None
+
+    def test_tier_cost_with_counted_tokens_crosses_size_bracket(self):
+        from src.tier_config import TierLevel, calculate_tier_cost
+        from src.token_counter import contar_tokens
+        texto = "Acórdão do Supremo Tribunal de Justiça sobre responsabilidade extracontratual. " * 2_400
+        tokens = contar_tokens(texto)
+        assert len(texto) // 4 <= 50_000 < tokens  # chars//4 subestimava o bloqueio
+        assert calculate_tier_cost(TierLevel.BRONZE, tokens)["bloqueio"] > calculate_tier_cost(
+            TierLevel.BRONZE, len(texto) // 4)["bloqueio"]
+
+
+# ============================================================
+# HEDGING — p95 + LIMITE DE GASTO POR TIER
+# ============================================================
+
+class TestHedgingPolicy:
+    """Tests for hedge planning in LexForumProcessor and latency p95 in PerformanceTracker."""
+
+    def test_latency_p95_from_recorded_calls(self):
+        from src.performance_tracker import PerformanceTracker
+        tracker = PerformanceTracker(MagicMock())
+        for ms in range(1, 101):
+            tracker.record_call(run_id="r", model="m/x", phase="auditor", role="A1", latency_ms=float(ms))
+        tracker.record_call(run_id="r", model="m/x", phase="auditor", role="A1", latency_ms=99999.0, success=False)
+        assert tracker.get_latency_p95("m/x", min_samples=20) == 95.0
+        assert tracker.get_latency_p95("m/x", min_samples=500) is None
+        assert tracker.get_latency_p95("m/desconhecido") is None
+
+    def test_plano_hedge_uses_substitute_p95_and_tier_cap(self):
+        from types import SimpleNamespace
+        from src.pipeline.processor import LexForumProcessor
+
+        proc = LexForumProcessor.__new__(LexForumProcessor)
+        proc._tier = "bronze"
+        proc._hedge_spend_usd = 0.0
+        proc._hedge_lock = threading.Lock()
+        proc._hedge_cond = threading.Condition(proc._hedge_lock)
+        proc._hedge_reservas = {}
+        proc._hedge_seq = 0
+        proc._cost_controller = MagicMock()
+        proc._cost_controller.register_usage.return_value = SimpleNamespace(cost_usd=0.6)
+        proc._cost_controller.calculate_cost.return_value = 0.2
+        tracker = MagicMock()
+        tracker.get_latency_p95.return_value = 45_000.0
+
+        with patch("src.config.HEDGING_ENABLED", True), \
+                patch("src.config.HEDGE_MIN_DELAY_S", 20.0), \
+                patch.dict("src.config.HEDGE_MAX_SPEND_USD", {"bronze": 0.5}):
+            assert proc._plano_hedge("auditor_1_json", "openai/gpt-5.2", tracker) == ("openai/gpt-4.1", 45.0)
+            # A correr no próprio Sub 1 → duplica para o Sub 2
+            assert proc._plano_hedge("relator_1", "openai/gpt-4.1", tracker) == ("google/gemini-2.5-pro", 45.0)
+            assert proc._plano_hedge("auditor_5_json_senior", "anthropic/claude-opus-4.6", tracker) is None
+            assert proc._plano_hedge("consolidador", "openai/gpt-5.2", tracker) is None
+            tracker.get_latency_p95.return_value = 2_000.0
+            assert proc._plano_hedge("auditor_2", "google/gemini-3-pro-preview", tracker)[1] == 20.0
+
+            # Reservas concorrentes contam para o limite antes de haver custo real
+            modelos = ("openai/gpt-5.2", "openai/gpt-4.1")
+            r1 = proc._reservar_hedge("auditor_1", modelos, 1000, 500)
+            r2 = proc._reservar_hedge("auditor_2", modelos, 1000, 500)
+            assert r1 is not None and r2 is not None
+            assert proc._reservar_hedge("auditor_3", modelos, 1000, 500) is None  # 0.4 + 0.2 > 0.5
+            proc._registar_custo_hedge("auditor_1", "openai/gpt-5.2",
+                                       SimpleNamespace(prompt_tokens=1000, completion_tokens=500), r1)
+            assert proc._cost_controller.register_usage.call_args.kwargs["phase"] == "auditor_1_hedge"
+            assert proc._hedge_spend_usd == 0.6 and list(proc._hedge_reservas) == [r2]
+            assert proc._reservar_hedge("auditor_3", modelos, 1000, 500) is None
+
+            # Finalize: o pendente é cobrado pela estimativa; a liquidação tardia é ignorada
+            proc._liquidar_hedges_pendentes(timeout=0.01)
+            assert proc._cost_controller.register_usage.call_args.kwargs["phase"] == "auditor_2_hedge_estimado"
+            assert proc._hedge_reservas == {} and proc._hedge_spend_usd == pytest.approx(0.8)
+            chamadas = proc._cost_controller.register_usage.call_count
+            proc._registar_custo_hedge("auditor_2", "openai/gpt-5.2",
+                                       SimpleNamespace(prompt_tokens=1000, completion_tokens=500), r2)
+            assert proc._cost_controller.register_usage.call_count == chamadas
+
+        assert proc._plano_hedge("auditor_1", "openai/gpt-5.2", tracker) is None  # opt-in
+
+
+# ============================================================
+# FASE 1 — (EXTRACTOR × CHUNK) SCHEDULER
+# ============================================================
+
+class TestFase1ChunkScheduler:
+    """Tests for the chunk-level scheduler in LexForumProcessor._fase1_extracao_unified."""
+
+    def test_chunks_parallel_per_provider_limit_and_chunk_order(self, tmp_path):
+        """Chunks of one extractor run concurrently, provider cap holds, items come back in chunk order."""
+        import json
+        import random
+        from types import SimpleNamespace
+        from src.document_loader import DocumentContent
+        from src.pipeline.processor import LexForumProcessor
+
+        lock = threading.Lock()
+        ativos = {"por_modelo": {}, "por_provider": {}}
+        picos = {"por_modelo": {}, "por_provider": {}}
+        rng = random.Random(3)  # noqa: S311 — dados de teste, não criptografia
+
+        def fake_chat_simple(model, prompt, **kwargs):
+            provider = model.split("/")[0]
+            with lock:
+                for tipo, chave in (("por_modelo", model), ("por_provider", provider)):
+                    ativos[tipo][chave] = ativos[tipo].get(chave, 0) + 1
+                    picos[tipo][chave] = max(picos[tipo].get(chave, 0), ativos[tipo][chave])
+                pausa = rng.uniform(0.02, 0.1)
+            time.sleep(pausa)  # chunks terminam fora de ordem
+            with lock:
+                ativos["por_modelo"][model] -= 1
+                ativos["por_provider"][provider] -= 1
+            content = json.dumps({"items": [
+                {"item_type": "other", "value_normalized": "facto", "raw_text": "facto",
+                 "offset_start": 0, "offset_end": 5},
+            ]})
+            return SimpleNamespace(content=content, success=True, prompt_tokens=10, completion_tokens=5,
+                                   total_tokens=15, latency_ms=1, error=None, finish_reason="stop")
+
+        proc = LexForumProcessor.__new__(LexForumProcessor)
+        proc._llm_configs = [
+            {"id": "E1", "model": "openai/a", "role": "r", "instructions": "i"},
+            {"id": "E2", "model": "openai/b", "role": "r", "instructions": "i"},
+            {"id": "E3", "model": "google/c", "role": "r", "instructions": "i"},
+        ]
+        proc.llm_client = MagicMock()
+        proc.llm_client.chat_simple.side_effect = fake_chat_simple
+        proc.callback_progresso = None
+        proc._output_dir = tmp_path
+        proc._cost_controller = None
+        proc._perf_tracker = None
+
+        capturado = {}
+
+        class _Stop(Exception):
+            pass
+
+        def capturar(items_by_extractor):
+            capturado.update(items_by_extractor)
+            raise _Stop()
+
+        documento = DocumentContent(filename="doc.txt", extension=".txt", text="Lorem ipsum dolor. " * 12_000)
+        with patch("src.config.EXTRACTION_PROVIDER_CONCURRENCY", 2), \
+                patch("src.config.EXTRACTION_MAX_CONCURRENCY", 8), \
+                patch("src.pipeline.processor.validate_and_filter_extractors", side_effect=capturar), \
+                pytest.raises(_Stop):
+            proc._fase1_extracao_unified(documento, "Civil")
+
+        assert set(capturado) == {"E1", "E2", "E3"}
+        starts = [item.source_spans[0].start_char for item in capturado["E1"]]
+        assert len(starts) >= 3
+        assert starts == sorted(starts)  # remontado por ordem de chunk
+        assert max(picos["por_modelo"].values()) > 1  # chunks do mesmo extrator em paralelo
+        assert picos["por_provider"]["openai"] <= 2
+        from src.pipeline.artefact_store import get_artefact_store
+        assert get_artefact_store().flush(tmp_path, timeout=10)
+        assert (tmp_path / "fase1_extractor_E1_items.ndjson").exists()
+        assert len(get_artefact_store().read_json(tmp_path / "fase1_extractor_E1_items.json")) == len(starts)
+
+    def test_stall_timeout_covers_worst_case_of_one_chunk(self):
+        import os
+        from src import config
+
+        # titular até ao deadline + tentativa em curso, depois cada suplente
+        pior = (
+            config.EXTRACTOR_RETRY_DEADLINE + config.EXTRACTOR_CALL_TIMEOUT
+            + len(config.EXTRACTOR_SUBSTITUTES) * config.EXTRACTOR_SUBSTITUTE_RETRIES * config.EXTRACTOR_CALL_TIMEOUT
+        )
+        assert config.EXTRACTOR_PIOR_CASO_CHUNK >= pior
+        if "EXTRACTOR_STALL_TIMEOUT" not in os.environ:
+            assert config.EXTRACTOR_STALL_TIMEOUT == config.EXTRACTOR_PIOR_CASO_CHUNK